@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for the benchmark scripts in this directory.
+
+Each benchmark case runs in a fresh spawned process, so its peak RSS is
+its own and not the high-water mark of earlier cases. Results are one dict
+per case; save_baseline() stores them under benchmarks/baselines/ and
+compare_to_baseline() reports each metric's change against a saved run and
+flags regressions past a threshold.
+
+Baselines are machine-specific: compare only against one recorded on the
+same machine with the same corpus parameters.
+"""
+
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCH_DIR)
+
+# Saved baselines; override with FBREF_BENCH_BASELINES
+BASELINE_DIR = os.environ.get('FBREF_BENCH_BASELINES', os.path.join(BENCH_DIR, 'baselines'))
+# Generated corpora; override with FBREF_BENCH_CORPUS
+CORPUS_DIR = os.environ.get('FBREF_BENCH_CORPUS', os.path.join(BENCH_DIR, 'corpus'))
+
+# Relative change past which a metric counts as a regression
+DEFAULT_THRESHOLD = 0.10
+
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def run_isolated(func: Callable, *args):
+    """func(*args) in a fresh spawned process; returns its result."""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return pool.submit(func, *args).result()
+
+
+def best_of(repeat: int, func: Callable) -> Tuple[float, object]:
+    """(fastest wall time, result) of repeat calls of func()."""
+    best, result = None, None
+    for _ in range(max(repeat, 1)):
+        started = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def environment() -> Dict:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.node(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def baseline_path(name: str) -> str:
+    return os.path.join(BASELINE_DIR, f"{name}.json")
+
+
+def save_baseline(name: str, results: Dict[str, Dict], params: Dict) -> str:
+    """Store results (case -> metrics) with the run parameters; returns the path."""
+    os.makedirs(BASELINE_DIR, exist_ok=True)
+    path = baseline_path(name)
+    with open(path, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'environment': environment(),
+            'params': params,
+            'results': results,
+        }, f, indent=2, sort_keys=True)
+    return path
+
+
+def load_baseline(name: str) -> Optional[Dict]:
+    path = baseline_path(name)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_to_baseline(results: Dict[str, Dict], baseline: Dict, higher_is_better: List[str],
+                        lower_is_better: List[str], threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    Print each metric's change against the baseline; returns the regressions.
+
+    A throughput metric regresses when it drops by more than threshold, a
+    cost metric (time, memory) when it grows by more than threshold.
+    """
+    regressions = []
+    print(f"\nCompared with baseline of {baseline['created']} ({baseline['environment']['machine']}):")
+    for case, metrics in results.items():
+        before = baseline['results'].get(case)
+        if not before:
+            print(f"  {case:22} (not in baseline)")
+            continue
+        changes = []
+        for metric in higher_is_better + lower_is_better:
+            old, new = before.get(metric), metrics.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            worse = -change if metric in higher_is_better else change
+            flag = ' REGRESSION' if worse > threshold else ''
+            if flag:
+                regressions.append(f"{case} {metric} {change:+.1%}")
+            changes.append(f"{metric} {change:+.1%}{flag}")
+        print(f"  {case:22} " + ', '.join(changes))
+    return regressions
+
+
+def print_table(results: Dict[str, Dict], columns: List[Tuple[str, str, str]]):
+    """Print results as a table of (metric, header, format spec) columns."""
+    header = f"{'case':22}" + ''.join(f"{title:>14}" for _, title, _ in columns)
+    print(header)
+    print('-' * len(header))
+    for case, metrics in results.items():
+        cells = []
+        for metric, _, spec in columns:
+            value = metrics.get(metric)
+            cells.append(f"{value:>14{spec}}" if value is not None else f"{'-':>14}")
+        print(f"{case:22}" + ''.join(cells))
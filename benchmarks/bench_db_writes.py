@@ -0,0 +1,601 @@
+#!/usr/bin/env python3
+"""
+Benchmark the database write strategies used by the extractors.
+
+Builds a scratch database (schema_postgres.sql, then migrations/, then
+bench_schema.sql for the tables written here), seeds match_player rows and
+times each write strategy in the codebase over the same records at several
+batch sizes, committing after every batch:
+
+    per_row         one statement per record (update_passing_record,
+                    the per-row UPDATE in the old misc process_batch)
+    execute_batch   psycopg2 execute_batch, page_size 100 (insert_shots_to_db)
+    execute_values  psycopg2 execute_values, one page per batch (the old misc
+                    process_batch INSERT, rebuild insert_shots); updates use
+                    UPDATE ... FROM (VALUES ...)
+    copy_merge      BulkLoader: COPY into a staging table + set-based merge
+    values_merge    BulkLoader method='values': the same merge as one
+                    UPDATE ... FROM (VALUES ...) + INSERT statement
+                    (BatchMiscStatsExtractor.process_batch for batches
+                    of up to bulk_loader.VALUES_MAX_ROWS records)
+    prepared        db_session.PreparedStatement: PREPAREd once per
+                    connection, pages of 100 EXECUTEs (insert_shots_to_db,
+                    insert_lineups)
+    pipeline        db_session.executemany on a psycopg 3 connection in
+                    pipeline mode (only when psycopg 3 is installed)
+
+Workloads:
+
+    misc_insert     new match_player_misc rows
+    misc_update     every row already stored, every value changed
+    misc_rerun      every row already stored, values unchanged (the
+                    stats_fingerprint skip only applies to copy_merge)
+    shot_insert     new match_shot rows
+
+Each case reports rows/sec, DB round trips (etl_metrics) and the WAL it
+generated (pg_current_wal_lsn before and after).
+
+Server:
+    --server existing   an already running server (default localhost:5433,
+                        the docker-compose port)
+    --server compose    docker compose -f docker-compose.postgres.yml up -d
+    --server initdb     a throwaway cluster in a temp directory (needs the
+                        PostgreSQL binaries on PATH or --pg-bin; not as root)
+
+The scratch database (--database, default nwsl_bench) is dropped and
+recreated on every run; never point it at a database holding real data.
+
+Usage:
+    python benchmarks/bench_db_writes.py                              # existing server
+    python benchmarks/bench_db_writes.py --server initdb --rows 5000
+    python benchmarks/bench_db_writes.py --only misc_update --batch-sizes 100,1000
+    python benchmarks/bench_db_writes.py --save-baseline / --compare
+"""
+
+import os
+import sys
+import time
+import uuid
+import atexit
+import random
+import shutil
+import logging
+import argparse
+import tempfile
+import subprocess
+from typing import Callable, Dict, List, Optional
+
+import psycopg2
+from psycopg2.extras import execute_batch, execute_values
+
+from bench_common import (BENCH_DIR, DEFAULT_THRESHOLD, REPO_ROOT, compare_to_baseline, load_baseline,
+                          print_table, save_baseline)
+from bulk_loader import MISC_COLUMNS, SHOT_COLUMNS, BulkLoader, copy_buffer
+from db_session import PreparedStatement, connect_pipelined, executemany, pipeline_available
+from etl_metrics import metered_connect, start_run
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+BASELINE_NAME = 'db_writes'
+DEFAULT_ROWS = 20000
+DEFAULT_BATCH_SIZES = [50, 500, 5000]
+DEFAULT_SEED = 2024
+DEFAULT_REPEAT = 1
+PLAYERS_PER_MATCH = 28
+
+BENCH_DATABASE = 'nwsl_bench'
+SCHEMA_FILE = os.path.join(REPO_ROOT, 'schema_postgres.sql')
+MIGRATIONS_DIR = os.path.join(REPO_ROOT, 'migrations')
+# Rollbacks undo the other migrations; never applied
+SKIP_MIGRATIONS = {'00_rollback_key_changes.sql'}
+BENCH_SCHEMA_FILE = os.path.join(BENCH_DIR, 'bench_schema.sql')
+COMPOSE_FILE = os.path.join(REPO_ROOT, 'docker-compose.postgres.yml')
+
+# docker-compose.postgres.yml credentials
+SERVER_DEFAULTS = {'host': 'localhost', 'port': 5433, 'user': 'postgres', 'password': 'postgres'}
+SERVER_MODES = ['existing', 'compose', 'initdb']
+STARTUP_TIMEOUT = 60
+
+WORKLOADS = {
+    'misc_insert': ['per_row', 'execute_batch', 'execute_values', 'copy_merge', 'values_merge', 'prepared'],
+    'misc_update': ['per_row', 'execute_batch', 'execute_values', 'copy_merge', 'values_merge', 'prepared'],
+    'misc_rerun': ['per_row', 'execute_batch', 'execute_values', 'copy_merge', 'values_merge', 'prepared'],
+    'shot_insert': ['execute_batch', 'execute_values', 'copy_merge', 'prepared'],
+}
+if pipeline_available():
+    for strategies in WORKLOADS.values():
+        strategies.append('pipeline')
+
+RESULT_COLUMNS = [
+    ('rows', 'rows', ',d'), ('seconds', 'seconds', '.2f'), ('rows_per_sec', 'rows/s', ',.0f'),
+    ('db_round_trips', 'round trips', ',d'), ('wal_mb', 'WAL MB', '.1f'),
+]
+HIGHER_IS_BETTER = ['rows_per_sec']
+LOWER_IS_BETTER = ['wal_mb']
+
+# Column types for the UPDATE ... FROM (VALUES ...) template (NULLs need a cast)
+MISC_TYPES = dict({col: 'integer' for col in MISC_COLUMNS},
+                  match_player_id='uuid', aerial_duels_won_pct='numeric')
+
+# INSERT column lists of the code paths being measured
+SHOT_BATCH_COLUMNS = [
+    'shot_id', 'match_id', 'minute', 'player_name', 'player_id', 'squad',
+    'xg', 'psxg', 'outcome_id', 'distance', 'body_part', 'notes',
+    'sca1_player_name', 'sca1_event', 'sca2_player_name', 'sca2_event',
+    'player_uuid'
+]
+SHOT_VALUES_COLUMNS = [
+    'match_id', 'minute', 'player_name', 'player_id', 'team_name',
+    'xg', 'psxg', 'outcome', 'distance', 'body_part', 'notes',
+    'sca1_player_name', 'sca1_event', 'sca2_player_name', 'sca2_event',
+    'season_year'
+]
+SHOT_OUTCOMES = ['Goal', 'Saved', 'Off Target', 'Blocked', 'Woodwork']
+BODY_PARTS = ['Right Foot', 'Left Foot', 'Head']
+SCA_EVENTS = ['Pass (Live)', 'Pass (Dead)', 'Take-On', 'Shot', 'Fouled', None]
+
+
+# ----------------------------------------------------------------------------
+# Server and schema
+# ----------------------------------------------------------------------------
+
+def pg_tool(pg_bin: Optional[str], name: str) -> str:
+    return os.path.join(pg_bin, name) if pg_bin else name
+
+
+def wait_for_server(params: Dict, timeout: int = STARTUP_TIMEOUT):
+    """Block until the server accepts connections."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            psycopg2.connect(dbname='postgres', connect_timeout=3, **params).close()
+            return
+        except psycopg2.OperationalError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(1)
+
+
+def start_compose(params: Dict) -> Dict:
+    """Start the docker-compose Postgres and wait for it."""
+    logger.info(f"Starting {COMPOSE_FILE}")
+    subprocess.run(['docker', 'compose', '-f', COMPOSE_FILE, 'up', '-d'], check=True)
+    wait_for_server(params)
+    return params
+
+
+def start_initdb(pg_bin: Optional[str], port: int) -> Dict:
+    """A throwaway cluster in a temp directory, stopped and removed at exit."""
+    data_dir = tempfile.mkdtemp(prefix='nwsl-bench-pg-')
+    logger.info(f"Creating a temporary cluster in {data_dir}")
+    subprocess.run([pg_tool(pg_bin, 'initdb'), '-D', data_dir, '-U', 'postgres', '--auth=trust',
+                    '--encoding=UTF8', '--no-sync'], check=True, stdout=subprocess.DEVNULL)
+    options = f"-p {port} -k {data_dir} -c listen_addresses=''"
+    subprocess.run([pg_tool(pg_bin, 'pg_ctl'), '-D', data_dir, '-o', options,
+                    '-l', os.path.join(data_dir, 'server.log'), '-w', 'start'],
+                   check=True, stdout=subprocess.DEVNULL)
+
+    def stop():
+        subprocess.run([pg_tool(pg_bin, 'pg_ctl'), '-D', data_dir, '-m', 'fast', '-w', 'stop'],
+                       stdout=subprocess.DEVNULL)
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    atexit.register(stop)
+    params = {'host': data_dir, 'port': port, 'user': 'postgres'}
+    wait_for_server(params)
+    return params
+
+
+def run_sql_file(pg_bin: Optional[str], params: Dict, database: str, path: str, stop_on_error: bool) -> int:
+    """Run a SQL file through psql; returns the number of failed statements."""
+    env = dict(os.environ, PGPASSWORD=str(params.get('password', '')))
+    result = subprocess.run(
+        [pg_tool(pg_bin, 'psql'), '-X', '-q', '-h', str(params['host']), '-p', str(params['port']),
+         '-U', params['user'], '-d', database, '-v', f"ON_ERROR_STOP={int(stop_on_error)}", '-f', path],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    errors = [line for line in result.stderr.splitlines() if 'ERROR:' in line]
+    if stop_on_error and result.returncode != 0:
+        raise RuntimeError(f"{os.path.basename(path)} failed: {result.stderr.strip()}")
+    for line in errors[:3]:
+        logger.debug(f"  {line}")
+    return len(errors)
+
+
+def create_database(pg_bin: Optional[str], params: Dict, database: str):
+    """Drop and recreate the scratch database and load the schema into it."""
+    conn = psycopg2.connect(dbname='postgres', **params)
+    conn.autocommit = True
+    cursor = conn.cursor()
+    cursor.execute(f'DROP DATABASE IF EXISTS "{database}"')
+    cursor.execute(f'CREATE DATABASE "{database}"')
+    conn.close()
+
+    migrations = sorted(name for name in os.listdir(MIGRATIONS_DIR)
+                        if name.endswith('.sql') and name not in SKIP_MIGRATIONS)
+    for path in [SCHEMA_FILE] + [os.path.join(MIGRATIONS_DIR, name) for name in migrations]:
+        errors = run_sql_file(pg_bin, params, database, path, stop_on_error=False)
+        status = f"{errors} statements failed" if errors else 'ok'
+        logger.info(f"Loaded {os.path.relpath(path, REPO_ROOT)}: {status}")
+    run_sql_file(pg_bin, params, database, BENCH_SCHEMA_FILE, stop_on_error=True)
+    logger.info(f"Loaded {os.path.relpath(BENCH_SCHEMA_FILE, REPO_ROOT)}")
+
+
+# ----------------------------------------------------------------------------
+# Data
+# ----------------------------------------------------------------------------
+
+def seed_match_players(conn, rows: int, seed: int) -> List[str]:
+    """Insert enough match_player rows for the misc workloads; returns their ids."""
+    rng = random.Random(f'match_player/{seed}')
+    records = []
+    for index in range(rows):
+        match_id = f'{rng.getrandbits(32):08x}' if index % PLAYERS_PER_MATCH == 0 else records[-1]['match_id']
+        records.append({
+            'id': str(uuid.uuid5(uuid.NAMESPACE_URL, f'nwsl-bench/match_player/{seed}/{index}')),
+            'match_id': match_id,
+            'player_id': f'{rng.getrandbits(32):08x}',
+            'minutes_played': rng.randint(1, 90),
+            'started': index % PLAYERS_PER_MATCH < 22,
+        })
+    columns = ['id', 'match_id', 'player_id', 'minutes_played', 'started']
+    cursor = conn.cursor()
+    cursor.copy_expert(f"COPY match_player ({', '.join(columns)}) FROM STDIN", copy_buffer(records, columns))
+    cursor.execute("ANALYZE match_player")
+    conn.commit()
+    cursor.close()
+    return [record['id'] for record in records]
+
+
+def misc_records(match_player_ids: List[str], seed: int, version: int) -> List[Dict]:
+    """One misc stat record per match_player; a different version changes every value."""
+    rng = random.Random(f'misc/{seed}/{version}')
+    records = []
+    for match_player_id in match_player_ids:
+        record = {col: rng.randint(0, 12) + 20 * version for col in MISC_COLUMNS[1:]}
+        won, lost = record['aerial_duels_won'], record['aerial_duels_lost']
+        record['aerial_duels_won_pct'] = round(100.0 * won / (won + lost), 1) if won + lost else None
+        record['match_player_id'] = match_player_id
+        records.append(record)
+    return records
+
+
+def shot_records(rows: int, seed: int) -> List[Dict]:
+    """rows shots spread over matches of about 25 shots."""
+    rng = random.Random(f'shots/{seed}')
+    records = []
+    match_id = None
+    for index in range(rows):
+        if index % 25 == 0:
+            match_id = f'{rng.getrandbits(32):08x}'
+        outcome = rng.choice(SHOT_OUTCOMES)
+        team = f'Team {rng.randint(1, 14)}'
+        records.append({
+            'shot_id': f'{match_id}_{index % 25}',
+            'match_id': match_id,
+            'minute': rng.randint(1, 95),
+            'player_name': f'Player {rng.randint(1, 400)}',
+            'player_id': f'{rng.getrandbits(32):08x}',
+            'squad': team,
+            'team_name': team,
+            'xg': round(rng.random() * 0.6, 2),
+            'psxg': round(rng.random() * 0.8, 2) if outcome in ('Goal', 'Saved') else None,
+            'outcome_id': outcome,
+            'outcome': outcome,
+            'distance': rng.randint(4, 35),
+            'body_part': rng.choice(BODY_PARTS),
+            'notes': rng.choice(['', 'Volley', 'Free kick', 'Deflected']),
+            'sca1_player_name': f'Player {rng.randint(1, 400)}',
+            'sca1_event': rng.choice(SCA_EVENTS),
+            'sca2_player_name': f'Player {rng.randint(1, 400)}',
+            'sca2_event': rng.choice(SCA_EVENTS),
+            'player_uuid': str(uuid.uuid5(uuid.NAMESPACE_URL, f'nwsl-bench/player/{index % 400}')),
+            'season_year': 2024,
+        })
+    return records
+
+
+# ----------------------------------------------------------------------------
+# Strategies: each writes one batch without committing
+# ----------------------------------------------------------------------------
+
+MISC_STAT_COLUMNS = MISC_COLUMNS[1:]
+MISC_INSERT_SQL = (f"INSERT INTO match_player_misc ({', '.join(MISC_COLUMNS)}) "
+                   f"VALUES ({', '.join(['%s'] * len(MISC_COLUMNS))})")
+MISC_UPDATE_SQL = (f"UPDATE match_player_misc SET {', '.join(f'{col} = %s' for col in MISC_STAT_COLUMNS)} "
+                   f"WHERE match_player_id = %s")
+SHOT_INSERT_SQL = (f"INSERT INTO match_shot ({', '.join(SHOT_BATCH_COLUMNS)}) "
+                   f"VALUES ({', '.join(f'%({col})s' for col in SHOT_BATCH_COLUMNS)}) "
+                   f"ON CONFLICT (shot_id) DO NOTHING")
+MISC_INSERT_PREPARED = PreparedStatement('bench_misc_insert', MISC_INSERT_SQL)
+MISC_UPDATE_PREPARED = PreparedStatement('bench_misc_update', MISC_UPDATE_SQL)
+SHOT_INSERT_PREPARED = PreparedStatement('bench_shot_insert', SHOT_INSERT_SQL)
+
+
+def misc_tuple(record: Dict) -> tuple:
+    return tuple(record[col] for col in MISC_COLUMNS)
+
+
+def misc_update_tuple(record: Dict) -> tuple:
+    return tuple(record[col] for col in MISC_STAT_COLUMNS) + (record['match_player_id'],)
+
+
+def misc_insert_per_row(conn, batch: List[Dict]):
+    cursor = conn.cursor()
+    for record in batch:
+        cursor.execute(MISC_INSERT_SQL, misc_tuple(record))
+    cursor.close()
+
+
+def misc_insert_execute_batch(conn, batch: List[Dict]):
+    cursor = conn.cursor()
+    execute_batch(cursor, MISC_INSERT_SQL, [misc_tuple(record) for record in batch])
+    cursor.close()
+
+
+def misc_insert_execute_values(conn, batch: List[Dict]):
+    cursor = conn.cursor()
+    execute_values(cursor, f"INSERT INTO match_player_misc ({', '.join(MISC_COLUMNS)}) VALUES %s",
+                   [misc_tuple(record) for record in batch], page_size=len(batch))
+    cursor.close()
+
+
+def misc_update_per_row(conn, batch: List[Dict]):
+    cursor = conn.cursor()
+    for record in batch:
+        cursor.execute(MISC_UPDATE_SQL, misc_update_tuple(record))
+    cursor.close()
+
+
+def misc_update_execute_batch(conn, batch: List[Dict]):
+    cursor = conn.cursor()
+    execute_batch(cursor, MISC_UPDATE_SQL, [misc_update_tuple(record) for record in batch])
+    cursor.close()
+
+
+def misc_update_execute_values(conn, batch: List[Dict]):
+    cursor = conn.cursor()
+    template = '(' + ', '.join(f'%s::{MISC_TYPES[col]}' for col in MISC_COLUMNS) + ')'
+    execute_values(cursor, f"""
+        UPDATE match_player_misc t SET {', '.join(f'{col} = v.{col}' for col in MISC_STAT_COLUMNS)}
+        FROM (VALUES %s) AS v ({', '.join(MISC_COLUMNS)})
+        WHERE t.match_player_id = v.match_player_id
+    """, [misc_tuple(record) for record in batch], template=template, page_size=len(batch))
+    cursor.close()
+
+
+def misc_copy_merge(conn, batch: List[Dict]):
+    BulkLoader(conn).load('match_player_misc', batch)
+
+
+def misc_values_merge(conn, batch: List[Dict]):
+    BulkLoader(conn).load('match_player_misc', batch, method='values')
+
+
+def shot_insert_execute_batch(conn, batch: List[Dict]):
+    cursor = conn.cursor()
+    execute_batch(cursor, SHOT_INSERT_SQL, batch)
+    cursor.close()
+
+
+def shot_insert_execute_values(conn, batch: List[Dict]):
+    cursor = conn.cursor()
+    execute_values(cursor, f"INSERT INTO match_shot ({', '.join(SHOT_VALUES_COLUMNS)}) VALUES %s",
+                   [tuple(record[col] for col in SHOT_VALUES_COLUMNS) for record in batch],
+                   page_size=len(batch))
+    cursor.close()
+
+
+def shot_copy_merge(conn, batch: List[Dict]):
+    BulkLoader(conn).load('match_shot', batch, SHOT_COLUMNS)
+
+
+def misc_insert_prepared(conn, batch: List[Dict]):
+    cursor = conn.cursor()
+    MISC_INSERT_PREPARED.execute_many(cursor, [misc_tuple(record) for record in batch])
+    cursor.close()
+
+
+def misc_update_prepared(conn, batch: List[Dict]):
+    cursor = conn.cursor()
+    MISC_UPDATE_PREPARED.execute_many(cursor, [misc_update_tuple(record) for record in batch])
+    cursor.close()
+
+
+def shot_insert_prepared(conn, batch: List[Dict]):
+    cursor = conn.cursor()
+    SHOT_INSERT_PREPARED.execute_many(cursor, batch)
+    cursor.close()
+
+
+def misc_insert_pipeline(conn, batch: List[Dict]):
+    executemany(conn, MISC_INSERT_SQL, [misc_tuple(record) for record in batch])
+
+
+def misc_update_pipeline(conn, batch: List[Dict]):
+    executemany(conn, MISC_UPDATE_SQL, [misc_update_tuple(record) for record in batch])
+
+
+def shot_insert_pipeline(conn, batch: List[Dict]):
+    executemany(conn, SHOT_INSERT_SQL, batch)
+
+
+STRATEGIES: Dict[str, Dict[str, Callable]] = {
+    'misc_insert': {
+        'per_row': misc_insert_per_row,
+        'execute_batch': misc_insert_execute_batch,
+        'execute_values': misc_insert_execute_values,
+        'copy_merge': misc_copy_merge,
+        'values_merge': misc_values_merge,
+        'prepared': misc_insert_prepared,
+        'pipeline': misc_insert_pipeline,
+    },
+    'misc_update': {
+        'per_row': misc_update_per_row,
+        'execute_batch': misc_update_execute_batch,
+        'execute_values': misc_update_execute_values,
+        'copy_merge': misc_copy_merge,
+        'values_merge': misc_values_merge,
+        'prepared': misc_update_prepared,
+        'pipeline': misc_update_pipeline,
+    },
+    'shot_insert': {
+        'execute_batch': shot_insert_execute_batch,
+        'execute_values': shot_insert_execute_values,
+        'copy_merge': shot_copy_merge,
+        'prepared': shot_insert_prepared,
+        'pipeline': shot_insert_pipeline,
+    },
+}
+STRATEGIES['misc_rerun'] = STRATEGIES['misc_update']
+
+
+# ----------------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------------
+
+def prepare(conn, workload: str, data: Dict):
+    """Reset the target table to the workload's starting state (untimed)."""
+    cursor = conn.cursor()
+    if workload == 'shot_insert':
+        cursor.execute("TRUNCATE match_shot")
+    else:
+        cursor.execute("TRUNCATE match_player_misc")
+        if workload in ('misc_update', 'misc_rerun'):
+            BulkLoader(conn).load('match_player_misc', data['misc_v0'])
+    conn.commit()
+    cursor.execute("VACUUM ANALYZE match_shot" if workload == 'shot_insert' else "VACUUM ANALYZE match_player_misc")
+    cursor.execute("CHECKPOINT")
+    cursor.close()
+
+
+def wal_position(conn) -> str:
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_current_wal_lsn()")
+    lsn = cursor.fetchone()[0]
+    cursor.close()
+    return lsn
+
+
+def wal_bytes_since(conn, lsn: str) -> int:
+    cursor = conn.cursor()
+    cursor.execute("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), %s)", (lsn,))
+    written = int(cursor.fetchone()[0])
+    cursor.close()
+    return written
+
+
+def run_case(params: Dict, workload: str, strategy: str, batch_size: int, data: Dict, repeat: int) -> Dict:
+    """Time one strategy over the workload's records; the fastest of repeat passes is kept."""
+    records = data['shots'] if workload == 'shot_insert' else \
+        data['misc_v0'] if workload == 'misc_rerun' else \
+        data['misc_v1'] if workload == 'misc_update' else data['misc_v0']
+    write = STRATEGIES[workload][strategy]
+    admin = psycopg2.connect(**params)
+    admin.autocommit = True
+    best = None
+    for _ in range(max(repeat, 1)):
+        prepare(admin, workload, data)
+        metrics = start_run(f'{workload}-{strategy}-{batch_size}')
+        conn = connect_pipelined(**params) if strategy == 'pipeline' else metered_connect(**params)
+        lsn = wal_position(admin)
+        started = time.perf_counter()
+        for offset in range(0, len(records), batch_size):
+            write(conn, records[offset:offset + batch_size])
+            conn.commit()
+        seconds = time.perf_counter() - started
+        wal = wal_bytes_since(admin, lsn)
+        conn.close()
+        round_trips = sum(counters.get('db_round_trips', 0) for counters in metrics.snapshot()['stages'].values())
+        if best is None or seconds < best['seconds']:
+            best = {
+                'rows': len(records),
+                'seconds': round(seconds, 4),
+                'rows_per_sec': round(len(records) / seconds, 1) if seconds else 0.0,
+                'db_round_trips': int(round_trips),
+                'wal_mb': round(wal / (1024 * 1024), 3),
+            }
+    admin.close()
+    return best
+
+
+def main():
+    """Run the write-path benchmarks."""
+    parser = argparse.ArgumentParser(description='Benchmark database write strategies against a local Postgres')
+    parser.add_argument('--server', choices=SERVER_MODES, default='existing', help='Where Postgres comes from')
+    parser.add_argument('--host', default=SERVER_DEFAULTS['host'])
+    parser.add_argument('--port', type=int, default=SERVER_DEFAULTS['port'])
+    parser.add_argument('--user', default=SERVER_DEFAULTS['user'])
+    parser.add_argument('--password', default=SERVER_DEFAULTS['password'])
+    parser.add_argument('--pg-bin', help='Directory with initdb, pg_ctl and psql (default: PATH)')
+    parser.add_argument('--database', default=BENCH_DATABASE, help='Scratch database (dropped and recreated)')
+    parser.add_argument('--only', help=f"Comma-separated workloads (default: all of {', '.join(WORKLOADS)})")
+    parser.add_argument('--rows', type=int, default=DEFAULT_ROWS, help='Records written per case')
+    parser.add_argument('--batch-sizes', default=','.join(map(str, DEFAULT_BATCH_SIZES)),
+                        help='Comma-separated records per commit')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Data seed')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Passes per case (best is kept)')
+    parser.add_argument('--save-baseline', action='store_true', help='Save results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='Compare with the saved baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative change that counts as a regression')
+    args = parser.parse_args()
+
+    workloads = args.only.split(',') if args.only else list(WORKLOADS)
+    unknown = [workload for workload in workloads if workload not in WORKLOADS]
+    if unknown:
+        parser.error(f"Unknown workloads: {', '.join(unknown)}")
+    batch_sizes = [int(size) for size in args.batch_sizes.split(',')]
+
+    server = {'host': args.host, 'port': args.port, 'user': args.user, 'password': args.password}
+    if args.server == 'compose':
+        server = start_compose(server)
+    elif args.server == 'initdb':
+        server = start_initdb(args.pg_bin, args.port)
+    create_database(args.pg_bin, server, args.database)
+    params = dict(server, dbname=args.database)
+
+    conn = psycopg2.connect(**params)
+    match_player_ids = seed_match_players(conn, args.rows, args.seed)
+    conn.close()
+    data = {
+        'misc_v0': misc_records(match_player_ids, args.seed, 0),
+        'misc_v1': misc_records(match_player_ids, args.seed, 1),
+        'shots': shot_records(args.rows, args.seed),
+    }
+    run_params = {'rows': args.rows, 'batch_sizes': batch_sizes, 'seed': args.seed, 'repeat': args.repeat}
+
+    results = {}
+    for workload in workloads:
+        for strategy in WORKLOADS[workload]:
+            for batch_size in batch_sizes:
+                case = f'{workload}/{strategy}/{batch_size}'
+                logger.info(f"Running {case}")
+                results[case] = run_case(params, workload, strategy, batch_size, data, args.repeat)
+    for workload in workloads:
+        print(f"\n{workload} ({args.rows:,} rows)")
+        print_table({case.split('/', 1)[1]: metrics for case, metrics in results.items()
+                     if case.startswith(f'{workload}/')}, RESULT_COLUMNS)
+
+    regressions = []
+    if args.compare:
+        baseline = load_baseline(BASELINE_NAME)
+        if baseline is None:
+            logger.warning("No saved baseline to compare with; run with --save-baseline first")
+        elif baseline['params'] != run_params:
+            logger.warning(f"Baseline was recorded with {baseline['params']}, not {run_params}; not comparing")
+        else:
+            regressions = compare_to_baseline(results, baseline, HIGHER_IS_BETTER, LOWER_IS_BETTER, args.threshold)
+    if args.save_baseline:
+        logger.info(f"Baseline saved to {save_baseline(BASELINE_NAME, results, run_params)}")
+    if regressions:
+        print(f"\n{len(regressions)} regressions past {args.threshold:.0%}: " + '; '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Benchmark every HTML parse path on a synthetic FBref corpus.
+
+One case per extractor parse function, each run the way its extractor
+calls it for one match file (read + parse + extract; no database):
+
+    passing         FBrefPassingFullExtractor.extract_all_passing_data
+    possession      FBrefPossessionExtractor.extract_possession_table
+    misc            BatchMiscStatsExtractor.extract_misc_stats_from_html
+    defense         extract_defensive_actions_from_html
+    keeper_stats    extract_goalkeeper_table + process_goalkeeper_row
+    passing_types   PassTypesExtractor.parse_pass_types_table
+    shots           ShotDataExtractor.extract_shot_data_from_html
+    shots_all       CompleteShotDataExtractor.extract_shot_data_from_html
+    lineups         extract_lineup_from_html
+    team_stats      TeamPerformanceExtractor.parse_team_stats_table
+
+Pages are parsed from the file every time (the parsed-table cache and the
+table index are not used), and player / match_player mappings are built
+from the corpus manifest the way load_all() and player_mapping() would
+have loaded them. Each case runs in its own process and reports files/sec,
+rows/sec, peak RSS and the read / parse / extract split from etl_metrics.
+Extractor prints and INFO logs are discarded while timing.
+
+Usage:
+    python benchmarks/bench_parsers.py                        # all cases, 200 matches
+    python benchmarks/bench_parsers.py --only misc,shots_all --matches 50
+    python benchmarks/bench_parsers.py --save-baseline        # record benchmarks/baselines/parsers.json
+    python benchmarks/bench_parsers.py --compare              # exit 1 on a >10% regression
+"""
+
+import os
+import sys
+import uuid
+import logging
+import argparse
+import contextlib
+from typing import Callable, Dict
+
+from bench_common import (CORPUS_DIR, DEFAULT_THRESHOLD, best_of, compare_to_baseline, load_baseline,
+                          peak_rss_mb, print_table, run_isolated, save_baseline)
+from synthetic_corpus import DEFAULT_MATCHES, DEFAULT_PADDING_KB, DEFAULT_SEED, ensure_corpus, match_player_rows
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+BASELINE_NAME = 'parsers'
+DEFAULT_REPEAT = 3
+
+CASES = ['passing', 'possession', 'misc', 'defense', 'keeper_stats', 'passing_types',
+         'shots', 'shots_all', 'lineups', 'team_stats']
+
+RESULT_COLUMNS = [
+    ('files', 'files', ',d'), ('rows', 'rows', ',d'), ('seconds', 'seconds', '.2f'),
+    ('files_per_sec', 'files/s', ',.1f'), ('rows_per_sec', 'rows/s', ',.0f'),
+    ('peak_rss_mb', 'peak RSS MB', '.0f'), ('rss_growth_mb', 'RSS growth MB', '.1f'),
+    ('parse_share', 'parse %', '.0%'), ('extract_share', 'extract %', '.0%'),
+]
+HIGHER_IS_BETTER = ['files_per_sec', 'rows_per_sec']
+LOWER_IS_BETTER = ['peak_rss_mb']
+
+
+def team_season_id(team_id: str, season: int) -> str:
+    """Synthetic team_season.id for a team and season."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f'fbref-synthetic/team_season/{team_id}/{season}'))
+
+
+def match_data(match: Dict) -> Dict:
+    """The match row an extractor would have read from the database."""
+    return {
+        'match_id': match['match_id'],
+        'match_date': match['match_date'],
+        'season_id': match['season'],
+        'home_team_season_id': team_season_id(match['home']['team_id'], match['season']),
+        'away_team_season_id': team_season_id(match['away']['team_id'], match['season']),
+        'home_team_name': match['home']['name'],
+        'away_team_name': match['away']['name'],
+        'home_team': match['home']['name'],
+        'away_team': match['away']['name'],
+        'match_type_name': 'Regular Season',
+        'match_subtype_name': None,
+    }
+
+
+def preloaded_resolver(manifest: Dict):
+    """A MatchPlayerResolver holding every corpus match_player row, as after load_all()."""
+    from compact_ids import CompactIdMap
+    from match_player_resolver import MatchPlayerResolver
+    resolver = MatchPlayerResolver(None)
+    resolver.ids = CompactIdMap.from_rows(match_player_rows(manifest), pairs=True)
+    resolver.all_loaded = True
+    return resolver
+
+
+def corpus_player_mapping(manifest: Dict):
+    from compact_ids import CompactPlayerMap
+    return CompactPlayerMap.from_rows(manifest['players'])
+
+
+def build_case(name: str, manifest: Dict) -> Callable[[str, Dict], int]:
+    """run(path, match) -> rows extracted from one file, for one case."""
+    from fbref_table_cache import get_stat_tables
+    from fbref_tables import parse_html_file
+
+    if name == 'passing':
+        from extract_fbref_passing_full import FBrefPassingFullExtractor
+        extractor = FBrefPassingFullExtractor({})
+
+        def run(path, match):
+            return len(extractor.extract_all_passing_data(path, parse_html_file(path)))
+
+    elif name == 'possession':
+        from extract_fbref_possession_full import FBrefPossessionExtractor, POSSESSION_TABLE_RE
+        extractor = FBrefPossessionExtractor({})
+
+        def run(path, match):
+            rows = 0
+            for team_match, stat_table in get_stat_tables(path, POSSESSION_TABLE_RE, parse_html_file(path)):
+                df = extractor.extract_possession_table(stat_table, team_match.group(1))
+                rows += len(df) if df is not None else 0
+            return rows
+
+    elif name == 'misc':
+        from extract_misc_stats_batch import BatchMiscStatsExtractor
+        extractor = BatchMiscStatsExtractor()
+        extractor.resolver = preloaded_resolver(manifest)
+
+        def run(path, match):
+            return len(extractor.extract_misc_stats_from_html(path, parse_html_file(path)))
+
+    elif name == 'defense':
+        from extract_defensive_actions import extract_defensive_actions_from_html
+
+        def run(path, match):
+            return len(extract_defensive_actions_from_html(path, parse_html_file(path)))
+
+    elif name == 'keeper_stats':
+        from extract_goalkeeper_data_accurate import KEEPER_TABLE_RE, extract_goalkeeper_table, process_goalkeeper_row
+        from fbref_tables import iter_tables
+
+        def run(path, match):
+            root = parse_html_file(path)
+            info = match_data(match)
+            rows = 0
+            for _, table in iter_tables(root, KEEPER_TABLE_RE):
+                df = extract_goalkeeper_table(root, table.get('id'))
+                if df is None:
+                    continue
+                for _, row in df.iterrows():
+                    rows += process_goalkeeper_row(row.to_dict(), match['match_id'], info) is not None
+            return rows
+
+    elif name == 'passing_types':
+        from extract_pass_types_comprehensive import PASS_TYPES_TABLE_RE, PassTypesExtractor
+        extractor = PassTypesExtractor()
+
+        def run(path, match):
+            rows = 0
+            for team_match, stat_table in get_stat_tables(path, PASS_TYPES_TABLE_RE, parse_html_file(path)):
+                rows += len(extractor.parse_pass_types_table(stat_table, match['match_id'], team_match.group(1)))
+            return rows
+
+    elif name == 'shots':
+        from extract_shot_data import ShotDataExtractor
+        extractor = ShotDataExtractor({}, CORPUS_DIR)
+        extractor.player_mapping = corpus_player_mapping(manifest)
+
+        def run(path, match):
+            return len(extractor.extract_shot_data_from_html(path, match['match_id']))
+
+    elif name == 'shots_all':
+        from extract_shot_data_complete import CompleteShotDataExtractor
+        extractor = CompleteShotDataExtractor({}, [CORPUS_DIR])
+        extractor.player_mapping = corpus_player_mapping(manifest)
+
+        def run(path, match):
+            return len(extractor.extract_shot_data_from_html(path, match['match_id']))
+
+    elif name == 'lineups':
+        from extract_comprehensive_lineups_v3 import extract_lineup_from_html
+        players = corpus_player_mapping(manifest)
+        team_season_map, fbref_to_uuid_map = {}, {}
+        for team in manifest['teams']:
+            fbref_to_uuid_map[team['team_id']] = team['uuid']
+        for match in manifest['matches']:
+            for side in ('home', 'away'):
+                team = match[side]
+                team_season_map[team_season_id(team['team_id'], match['season'])] = {
+                    'fbref_team_id': team['team_id'], 'name': team['name'], 'alt_name': None}
+
+        def run(path, match):
+            return len(extract_lineup_from_html(path, match_data(match), players,
+                                                team_season_map, fbref_to_uuid_map))
+
+    elif name == 'team_stats':
+        from extract_team_performance import TeamPerformanceExtractor
+        extractor = TeamPerformanceExtractor()
+
+        def run(path, match):
+            return len(extractor.extract_team_stats_from_html(path, match_data(match), parse_html_file(path)))
+
+    else:
+        raise ValueError(f"Unknown case {name!r}; choose from {', '.join(CASES)}")
+    return run
+
+
+def run_case(name: str, directory: str, manifest: Dict, repeat: int) -> Dict:
+    """Time one case over the corpus (in the current process); returns its metrics."""
+    from etl_metrics import start_run
+
+    matches = manifest['matches']
+    paths = [os.path.join(directory, match['file']) for match in matches]
+    run = build_case(name, manifest)
+    metrics = start_run(f'bench_{name}')
+
+    def one_pass() -> int:
+        rows = 0
+        for path, match in zip(paths, matches):
+            with metrics.stage(name):
+                rows += run(path, match)
+        return rows
+
+    logging.disable(logging.INFO)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        run(paths[0], matches[0])  # warm imports and lazy initialisation
+        rss_before = peak_rss_mb()
+        metrics.reset(f'bench_{name}')
+        seconds, rows = best_of(repeat, one_pass)
+    logging.disable(logging.NOTSET)
+
+    counters = metrics.snapshot()['stages'].get(name, {})
+    wall = counters.get('wall_seconds') or 1.0
+    return {
+        'files': len(paths),
+        'rows': rows,
+        'seconds': seconds,
+        'files_per_sec': len(paths) / seconds,
+        'rows_per_sec': rows / seconds,
+        'peak_rss_mb': peak_rss_mb(),
+        'rss_growth_mb': peak_rss_mb() - rss_before,
+        'read_share': counters.get('read_seconds', 0.0) / wall,
+        'parse_share': counters.get('parse_seconds', 0.0) / wall,
+        'extract_share': counters.get('extract_seconds', 0.0) / wall,
+    }
+
+
+def main():
+    """Run the parser benchmarks."""
+    parser = argparse.ArgumentParser(description='Benchmark FBref HTML parse paths on a synthetic corpus')
+    parser.add_argument('--only', help=f"Comma-separated cases (default: all of {', '.join(CASES)})")
+    parser.add_argument('--matches', type=int, default=DEFAULT_MATCHES, help='Synthetic match files')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Corpus seed')
+    parser.add_argument('--padding-kb', type=int, default=DEFAULT_PADDING_KB, help='Non-table filler per page')
+    parser.add_argument('--corpus-dir', default=CORPUS_DIR, help='Where the corpus is generated')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Passes per case (best is kept)')
+    parser.add_argument('--save-baseline', action='store_true', help='Save results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='Compare with the saved baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative change that counts as a regression')
+    args = parser.parse_args()
+
+    cases = args.only.split(',') if args.only else CASES
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"Unknown cases: {', '.join(unknown)}")
+
+    directory = os.path.join(args.corpus_dir, f'seed{args.seed}-{args.matches}-{args.padding_kb}kb')
+    manifest = ensure_corpus(directory, args.matches, args.seed, args.padding_kb)
+    params = {'matches': args.matches, 'seed': args.seed, 'padding_kb': args.padding_kb, 'repeat': args.repeat}
+
+    results = {}
+    for case in cases:
+        logger.info(f"Running {case} over {len(manifest['matches'])} files")
+        results[case] = run_isolated(run_case, case, directory, manifest, args.repeat)
+    print()
+    print_table(results, RESULT_COLUMNS)
+
+    regressions = []
+    if args.compare:
+        baseline = load_baseline(BASELINE_NAME)
+        if baseline is None:
+            logger.warning("No saved baseline to compare with; run with --save-baseline first")
+        elif baseline['params'] != params:
+            logger.warning(f"Baseline was recorded with {baseline['params']}, not {params}; not comparing")
+        else:
+            regressions = compare_to_baseline(results, baseline, HIGHER_IS_BETTER, LOWER_IS_BETTER, args.threshold)
+    if args.save_baseline:
+        logger.info(f"Baseline saved to {save_baseline(BASELINE_NAME, results, params)}")
+    if regressions:
+        print(f"\n{len(regressions)} regressions past {args.threshold:.0%}: " + '; '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+-- =====================================================
+-- WRITE-PATH BENCHMARK TABLES
+-- Applied by bench_db_writes.py after schema_postgres.sql and migrations/
+-- =====================================================
+
+-- schema_postgres.sql is a dump of the pre-UUID sqlite import: its
+-- match_player_misc keys are text and its match_shot has no player_uuid.
+-- The extractors write the post-migration shape, so the tables the
+-- benchmark writes to are recreated here in that shape. match_shot carries
+-- both the extract_shot_data.py columns (shot_id, squad, outcome_id) and
+-- the rebuild/bulk_loader ones (team_name, outcome, season_year).
+-- season, team_season, player and match are recreated the same way, with
+-- the columns the extractors query, so scale_corpus.py seed rows load.
+
+BEGIN;
+
+DROP TABLE IF EXISTS match_player_misc CASCADE;
+DROP TABLE IF EXISTS match_shot CASCADE;
+DROP TABLE IF EXISTS match_player CASCADE;
+DROP TABLE IF EXISTS match CASCADE;
+DROP TABLE IF EXISTS player CASCADE;
+DROP TABLE IF EXISTS team_season CASCADE;
+DROP TABLE IF EXISTS season CASCADE;
+
+CREATE TABLE season (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    season_id bigint UNIQUE,
+    season_year bigint,
+    league_name text
+);
+
+CREATE TABLE team_season (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    team_season_id text,
+    team_id text,
+    season_id bigint,
+    team_name_season_1 text,
+    team_name_season_2 text
+);
+
+CREATE INDEX idx_team_season_team_season ON team_season(team_id, season_id);
+
+CREATE TABLE player (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    player_id text UNIQUE,
+    player_name text
+);
+
+CREATE TABLE match (
+    match_id text PRIMARY KEY,
+    match_date date,
+    season_id bigint,
+    season_uuid uuid REFERENCES season(id),
+    home_team_id text,
+    away_team_id text,
+    home_team_name text,
+    away_team_name text,
+    home_team_season_id uuid REFERENCES team_season(id),
+    away_team_season_id uuid REFERENCES team_season(id),
+    home_goals bigint,
+    away_goals bigint,
+    xg_home real,
+    xg_away real
+);
+
+CREATE TABLE match_player (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    match_id text NOT NULL,
+    player_id text NOT NULL,
+    player_name text,
+    team_season_id uuid,
+    minutes_played integer,
+    started boolean,
+    match_date date,
+    season_id integer,
+    UNIQUE (match_id, player_id)
+);
+
+CREATE TABLE match_player_misc (
+    id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+    match_player_id uuid UNIQUE REFERENCES match_player(id),
+    yellow_cards integer,
+    red_cards integer,
+    second_yellow_cards integer,
+    fouls_committed integer,
+    fouled integer,
+    offsides integer,
+    crosses integer,
+    interceptions integer,
+    tackles_won integer,
+    penalty_kicks_won integer,
+    penalty_kicks_conceded integer,
+    own_goals integer,
+    ball_recoveries integer,
+    aerial_duels_won integer,
+    aerial_duels_lost integer,
+    aerial_duels_won_pct numeric,
+    stats_fingerprint text
+);
+
+CREATE TABLE match_shot (
+    shot_id text PRIMARY KEY DEFAULT gen_random_uuid()::text,
+    match_id text,
+    minute integer,
+    player_name text,
+    player_id text,
+    squad text,
+    team_name text,
+    xg numeric,
+    psxg numeric,
+    outcome_id text,
+    outcome text,
+    distance integer,
+    body_part text,
+    notes text,
+    sca1_player_name text,
+    sca1_event text,
+    sca2_player_name text,
+    sca2_event text,
+    player_uuid uuid,
+    season_year integer
+);
+
+CREATE INDEX idx_match_shot_match_id ON match_shot(match_id);
+
+COMMIT;
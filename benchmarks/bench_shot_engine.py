@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+Benchmark the shot engine against the shots_all parse paths it replaced.
+
+One case per way shots_all has been read, each run over every match file
+(read + parse + extract into write-path records; no database):
+
+    read_html       BeautifulSoup find + pd.read_html(str(table)) + iterrows
+                    (the original extract_shot_data.py)
+    soup_rows       BeautifulSoup per-row cells, 13 or more cells required
+                    (extract_shot_data_complete.py before the engine)
+    positional      BeautifulSoup tbody rows read as cells[0..12], integer
+                    minutes only (the original rebuild_match_shot_table.py)
+    stat_table      fbref_tables.load_stat_table dict rows keyed by data-stat
+                    (extract_shot_data.py / the rebuild before the engine)
+    engine          fbref_shot_engine.read_shots + match_shot records
+
+The old paths are kept here, as they were, only to be timed. rows is the
+number of shots each path keeps, so differences in coverage show up next to
+the speed; engine_speedup is how many times faster engine is than each case.
+
+The corpus is the synthetic one (synthetic_corpus.py) unless --html-dir
+points at a directory of real match_*.html files, e.g. the full FBref
+corpus; every match_*.html there is used.
+
+Usage:
+    python benchmarks/bench_shot_engine.py                              # synthetic, 200 matches
+    python benchmarks/bench_shot_engine.py --html-dir ~/nwsl/html_files  # full corpus
+    python benchmarks/bench_shot_engine.py --only soup_rows,engine --repeat 1
+    python benchmarks/bench_shot_engine.py --save-baseline / --compare
+"""
+
+import os
+import re
+import sys
+import logging
+import argparse
+import contextlib
+from io import StringIO
+from typing import Callable, Dict, List, Optional
+
+from bench_common import (CORPUS_DIR, DEFAULT_THRESHOLD, best_of, compare_to_baseline, load_baseline,
+                          peak_rss_mb, print_table, run_isolated, save_baseline)
+from synthetic_corpus import DEFAULT_MATCHES, DEFAULT_PADDING_KB, DEFAULT_SEED, ensure_corpus
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+BASELINE_NAME = 'shot_engine'
+DEFAULT_REPEAT = 3
+
+CASES = ['read_html', 'soup_rows', 'positional', 'stat_table', 'engine']
+
+RESULT_COLUMNS = [
+    ('files', 'files', ',d'), ('rows', 'rows', ',d'), ('seconds', 'seconds', '.2f'),
+    ('files_per_sec', 'files/s', ',.1f'), ('rows_per_sec', 'rows/s', ',.0f'),
+    ('peak_rss_mb', 'peak RSS MB', '.0f'), ('engine_speedup', 'engine x', '.1f'),
+]
+HIGHER_IS_BETTER = ['files_per_sec', 'rows_per_sec']
+LOWER_IS_BETTER = ['peak_rss_mb']
+
+SHOT_ROW_CLASS_RE = re.compile(r'shots_[a-z0-9]+')
+
+
+def corpus_files(html_dir: str) -> List[Dict]:
+    """{'match_id', 'file'} for every match_*.html in a directory of real pages."""
+    files = sorted(f for f in os.listdir(html_dir) if f.startswith('match_') and f.endswith('.html'))
+    return [{'match_id': f[len('match_'):-len('.html')], 'file': f} for f in files]
+
+
+def _minute(text) -> Optional[int]:
+    """The old extractors' minute parse ("45+2" -> 47)."""
+    try:
+        if '+' in str(text):
+            base, added = str(text).split('+')[:2]
+            return int(base) + int(added)
+        return int(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _float(text) -> Optional[float]:
+    try:
+        return float(text) if text not in (None, '', '—') else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _shot(match_id: str, minute, player_name, player_id, cells: List) -> Dict:
+    """A match_shot record from the cells after minute and player (text, in column order)."""
+    team, xg, psxg, outcome, distance, body_part, notes = cells[:7]
+    sca = list(cells[7:11]) + [None] * (4 - len(cells[7:11]))
+    return {
+        'match_id': match_id, 'minute': minute, 'player_name': player_name, 'player_id': player_id,
+        'team_name': team, 'xg': _float(xg), 'psxg': _float(psxg), 'outcome': outcome,
+        'distance': _float(distance), 'body_part': body_part or None, 'notes': notes or None,
+        'sca1_player_name': sca[0] or None, 'sca1_event': sca[1] or None,
+        'sca2_player_name': sca[2] or None, 'sca2_event': sca[3] or None,
+    }
+
+
+def build_case(name: str, players) -> Callable[[str, str], int]:
+    """run(path, match_id) -> shots kept from one file, for one case."""
+    from fbref_tables import read_html_file
+
+    def player_uuid(player_id):
+        player = players.get(player_id) if player_id else None
+        return player['uuid'] if player else None
+
+    if name == 'read_html':
+        import pandas as pd
+        from bs4 import BeautifulSoup
+
+        def run(path, match_id):
+            table = BeautifulSoup(read_html_file(path), 'html.parser').find('table', {'id': 'shots_all'})
+            if table is None:
+                return 0
+            df = pd.read_html(StringIO(str(table)))[0]
+            if isinstance(df.columns, pd.MultiIndex):
+                df.columns = df.columns.get_level_values(-1)
+            df = df.loc[:, ~df.columns.duplicated()]
+            shots = []
+            for idx, row in df.iterrows():
+                minute = _minute(row.get('Minute'))
+                player_name = row.get('Player')
+                if minute is None or pd.isna(player_name) or not player_name:
+                    continue
+                cells = [row.get(col) for col in ('Squad', 'xG', 'PSxG', 'Outcome', 'Distance',
+                                                  'Body Part', 'Notes')]
+                shots.append(_shot(match_id, minute, player_name, None,
+                                   [None if pd.isna(value) else value for value in cells]))
+            return len(shots)
+
+    elif name in ('soup_rows', 'positional'):
+        from bs4 import BeautifulSoup
+
+        def run(path, match_id):
+            table = BeautifulSoup(read_html_file(path), 'html.parser').find('table', {'id': 'shots_all'})
+            if table is None:
+                return 0
+            if name == 'soup_rows':
+                rows = table.find_all('tr', class_=SHOT_ROW_CLASS_RE)
+            else:
+                tbody = table.find('tbody')
+                rows = tbody.find_all('tr') if tbody else []
+            shots = []
+            for row in rows:
+                if {'thead', 'over_header', 'spacer'}.intersection(row.get('class', [])):
+                    continue
+                cells = row.find_all(['td', 'th'])
+                if len(cells) < 13:
+                    continue
+                texts = [cell.get_text(strip=True) for cell in cells[:13]]
+                if name == 'soup_rows':
+                    minute = _minute(texts[0])
+                else:
+                    minute = int(texts[0]) if texts[0].isdigit() else None
+                player_id = cells[1].get('data-append-csv')
+                if not player_id:
+                    link = cells[1].find('a')
+                    parts = link['href'].split('/') if link and link.get('href') else []
+                    player_id = parts[3] if len(parts) >= 4 and parts[2] == 'players' else None
+                if name == 'soup_rows' and (minute is None or not texts[1]):
+                    continue
+                shot = _shot(match_id, minute, texts[1], player_id, texts[2:])
+                shot['player_uuid'] = player_uuid(player_id)
+                shots.append(shot)
+            return len(shots)
+
+    elif name == 'stat_table':
+        from fbref_tables import load_stat_table, parse_html_file
+
+        def run(path, match_id):
+            table = load_stat_table(parse_html_file(path), 'shots_all')
+            if not table:
+                return 0
+            shots = []
+            for row, row_ids in zip(table.rows, table.ids):
+                minute = _minute(row.get('minute', ''))
+                if minute is None or not row.get('player'):
+                    continue
+                cells = [row.get(stat) for stat in ('team', 'xg_shot', 'psxg_shot', 'outcome', 'distance',
+                                                    'body_part', 'notes', 'sca_1_player', 'sca_1_type',
+                                                    'sca_2_player', 'sca_2_type')]
+                shot = _shot(match_id, minute, row['player'], row_ids.get('player'), cells)
+                shot['player_uuid'] = player_uuid(row_ids.get('player'))
+                shots.append(shot)
+            return len(shots)
+
+    elif name == 'engine':
+        from fbref_shot_engine import read_shots_file
+
+        def run(path, match_id):
+            table = read_shots_file(path)
+            return len(table.records(match_id, 'match_shot', player_uuid=player_uuid)) if table else 0
+
+    else:
+        raise ValueError(f"Unknown case {name!r}; choose from {', '.join(CASES)}")
+    return run
+
+
+def run_case(name: str, directory: str, matches: List[Dict], players_rows: List, repeat: int) -> Dict:
+    """Time one case over the corpus (in the current process); returns its metrics."""
+    from compact_ids import CompactPlayerMap
+    from etl_metrics import start_run
+
+    paths = [os.path.join(directory, match['file']) for match in matches]
+    run = build_case(name, CompactPlayerMap.from_rows(players_rows))
+    metrics = start_run(f'bench_{name}')
+
+    def one_pass() -> int:
+        rows = 0
+        for path, match in zip(paths, matches):
+            with metrics.stage(name):
+                rows += run(path, match['match_id'])
+        return rows
+
+    logging.disable(logging.INFO)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        run(paths[0], matches[0]['match_id'])  # warm imports and lazy initialisation
+        seconds, rows = best_of(repeat, one_pass)
+    logging.disable(logging.NOTSET)
+
+    return {
+        'files': len(paths),
+        'rows': rows,
+        'seconds': seconds,
+        'files_per_sec': len(paths) / seconds,
+        'rows_per_sec': rows / seconds,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def main():
+    """Run the shot engine benchmark."""
+    parser = argparse.ArgumentParser(description='Benchmark the shot engine against the old shots_all parsers')
+    parser.add_argument('--only', help=f"Comma-separated cases (default: all of {', '.join(CASES)})")
+    parser.add_argument('--html-dir', help='Directory of real match_*.html files (default: synthetic corpus)')
+    parser.add_argument('--matches', type=int, default=DEFAULT_MATCHES, help='Synthetic match files')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Corpus seed')
+    parser.add_argument('--padding-kb', type=int, default=DEFAULT_PADDING_KB, help='Non-table filler per page')
+    parser.add_argument('--corpus-dir', default=CORPUS_DIR, help='Where the synthetic corpus is generated')
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT, help='Passes per case (best is kept)')
+    parser.add_argument('--save-baseline', action='store_true', help='Save results as the baseline')
+    parser.add_argument('--compare', action='store_true', help='Compare with the saved baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Relative change that counts as a regression')
+    args = parser.parse_args()
+
+    cases = args.only.split(',') if args.only else CASES
+    unknown = [case for case in cases if case not in CASES]
+    if unknown:
+        parser.error(f"Unknown cases: {', '.join(unknown)}")
+
+    if args.html_dir:
+        directory = os.path.abspath(os.path.expanduser(args.html_dir))
+        matches, players_rows = corpus_files(directory), []
+        if not matches:
+            parser.error(f"No match_*.html files in {directory}")
+        params = {'html_dir': directory, 'files': len(matches), 'repeat': args.repeat}
+    else:
+        directory = os.path.join(args.corpus_dir, f'seed{args.seed}-{args.matches}-{args.padding_kb}kb')
+        manifest = ensure_corpus(directory, args.matches, args.seed, args.padding_kb)
+        matches, players_rows = manifest['matches'], manifest['players']
+        params = {'matches': args.matches, 'seed': args.seed, 'padding_kb': args.padding_kb, 'repeat': args.repeat}
+
+    results = {}
+    for case in cases:
+        logger.info(f"Running {case} over {len(matches)} files")
+        results[case] = run_isolated(run_case, case, directory, matches, players_rows, args.repeat)
+    if 'engine' in results:
+        for result in results.values():
+            result['engine_speedup'] = results['engine']['files_per_sec'] / result['files_per_sec']
+    print()
+    print_table(results, RESULT_COLUMNS)
+
+    regressions = []
+    if args.compare:
+        baseline = load_baseline(BASELINE_NAME)
+        if baseline is None:
+            logger.warning("No saved baseline to compare with; run with --save-baseline first")
+        elif baseline['params'] != params:
+            logger.warning(f"Baseline was recorded with {baseline['params']}, not {params}; not comparing")
+        else:
+            regressions = compare_to_baseline(results, baseline, HIGHER_IS_BETTER, LOWER_IS_BETTER, args.threshold)
+    if args.save_baseline:
+        logger.info(f"Baseline saved to {save_baseline(BASELINE_NAME, results, params)}")
+    if regressions:
+        print(f"\n{len(regressions)} regressions past {args.threshold:.0%}: " + '; '.join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
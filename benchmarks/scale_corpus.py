@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Scale-test corpus: 10k-100k match pages cloned from a set of templates.
+
+Each output match is a template page (real FBref match_*.html files from
+--template-dir, or a synthetic_corpus corpus by default) with its IDs and
+numbers rewritten:
+
+  - the match, team and player hex IDs are remapped to fresh unique ones.
+    Matches are split into leagues of MATCHES_PER_LEAGUE; within a league a
+    template team or player always maps to the same clone, so players recur
+    across matches the way they do in a real corpus, and the number of
+    players and team_seasons grows with the corpus
+  - team names get the league as suffix, and the /en/matches/<date> links
+    the new match date
+  - numeric stat cells are jittered (counts by -1..+1, decimals by up to
+    15%); per-table totals are not re-balanced
+
+Seed rows for the clones are written as CSV under seed/ - season,
+team_season, player, match and match_player, with the columns the
+extractors and validate_data_consistency.py query - and load_seed() COPYs
+them into a database (see bench_schema.sql). A scale.json manifest
+records the parameters and counts.
+
+Output is deterministic for a given seed and template set. Pages are
+written without filler by default (about 320KB each for synthetic
+templates, so 100k matches is about 32GB); check the disk first.
+
+Usage:
+    python benchmarks/scale_corpus.py /data/scale10k --matches 10000
+    python benchmarks/scale_corpus.py /data/scale100k --matches 100000 --template-dir html_files
+    python benchmarks/scale_corpus.py /data/scale10k --matches 10000 --load --port 5433
+"""
+
+import os
+import re
+import csv
+import json
+import uuid
+import random
+import hashlib
+import logging
+import argparse
+from datetime import date, timedelta
+from html import escape, unescape
+from typing import Dict, List, Optional, Tuple
+
+import psycopg2
+
+from bench_common import CORPUS_DIR
+from synthetic_corpus import SEASONS, ensure_corpus
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SCALE_VERSION = 1
+MANIFEST_NAME = 'scale.json'
+SEED_DIR = 'seed'
+DEFAULT_SEED = 2024
+DEFAULT_MATCHES = 10000
+DEFAULT_TEMPLATES = 50
+DEFAULT_PADDING_KB = 0
+MATCHES_PER_LEAGUE = 1000
+PROGRESS_EVERY = 5000
+
+# Load order matters: match and match_player reference the rows before them
+SEED_TABLES = {
+    'season': ['id', 'season_id', 'season_year', 'league_name'],
+    'team_season': ['id', 'team_season_id', 'team_id', 'season_id', 'team_name_season_1'],
+    'player': ['id', 'player_id', 'player_name'],
+    'match': ['match_id', 'match_date', 'season_id', 'season_uuid', 'home_team_id', 'away_team_id',
+              'home_team_name', 'away_team_name', 'home_team_season_id', 'away_team_season_id',
+              'home_goals', 'away_goals'],
+    'match_player': ['id', 'match_id', 'player_id', 'player_name', 'team_season_id', 'match_date', 'season_id'],
+}
+
+# Stat cells left as they are: identity columns, and the ones other tables must agree with
+FIXED_STATS = {'shirtnumber', 'age', 'minutes', 'minute', 'goals', 'gk_goals_against'}
+
+DB_DEFAULTS = {'host': 'localhost', 'port': 5433, 'database': 'nwsl_bench', 'user': 'postgres', 'password': 'postgres'}
+
+HEX_ID_RE = re.compile(r'(?<![0-9a-f])[0-9a-f]{8}(?![0-9a-f])')
+MATCH_ID_RE = re.compile(r'/en/matches/([0-9a-f]{8})/')
+MATCH_DATE_RE = re.compile(r'/en/matches/\d{4}-\d{2}-\d{2}')
+FILENAME_ID_RE = re.compile(r'^match_([0-9a-f]{8})\.html$')
+TEAM_TABLE_RE = re.compile(r'id="stats_([0-9a-f]{8})_summary"[^>]*>\s*<caption>(.*?) Player Stats Table</caption>')
+PLAYER_ROW_RE = re.compile(r'data-append-csv="([0-9a-f]{8})"[^>]*>\s*<a href="/en/players/[0-9a-f]{8}/[^"]*">([^<]*)</a>')
+GOAL_CELL_RE = re.compile(r'data-stat="outcome"[^>]*>Goal<')
+STAT_CELL_RE = re.compile(r'(<td[^>]*data-stat="(\w+)"[^>]*>)(\d+(?:\.\d+)?)(%?</td>)')
+# Count jitter, indexed by the low two bits of a noise byte
+JITTER_STEPS = (-1, 0, 0, 1)
+
+
+def table_html(page: str, table_id: str) -> str:
+    """The markup of one table, or '' if the page has none with that id."""
+    start = page.find(f'id="{table_id}"')
+    if start < 0:
+        return ''
+    end = page.find('</table>', start)
+    return page[start:end if end >= 0 else len(page)]
+
+
+def read_template(path: str) -> Optional[Dict]:
+    """Match ID, teams (home first) and players of one match page; None if it isn't one."""
+    with open(path, encoding='utf-8', errors='replace') as f:
+        page = f.read()
+    name_match = FILENAME_ID_RE.match(os.path.basename(path))
+    id_match = MATCH_ID_RE.search(page)
+    match_id = id_match.group(1) if id_match else name_match.group(1) if name_match else None
+    teams = []
+    for team_id, caption in TEAM_TABLE_RE.findall(page):
+        if team_id in (team['team_id'] for team in teams):
+            continue
+        players = [(player_id, unescape(name)) for player_id, name
+                   in PLAYER_ROW_RE.findall(table_html(page, f'stats_{team_id}_summary'))]
+        goals = len(GOAL_CELL_RE.findall(table_html(page, f'shots_{team_id}')))
+        teams.append({'team_id': team_id, 'name': unescape(caption), 'players': players, 'goals': goals})
+    if not match_id or len(teams) != 2:
+        return None
+    return {'path': path, 'page': page, 'match_id': match_id, 'teams': teams}
+
+
+def load_templates(template_dir: Optional[str], count: int, seed: int, padding_kb: int) -> List[Dict]:
+    """Template pages from template_dir, else a synthetic corpus of count matches."""
+    if not template_dir:
+        template_dir = os.path.join(CORPUS_DIR, f'seed{seed}-{count}-{padding_kb}kb')
+        ensure_corpus(template_dir, count, seed, padding_kb)
+    files = sorted(name for name in os.listdir(template_dir) if FILENAME_ID_RE.match(name))[:count]
+    templates = [template for template in (read_template(os.path.join(template_dir, name)) for name in files)
+                 if template]
+    if not templates:
+        raise ValueError(f"No usable match pages in {template_dir}")
+    logger.info(f"Loaded {len(templates)} template pages from {template_dir} "
+                f"({len(files) - len(templates)} skipped)")
+    return templates
+
+
+class IdSpace:
+    """Deterministic unique 8-hex IDs and UUIDs for (kind, key) pairs."""
+
+    def __init__(self, seed: int, reserved=()):
+        self.seed = seed
+        self.ids: Dict[Tuple[str, str], str] = {}
+        self.used = set(reserved)
+
+    def hex_id(self, kind: str, key: str) -> str:
+        if (kind, key) not in self.ids:
+            attempt = 0
+            while True:
+                digest = hashlib.md5(f'{self.seed}:{kind}:{key}:{attempt}'.encode()).hexdigest()[:8]
+                if digest not in self.used:
+                    break
+                attempt += 1
+            self.used.add(digest)
+            self.ids[(kind, key)] = digest
+        return self.ids[(kind, key)]
+
+    def uuid(self, kind: str, key: str) -> str:
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f'fbref-scale/{self.seed}/{kind}/{key}'))
+
+
+def compile_template(template: Dict):
+    """
+    Split a template page into literal text and the slots a clone rewrites.
+
+    Slots are ('id', template id), ('date', None), ('name', (team name, escaped))
+    and ('number', (value, decimals, suffix)); render() fills them, so each
+    clone costs one pass over a list rather than several regex passes.
+    """
+    page = template['page']
+    entity_ids = {template['match_id']} | {team['team_id'] for team in template['teams']} | \
+        {player_id for team in template['teams'] for player_id, _ in team['players']}
+    names = sorted((team['name'] for team in template['teams']), key=len, reverse=True)
+    name_forms = {}
+    for name in names:
+        name_forms.setdefault(escape(name), (name, True))
+        name_forms.setdefault(name, (name, False))
+    pattern = re.compile('|'.join([
+        f'(?P<cell>{STAT_CELL_RE.pattern})', f'(?P<id>{HEX_ID_RE.pattern})', f'(?P<date>{MATCH_DATE_RE.pattern})',
+    ] + ([f"(?P<name>{'|'.join(re.escape(form) for form in name_forms)})"] if name_forms else [])))
+
+    parts, position, numbers = [], 0, 0
+    for found in pattern.finditer(page):
+        kind = found.lastgroup
+        if kind == 'id' and found.group(0) not in entity_ids:
+            continue
+        if kind == 'cell':
+            tag, stat, value, suffix = found.group(2, 3, 4, 5)
+            if stat in FIXED_STATS:
+                continue
+            parts.append(page[position:found.start()] + tag)
+            decimals = len(value.split('.')[1]) if '.' in value else 0
+            parts.append(('number', (float(value) if decimals else int(value), decimals, suffix)))
+            numbers += 1
+        else:
+            parts.append(page[position:found.start()])
+            parts.append((kind, found.group(0) if kind == 'id' else
+                          name_forms[found.group(0)] if kind == 'name' else None))
+        position = found.end()
+    parts.append(page[position:])
+    template['parts'] = parts
+    template['numbers'] = numbers
+    # The raw page is no longer needed; only its size is reported
+    template['size'] = len(page)
+    del template['page']
+
+
+def render(template: Dict, id_map: Dict[str, str], names: Dict[str, str], match_date: date,
+           noise: bytes) -> str:
+    """A clone of a compiled template: IDs, team names and date replaced, numbers jittered by noise."""
+    date_link = f'/en/matches/{match_date.isoformat()}'
+    out, n = [], 0
+    for part in template['parts']:
+        if part.__class__ is str:
+            out.append(part)
+            continue
+        kind, value = part
+        if kind == 'number':
+            number, decimals, suffix = value
+            byte = noise[n]
+            n += 1
+            if decimals:
+                # Up to 15% either way
+                out.append(f'{number * (0.85 + 0.3 * byte / 255):.{decimals}f}{suffix}')
+            else:
+                out.append(f'{max(0, number + JITTER_STEPS[byte & 3])}{suffix}')
+        elif kind == 'id':
+            out.append(id_map[value])
+        elif kind == 'date':
+            out.append(date_link)
+        else:
+            name, escaped = value
+            out.append(escape(names[name]) if escaped else names[name])
+    return ''.join(out)
+
+
+class SeedWriter:
+    """Streams seed rows to one CSV per table."""
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.files = {table: open(os.path.join(directory, f'{table}.csv'), 'w', newline='', encoding='utf-8')
+                      for table in SEED_TABLES}
+        self.writers = {table: csv.DictWriter(f, SEED_TABLES[table]) for table, f in self.files.items()}
+        self.counts = dict.fromkeys(SEED_TABLES, 0)
+        for writer in self.writers.values():
+            writer.writeheader()
+
+    def write(self, table: str, row: Dict):
+        self.writers[table].writerow(row)
+        self.counts[table] += 1
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+
+
+def generate_scale_corpus(directory: str, matches: int = DEFAULT_MATCHES, seed: int = DEFAULT_SEED,
+                          template_dir: Optional[str] = None, templates: int = DEFAULT_TEMPLATES,
+                          padding_kb: int = DEFAULT_PADDING_KB) -> Dict:
+    """Write matches cloned pages and their seed rows into directory; returns the manifest."""
+    sources = load_templates(template_dir, templates, seed, padding_kb)
+    leagues = max(1, -(-matches // MATCHES_PER_LEAGUE))
+    for template in sources:
+        compile_template(template)
+    estimate_gb = matches * sum(t['size'] for t in sources) / len(sources) / 1024 ** 3
+    logger.info(f"Generating {matches:,} matches in {leagues} leagues into {directory} (~{estimate_gb:.1f}GB)")
+
+    os.makedirs(directory, exist_ok=True)
+    # Template IDs are reserved so a clone never reuses one
+    reserved = {t['match_id'] for t in sources} | {team['team_id'] for t in sources for team in t['teams']} | \
+        {player_id for t in sources for team in t['teams'] for player_id, _ in team['players']}
+    ids = IdSpace(seed, reserved)
+    seeds = SeedWriter(os.path.join(directory, SEED_DIR))
+    seen_seasons, seen_team_seasons, seen_players = set(), set(), set()
+
+    for index in range(matches):
+        rng = random.Random(f'{seed}:scale:{index}')
+        template = sources[rng.randrange(len(sources))]
+        league = index * leagues // matches
+        league_name = f'Scale League {league + 1}'
+        season = SEASONS[rng.randrange(len(SEASONS))]
+        match_date = date(season, 3, 15) + timedelta(days=rng.randint(0, 220))
+        match_id = ids.hex_id('match', str(index))
+
+        season_key = f'{league}/{season}'
+        season_uuid = ids.uuid('season', season_key)
+        if season_key not in seen_seasons:
+            seen_seasons.add(season_key)
+            seeds.write('season', {'id': season_uuid, 'season_id': (league + 1) * 10000 + season,
+                                   'season_year': season, 'league_name': league_name})
+
+        id_map = {template['match_id']: match_id}
+        names, clones = {}, []
+        for team in template['teams']:
+            team_id = ids.hex_id('team', f"{league}/{team['team_id']}")
+            name = f"{team['name']} L{league + 1}"
+            id_map[team['team_id']] = team_id
+            names[team['name']] = name
+            team_season_key = f"{league}/{team['team_id']}/{season}"
+            team_season_uuid = ids.uuid('team_season', team_season_key)
+            if team_season_key not in seen_team_seasons:
+                seen_team_seasons.add(team_season_key)
+                seeds.write('team_season', {'id': team_season_uuid, 'team_season_id': f'{team_id}_{season}',
+                                            'team_id': team_id, 'season_id': season,
+                                            'team_name_season_1': name})
+            for player_id, player_name in team['players']:
+                player_key = f'{league}/{player_id}'
+                clone_id = ids.hex_id('player', player_key)
+                id_map[player_id] = clone_id
+                if player_key not in seen_players:
+                    seen_players.add(player_key)
+                    seeds.write('player', {'id': ids.uuid('player', player_key), 'player_id': clone_id,
+                                           'player_name': player_name})
+                seeds.write('match_player', {
+                    'id': ids.uuid('match_player', f'{match_id}/{clone_id}'), 'match_id': match_id,
+                    'player_id': clone_id, 'player_name': player_name, 'team_season_id': team_season_uuid,
+                    'match_date': match_date.isoformat(), 'season_id': season,
+                })
+            clones.append({'team_id': team_id, 'name': name, 'team_season_id': team_season_uuid,
+                           'goals': team['goals']})
+
+        home, away = clones
+        seeds.write('match', {
+            'match_id': match_id, 'match_date': match_date.isoformat(), 'season_id': season,
+            'season_uuid': season_uuid, 'home_team_id': home['team_id'], 'away_team_id': away['team_id'],
+            'home_team_name': home['name'], 'away_team_name': away['name'],
+            'home_team_season_id': home['team_season_id'], 'away_team_season_id': away['team_season_id'],
+            'home_goals': home['goals'], 'away_goals': away['goals'],
+        })
+
+        page = render(template, id_map, names, match_date, rng.randbytes(template['numbers']))
+        with open(os.path.join(directory, f'match_{match_id}.html'), 'w', encoding='utf-8') as f:
+            f.write(page)
+        if (index + 1) % PROGRESS_EVERY == 0:
+            logger.info(f"  {index + 1:,}/{matches:,} matches")
+
+    seeds.close()
+    manifest = {
+        'version': SCALE_VERSION,
+        'seed': seed,
+        'matches': matches,
+        'leagues': leagues,
+        'templates': [os.path.basename(t['path']) for t in sources],
+        'template_dir': os.path.dirname(sources[0]['path']),
+        'seed_rows': seeds.counts,
+    }
+    with open(os.path.join(directory, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Generated {matches:,} match files; seed rows: "
+                + ', '.join(f'{table} {count:,}' for table, count in seeds.counts.items()))
+    return manifest
+
+
+def load_seed(conn, directory: str, truncate: bool = False) -> Dict[str, int]:
+    """COPY the seed CSVs of a scale corpus into conn's database; commits."""
+    cursor = conn.cursor()
+    if truncate:
+        cursor.execute(f"TRUNCATE {', '.join(reversed(list(SEED_TABLES)))} CASCADE")
+    counts = {}
+    for table, columns in SEED_TABLES.items():
+        with open(os.path.join(directory, SEED_DIR, f'{table}.csv'), encoding='utf-8') as f:
+            cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, HEADER true)", f)
+        counts[table] = cursor.rowcount
+        logger.info(f"Loaded {cursor.rowcount:,} {table} rows")
+    cursor.execute(f"ANALYZE {', '.join(SEED_TABLES)}")
+    conn.commit()
+    cursor.close()
+    return counts
+
+
+def main():
+    """Generate a scale-test corpus."""
+    parser = argparse.ArgumentParser(description='Clone match pages into a 10k-100k match corpus with seed rows')
+    parser.add_argument('directory', help='Output directory')
+    parser.add_argument('--matches', type=int, default=DEFAULT_MATCHES, help='Number of match files')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Random seed')
+    parser.add_argument('--template-dir', help='Real match_*.html pages to clone (default: a synthetic corpus)')
+    parser.add_argument('--templates', type=int, default=DEFAULT_TEMPLATES, help='Template pages to use')
+    parser.add_argument('--padding-kb', type=int, default=DEFAULT_PADDING_KB,
+                        help='Filler per synthetic template page (KB)')
+    parser.add_argument('--load', action='store_true', help='COPY the seed rows into the database afterwards')
+    parser.add_argument('--load-only', action='store_true', help='Only load an existing corpus\'s seed rows')
+    parser.add_argument('--truncate', action='store_true', help='Empty the seed tables before loading')
+    for option, default in DB_DEFAULTS.items():
+        parser.add_argument(f'--{option}', type=type(default), default=default, help=f'Database {option}')
+    args = parser.parse_args()
+
+    if not args.load_only:
+        generate_scale_corpus(args.directory, args.matches, args.seed, args.template_dir,
+                              args.templates, args.padding_kb)
+    if args.load or args.load_only:
+        conn = psycopg2.connect(**{option: getattr(args, option) for option in DB_DEFAULTS})
+        try:
+            load_seed(conn, args.directory, args.truncate)
+        finally:
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
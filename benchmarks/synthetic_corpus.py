@@ -0,0 +1,584 @@
+#!/usr/bin/env python3
+"""
+Deterministic synthetic corpus of FBref-shaped match pages for benchmarks.
+
+Real match files can't be shipped with the repo, so the benchmarks run on
+generated pages with the same structure the extractors read: per-team
+summary, passing, passing_types, defense, possession, misc and keeper_stats
+tables keyed by data-stat (player cells carry data-append-csv and a
+/players/ link), the shots_all table with shots_{team_id} rows, and a
+team_stats grid. Each page is padded with nav/script filler so its size and
+parse cost are close to a real page.
+
+The same seed always produces byte-identical files: a league of teams and
+rosters is drawn first, then each match from its own Random(seed, index),
+so generating N matches and then N + M gives the same first N.
+
+A corpus.json manifest lists the matches, teams and players, so a benchmark
+can build the player and match_player mappings the extractors would have
+loaded from the database (match_player ids come from match_player_uuid()).
+
+Usage:
+    python benchmarks/synthetic_corpus.py /tmp/fbref_corpus --matches 200 --seed 7
+
+    corpus = ensure_corpus('/tmp/fbref_corpus', matches=200)
+    for match in corpus['matches']: ...
+"""
+
+import os
+import json
+import uuid
+import random
+import logging
+import argparse
+from datetime import date, timedelta
+from html import escape
+from typing import Dict, List, Optional, Tuple
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Bump when the generated markup changes, so stale corpora are regenerated
+CORPUS_VERSION = 1
+MANIFEST_NAME = 'corpus.json'
+
+DEFAULT_SEED = 2024
+DEFAULT_MATCHES = 200
+# Non-table filler per page; real match pages are a few hundred KB
+DEFAULT_PADDING_KB = 200
+
+SEASONS = list(range(2013, 2025))
+ROSTER_SIZE = 24
+STARTERS = 11
+MAX_SUBS = 5
+
+TEAM_NAMES = [
+    'Portland Thorns FC', 'North Carolina Courage', 'OL Reign', 'Chicago Red Stars',
+    'Washington Spirit', 'NJ/NY Gotham FC', 'Houston Dash', 'Orlando Pride',
+    'Kansas City Current', 'Racing Louisville FC', 'Angel City FC', 'San Diego Wave FC',
+    'Utah Royals', 'Bay FC',
+]
+FIRST_NAMES = [
+    'Alex', 'Sam', 'Jordan', 'Casey', 'Morgan', 'Taylor', 'Riley', 'Jamie', 'Avery', 'Quinn',
+    'Emily', 'Sophia', 'Mallory', 'Lindsey', 'Rose', 'Trinity', 'Sophie', 'Ashley', 'Kristie', 'Megan',
+]
+LAST_NAMES = [
+    'Smith', 'Horan', 'Lavelle', 'Rodman', 'Swanson', 'Sauerbrunn', 'Naeher', 'Dunn', 'Williams',
+    'Press', 'Heath', 'Morgan', 'Sonnett', 'Girma', 'Fox', 'Huerta', 'Kingsbury', 'Macario',
+]
+POSITIONS = ['GK', 'DF', 'DF', 'DF', 'DF', 'MF', 'MF', 'MF', 'FW', 'FW', 'FW']
+OUTCOMES = ['Goal', 'Saved', 'Off Target', 'Off Target', 'Blocked', 'Saved', 'Woodwork']
+BODY_PARTS = ['Right Foot', 'Left Foot', 'Head']
+SCA_TYPES = ['Pass (Live)', 'Pass (Dead)', 'Take-On', 'Shot', 'Fouled', 'Defensive Action']
+
+# (data-stat, header label) per table; player-identity columns come first in each
+IDENTITY_COLUMNS = [('player', 'Player'), ('shirtnumber', '#'), ('nationality', 'Nation'),
+                    ('position', 'Pos'), ('age', 'Age'), ('minutes', 'Min')]
+TABLE_COLUMNS = {
+    'summary': [
+        ('goals', 'Gls'), ('assists', 'Ast'), ('pens_made', 'PK'), ('pens_att', 'PKatt'),
+        ('shots', 'Sh'), ('shots_on_target', 'SoT'), ('cards_yellow', 'CrdY'), ('cards_red', 'CrdR'),
+        ('touches', 'Touches'), ('tackles', 'Tkl'), ('interceptions', 'Int'), ('blocks', 'Blocks'),
+        ('xg', 'xG'), ('npxg', 'npxG'), ('xg_assist', 'xAG'), ('sca', 'SCA'), ('gca', 'GCA'),
+        ('passes_completed', 'Cmp'), ('passes', 'Att'), ('passes_pct', 'Cmp%'),
+        ('progressive_passes', 'PrgP'), ('carries', 'Carries'), ('progressive_carries', 'PrgC'),
+        ('take_ons', 'Att'), ('take_ons_won', 'Succ'),
+    ],
+    'passing': [
+        ('passes_completed', 'Cmp'), ('passes', 'Att'), ('passes_pct', 'Cmp%'),
+        ('passes_total_distance', 'TotDist'), ('passes_progressive_distance', 'PrgDist'),
+        ('passes_completed_short', 'Cmp'), ('passes_short', 'Att'), ('passes_pct_short', 'Cmp%'),
+        ('passes_completed_medium', 'Cmp'), ('passes_medium', 'Att'), ('passes_pct_medium', 'Cmp%'),
+        ('passes_completed_long', 'Cmp'), ('passes_long', 'Att'), ('passes_pct_long', 'Cmp%'),
+        ('assists', 'Ast'), ('xg_assist', 'xAG'), ('pass_xa', 'xA'), ('assisted_shots', 'KP'),
+        ('passes_into_final_third', '1/3'), ('passes_into_penalty_area', 'PPA'),
+        ('crosses_into_penalty_area', 'CrsPA'), ('progressive_passes', 'PrgP'),
+    ],
+    'passing_types': [
+        ('passes', 'Att'), ('passes_live', 'Live'), ('passes_dead', 'Dead'), ('passes_free_kicks', 'FK'),
+        ('through_balls', 'TB'), ('passes_switches', 'Sw'), ('crosses', 'Crs'), ('throw_ins', 'TI'),
+        ('corner_kicks', 'CK'), ('corner_kicks_in', 'In'), ('corner_kicks_out', 'Out'),
+        ('corner_kicks_straight', 'Str'), ('passes_completed', 'Cmp'), ('passes_offsides', 'Off'),
+        ('passes_blocked', 'Blocks'),
+    ],
+    'defense': [
+        ('tackles', 'Tkl'), ('tackles_won', 'TklW'), ('tackles_def_3rd', 'Def 3rd'),
+        ('tackles_mid_3rd', 'Mid 3rd'), ('tackles_att_3rd', 'Att 3rd'), ('challenge_tackles', 'Tkl'),
+        ('challenges', 'Att'), ('challenge_tackles_pct', 'Tkl%'), ('challenges_lost', 'Lost'),
+        ('blocks', 'Blocks'), ('blocked_shots', 'Sh'), ('blocked_passes', 'Pass'),
+        ('interceptions', 'Int'), ('tackles_interceptions', 'Tkl+Int'), ('clearances', 'Clr'),
+        ('errors', 'Err'),
+    ],
+    'possession': [
+        ('touches', 'Touches'), ('touches_def_pen_area', 'Def Pen'), ('touches_def_3rd', 'Def 3rd'),
+        ('touches_mid_3rd', 'Mid 3rd'), ('touches_att_3rd', 'Att 3rd'), ('touches_att_pen_area', 'Att Pen'),
+        ('touches_live_ball', 'Live'), ('take_ons', 'Att'), ('take_ons_won', 'Succ'),
+        ('take_ons_won_pct', 'Succ%'), ('take_ons_tackled', 'Tkld'), ('take_ons_tackled_pct', 'Tkld%'),
+        ('carries', 'Carries'), ('carries_distance', 'TotDist'), ('carries_progressive_distance', 'PrgDist'),
+        ('progressive_carries', 'PrgC'), ('carries_into_final_third', '1/3'),
+        ('carries_into_penalty_area', 'CPA'), ('miscontrols', 'Mis'), ('dispossessed', 'Dis'),
+        ('passes_received', 'Rec'), ('progressive_passes_received', 'PrgR'),
+    ],
+    'misc': [
+        ('cards_yellow', 'CrdY'), ('cards_red', 'CrdR'), ('cards_yellow_red', '2CrdY'), ('fouls', 'Fls'),
+        ('fouled', 'Fld'), ('offsides', 'Off'), ('crosses', 'Crs'), ('interceptions', 'Int'),
+        ('tackles_won', 'TklW'), ('pens_won', 'PKwon'), ('pens_conceded', 'PKcon'), ('own_goals', 'OG'),
+        ('ball_recoveries', 'Recov'), ('aerials_won', 'Won'), ('aerials_lost', 'Lost'),
+        ('aerials_won_pct', 'Won%'),
+    ],
+}
+KEEPER_COLUMNS = [
+    ('player', 'Player'), ('nationality', 'Nation'), ('age', 'Age'), ('minutes', 'Min'),
+    ('gk_shots_on_target_against', 'SoTA'), ('gk_goals_against', 'GA'), ('gk_saves', 'Saves'),
+    ('gk_save_pct', 'Save%'), ('gk_psxg', 'PSxG'), ('gk_passes_completed_launched', 'Cmp'),
+    ('gk_passes_launched', 'Att'), ('gk_passes_pct_launched', 'Cmp%'), ('gk_passes', 'Att (GK)'),
+    ('gk_passes_throws', 'Thr'), ('gk_pct_passes_launched', 'Launch%'), ('gk_passes_length_avg', 'AvgLen'),
+    ('gk_goal_kicks', 'Att'), ('gk_pct_goal_kicks_launched', 'Launch%'), ('gk_goal_kick_length_avg', 'AvgLen'),
+    ('gk_crosses', 'Opp'), ('gk_crosses_stopped', 'Stp'), ('gk_crosses_stopped_pct', 'Stp%'),
+    ('gk_def_actions_outside_pen_area', '#OPA'), ('gk_avg_distance_def_actions', 'AvgDist'),
+]
+SHOT_COLUMNS = [
+    ('minute', 'Minute'), ('player', 'Player'), ('team', 'Squad'), ('xg_shot', 'xG'), ('psxg_shot', 'PSxG'),
+    ('outcome', 'Outcome'), ('distance', 'Distance'), ('body_part', 'Body Part'), ('notes', 'Notes'),
+    ('sca_1_player', 'Player'), ('sca_1_type', 'Event'), ('sca_2_player', 'Player'), ('sca_2_type', 'Event'),
+]
+TEAM_STATS_COLUMNS = ['Squad', 'Poss', 'Pass%', 'SoT%', 'Save%', 'Gls', 'Sh', 'Tkl', 'Int', 'Clr',
+                      'Fls', 'CK', 'Crs', 'Off', 'Won', 'CrdY', 'CrdR', 'xG']
+
+
+def hex_id(rng: random.Random) -> str:
+    """An 8-hex FBref-style ID."""
+    return f'{rng.getrandbits(32):08x}'
+
+
+def stable_uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def match_player_uuid(match_id: str, player_id: str) -> str:
+    """The match_player.id a benchmark assigns to a (match, player) pair."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f'fbref-synthetic/{match_id}/{player_id}'))
+
+
+def slug(name: str) -> str:
+    return name.replace(' ', '-').replace('/', '-')
+
+
+def build_league(seed: int) -> Dict:
+    """Teams with fixed rosters (two keepers each), drawn from the seed."""
+    rng = random.Random(f'{seed}:league')
+    used = set()
+    teams, players = [], []
+    for name in TEAM_NAMES:
+        team_id = hex_id(rng)
+        roster = []
+        for i in range(ROSTER_SIZE):
+            player_id = hex_id(rng)
+            while player_id in used:
+                player_id = hex_id(rng)
+            used.add(player_id)
+            player = {
+                'player_id': player_id,
+                'uuid': stable_uuid(rng),
+                'name': f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                'position': 'GK' if i < 2 else POSITIONS[1 + (i - 2) % (len(POSITIONS) - 1)],
+                'shirtnumber': i + 1,
+                'nationality': rng.choice(['us USA', 'ca CAN', 'au AUS', 'br BRA', 'jp JPN', 'eng ENG']),
+            }
+            roster.append(player)
+            players.append(player)
+        teams.append({'team_id': team_id, 'name': name, 'uuid': stable_uuid(rng), 'roster': roster})
+    return {'teams': teams, 'players': players}
+
+
+def _scaled(rng: random.Random, high: int, minutes: int) -> int:
+    return rng.randint(0, max(0, round(high * minutes / 90)))
+
+
+def _pct(part: int, whole: int) -> str:
+    return f'{100 * part / whole:.1f}' if whole else ''
+
+
+def player_stats(rng: random.Random, player: Dict, minutes: int) -> Dict[str, str]:
+    """Cell text for every data-stat of one player's appearance (all tables share it)."""
+    s = {}
+    passes = _scaled(rng, 70, minutes)
+    completed = rng.randint(passes // 2, passes) if passes else 0
+    short, medium = passes // 3, passes // 3
+    long_ = passes - short - medium
+    s.update({
+        'passes': passes, 'passes_completed': completed, 'passes_pct': _pct(completed, passes),
+        'passes_total_distance': completed * rng.randint(10, 25),
+        'passes_progressive_distance': completed * rng.randint(2, 8),
+        'passes_short': short, 'passes_completed_short': max(short - _scaled(rng, 2, minutes), 0),
+        'passes_medium': medium, 'passes_completed_medium': max(medium - _scaled(rng, 3, minutes), 0),
+        'passes_long': long_, 'passes_completed_long': long_ // 2,
+        'assists': int(rng.random() < 0.08), 'xg_assist': f'{rng.random() * 0.4:.1f}',
+        'pass_xa': f'{rng.random() * 0.3:.1f}', 'assisted_shots': _scaled(rng, 3, minutes),
+        'passes_into_final_third': _scaled(rng, 6, minutes), 'passes_into_penalty_area': _scaled(rng, 3, minutes),
+        'crosses_into_penalty_area': _scaled(rng, 2, minutes), 'progressive_passes': _scaled(rng, 6, minutes),
+    })
+    for key in ('passes_short', 'passes_medium', 'passes_long'):
+        s[key.replace('passes_', 'passes_pct_')] = _pct(s[key.replace('passes_', 'passes_completed_')], s[key])
+    dead = _scaled(rng, 6, minutes)
+    s.update({
+        'passes_live': passes - min(dead, passes), 'passes_dead': min(dead, passes),
+        'passes_free_kicks': _scaled(rng, 2, minutes), 'through_balls': _scaled(rng, 1, minutes),
+        'passes_switches': _scaled(rng, 2, minutes), 'crosses': _scaled(rng, 4, minutes),
+        'throw_ins': _scaled(rng, 5, minutes), 'corner_kicks': 0, 'corner_kicks_in': 0,
+        'corner_kicks_out': 0, 'corner_kicks_straight': 0,
+        'passes_offsides': _scaled(rng, 1, minutes), 'passes_blocked': _scaled(rng, 2, minutes),
+    })
+    tackles = _scaled(rng, 5, minutes)
+    challenges = _scaled(rng, 4, minutes)
+    challenge_tackles = rng.randint(0, challenges)
+    interceptions = _scaled(rng, 3, minutes)
+    blocked_shots, blocked_passes = _scaled(rng, 1, minutes), _scaled(rng, 2, minutes)
+    s.update({
+        'tackles': tackles, 'tackles_won': rng.randint(0, tackles),
+        'tackles_def_3rd': tackles // 2, 'tackles_mid_3rd': tackles - tackles // 2, 'tackles_att_3rd': 0,
+        'challenge_tackles': challenge_tackles, 'challenges': challenges,
+        'challenge_tackles_pct': _pct(challenge_tackles, challenges),
+        'challenges_lost': challenges - challenge_tackles,
+        'blocks': blocked_shots + blocked_passes, 'blocked_shots': blocked_shots, 'blocked_passes': blocked_passes,
+        'interceptions': interceptions, 'tackles_interceptions': tackles + interceptions,
+        'clearances': _scaled(rng, 6, minutes), 'errors': int(rng.random() < 0.03),
+    })
+    touches = passes + _scaled(rng, 20, minutes)
+    take_ons = _scaled(rng, 4, minutes)
+    take_ons_won = rng.randint(0, take_ons)
+    carries = _scaled(rng, 35, minutes)
+    s.update({
+        'touches': touches, 'touches_def_pen_area': touches // 10, 'touches_def_3rd': touches // 4,
+        'touches_mid_3rd': touches // 2, 'touches_att_3rd': touches // 4, 'touches_att_pen_area': touches // 20,
+        'touches_live_ball': touches - min(dead, touches), 'take_ons': take_ons, 'take_ons_won': take_ons_won,
+        'take_ons_won_pct': _pct(take_ons_won, take_ons), 'take_ons_tackled': take_ons - take_ons_won,
+        'take_ons_tackled_pct': _pct(take_ons - take_ons_won, take_ons), 'carries': carries,
+        'carries_distance': carries * rng.randint(3, 9), 'carries_progressive_distance': carries * rng.randint(1, 4),
+        'progressive_carries': _scaled(rng, 4, minutes), 'carries_into_final_third': _scaled(rng, 3, minutes),
+        'carries_into_penalty_area': _scaled(rng, 1, minutes), 'miscontrols': _scaled(rng, 3, minutes),
+        'dispossessed': _scaled(rng, 2, minutes), 'passes_received': _scaled(rng, 45, minutes),
+        'progressive_passes_received': _scaled(rng, 5, minutes),
+    })
+    aerials_won, aerials_lost = _scaled(rng, 3, minutes), _scaled(rng, 3, minutes)
+    yellow = int(rng.random() < 0.1)
+    s.update({
+        'cards_yellow': yellow, 'cards_red': int(rng.random() < 0.01), 'cards_yellow_red': 0,
+        'fouls': _scaled(rng, 3, minutes), 'fouled': _scaled(rng, 3, minutes), 'offsides': _scaled(rng, 1, minutes),
+        'pens_won': 0, 'pens_conceded': 0, 'own_goals': 0, 'ball_recoveries': _scaled(rng, 8, minutes),
+        'aerials_won': aerials_won, 'aerials_lost': aerials_lost,
+        'aerials_won_pct': _pct(aerials_won, aerials_won + aerials_lost),
+    })
+    shots = _scaled(rng, 3, minutes) if player['position'] != 'GK' else 0
+    xg = rng.random() * 0.3 * shots
+    s.update({
+        'goals': 0, 'pens_made': 0, 'pens_att': 0, 'shots': shots, 'shots_on_target': rng.randint(0, shots),
+        'blocks': s['blocks'], 'xg': f'{xg:.1f}', 'npxg': f'{xg:.1f}', 'sca': _scaled(rng, 4, minutes),
+        'gca': int(rng.random() < 0.1),
+    })
+    s.update({
+        'shirtnumber': player['shirtnumber'], 'nationality': player['nationality'],
+        'position': player['position'], 'age': f"{rng.randint(19, 34)}-{rng.randint(0, 364):03d}",
+        'minutes': minutes,
+    })
+    return {key: str(value) for key, value in s.items()}
+
+
+def keeper_stats(rng: random.Random, player: Dict, minutes: int, goals_against: int) -> Dict[str, str]:
+    """Cell text for a keeper_stats row; saves + goals against = shots on target against."""
+    saves = rng.randint(0, 8)
+    sota = saves + goals_against
+    launched = rng.randint(5, 20)
+    launched_completed = rng.randint(0, launched)
+    passes = launched + rng.randint(5, 20)
+    goal_kicks = rng.randint(3, 12)
+    crosses = rng.randint(2, 15)
+    stopped = rng.randint(0, crosses)
+    s = {
+        'nationality': player['nationality'], 'age': f"{rng.randint(19, 34)}-{rng.randint(0, 364):03d}",
+        'minutes': minutes, 'gk_shots_on_target_against': sota, 'gk_goals_against': goals_against,
+        'gk_saves': saves, 'gk_save_pct': _pct(saves, sota), 'gk_psxg': f'{rng.random() * 2.5:.1f}',
+        'gk_passes_completed_launched': launched_completed, 'gk_passes_launched': launched,
+        'gk_passes_pct_launched': _pct(launched_completed, launched), 'gk_passes': passes,
+        'gk_passes_throws': rng.randint(0, 8), 'gk_pct_passes_launched': _pct(launched, passes),
+        'gk_passes_length_avg': f'{rng.uniform(20, 45):.1f}', 'gk_goal_kicks': goal_kicks,
+        'gk_pct_goal_kicks_launched': f'{rng.uniform(20, 90):.1f}',
+        'gk_goal_kick_length_avg': f'{rng.uniform(25, 55):.1f}', 'gk_crosses': crosses,
+        'gk_crosses_stopped': stopped, 'gk_crosses_stopped_pct': _pct(stopped, crosses),
+        'gk_def_actions_outside_pen_area': rng.randint(0, 4),
+        'gk_avg_distance_def_actions': f'{rng.uniform(8, 20):.1f}',
+    }
+    return {key: str(value) for key, value in s.items()}
+
+
+def player_cell(player: Dict, tag: str = 'th') -> str:
+    scope = ' scope="row"' if tag == 'th' else ''
+    return (f'<{tag}{scope} class="left " data-append-csv="{player["player_id"]}" data-stat="player" '
+            f'csk="{escape(player["name"])}"><a href="/en/players/{player["player_id"]}/{slug(player["name"])}">'
+            f'{escape(player["name"])}</a></{tag}>')
+
+
+def table_head(columns: List[Tuple[str, str]], over_header: Optional[str] = None) -> str:
+    head = ['<thead>']
+    if over_header:
+        head.append(f'<tr class="over_header"><th colspan="{len(columns)}" class="over_header center">'
+                    f'{over_header}</th></tr>')
+    cells = ''.join(f'<th aria-label="{escape(label)}" data-stat="{stat}" scope="col" class=" poptip">'
+                    f'{escape(label)}</th>' for stat, label in columns)
+    head.append(f'<tr>{cells}</tr></thead>')
+    return ''.join(head)
+
+
+def stat_table(table_id: str, caption: str, columns: List[Tuple[str, str]],
+               rows: List[Tuple[Dict, Dict[str, str]]], footer: Optional[str] = None) -> str:
+    """One stats table: a player cell plus one td per data-stat for each (player, stats) row."""
+    parts = [f'<table class="stats_table sortable min_width" id="{table_id}" data-cols-to-freeze=",1">'
+             f'<caption>{escape(caption)}</caption>', table_head(columns, 'Performance'), '<tbody>']
+    for player, stats in rows:
+        cells = ''.join(f'<td class="right " data-stat="{stat}">{escape(stats.get(stat, ""))}</td>'
+                        for stat, _ in columns[1:])
+        parts.append(f'<tr>{player_cell(player)}{cells}</tr>')
+    parts.append('</tbody>')
+    if footer:
+        parts.append(f'<tfoot><tr><th scope="row" class="left " data-stat="player">{footer}</th></tr></tfoot>')
+    parts.append('</table>')
+    return ''.join(parts)
+
+
+def shots_table(table_id: str, caption: str, shots: List[Dict], team_names: Dict[str, str]) -> str:
+    parts = [f'<table class="stats_table min_width" id="{table_id}"><caption>{escape(caption)}</caption>',
+             table_head(SHOT_COLUMNS, 'Shots'), '<tbody>']
+    half_time_done = False
+    for shot in shots:
+        if not half_time_done and shot['minute'] > 45:
+            parts.append('<tr class="spacer partial_table result_all"><td colspan="13"></td></tr>')
+            half_time_done = True
+        sca = shot['sca']
+        sca_cells = ''
+        for i, (player, event) in enumerate(sca, 1):
+            name = (f'<a href="/en/players/{player["player_id"]}/{slug(player["name"])}">'
+                    f'{escape(player["name"])}</a>') if player else ''
+            sca_cells += (f'<td class="left " data-stat="sca_{i}_player">{name}</td>'
+                          f'<td class="left " data-stat="sca_{i}_type">{escape(event)}</td>')
+        parts.append(
+            f'<tr class="shots_{shot["team_id"]}">'
+            f'<th scope="row" class="right " data-stat="minute">{shot["minute"]}</th>'
+            f'{player_cell(shot["player"], "td")}'
+            f'<td class="left " data-stat="team"><a href="/en/squads/{shot["team_id"]}/">'
+            f'{escape(team_names[shot["team_id"]])}</a></td>'
+            f'<td class="right " data-stat="xg_shot">{shot["xg"]}</td>'
+            f'<td class="right " data-stat="psxg_shot">{shot["psxg"]}</td>'
+            f'<td class="left " data-stat="outcome">{shot["outcome"]}</td>'
+            f'<td class="right " data-stat="distance">{shot["distance"]}</td>'
+            f'<td class="left " data-stat="body_part">{shot["body_part"]}</td>'
+            f'<td class="left " data-stat="notes">{shot["notes"]}</td>{sca_cells}</tr>')
+    parts.append('</tbody></table>')
+    return ''.join(parts)
+
+
+def team_stats_table(home: Dict, away: Dict) -> str:
+    """The team_stats grid (header labels, no data-stat), one row per team."""
+    head = ''.join(f'<th scope="col">{label}</th>' for label in TEAM_STATS_COLUMNS)
+    body = ''.join('<tr>' + ''.join(f'<td>{escape(str(value))}</td>' for value in row) + '</tr>'
+                   for row in (home, away))
+    return (f'<table id="team_stats"><caption>Team Stats</caption><thead><tr>{head}</tr></thead>'
+            f'<tbody>{body}</tbody></table>')
+
+
+def padding(rng: random.Random, size_kb: int) -> str:
+    """Nav links and inline script text standing in for the rest of a real page."""
+    if size_kb <= 0:
+        return ''
+    parts, size = ['<div id="nav"><ul>'], 0
+    while size < size_kb * 1024:
+        item = (f'<li><a href="/en/comps/182/{hex_id(rng)}/NWSL-Stats">NWSL {rng.choice(SEASONS)} '
+                f'{rng.choice(TEAM_NAMES)}</a></li>')
+        parts.append(item)
+        size += len(item)
+        if len(parts) % 50 == 0:
+            script = f'<script>var sr_{hex_id(rng)} = {{"k": "{hex_id(rng) * 8}"}};</script>'
+            parts.append(script)
+            size += len(script)
+    parts.append('</ul></div>')
+    return ''.join(parts)
+
+
+def appearances(rng: random.Random, team: Dict) -> List[Tuple[Dict, int]]:
+    """(player, minutes) for everyone who played: 11 starters and up to 5 subs."""
+    roster = team['roster']
+    keeper = roster[rng.randint(0, 1)]
+    outfield = rng.sample(roster[2:], STARTERS - 1 + MAX_SUBS)
+    starters, bench = [keeper] + outfield[:STARTERS - 1], outfield[STARTERS - 1:]
+    played = [[player, 90] for player in starters]
+    for sub in bench[:rng.randint(0, MAX_SUBS)]:
+        replaced = played[rng.randint(1, STARTERS - 1)]
+        if replaced[1] < 90:
+            continue
+        minute = rng.randint(46, 88)
+        replaced[1] = minute
+        played.append([sub, 90 - minute])
+    return [(player, minutes) for player, minutes in played]
+
+
+def generate_match(league: Dict, seed: int, index: int, match_id: str,
+                   padding_kb: int = DEFAULT_PADDING_KB) -> Tuple[Dict, str]:
+    """(manifest entry, page HTML) for match number index of the corpus."""
+    rng = random.Random(f'{seed}:match:{index}')
+    home, away = rng.sample(league['teams'], 2)
+    season = SEASONS[index % len(SEASONS)]
+    match_date = date(season, 3, 15) + timedelta(days=rng.randint(0, 220))
+    team_names = {home['team_id']: home['name'], away['team_id']: away['name']}
+
+    lineups = {team['team_id']: appearances(rng, team) for team in (home, away)}
+    stats = {team_id: [(player, player_stats(rng, player, minutes)) for player, minutes in played]
+             for team_id, played in lineups.items()}
+
+    # Shots first, so goals feed the keeper tables and team stats
+    shots = []
+    for team in (home, away):
+        shooters = [(p, s) for p, s in stats[team['team_id']] if int(s['shots'])]
+        for player, player_stat in shooters:
+            for _ in range(int(player_stat['shots'])):
+                outcome = rng.choice(OUTCOMES)
+                xg = rng.random() * 0.5
+                helpers = [p for p, _ in stats[team['team_id']] if p is not player]
+                shots.append({
+                    'team_id': team['team_id'], 'player': player, 'minute': rng.randint(1, 90),
+                    'xg': f'{xg:.2f}', 'psxg': f'{min(xg * 1.4, 0.99):.2f}' if outcome in ('Goal', 'Saved') else '',
+                    'outcome': outcome, 'distance': rng.randint(5, 32), 'body_part': rng.choice(BODY_PARTS),
+                    'notes': rng.choice(['', '', 'Volley', 'Free kick', 'Deflected']),
+                    'sca': [(rng.choice(helpers), rng.choice(SCA_TYPES)), (None, '')] if rng.random() < 0.7
+                    else [(None, ''), (None, '')],
+                })
+    shots.sort(key=lambda shot: (shot['minute'], shot['team_id']))
+    goals = {team_id: sum(1 for shot in shots if shot['team_id'] == team_id and shot['outcome'] == 'Goal')
+             for team_id in team_names}
+
+    tables = []
+    for team, opponent in ((home, away), (away, home)):
+        team_id = team['team_id']
+        rows = stats[team_id]
+        for kind, columns in TABLE_COLUMNS.items():
+            tables.append(stat_table(f'stats_{team_id}_{kind}', f"{team['name']} Player Stats Table",
+                                     IDENTITY_COLUMNS + columns, rows, f'{len(rows)} Players'))
+        keepers = [(player, keeper_stats(rng, player, minutes, goals[opponent['team_id']]))
+                   for player, minutes in lineups[team_id] if player['position'] == 'GK']
+        tables.append(stat_table(f'keeper_stats_{team_id}', f"{team['name']} Goalkeeper Stats Table",
+                                 KEEPER_COLUMNS, keepers))
+
+    tables.append(shots_table('shots_all', 'Shots Table', shots, team_names))
+    for team in (home, away):
+        tables.append(shots_table(f"shots_{team['team_id']}", f"{team['name']} Shots Table",
+                                  [shot for shot in shots if shot['team_id'] == team['team_id']], team_names))
+
+    team_rows = []
+    for team in (home, away):
+        rows = [s for _, s in stats[team['team_id']]]
+
+        def total(key: str) -> int:
+            return sum(int(s[key]) for s in rows)
+
+        team_rows.append([
+            team['name'], rng.randint(35, 65), f"{100 * total('passes_completed') / max(total('passes'), 1):.0f}%",
+            f"{100 * total('shots_on_target') / max(total('shots'), 1):.0f}%", f'{rng.randint(50, 100)}%',
+            goals[team['team_id']], total('shots'), total('tackles'), total('interceptions'), total('clearances'),
+            total('fouls'), rng.randint(0, 10), total('crosses'), total('offsides'), total('aerials_won'),
+            total('cards_yellow'), total('cards_red'), f"{sum(float(s['xg']) for s in rows):.1f}",
+        ])
+    tables.insert(0, team_stats_table(*team_rows))
+
+    title = f"{home['name']} vs. {away['name']} Match Report - {match_date:%A %B %d, %Y} | FBref.com"
+    page = ''.join([
+        '<!DOCTYPE html><html lang="en"><head><meta charset="utf-8">', f'<title>{escape(title)}</title>',
+        f'<link rel="canonical" href="https://fbref.com/en/matches/{match_id}/">', '</head><body>',
+        padding(rng, padding_kb // 2), f'<div id="content"><h1>{escape(title)}</h1>', *tables, '</div>',
+        padding(rng, padding_kb - padding_kb // 2), '</body></html>',
+    ])
+    entry = {
+        'match_id': match_id,
+        'file': f'match_{match_id}.html',
+        'match_date': match_date.isoformat(),
+        'season': season,
+        'home': {'team_id': home['team_id'], 'name': home['name'], 'goals': goals[home['team_id']]},
+        'away': {'team_id': away['team_id'], 'name': away['name'], 'goals': goals[away['team_id']]},
+        'players': {team_id: [player['player_id'] for player, _ in played] for team_id, played in lineups.items()},
+        'shots': len(shots),
+    }
+    return entry, page
+
+
+def generate_corpus(directory: str, matches: int = DEFAULT_MATCHES, seed: int = DEFAULT_SEED,
+                    padding_kb: int = DEFAULT_PADDING_KB) -> Dict:
+    """Write matches pages and corpus.json into directory; returns the manifest."""
+    os.makedirs(directory, exist_ok=True)
+    league = build_league(seed)
+    entries, seen = [], set()
+    for index in range(matches):
+        # Match IDs come from their own stream, redrawn on the (rare) collision
+        id_rng = random.Random(f'{seed}:id:{index}')
+        match_id = hex_id(id_rng)
+        while match_id in seen:
+            match_id = hex_id(id_rng)
+        seen.add(match_id)
+        entry, page = generate_match(league, seed, index, match_id, padding_kb)
+        with open(os.path.join(directory, entry['file']), 'w', encoding='utf-8') as f:
+            f.write(page)
+        entries.append(entry)
+    manifest = {
+        'version': CORPUS_VERSION,
+        'seed': seed,
+        'padding_kb': padding_kb,
+        'teams': [{key: team[key] for key in ('team_id', 'name', 'uuid')} for team in league['teams']],
+        'players': [[p['player_id'], p['uuid'], p['name']] for p in league['players']],
+        'matches': entries,
+    }
+    with open(os.path.join(directory, MANIFEST_NAME), 'w') as f:
+        json.dump(manifest, f)
+    logger.info(f"Generated {len(entries)} synthetic match files in {directory}")
+    return manifest
+
+
+def load_manifest(directory: str) -> Optional[Dict]:
+    path = os.path.join(directory, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def ensure_corpus(directory: str, matches: int = DEFAULT_MATCHES, seed: int = DEFAULT_SEED,
+                  padding_kb: int = DEFAULT_PADDING_KB) -> Dict:
+    """The corpus in directory, (re)generated unless it already matches the parameters."""
+    manifest = load_manifest(directory)
+    if (manifest and manifest['version'] == CORPUS_VERSION and manifest['seed'] == seed
+            and manifest['padding_kb'] == padding_kb and len(manifest['matches']) == matches):
+        return manifest
+    return generate_corpus(directory, matches, seed, padding_kb)
+
+
+def match_player_rows(manifest: Dict) -> List[Tuple[str, str, str]]:
+    """(match_id, player_id, match_player id) for every appearance in the corpus."""
+    return [(match['match_id'], player_id, match_player_uuid(match['match_id'], player_id))
+            for match in manifest['matches']
+            for player_ids in match['players'].values()
+            for player_id in player_ids]
+
+
+def main():
+    """Generate a synthetic corpus."""
+    parser = argparse.ArgumentParser(description='Generate deterministic FBref-shaped match pages')
+    parser.add_argument('directory', help='Output directory')
+    parser.add_argument('--matches', type=int, default=DEFAULT_MATCHES, help='Number of match files')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help='Random seed')
+    parser.add_argument('--padding-kb', type=int, default=DEFAULT_PADDING_KB,
+                        help='Non-table filler per page (KB)')
+    args = parser.parse_args()
+    generate_corpus(args.directory, args.matches, args.seed, args.padding_kb)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,423 @@
+#!/usr/bin/env python3
+"""
+COPY-based staging loader for the match_player_* stat tables.
+
+Each batch of extracted records is streamed into a temporary staging table with
+COPY FROM STDIN and applied to its target with one set-based UPDATE ... FROM and
+one INSERT ... SELECT ... WHERE NOT EXISTS. A batch costs a handful of round
+trips regardless of its size, instead of one to three statements per player.
+
+The update/insert pair (rather than INSERT ... ON CONFLICT) needs no unique
+constraint on the target key - match_goalkeeper_performance has none on
+(match_id, player_id) - and reports inserted and updated rows separately.
+Records sharing a key within a batch collapse to the last one.
+
+Small batches can skip the staging table: load(..., method='values') sends
+the batch inline as one UPDATE ... FROM (VALUES ...) plus INSERT in a single
+data-modifying statement, one round trip instead of five and no temp-table
+DDL per batch. The merge rules, counts and fingerprint skip are the same.
+Per row it costs more than COPY, so method='auto' picks it only for batches
+of up to VALUES_MAX_ROWS records (bench_db_writes.py: misc_*/values_merge).
+
+Append-only targets with a partition column (match_shot by match_id) are
+refreshed with replace(): one DELETE ... WHERE match_id = ANY(...) for every
+match in the batch and one COPY of their new rows, in the caller's
+transaction, so each match's rows are swapped as a whole.
+
+Keyed targets that have a stats_fingerprint column (migrations/03) store a
+hash of each row's stat values; matched rows whose fingerprint is unchanged
+are left alone, so re-running an extractor over an unchanged corpus costs
+no row writes (no WAL, no dead tuples). Such rows are counted as 'unchanged'.
+
+Usage:
+    loader = BulkLoader(conn)
+    counts = loader.load('match_player_misc', records)   # {'staged', 'updated', 'inserted', 'unchanged'}
+    counts = loader.load('match_player_misc', records, method='auto')
+    counts = loader.replace('match_shot', shots, match_ids)   # {'deleted', 'inserted'}
+    conn.commit()
+"""
+
+import io
+import math
+import hashlib
+import logging
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+MISC_COLUMNS = [
+    'match_player_id', 'yellow_cards', 'red_cards',
+    'second_yellow_cards', 'fouls_committed', 'fouled', 'offsides',
+    'crosses', 'interceptions', 'tackles_won', 'penalty_kicks_won',
+    'penalty_kicks_conceded', 'own_goals', 'ball_recoveries',
+    'aerial_duels_won', 'aerial_duels_lost', 'aerial_duels_won_pct'
+]
+
+DEFENSIVE_ACTIONS_COLUMNS = [
+    'match_player_id',
+    'tackles', 'tackles_won', 'tackles_def_3rd', 'tackles_mid_3rd', 'tackles_att_3rd',
+    'challenges_tkl', 'challenges_att', 'challenges_tkl_pct', 'challenges_lost',
+    'blocks', 'blocks_shots', 'blocks_passes',
+    'interceptions', 'tackles_interceptions', 'clearances', 'errors'
+]
+
+PASS_TYPES_COLUMNS = [
+    'match_player_id',
+    'passes', 'passes_live', 'passes_dead', 'passes_free_kicks',
+    'through_balls', 'passes_switches', 'crosses',
+    'throw_ins', 'corner_kicks', 'corner_kicks_in', 'corner_kicks_out', 'corner_kicks_straight',
+    'passes_completed', 'passes_offsides', 'passes_blocked',
+    'passes_pressure', 'passes_ground', 'passes_low', 'passes_high',
+    'data_source', 'is_complete'
+]
+
+SHOT_COLUMNS = [
+    'match_id', 'minute', 'player_name', 'player_id', 'team_name',
+    'xg', 'psxg', 'outcome', 'distance', 'body_part', 'notes',
+    'sca1_player_name', 'sca1_event', 'sca2_player_name', 'sca2_event',
+    'player_uuid'
+]
+
+# How each target is merged:
+#   key             columns identifying an existing row (None: append-only)
+#   columns         fixed column list, or None to use the keys present in the records
+#   mode            'replace' overwrites matched rows, 'coalesce' keeps existing values
+#                   where the batch has NULL (only fields the extractor found)
+#   insert_only     columns written on insert but never updated
+#   touch_update    timestamp columns set to NOW() on update
+#   touch_insert    timestamp columns set to NOW() on insert
+#   partition       column replace() deletes and reloads by (append-only targets)
+TARGETS = {
+    'match_player_passing': {
+        'key': ['match_player_id'],
+        'columns': None,
+        'mode': 'coalesce',
+        'touch_update': ['updated_at'],
+    },
+    'match_player_pass_types': {
+        'key': ['match_player_id'],
+        'columns': PASS_TYPES_COLUMNS,
+        'mode': 'replace',
+        'touch_update': ['updated_at'],
+        'touch_insert': ['created_at', 'updated_at'],
+    },
+    'match_player_possession': {
+        'key': ['match_player_id'],
+        'columns': None,
+        'mode': 'coalesce',
+    },
+    'match_player_misc': {
+        'key': ['match_player_id'],
+        'columns': MISC_COLUMNS,
+        'mode': 'replace',
+    },
+    'match_player_defensive_actions': {
+        'key': ['match_player_id'],
+        'columns': DEFENSIVE_ACTIONS_COLUMNS,
+        'mode': 'replace',
+    },
+    'match_goalkeeper_performance': {
+        'key': ['match_id', 'player_id'],
+        'columns': None,
+        'mode': 'coalesce',
+        'insert_only': ['team_season_id', 'match_date', 'season_id'],
+        'touch_update': ['updated_at'],
+    },
+    'match_shot': {
+        'key': None,
+        'columns': SHOT_COLUMNS,
+        'mode': 'append',
+        'partition': 'match_id',
+    },
+}
+
+FINGERPRINT_COLUMN = 'stats_fingerprint'
+LOAD_METHODS = ['copy', 'values', 'auto']
+# Largest batch method='auto' merges from VALUES; bigger ones are COPYed
+VALUES_MAX_ROWS = 200
+
+# (dsn, target) -> whether the target has a stats_fingerprint column
+_fingerprint_targets: Dict[Tuple[str, str], bool] = {}
+# (dsn, target) -> {column: SQL type}, for casting VALUES rows
+_column_types: Dict[Tuple[str, str], Dict[str, str]] = {}
+
+
+def text_value(value) -> Optional[str]:
+    """Render one value as Postgres input text (None for NULL)."""
+    # Stat values are overwhelmingly plain ints and strings
+    kind = type(value)
+    if kind is int:
+        return str(value)
+    if kind is str:
+        return value
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, float):
+        # float.__repr__ also covers numpy floats, whose own repr is not a number
+        return None if math.isnan(value) else float.__repr__(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def sql_value(value):
+    """A value psycopg2 can adapt: plain ints and strings as-is, the rest as text_value."""
+    if type(value) in (int, str):
+        return value
+    return text_value(value)
+
+
+def copy_value(value) -> str:
+    """Render one value in COPY text format (\\N for NULL)."""
+    if type(value) is int:
+        return str(value)
+    text = text_value(value)
+    if text is None:
+        return '\\N'
+    return (text.replace('\\', '\\\\').replace('\t', '\\t')
+                .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def stats_fingerprint(record: Dict, exclude) -> str:
+    """Stable hash of a record's non-NULL values, ignoring the columns in exclude."""
+    rendered = ((col, copy_value(value)) for col, value in record.items() if col not in exclude)
+    items = sorted((col, text) for col, text in rendered if text != '\\N')
+    return hashlib.md5('\x1f'.join(f"{col}={value}" for col, value in items).encode('utf-8')).hexdigest()
+
+
+def copy_buffer(records: List[Dict], columns: List[str]) -> io.StringIO:
+    """Records as a tab-separated COPY stream."""
+    buffer = io.StringIO()
+    for record in records:
+        buffer.write('\t'.join(copy_value(record.get(col)) for col in columns))
+        buffer.write('\n')
+    buffer.seek(0)
+    return buffer
+
+
+class BulkLoader:
+    """Stage batches with COPY and merge them into their target tables."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.stats = {'batches': 0, 'staged': 0, 'updated': 0, 'inserted': 0, 'unchanged': 0, 'round_trips': 0}
+
+    def _columns(self, spec: Dict, records: List[Dict], columns: Optional[List[str]]) -> List[str]:
+        if columns:
+            return list(columns)
+        if spec['columns']:
+            return list(spec['columns'])
+        # Union of record keys, first-seen order
+        seen = {}
+        for record in records:
+            for col in record:
+                seen.setdefault(col, None)
+        return list(seen)
+
+    def _has_fingerprint(self, target: str) -> bool:
+        """Whether target has a stats_fingerprint column (looked up once per database)."""
+        cache_key = (self.conn.dsn, target)
+        if cache_key not in _fingerprint_targets:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = %s AND column_name = %s
+                  AND table_schema = ANY(current_schemas(false))
+            """, (target, FINGERPRINT_COLUMN))
+            _fingerprint_targets[cache_key] = cursor.fetchone() is not None
+            cursor.close()
+            self.stats['round_trips'] += 1
+        return _fingerprint_targets[cache_key]
+
+    def _types(self, target: str) -> Dict[str, str]:
+        """Column types of target (looked up once per database)."""
+        cache_key = (self.conn.dsn, target)
+        if cache_key not in _column_types:
+            cursor = self.conn.cursor()
+            cursor.execute("""
+                SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute
+                WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+            """, (target,))
+            _column_types[cache_key] = dict(cursor.fetchall())
+            cursor.close()
+            self.stats['round_trips'] += 1
+        return _column_types[cache_key]
+
+    def _dedupe(self, key: List[str], records: List[Dict]) -> List[Dict]:
+        """Last record wins per key; records missing a key column are dropped."""
+        by_key = {}
+        for record in records:
+            values = tuple(record.get(col) for col in key)
+            if any(v is None for v in values):
+                continue
+            by_key[values] = record
+        return list(by_key.values())
+
+    def _merge_values(self, cursor, target: str, records: List[Dict], cols: List[str], join: str,
+                      set_clauses: List[str], changed: str, insert_cols: List[str],
+                      select_cols: List[str]) -> Tuple[int, int]:
+        """Apply records as one UPDATE ... FROM (VALUES ...) + INSERT statement; returns (updated, inserted)."""
+        types = self._types(target)
+        # Values travel as text and are cast to the target's column types
+        template = '(' + ', '.join(f"%s::{types.get(col, 'text')}" for col in cols) + ')'
+        update = (f"""updated AS (
+                UPDATE {target} t SET {', '.join(set_clauses)}
+                FROM s WHERE {join}{changed}
+                RETURNING 1
+            ),""" if set_clauses else '')
+        # Both halves see the table as it was before the statement, so the
+        # INSERT only picks keys that did not exist yet
+        rows = execute_values(cursor, f"""
+            WITH s ({', '.join(cols)}) AS (VALUES %s),
+            {update}
+            inserted AS (
+                INSERT INTO {target} ({', '.join(insert_cols)})
+                SELECT {', '.join(select_cols)}
+                FROM s
+                WHERE NOT EXISTS (SELECT 1 FROM {target} t WHERE {join})
+                RETURNING 1
+            )
+            SELECT {'(SELECT count(*) FROM updated)' if set_clauses else '0'},
+                   (SELECT count(*) FROM inserted)
+        """, [tuple(sql_value(record.get(col)) for col in cols) for record in records],
+            template=template, page_size=len(records), fetch=True)
+        self.stats['round_trips'] += 1
+        return int(rows[0][0]), int(rows[0][1])
+
+    def load(self, target: str, records: List[Dict], columns: Optional[List[str]] = None,
+             method: str = 'copy') -> Dict[str, int]:
+        """
+        Stage records and apply them to target in one set-based pass.
+
+        method is 'copy' (COPY into a staging table, then merge), 'values'
+        (one statement with the batch inline) or 'auto' (values for up to
+        VALUES_MAX_ROWS records, else copy). Append-only targets are always
+        COPYed. Does not commit; the caller owns the
+        transaction.
+        """
+        if method not in LOAD_METHODS:
+            raise ValueError(f"Unknown load method '{method}'. Choose from: {', '.join(LOAD_METHODS)}")
+        spec = TARGETS[target]
+        counts = {'staged': 0, 'updated': 0, 'inserted': 0, 'unchanged': 0}
+        if not records:
+            return counts
+
+        key = spec['key']
+        if key:
+            records = self._dedupe(key, records)
+        if method == 'auto':
+            method = 'values' if len(records) <= VALUES_MAX_ROWS else 'copy'
+        cols = self._columns(spec, records, columns)
+        fingerprint = bool(key) and self._has_fingerprint(target)
+        if fingerprint:
+            exclude = set(key) | set(spec.get('insert_only', [])) | {FINGERPRINT_COLUMN}
+            records = [dict(record, **{FINGERPRINT_COLUMN: stats_fingerprint(record, exclude)})
+                       for record in records]
+            cols = [col for col in cols if col != FINGERPRINT_COLUMN] + [FINGERPRINT_COLUMN]
+        col_list = ', '.join(cols)
+        cursor = self.conn.cursor()
+
+        try:
+            if not key:
+                # Append-only: COPY straight into the target
+                cursor.copy_expert(f"COPY {target} ({col_list}) FROM STDIN", copy_buffer(records, cols))
+                self.stats['round_trips'] += 1
+                counts['staged'] = counts['inserted'] = len(records)
+            else:
+                join = ' AND '.join(f"t.{col} = s.{col}" for col in key)
+                insert_only = set(spec.get('insert_only', []))
+                set_clauses = []
+                for col in cols:
+                    if col in key or col in insert_only:
+                        continue
+                    if spec['mode'] == 'coalesce' and col != FINGERPRINT_COLUMN:
+                        set_clauses.append(f"{col} = COALESCE(s.{col}, t.{col})")
+                    else:
+                        set_clauses.append(f"{col} = s.{col}")
+                set_clauses.extend(f"{col} = NOW()" for col in spec.get('touch_update', []))
+                # Rows whose stored fingerprint matches are not rewritten
+                changed = (f" AND t.{FINGERPRINT_COLUMN} IS DISTINCT FROM s.{FINGERPRINT_COLUMN}"
+                           if fingerprint else '')
+
+                touch_insert = spec.get('touch_insert', [])
+                insert_cols = cols + touch_insert
+                select_cols = [f"s.{col}" for col in cols] + ['NOW()'] * len(touch_insert)
+                counts['staged'] = len(records)
+
+                if method == 'values':
+                    counts['updated'], counts['inserted'] = self._merge_values(
+                        cursor, target, records, cols, join, set_clauses, changed, insert_cols, select_cols)
+                else:
+                    stage = f"stage_{target}"
+                    cursor.execute(f"""
+                        DROP TABLE IF EXISTS pg_temp.{stage};
+                        CREATE TEMP TABLE {stage} AS SELECT {col_list} FROM {target} WITH NO DATA;
+                    """)
+                    cursor.copy_expert(f"COPY {stage} ({col_list}) FROM STDIN", copy_buffer(records, cols))
+
+                    if set_clauses:
+                        cursor.execute(f"""
+                            ANALYZE {stage};
+                            UPDATE {target} t SET {', '.join(set_clauses)}
+                            FROM {stage} s
+                            WHERE {join}{changed}
+                        """)
+                        counts['updated'] = cursor.rowcount
+                        self.stats['round_trips'] += 1
+
+                    cursor.execute(f"""
+                        INSERT INTO {target} ({', '.join(insert_cols)})
+                        SELECT {', '.join(select_cols)}
+                        FROM {stage} s
+                        WHERE NOT EXISTS (SELECT 1 FROM {target} t WHERE {join})
+                    """)
+                    counts['inserted'] = cursor.rowcount
+                    self.stats['round_trips'] += 3
+                counts['unchanged'] = counts['staged'] - counts['updated'] - counts['inserted']
+        finally:
+            cursor.close()
+
+        self.stats['batches'] += 1
+        for name, value in counts.items():
+            self.stats[name] += value
+        logger.debug(f"{target}: staged {counts['staged']}, updated {counts['updated']}, "
+                     f"inserted {counts['inserted']}, unchanged {counts['unchanged']}")
+        return counts
+
+    def replace(self, target: str, records: List[Dict], partitions: Iterable,
+                columns: Optional[List[str]] = None) -> Dict[str, int]:
+        """
+        Delete every row of the given partitions (e.g. match IDs) and COPY records in their place.
+
+        Partitions without records are emptied. Two round trips whatever the
+        batch size; does not commit, so the caller's transaction makes the
+        swap atomic.
+        """
+        spec = TARGETS[target]
+        partition = spec.get('partition')
+        if spec['key'] or not partition:
+            raise ValueError(f"{target} is not an append-only target with a partition column")
+        partitions = list(dict.fromkeys(partitions))
+        counts = {'deleted': 0, 'inserted': 0}
+        if partitions:
+            cursor = self.conn.cursor()
+            try:
+                cursor.execute(f"DELETE FROM {target} WHERE {partition} = ANY(%s)", (partitions,))
+                counts['deleted'] = cursor.rowcount
+            finally:
+                cursor.close()
+            self.stats['round_trips'] += 1
+        counts['inserted'] = self.load(target, records, columns)['inserted']
+        logger.debug(f"{target}: replaced {len(partitions)} {partition}s, "
+                     f"deleted {counts['deleted']}, inserted {counts['inserted']}")
+        return counts
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Durable checkpoints for long corpus runs.
+
+A run appends one line to checkpoints/<name>.jsonl after every committed
+batch: the files whose rows that batch committed, plus the run's cumulative
+counters. Lines are flushed and fsynced before the run moves on, so after a
+crash the log lists exactly the files whose data is in the database. With
+--resume, an extractor skips those files and picks its counters back up;
+without it, the log is cleared and the run starts over.
+
+Appending (rather than rewriting one state file) keeps each checkpoint at
+O(batch) regardless of corpus size. A torn last line from a crash mid-write
+is cut off on resume, so the next append starts on a line of its own; lines
+that still can't be decoded are skipped.
+
+Usage:
+    checkpoint = Checkpoint('misc_stats', resume=args.resume)
+    files = [f for f in files if f not in checkpoint.completed]
+    ...  # after each conn.commit():
+    checkpoint.commit(batch_files, files_processed=n, stats_extracted=m)
+"""
+
+import os
+import json
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, Set
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Checkpoint directory; override with FBREF_CHECKPOINT_DIR
+CHECKPOINT_DIR = os.environ.get(
+    'FBREF_CHECKPOINT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkpoints')
+)
+
+
+class Checkpoint:
+    """Append-only log of the files committed by a named run."""
+
+    def __init__(self, name: str, resume: bool = False, directory: str = CHECKPOINT_DIR):
+        self.name = name
+        self.path = os.path.join(directory, f"{name}.jsonl")
+        self.completed: Set[str] = set()
+        self.counters: Dict = {}
+        os.makedirs(directory, exist_ok=True)
+        if resume:
+            self._load()
+            logger.info(f"Resuming {name}: {len(self.completed)} files already committed")
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        self._truncate_torn_line()
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    # Garbled line (bad bytes or JSON): that batch's commit is not recorded
+                    logger.warning(f"Ignoring undecodable checkpoint line in {self.path}")
+                    continue
+                if not isinstance(entry, dict):
+                    continue
+                self.completed.update(entry.get('files', []))
+                self.counters = entry.get('counters', self.counters)
+
+    def _truncate_torn_line(self):
+        """Cut a last line without its newline (a crash mid-write) so appends start clean."""
+        with open(self.path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+            # Walk back to the last complete line
+            end = size
+            while end > 0:
+                start = max(0, end - 65536)
+                f.seek(start)
+                newline = f.read(end - start).rfind(b'\n')
+                if newline != -1:
+                    end = start + newline + 1
+                    break
+                end = start
+            logger.warning(f"Dropping torn checkpoint line in {self.path} ({size - end} bytes)")
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def commit(self, files: Iterable[str], **counters):
+        """Record files whose data has been committed, with the run's cumulative counters."""
+        files = [os.path.basename(f) for f in files]
+        if not files:
+            return
+        entry = {'at': datetime.now().isoformat(), 'files': files, 'counters': counters}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.completed.update(files)
+        self.counters = counters
+
+    def is_done(self, filepath: str) -> bool:
+        """Whether a file was committed by this run (or the run being resumed)."""
+        return os.path.basename(filepath) in self.completed
+
+    def counter(self, name: str, default=0):
+        """Cumulative counter from the last checkpoint."""
+        return self.counters.get(name, default)
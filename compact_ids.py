@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Compact in-memory ID mappings for the extractor caches.
+
+The mapping caches (match_player ids, player FBref ID -> UUID/name) used to be
+dicts of Python strings - and dicts of dicts - costing a few hundred bytes per
+row. Here an 8-hex FBref ID is packed into a uint32, a (match, player) pair
+into one uint64, and a UUID into 16 raw bytes; rows live in sorted numpy
+arrays searched with searchsorted. That is 20-24 bytes per match_player row
+instead of ~350, so the full caches stay small and cheap to keep across a
+corpus run.
+
+The maps are read-mostly: rows added after the bulk load (prefetches, newly
+created match_player rows) go to a small dict overlay that is merged into the
+arrays once it grows. IDs that are not 8-hex also live in the overlay, so any
+key works. Lookups return the same values the old dicts did (UUID strings,
+{'uuid', 'name'} dicts for players), so callers only change how the map is
+built.
+
+Usage:
+    ids = CompactIdMap.from_rows(cursor.fetchall(), pairs=True)   # (match_id, player_id, id) rows
+    ids.get(('07c68416', 'a1b2c3d4'))
+    players = CompactPlayerMap.from_rows(cursor.fetchall())       # (player_id, id, player_name) rows
+    players.get('a1b2c3d4', {}).get('uuid')
+"""
+
+import uuid
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Overlay size at which additions are merged into the sorted arrays
+COMPACT_THRESHOLD = 50000
+
+
+def pack_hex_id(hex_id) -> Optional[int]:
+    """An 8-hex FBref ID as an int, or None when the value is not one."""
+    if isinstance(hex_id, str) and len(hex_id) == 8:
+        try:
+            return int(hex_id, 16)
+        except ValueError:
+            return None
+    return None
+
+
+def unpack_hex_id(value: int) -> str:
+    """The 8-hex FBref ID for a packed int."""
+    return f'{value:08x}'
+
+
+def pack_pair(first, second) -> Optional[int]:
+    """A pair of 8-hex IDs (e.g. match_id, player_id) as one 64-bit int, or None."""
+    a, b = pack_hex_id(first), pack_hex_id(second)
+    if a is None or b is None:
+        return None
+    return (a << 32) | b
+
+
+def uuid_bytes(value) -> bytes:
+    """16 raw bytes for a UUID given as a string or uuid.UUID."""
+    if isinstance(value, uuid.UUID):
+        return value.bytes
+    return bytes.fromhex(str(value).replace('-', ''))
+
+
+def _try_uuid_bytes(value) -> Optional[bytes]:
+    """uuid_bytes, or None for NULL or non-UUID values (those stay in the overlay)."""
+    if value is None:
+        return None
+    try:
+        raw = uuid_bytes(value)
+    except ValueError:
+        return None
+    return raw if len(raw) == 16 else None
+
+
+def uuid_str(raw: bytes) -> str:
+    """Canonical string form of 16 raw UUID bytes (as psycopg2 returns uuid columns)."""
+    # numpy 'S' arrays drop trailing NUL bytes on read
+    return str(uuid.UUID(bytes=raw.ljust(16, b'\x00')))
+
+
+class _SortedTable:
+    """Sorted packed keys plus a dict overlay for late additions and unpackable keys."""
+
+    def __init__(self, pairs: bool = False):
+        self.pairs = pairs
+        self.dtype = np.uint64 if pairs else np.uint32
+        self._keys = np.empty(0, dtype=self.dtype)
+        self._extra: Dict = {}
+
+    def _pack(self, key) -> Optional[int]:
+        if self.pairs:
+            return pack_pair(*key) if isinstance(key, tuple) and len(key) == 2 else None
+        return pack_hex_id(key)
+
+    def _find(self, key) -> Optional[int]:
+        """Array index of a key (last occurrence wins), or None."""
+        packed = self._pack(key)
+        if packed is None or not len(self._keys):
+            return None
+        i = int(np.searchsorted(self._keys, self.dtype(packed), side='right')) - 1
+        if i >= 0 and self._keys[i] == packed:
+            return i
+        return None
+
+    def _sorted(self, keys: np.ndarray, *columns):
+        """Keys and columns sorted by key, keeping the last of duplicate keys."""
+        order = np.argsort(keys, kind='stable')
+        keys = keys[order]
+        keep = np.append(keys[1:] != keys[:-1], True) if len(keys) else np.empty(0, dtype=bool)
+        return (keys[keep],) + tuple(column[order][keep] for column in columns)
+
+    def __contains__(self, key) -> bool:
+        return key in self._extra or self._find(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._keys) + sum(1 for key in self._extra if self._find(key) is None)
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate bytes held by the arrays (the overlay is not counted)."""
+        return self._keys.nbytes
+
+
+class CompactIdMap(_SortedTable):
+    """FBref hex ID (or ID pair) -> UUID string, array-backed."""
+
+    def __init__(self, pairs: bool = False):
+        super().__init__(pairs)
+        self._values = np.empty(0, dtype='S16')
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple], pairs: bool = False) -> 'CompactIdMap':
+        """Build from (id, uuid) rows, or (id, id, uuid) rows when pairs is set."""
+        table = cls(pairs)
+        table.load(rows)
+        return table
+
+    def load(self, rows: Iterable[Tuple]):
+        """
+        Add rows: a load of COMPACT_THRESHOLD rows or more is merged into the
+        arrays at once, smaller ones (per-match prefetches, created rows) go to
+        the overlay, which is merged once it reaches COMPACT_THRESHOLD.
+        """
+        rows = list(rows)
+        if len(rows) >= COMPACT_THRESHOLD:
+            self._merge(rows)
+            return
+        for row in rows:
+            key = (row[0], row[1]) if self.pairs else row[0]
+            self._extra[key] = row[-1]
+        if len(self._extra) >= COMPACT_THRESHOLD:
+            self.compact()
+
+    def _merge(self, rows: Iterable[Tuple]):
+        """Add rows to the sorted arrays (unpackable ones to the overlay), re-sorting once."""
+        packed, values = [], []
+        for row in rows:
+            key = (row[0], row[1]) if self.pairs else row[0]
+            value = row[-1]
+            p = self._pack(key)
+            raw = _try_uuid_bytes(value) if p is not None else None
+            if raw is None:
+                self._extra[key] = value
+            else:
+                self._extra.pop(key, None)
+                packed.append(p)
+                values.append(raw)
+        if packed:
+            # Existing rows first so that re-added keys take the new value
+            self._keys, self._values = self._sorted(
+                np.concatenate([self._keys, np.array(packed, dtype=self.dtype)]),
+                np.concatenate([self._values, np.array(values, dtype='S16')]))
+
+    def compact(self):
+        """Merge packable overlay entries into the arrays."""
+        movable = [(key, value) for key, value in self._extra.items()
+                   if self._pack(key) is not None and _try_uuid_bytes(value) is not None]
+        for key, _ in movable:
+            del self._extra[key]
+        self._merge((*key, value) if self.pairs else (key, value) for key, value in movable)
+
+    def get(self, key, default=None) -> Optional[str]:
+        if key in self._extra:
+            return self._extra[key]
+        i = self._find(key)
+        return uuid_str(self._values[i]) if i is not None else default
+
+    def __getitem__(self, key) -> str:
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        self._extra[key] = value
+        if len(self._extra) >= COMPACT_THRESHOLD:
+            self.compact()
+
+    @property
+    def nbytes(self) -> int:
+        return self._keys.nbytes + self._values.nbytes
+
+
+class CompactPlayerMap(_SortedTable):
+    """FBref player ID -> {'uuid', 'name'}, array-backed (the player_mapping caches)."""
+
+    def __init__(self):
+        super().__init__(pairs=False)
+        self._uuids = np.empty(0, dtype='S16')
+        self._names = np.empty(0, dtype=object)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple]) -> 'CompactPlayerMap':
+        """Build from (player_id, uuid, player_name) rows."""
+        table = cls()
+        packed, uuids, names = [], [], []
+        for player_id, player_uuid, name in rows:
+            p = pack_hex_id(player_id)
+            raw = _try_uuid_bytes(player_uuid) if p is not None else None
+            if raw is None:
+                table._extra[player_id] = {'uuid': player_uuid, 'name': name}
+            else:
+                packed.append(p)
+                uuids.append(raw)
+                names.append(name)
+        if packed:
+            names_array = np.empty(len(names), dtype=object)
+            names_array[:] = names
+            table._keys, table._uuids, table._names = table._sorted(
+                np.array(packed, dtype=table.dtype), np.array(uuids, dtype='S16'), names_array)
+        return table
+
+    def get(self, player_id, default=None) -> Optional[Dict]:
+        if player_id in self._extra:
+            return self._extra[player_id]
+        i = self._find(player_id)
+        if i is None:
+            return default
+        return {'uuid': uuid_str(self._uuids[i]), 'name': self._names[i]}
+
+    def __getitem__(self, player_id) -> Dict:
+        value = self.get(player_id)
+        if value is None:
+            raise KeyError(player_id)
+        return value
+
+    @property
+    def nbytes(self) -> int:
+        return self._keys.nbytes + self._uuids.nbytes + self._names.nbytes
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Shared database session layer: connection settings, pooling, prepared
+statements, pipelining and batch transactions.
+
+Every script used to carry its own DB_CONFIG and open raw connections, and
+commit granularity was whatever each author picked. Scripts now take their
+settings and connections from here:
+
+    DB_CONFIG               one set of connection settings, overridable with
+                            NWSL_DB_HOST / _PORT / _NAME / _USER / _PASSWORD
+    connect()               a metered psycopg2 connection (etl_metrics)
+    create_pool()           a thread-safe pool of metered connections;
+    pooled_connection()     one connection borrowed from the process-wide pool
+    PreparedStatement       a hot statement PREPAREd once per connection and
+                            sent as pages of EXECUTEs, so a batch costs one
+                            parse/plan and len(rows) / page_size round trips
+    executemany()           PreparedStatement pages on a psycopg2 connection;
+                            pipeline mode on a psycopg 3 connection
+    connect_pipelined()     a psycopg 3 connection (optional dependency) whose
+                            statements are prepared server-side
+    pipeline_connection()   the same in pipeline mode: queued statements are
+                            sent without waiting for each reply
+    BatchTransaction        commit every N units of work (matches), each unit
+                            under its own savepoint so a failed match only
+                            undoes itself
+
+The extractors use psycopg2 APIs throughout (RealDictCursor, execute_batch,
+copy_expert), so their hot paths get prepared statements in pages; psycopg 3
+pipeline mode is for code that owns its connection, and bench_db_writes.py
+measures both.
+
+Batch size comes from FBREF_COMMIT_EVERY (default 1: commit every match, as
+before). Batches only help a connection whose uncommitted rows no other
+connection needs to read meanwhile; see nwsl_etl.py.
+
+Usage:
+    conn = connect()
+    tx = BatchTransaction(conn, commit_every=50)
+    for match in matches:
+        with tx.unit():
+            ...               # writes for one match
+    tx.flush()
+
+    insert = PreparedStatement('insert_lineup', "INSERT INTO match_lineup (...) VALUES (%s, ...)")
+    insert.execute_many(cursor, rows)
+"""
+
+import os
+import re
+import logging
+import weakref
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Sequence
+
+from psycopg2.extras import execute_batch
+from psycopg2.pool import ThreadedConnectionPool
+
+from etl_metrics import MeteredConnection, get_metrics, metered_connect
+
+try:
+    import psycopg
+except ImportError:  # psycopg 3 is optional
+    psycopg = None
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Database connection parameters
+DB_CONFIG = {
+    'host': os.environ.get('NWSL_DB_HOST', 'localhost'),
+    'port': int(os.environ.get('NWSL_DB_PORT', '5433')),
+    'database': os.environ.get('NWSL_DB_NAME', 'nwsl_data'),
+    'user': os.environ.get('NWSL_DB_USER', 'postgres'),
+    'password': os.environ.get('NWSL_DB_PASSWORD', 'postgres')
+}
+
+# Units of work (matches) per commit; override with FBREF_COMMIT_EVERY
+COMMIT_EVERY = max(1, int(os.environ.get('FBREF_COMMIT_EVERY', '1')))
+# Size of the process-wide pool; override with FBREF_DB_POOL_SIZE
+POOL_SIZE = int(os.environ.get('FBREF_DB_POOL_SIZE', '4'))
+# EXECUTEs sent per round trip by PreparedStatement.execute_many
+PAGE_SIZE = 100
+
+PLACEHOLDER_RE = re.compile(r'%\((\w+)\)s|%s|%%')
+
+metrics = get_metrics()
+
+_pool: Optional[ThreadedConnectionPool] = None
+_pool_lock = threading.Lock()
+# connection -> names of the statements prepared on it
+_prepared: 'weakref.WeakKeyDictionary' = weakref.WeakKeyDictionary()
+
+
+def connect(**overrides):
+    """A metered psycopg2 connection with DB_CONFIG (plus overrides)."""
+    return metered_connect(**dict(DB_CONFIG, **overrides))
+
+
+def create_pool(maxconn: int, db_config: Optional[Dict] = None, minconn: int = 1) -> ThreadedConnectionPool:
+    """A thread-safe pool of metered connections."""
+    return ThreadedConnectionPool(minconn, maxconn, connection_factory=MeteredConnection,
+                                  **(db_config or DB_CONFIG))
+
+
+def get_pool() -> ThreadedConnectionPool:
+    """The process-wide pool (POOL_SIZE connections), created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed:
+            _pool = create_pool(POOL_SIZE)
+        return _pool
+
+
+@contextmanager
+def pooled_connection():
+    """Borrow a connection from the process-wide pool; rolled back if the block raises."""
+    pool = get_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def close_pool():
+    """Close every connection of the process-wide pool."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+
+
+class PreparedStatement:
+    """
+    A statement PREPAREd once per connection and run with EXECUTE.
+
+    sql uses psycopg2 placeholders (%s or %(name)s, not mixed); a named
+    placeholder used twice maps to the same parameter. Prepared statements
+    belong to the server session and survive rollbacks.
+    """
+
+    def __init__(self, name: str, sql: str):
+        self.name = name
+        positions: Dict[str, int] = {}
+        params: List[str] = []
+
+        def number(found):
+            if found.group(0) == '%%':
+                return '%'
+            key = found.group(1)
+            if key is None:
+                params.append('%s')
+                return f'${len(params)}'
+            if key not in positions:
+                params.append(f'%({key})s')
+                positions[key] = len(params)
+            return f'${positions[key]}'
+
+        self.server_sql = PLACEHOLDER_RE.sub(number, sql)
+        self.execute_sql = f"EXECUTE {name} ({', '.join(params)})" if params else f"EXECUTE {name}"
+
+    def prepare(self, cursor):
+        """PREPARE on the cursor's connection unless already done there."""
+        names = _prepared.setdefault(cursor.connection, set())
+        if self.name not in names:
+            cursor.execute(f"PREPARE {self.name} AS {self.server_sql}")
+            names.add(self.name)
+
+    def execute(self, cursor, params: Optional[Sequence] = None):
+        self.prepare(cursor)
+        cursor.execute(self.execute_sql, params)
+
+    def execute_many(self, cursor, rows: Sequence, page_size: int = PAGE_SIZE):
+        """EXECUTE once per row, page_size statements per round trip."""
+        if not rows:
+            return
+        self.prepare(cursor)
+        execute_batch(cursor, self.execute_sql, rows, page_size=page_size)
+
+
+def pipeline_available() -> bool:
+    """Whether psycopg 3 with libpq pipeline support is installed."""
+    return psycopg is not None and psycopg.Pipeline.is_supported()
+
+
+def connect_pipelined(**overrides):
+    """
+    A psycopg 3 connection with DB_CONFIG (plus overrides).
+
+    Every statement is prepared server-side from its first use
+    (prepare_threshold=0). Raises RuntimeError when psycopg 3 is missing.
+    """
+    if not pipeline_available():
+        raise RuntimeError("psycopg 3 with pipeline support is required (pip install 'psycopg[binary]')")
+    params = dict(DB_CONFIG, **overrides)
+    params.setdefault('dbname', params.pop('database', None))
+    return psycopg.connect(prepare_threshold=0, **params)
+
+
+@contextmanager
+def pipeline_connection(**overrides):
+    """A connect_pipelined() connection in pipeline mode, committed on success."""
+    conn = connect_pipelined(**overrides)
+    try:
+        with conn.pipeline():
+            yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def executemany(conn, sql: str, rows: Sequence, name: Optional[str] = None, page_size: int = PAGE_SIZE):
+    """
+    Run sql once per row without a round trip per row.
+
+    On a psycopg 3 connection the rows are pipelined; on a psycopg2 one sql
+    is prepared as name (required) and sent as pages of EXECUTEs.
+    """
+    if not rows:
+        return
+    if psycopg is not None and isinstance(conn, psycopg.Connection):
+        with metrics.phase('db'):
+            metrics.add('db_round_trips')
+            with conn.pipeline(), conn.cursor() as cursor:
+                cursor.executemany(sql, rows)
+        return
+    if name is None:
+        raise ValueError("a statement name is required on a psycopg2 connection")
+    cursor = conn.cursor()
+    try:
+        PreparedStatement(name, sql).execute_many(cursor, rows, page_size)
+    finally:
+        cursor.close()
+
+
+def set_commit_every(units: int):
+    """Batch size for BatchTransactions created from now on that don't pass one."""
+    global COMMIT_EVERY
+    if units != COMMIT_EVERY:
+        logger.info(f"Committing every {units} units of work (was {COMMIT_EVERY})")
+    COMMIT_EVERY = max(1, units)
+
+
+class BatchTransaction:
+    """
+    Commit every commit_every units of work, each under its own savepoint.
+
+    begin() starts a unit, commit() ends it and commits once commit_every
+    units are pending, rollback() undoes only the current unit. With
+    commit_every=1 these are plain commit/rollback and no savepoints are
+    used. Call flush() at the end of a run to commit the last partial batch,
+    or close() when the run may have been interrupted mid-unit.
+    """
+
+    SAVEPOINT = 'batch_unit'
+
+    def __init__(self, conn, commit_every: Optional[int] = None):
+        self.conn = conn
+        self.commit_every = max(1, commit_every or COMMIT_EVERY)
+        self.pending = 0
+        self.in_unit = False
+        self.stats = {'units': 0, 'failed_units': 0, 'commits': 0}
+
+    @property
+    def batching(self) -> bool:
+        return self.commit_every > 1
+
+    def _execute(self, sql: str):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql)
+        finally:
+            cursor.close()
+
+    def begin(self):
+        """Start a unit of work."""
+        if self.batching and not self.in_unit:
+            self._execute(f"SAVEPOINT {self.SAVEPOINT}")
+        self.in_unit = True
+
+    def commit(self):
+        """End the current unit; commits when a batch is complete."""
+        if self.batching and self.in_unit:
+            self._execute(f"RELEASE SAVEPOINT {self.SAVEPOINT}")
+        self.in_unit = False
+        self.pending += 1
+        self.stats['units'] += 1
+        if self.pending >= self.commit_every:
+            self.flush()
+
+    def rollback(self):
+        """Undo the current unit only (the whole open batch when no unit was begun)."""
+        self.stats['failed_units'] += 1
+        if self.batching and self.in_unit:
+            self._execute(f"ROLLBACK TO SAVEPOINT {self.SAVEPOINT}")
+            self._execute(f"RELEASE SAVEPOINT {self.SAVEPOINT}")
+        else:
+            if self.pending:
+                logger.warning(f"Rolling back {self.pending} uncommitted units")
+            self.conn.rollback()
+            self.pending = 0
+        self.in_unit = False
+
+    def flush(self):
+        """Commit every pending unit."""
+        self.conn.commit()
+        if self.pending:
+            self.stats['commits'] += 1
+        self.pending = 0
+
+    def close(self):
+        """Undo an unfinished unit and commit the finished ones (before closing the connection)."""
+        if self.in_unit:
+            self.rollback()
+        if self.pending:
+            self.flush()
+
+    @contextmanager
+    def unit(self):
+        """A unit of work: committed (per the batch size) on success, rolled back if the block raises."""
+        self.begin()
+        try:
+            yield
+        except Exception:
+            self.rollback()
+            raise
+        self.commit()
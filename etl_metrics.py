@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Per-stage throughput and latency metrics for the extractors.
+
+Every run records, per stage (a table family such as 'misc', or 'page' for
+the shared read/parse of a match file):
+
+    files, errors, wall seconds and per-file latency
+    read bytes and read / parse / extract / transform / db seconds
+    DB round-trips and rows written
+
+Time is attributed with nested frames kept per thread. A stage frame wraps
+one file's work for a family; phase frames inside it (file read, HTML parse,
+stat table extraction, each DB call) record their own time, and whatever
+the stage spent outside any phase is its transform time. A phase only counts
+its own time, so a DB call made inside a timed extraction is not counted
+twice.
+
+DB time and round-trips come from MeteredConnection (metered_connect(), or
+connection_factory= for pools): every statement, COPY, commit and rollback
+on it counts as one round-trip, whatever cursor class the caller asks for.
+
+At the end of a run write() logs a one-line summary per stage and writes
+metrics/<run>.json and metrics/<run>.prom. The .prom file uses the
+Prometheus text format and can be picked up by node_exporter's textfile
+collector. Metrics from worker processes are merged in through snapshot() /
+merge().
+
+Usage:
+    metrics = start_run('misc')
+    conn = metered_connect(**DB_CONFIG)
+    for path in files:
+        with metrics.stage('misc'):
+            ...
+    metrics.add('rows_written', n, stage='misc')
+    metrics.write()
+"""
+
+import os
+import json
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import psycopg2.extensions
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Output directory; override with FBREF_METRICS_DIR
+METRICS_DIR = os.environ.get(
+    'FBREF_METRICS_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'metrics')
+)
+
+PHASES = ['read', 'parse', 'extract', 'transform', 'db']
+COUNTERS = ['files', 'errors', 'wall_seconds', 'read_bytes', 'db_round_trips', 'rows_written'] + \
+    [f'{phase}_seconds' for phase in PHASES]
+QUANTILES = [0.5, 0.95, 0.99]
+PROMETHEUS_PREFIX = 'nwsl_etl'
+
+
+def _quantile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class _Frame:
+    __slots__ = ('stage', 'phase', 'started', 'child_seconds')
+
+    def __init__(self, stage: str, phase: Optional[str]):
+        self.stage = stage
+        self.phase = phase
+        self.started = time.perf_counter()
+        self.child_seconds = 0.0
+
+
+class EtlMetrics:
+    """Thread-safe per-stage counters and per-file latencies for one run."""
+
+    def __init__(self, run: str = 'etl'):
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        # thread ident -> that thread's frame stack, for samplers (etl_profile)
+        self._stacks: Dict[int, List[_Frame]] = {}
+        self.reset(run)
+
+    def reset(self, run: str):
+        """Start a new run, dropping everything recorded so far."""
+        with self.lock:
+            self.run = run
+            self.started_at = datetime.now()
+            self.started = time.perf_counter()
+            self.stages: Dict[str, Dict[str, float]] = {}
+            self.latencies: Dict[str, List[float]] = {}
+
+    def _stack(self) -> List[_Frame]:
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+            self._stacks[threading.get_ident()] = stack
+        return stack
+
+    def current_stage(self) -> str:
+        """Stage of the innermost frame on this thread, else the run name."""
+        stack = self._stack()
+        return stack[-1].stage if stack else self.run
+
+    def thread_stage(self, ident: int) -> Optional[str]:
+        """Stage another thread is currently in (None outside any frame); safe to call from any thread."""
+        stack = self._stacks.get(ident)
+        try:
+            return stack[-1].stage if stack else None
+        except IndexError:
+            return None
+
+    def add(self, counter: str, value: float = 1, stage: Optional[str] = None):
+        """Add to a counter of a stage (default: the current stage)."""
+        stage = stage or self.current_stage()
+        with self.lock:
+            counters = self.stages.setdefault(stage, dict.fromkeys(COUNTERS, 0))
+            counters[counter] = counters.get(counter, 0) + value
+
+    def _close(self, frame: _Frame, stack: List[_Frame]) -> float:
+        elapsed = time.perf_counter() - frame.started
+        stack.pop()
+        if stack:
+            stack[-1].child_seconds += elapsed
+        return elapsed
+
+    @contextmanager
+    def stage(self, name: str, files: int = 1):
+        """Time one file's work (or files=0 for work that is not per file, e.g. a batch write)."""
+        stack = self._stack()
+        frame = _Frame(name, None)
+        stack.append(frame)
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = self._close(frame, stack)
+            with self.lock:
+                counters = self.stages.setdefault(name, dict.fromkeys(COUNTERS, 0))
+                counters['files'] += files
+                counters['errors'] += int(failed)
+                counters['wall_seconds'] += elapsed
+                counters['transform_seconds'] += max(0.0, elapsed - frame.child_seconds)
+                if files:
+                    self.latencies.setdefault(name, []).append(elapsed)
+
+    @contextmanager
+    def phase(self, name: str, stage: Optional[str] = None):
+        """Time a read/parse/extract/db step, for a given stage or the current one."""
+        stack = self._stack()
+        frame = _Frame(stage or self.current_stage(), name)
+        stack.append(frame)
+        try:
+            yield
+        finally:
+            elapsed = self._close(frame, stack)
+            self.add(f'{name}_seconds', max(0.0, elapsed - frame.child_seconds), frame.stage)
+
+    def snapshot(self) -> Dict:
+        """Picklable copy of everything recorded, for merging across processes."""
+        with self.lock:
+            return {
+                'stages': {stage: dict(counters) for stage, counters in self.stages.items()},
+                'latencies': {stage: list(values) for stage, values in self.latencies.items()},
+            }
+
+    def merge(self, snapshot: Optional[Dict]):
+        """Add another process's snapshot to this run."""
+        if not snapshot:
+            return
+        with self.lock:
+            for stage, other in snapshot.get('stages', {}).items():
+                counters = self.stages.setdefault(stage, dict.fromkeys(COUNTERS, 0))
+                for counter, value in other.items():
+                    counters[counter] = counters.get(counter, 0) + value
+            for stage, values in snapshot.get('latencies', {}).items():
+                self.latencies.setdefault(stage, []).extend(values)
+
+    def summary(self) -> Dict:
+        """Run summary: per-stage totals, rates, latency quantiles and the dominant cost."""
+        elapsed = time.perf_counter() - self.started
+        snapshot = self.snapshot()
+        stages = {}
+        for stage, counters in sorted(snapshot['stages'].items()):
+            latencies = sorted(snapshot['latencies'].get(stage, []))
+            cpu_side = sum(counters.get(f'{phase}_seconds', 0) for phase in PHASES if phase != 'db')
+            db_side = counters.get('db_seconds', 0)
+            entry = {counter: round(value, 6) if isinstance(value, float) else value
+                     for counter, value in counters.items()}
+            entry['files_per_second'] = round(counters['files'] / elapsed, 3) if elapsed > 0 else 0
+            entry['latency_seconds'] = {
+                **{f'p{int(q * 100)}': round(_quantile(latencies, q), 6) for q in QUANTILES},
+                'max': round(latencies[-1], 6) if latencies else 0.0,
+            }
+            if cpu_side or db_side:
+                entry['bound'] = 'db' if db_side > cpu_side else 'parse'
+                entry['db_share'] = round(db_side / (cpu_side + db_side), 3)
+            stages[stage] = entry
+        return {
+            'run': self.run,
+            'started_at': self.started_at.isoformat(),
+            'elapsed_seconds': round(elapsed, 3),
+            'stages': stages,
+        }
+
+    def prometheus(self, summary: Optional[Dict] = None) -> str:
+        """The summary in the Prometheus text exposition format."""
+        summary = summary or self.summary()
+        run = summary['run']
+        lines = []
+
+        def metric(name: str, kind: str, help_text: str, samples: List):
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in [('run', run)] + labels)
+                lines.append(f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}} {value}")
+
+        stages = summary['stages']
+        metric('run_seconds', 'gauge', 'Wall time of the run.', [([], summary['elapsed_seconds'])])
+        metric('run_timestamp_seconds', 'gauge', 'Unix time the run started.',
+               [([], round(datetime.fromisoformat(summary['started_at']).timestamp(), 3))])
+        for counter, help_text in [
+            ('files', 'Files processed per stage.'),
+            ('errors', 'Files whose stage raised.'),
+            ('read_bytes', 'Bytes of HTML read.'),
+            ('db_round_trips', 'Statements and COPYs sent to Postgres.'),
+            ('rows_written', 'Rows written to the database.'),
+            ('wall_seconds', 'Wall time spent inside the stage.'),
+        ]:
+            metric(f'{counter}_total', 'counter', help_text,
+                   [([('stage', stage)], entry.get(counter, 0)) for stage, entry in stages.items()])
+        metric('phase_seconds_total', 'counter', 'Time per stage and phase (read, parse, extract, transform, db).',
+               [([('stage', stage), ('phase', phase)], entry.get(f'{phase}_seconds', 0))
+                for stage, entry in stages.items() for phase in PHASES])
+        metric('file_latency_seconds', 'gauge', 'Per-file stage latency quantiles.',
+               [([('stage', stage), ('quantile', key)], value)
+                for stage, entry in stages.items() for key, value in entry['latency_seconds'].items()])
+        return '\n'.join(lines) + '\n'
+
+    def write(self, directory: str = METRICS_DIR) -> Dict:
+        """Log the per-stage summary and write <run>.json and <run>.prom; returns the summary."""
+        summary = self.summary()
+        for stage, entry in summary['stages'].items():
+            logger.info(
+                f"[metrics] {stage}: {entry['files']} files, {entry['rows_written']} rows, "
+                f"{entry['files_per_second']:.1f} files/sec, p95 {entry['latency_seconds']['p95'] * 1000:.0f} ms | "
+                + ' '.join(f"{phase} {entry.get(f'{phase}_seconds', 0):.1f}s" for phase in PHASES)
+                + f" | {entry['db_round_trips']} round-trips"
+                + (f" | {entry['bound']}-bound" if 'bound' in entry else '')
+            )
+        try:
+            os.makedirs(directory, exist_ok=True)
+            _write_atomic(os.path.join(directory, f"{self.run}.json"), json.dumps(summary, indent=2))
+            # Atomic rename so the textfile collector never reads a partial file
+            _write_atomic(os.path.join(directory, f"{self.run}.prom"), self.prometheus(summary))
+            logger.info(f"Metrics written to {os.path.join(directory, self.run)}.json/.prom")
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {directory}: {e}")
+        return summary
+
+
+def _write_atomic(path: str, content: str):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+_metrics = EtlMetrics()
+
+
+def get_metrics() -> EtlMetrics:
+    """The process-wide metrics (module-level references stay valid across start_run)."""
+    return _metrics
+
+
+def start_run(run: str) -> EtlMetrics:
+    """Reset the process-wide metrics for a new run named run (the output file name)."""
+    _metrics.reset(run)
+    return _metrics
+
+
+class _MeteredCursorMixin:
+    """Counts every statement and COPY as a round-trip and times it as db."""
+
+    def execute(self, query, vars=None):
+        with _metrics.phase('db'):
+            _metrics.add('db_round_trips')
+            return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        with _metrics.phase('db'):
+            _metrics.add('db_round_trips')
+            return super().executemany(query, vars_list)
+
+    def callproc(self, procname, parameters=None):
+        with _metrics.phase('db'):
+            _metrics.add('db_round_trips')
+            return super().callproc(procname, parameters)
+
+    def copy_expert(self, sql, file, size=8192):
+        with _metrics.phase('db'):
+            _metrics.add('db_round_trips')
+            return super().copy_expert(sql, file, size)
+
+    def copy_from(self, file, table, sep='\t', null='\\N', size=8192, columns=None):
+        with _metrics.phase('db'):
+            _metrics.add('db_round_trips')
+            return super().copy_from(file, table, sep, null, size, columns)
+
+
+_metered_cursor_classes: Dict[type, type] = {}
+
+
+def metered_cursor_class(base: type) -> type:
+    """A subclass of a cursor class (plain, RealDictCursor, ...) that is metered."""
+    if issubclass(base, _MeteredCursorMixin):
+        return base
+    if base not in _metered_cursor_classes:
+        _metered_cursor_classes[base] = type(f'Metered{base.__name__}', (_MeteredCursorMixin, base), {})
+    return _metered_cursor_classes[base]
+
+
+MeteredCursor = metered_cursor_class(psycopg2.extensions.cursor)
+
+
+class MeteredConnection(psycopg2.extensions.connection):
+    """Connection whose cursors (whatever their cursor_factory), commits and rollbacks are metered."""
+
+    def cursor(self, *args, **kwargs):
+        base = kwargs.get('cursor_factory') or self.cursor_factory or psycopg2.extensions.cursor
+        kwargs['cursor_factory'] = metered_cursor_class(base)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        with _metrics.phase('db'):
+            _metrics.add('db_round_trips')
+            return super().commit()
+
+    def rollback(self):
+        with _metrics.phase('db'):
+            _metrics.add('db_round_trips')
+            return super().rollback()
+
+
+def metered_connect(**params):
+    """psycopg2.connect() returning a MeteredConnection."""
+    return psycopg2.connect(connection_factory=MeteredConnection, **params)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Built-in profiling for extractor runs (--profile).
+
+Every extractor entry point and the unified runner accept
+
+    --profile [sample|cprofile]   profile the run (default mode: sample)
+    --profile-top N               hot functions to print (default 25)
+
+sample mode polls the stacks of all threads of the process at a fixed
+interval (FBREF_PROFILE_INTERVAL seconds, default 0.005) and tags each
+sample with the stage the thread is in (etl_metrics frames: 'page', 'misc',
+'db_flush', ...). It costs a few percent, sees writer and pool threads,
+and writes profiles/<run>-<time>/:
+
+    all.folded            every sample
+    <stage>.folded        the samples taken inside that stage
+    summary.txt           the hot-function table printed at the end
+
+The .folded files are in the collapsed-stack format read by flamegraph.pl,
+speedscope and inferno (one 'frame;frame;frame count' line per stack).
+Idle threads (blocked in threading/queue waits) are not sampled. Time in C
+code (lxml, psycopg2) is charged to the Python function that called it.
+
+cprofile mode runs cProfile over the main thread instead: exact call counts
+and per-call times, but slower and blind to other threads. It writes
+profiles/<run>-<time>/main.pstats (open with snakeviz or pstats) and
+summary.txt.
+
+Neither mode follows worker processes (fbref_parallel, --workers N > 1);
+profile with --workers 1 to see the extraction code.
+
+Usage:
+    if __name__ == "__main__":
+        run_profiled(main, 'misc')
+"""
+
+import os
+import sys
+import time
+import pstats
+import cProfile
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from etl_metrics import get_metrics
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Output directory; override with FBREF_PROFILE_DIR
+PROFILE_DIR = os.environ.get(
+    'FBREF_PROFILE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+)
+SAMPLE_INTERVAL = float(os.environ.get('FBREF_PROFILE_INTERVAL', '0.005'))
+PROFILE_MODES = ['sample', 'cprofile']
+DEFAULT_TOP = 25
+
+# Samples whose innermost frame is in one of these files are idle threads
+IDLE_FILES = ('threading.py', 'queue.py', 'selectors.py')
+# Stage label for samples taken outside any metrics stage
+NO_STAGE = 'other'
+
+
+def _frame_label(code) -> str:
+    """file.py:function - the flame graph node for a code object."""
+    name = getattr(code, 'co_qualname', code.co_name)
+    filename = os.path.basename(code.co_filename)
+    if filename == '__init__.py':
+        filename = os.path.join(os.path.basename(os.path.dirname(code.co_filename)), filename)
+    return f"{filename}:{name}".replace(';', ',').replace(' ', '_')
+
+
+class StackSampler:
+    """Background thread sampling every other thread's Python stack."""
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks: Dict[str, Counter] = {}
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='etl-profile-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        metrics = get_metrics()
+        while not self._stop.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == own or frame.f_code.co_filename.endswith(IDLE_FILES):
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                stage = metrics.thread_stage(ident) or NO_STAGE
+                self.stacks.setdefault(stage, Counter())[';'.join(reversed(labels))] += 1
+                self.samples += 1
+
+    def folded(self, stage: Optional[str] = None) -> Counter:
+        """Folded stack -> samples for one stage, or for all stages."""
+        if stage is not None:
+            return self.stacks.get(stage, Counter())
+        total = Counter()
+        for stacks in self.stacks.values():
+            total.update(stacks)
+        return total
+
+
+def hot_functions(stacks: Counter, top: int) -> List[Tuple[str, int, int]]:
+    """(function, self samples, total samples) for the top functions by self samples."""
+    own, total = Counter(), Counter()
+    for stack, count in stacks.items():
+        labels = stack.split(';')
+        own[labels[-1]] += count
+        for label in set(labels):
+            total[label] += count
+    return [(label, count, total[label]) for label, count in own.most_common(top)]
+
+
+def write_folded(path: str, stacks: Counter):
+    with open(path, 'w') as f:
+        for stack, count in sorted(stacks.items()):
+            f.write(f"{stack} {count}\n")
+
+
+def sample_summary(sampler: StackSampler, top: int, elapsed: float) -> str:
+    """Per-stage sample shares and the top-N table of a sampled run."""
+    samples = max(sampler.samples, 1)
+    lines = [f"{sampler.samples:,} samples over {elapsed:.1f}s "
+             f"(every {sampler.interval * 1000:.0f} ms, all threads)", "", "Samples by stage:"]
+    by_stage = sorted(((sum(s.values()), stage) for stage, s in sampler.stacks.items()), reverse=True)
+    for count, stage in by_stage:
+        lines.append(f"  {stage:24} {count:8,} {count / samples:6.1%}")
+    lines += ["", f"Top {top} functions by self samples:", f"  {'self':>6} {'total':>6}  function"]
+    for label, own, total in hot_functions(sampler.folded(), top):
+        lines.append(f"  {own / samples:6.1%} {total / samples:6.1%}  {label}")
+    for count, stage in by_stage[:5]:
+        lines += ["", f"Top functions in {stage}:"]
+        for label, own, _ in hot_functions(sampler.folded(stage), min(top, 10)):
+            lines.append(f"  {own / max(count, 1):6.1%}  {label}")
+    return '\n'.join(lines)
+
+
+def cprofile_summary(profile: cProfile.Profile, top: int) -> str:
+    """pstats top-N tables (by own time and by cumulative time) of a cProfile run."""
+    from io import StringIO
+    out = StringIO()
+    stats = pstats.Stats(profile, stream=out)
+    stats.sort_stats('tottime').print_stats(top)
+    stats.sort_stats('cumulative').print_stats(top)
+    return out.getvalue()
+
+
+class Profiler:
+    """Context manager profiling a block of a run into PROFILE_DIR/<name>-<time>/."""
+
+    def __init__(self, name: str, mode: str = 'sample', top: int = DEFAULT_TOP,
+                 directory: str = PROFILE_DIR):
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}; use one of {PROFILE_MODES}")
+        self.name = name
+        self.mode = mode
+        self.top = top
+        self.directory = os.path.join(directory, f"{name}-{datetime.now():%Y%m%d-%H%M%S}")
+        self._sampler: Optional[StackSampler] = None
+        self._profile: Optional[cProfile.Profile] = None
+        self._started = 0.0
+
+    def __enter__(self):
+        logger.info(f"Profiling {self.name} ({self.mode}) into {self.directory}")
+        self._started = time.perf_counter()
+        if self.mode == 'sample':
+            self._sampler = StackSampler()
+            self._sampler.start()
+        else:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._started
+        os.makedirs(self.directory, exist_ok=True)
+        if self._sampler is not None:
+            self._sampler.stop()
+            write_folded(os.path.join(self.directory, 'all.folded'), self._sampler.folded())
+            for stage, stacks in self._sampler.stacks.items():
+                write_folded(os.path.join(self.directory, f"{stage}.folded"), stacks)
+            summary = sample_summary(self._sampler, self.top, elapsed)
+        else:
+            self._profile.disable()
+            self._profile.dump_stats(os.path.join(self.directory, 'main.pstats'))
+            summary = cprofile_summary(self._profile, self.top)
+        with open(os.path.join(self.directory, 'summary.txt'), 'w') as f:
+            f.write(summary + '\n')
+        print(f"\nPROFILE {self.name} ({self.mode}) -> {self.directory}\n{summary}")
+        return False
+
+
+def pop_profile_arguments(argv: List[str]) -> Tuple[Optional[str], int, List[str]]:
+    """
+    (mode, top, remaining argv) - --profile options taken out of argv.
+
+    A bare --profile means sample mode; the next argument is only taken as
+    the mode when it is one, so '--profile run' leaves 'run' in place.
+    """
+    mode, top, remaining = None, DEFAULT_TOP, []
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == '--profile':
+            mode = 'sample'
+            if i + 1 < len(argv) and argv[i + 1] in PROFILE_MODES:
+                mode = argv[i + 1]
+                i += 1
+        elif arg.startswith('--profile='):
+            mode = arg.split('=', 1)[1]
+        elif arg == '--profile-top' and i + 1 < len(argv):
+            top = int(argv[i + 1])
+            i += 1
+        elif arg.startswith('--profile-top='):
+            top = int(arg.split('=', 1)[1])
+        else:
+            remaining.append(arg)
+        i += 1
+    if mode is not None and mode not in PROFILE_MODES:
+        sys.exit(f"--profile: unknown mode {mode!r} (choose from {', '.join(PROFILE_MODES)})")
+    return mode, top, remaining
+
+
+@contextmanager
+def profiled(name: str, mode: Optional[str], top: int = DEFAULT_TOP):
+    """Profile the block when mode is set; a no-op otherwise."""
+    if not mode:
+        yield None
+        return
+    with Profiler(name, mode, top) as profiler:
+        yield profiler
+
+
+def run_profiled(main: Callable, name: str):
+    """
+    Entry point wrapper: run main() under --profile when given.
+
+    The --profile options are removed from sys.argv before main() parses its
+    own arguments, so scripts without argparse (or with their own sys.argv
+    checks) take them too.
+    """
+    mode, top, remaining = pop_profile_arguments(sys.argv[1:])
+    sys.argv[1:] = remaining
+    with profiled(name, mode, top):
+        return main()
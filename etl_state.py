@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Per-match ETL state for incremental runs (etl_match_state, migrations/04).
+
+Every (match, family) that is loaded is recorded with the content hash of the
+match file it came from and the extractor version that produced it. Before a
+run, the state for each requested family is read once; a match is skipped for
+a family when a 'done' row exists for its current file hash and the family's
+current version. New matches, re-downloaded pages and bumped extractor
+versions are picked up; everything else costs nothing.
+
+File hashes come from the match file locator, which already stores a sha256
+per file and only re-reads changed files.
+
+State rows are written on a dedicated connection in batches, after the data
+they describe has been committed. A crash between the two only means a few
+matches are processed again, which the upserts make harmless. Families that
+buffer rows across matches (misc, passing_types) defer() a match's 'done' row
+and confirm() it once the batch holding its rows has committed; deferred rows
+that are never confirmed are never written, and a run that fails discard()s
+whatever it has not written yet.
+
+Usage:
+    state = EtlState(conn)
+    todo = state.plan(files, ['passing', 'misc'])   # {path: {families still to run}}
+    state.record(match_id, 'passing', file_hash, 'done', records=22, seconds=0.4)
+    state.defer(match_id, 'misc', path, records=30, seconds=0.1)   # rows still buffered
+    state.confirm('misc', [match_id])                              # their batch committed
+    state.flush()
+"""
+
+import os
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+
+from psycopg2.extras import execute_values
+
+from db_session import connect
+from fbref_table_cache import file_sha256
+from match_file_locator import get_locator
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Bump a family's version when its extractor's output changes; every match is then redone
+EXTRACTOR_VERSIONS = {
+    'lineups': '1',
+    'team_stats': '1',
+    'keeper_stats': '1',
+    # 2: redo matches whose shots a failed parse cleared while being recorded done
+    'shots_all': '2',
+    'possession': '1',
+    'passing': '1',
+    'passing_types': '1',
+    'misc': '1',
+    'defense': '1',
+}
+
+FLUSH_EVERY = 200   # state rows buffered before a write
+
+
+def file_hashes(paths: List[str]) -> Dict[str, str]:
+    """Content sha256 per path, from the locator of the directories the paths live in."""
+    roots = sorted({os.path.dirname(os.path.abspath(path)) for path in paths})
+    if not roots:
+        return {}
+    known = get_locator(roots).file_hashes()
+    return {path: known.get(os.path.abspath(path)) for path in paths}
+
+
+class EtlState:
+    """Reads which matches are done per family and records new outcomes."""
+
+    def __init__(self, conn, versions: Dict[str, str] = EXTRACTOR_VERSIONS):
+        self.conn = conn
+        self.versions = versions
+        self.enabled = self._table_exists()
+        self.done: Dict[str, Set[Tuple[str, str]]] = {}
+        self.hashes: Dict[str, str] = {}
+        self.pending: List[Tuple] = []
+        self.deferred: Dict[Tuple[str, str], Tuple] = {}
+        self.lock = threading.RLock()
+        self.stats = {'skipped': 0, 'recorded': 0}
+        if not self.enabled:
+            logger.warning("etl_match_state not found (apply migrations/04_etl_match_state.sql); "
+                           "running without incremental state")
+
+    def _table_exists(self) -> bool:
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT to_regclass('etl_match_state') IS NOT NULL")
+        exists = cursor.fetchone()[0]
+        cursor.close()
+        self.conn.commit()
+        return exists
+
+    def load(self, families: List[str]):
+        """Read the done (match_id, file_hash) pairs of each family's current version."""
+        if not self.enabled:
+            return
+        cursor = self.conn.cursor()
+        for family in families:
+            cursor.execute("""
+                SELECT match_id, file_hash
+                FROM etl_match_state
+                WHERE family = %s AND extractor_version = %s AND status = 'done'
+            """, (family, self.versions.get(family, '1')))
+            self.done[family] = set(cursor.fetchall())
+        cursor.close()
+        self.conn.commit()
+
+    def is_done(self, match_id: str, family: str, file_hash: Optional[str]) -> bool:
+        """Whether a family already loaded this match from this file content."""
+        return bool(file_hash) and (match_id, file_hash) in self.done.get(family, ())
+
+    def plan(self, files: List[Tuple[str, str]], families: List[str],
+             force: bool = False) -> Dict[str, Set[str]]:
+        """
+        Families still to run per file.
+
+        files are (match_id, path) pairs; files with nothing left to do are
+        omitted. With force (or without the state table) everything runs.
+        """
+        self.hashes.update(file_hashes([path for _, path in files]))
+        if not force:
+            self.load(families)
+        todo = {}
+        for match_id, path in files:
+            if force or not self.enabled:
+                todo[path] = set(families)
+                continue
+            remaining = {f for f in families if not self.is_done(match_id, f, self.hashes.get(path))}
+            self.stats['skipped'] += len(families) - len(remaining)
+            if remaining:
+                todo[path] = remaining
+        return todo
+
+    def record(self, match_id: str, family: str, path_or_hash: str, status: str,
+               records: Optional[int] = None, seconds: Optional[float] = None, error: Optional[str] = None):
+        """Buffer one outcome ('done' or 'failed'); written every FLUSH_EVERY rows and on flush()."""
+        if not self.enabled:
+            return
+        file_hash = self.file_hash(path_or_hash)
+        if not file_hash:
+            logger.warning(f"No file hash for {match_id} ({path_or_hash}); {family} outcome not recorded")
+            return
+        finished_at = datetime.now()
+        started_at = finished_at - timedelta(seconds=seconds) if seconds is not None else None
+        row = (match_id, family, file_hash, self.versions.get(family, '1'), status, records,
+               int(seconds * 1000) if seconds is not None else None, error, started_at, finished_at)
+        with self.lock:
+            self.pending.append(row)
+            if len(self.pending) >= FLUSH_EVERY:
+                self._write()
+
+    def file_hash(self, path_or_hash: Optional[str]) -> Optional[str]:
+        """Content hash for a match file path (hashed here when the locator has none), or a hash as given."""
+        if not path_or_hash:
+            return None
+        known = self.hashes.get(path_or_hash)
+        if known:
+            return known
+        if os.path.isfile(path_or_hash):
+            self.hashes[path_or_hash] = file_sha256(path_or_hash)
+            return self.hashes[path_or_hash]
+        return None if path_or_hash in self.hashes else path_or_hash
+
+    def defer(self, match_id: str, family: str, path_or_hash: str,
+              records: Optional[int] = None, seconds: Optional[float] = None):
+        """Hold a 'done' outcome whose rows are still buffered until confirm() names the match."""
+        if not self.enabled:
+            return
+        with self.lock:
+            self.deferred[(family, match_id)] = (path_or_hash, records, seconds)
+
+    def confirm(self, family: str, match_ids: List[str]):
+        """Record the deferred 'done' outcomes of matches whose buffered rows have committed."""
+        with self.lock:
+            for match_id in match_ids:
+                held = self.deferred.pop((family, match_id), None)
+                if held is not None:
+                    path_or_hash, records, seconds = held
+                    self.record(match_id, family, path_or_hash, 'done', records, seconds)
+
+    def flush(self):
+        """Write buffered outcomes."""
+        with self.lock:
+            self._write()
+
+    def discard(self):
+        """Drop every outcome not written yet (after a failed run), so those matches are redone."""
+        with self.lock:
+            if self.pending or self.deferred:
+                logger.warning(f"Discarding {len(self.pending)} unwritten and {len(self.deferred)} "
+                               f"unconfirmed ETL state rows")
+            self.pending = []
+            self.deferred = {}
+
+    def _write(self):
+        if not self.pending:
+            return
+        # Last outcome wins for a key within the batch
+        rows = list({row[:4]: row for row in self.pending}.values())
+        self.pending = []
+        cursor = self.conn.cursor()
+        try:
+            execute_values(cursor, """
+                INSERT INTO etl_match_state (match_id, family, file_hash, extractor_version, status,
+                                             records, duration_ms, error, started_at, finished_at)
+                VALUES %s
+                ON CONFLICT (match_id, family, file_hash, extractor_version) DO UPDATE SET
+                    status = EXCLUDED.status,
+                    records = EXCLUDED.records,
+                    duration_ms = EXCLUDED.duration_ms,
+                    error = EXCLUDED.error,
+                    started_at = EXCLUDED.started_at,
+                    finished_at = EXCLUDED.finished_at,
+                    attempts = etl_match_state.attempts + 1
+            """, rows)
+            self.conn.commit()
+        except Exception as e:
+            # State rows only save work: dropping a batch means those matches are redone
+            self.conn.rollback()
+            logger.error(f"Error writing {len(rows)} ETL state rows: {e}")
+            return
+        finally:
+            cursor.close()
+        self.stats['recorded'] += len(rows)
+
+    def summary(self) -> List[Tuple]:
+        """(family, extractor_version, status, matches) for every recorded combination."""
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT family, extractor_version, status, COUNT(DISTINCT match_id)
+            FROM etl_match_state
+            GROUP BY family, extractor_version, status
+            ORDER BY family, extractor_version, status
+        """)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+
+def main():
+    """Show or reset the ETL state."""
+    parser = argparse.ArgumentParser(description='Inspect the per-match ETL state')
+    parser.add_argument('--reset', metavar='FAMILY', help='Forget every state row of a family so it is redone')
+    args = parser.parse_args()
+
+    conn = connect()
+    try:
+        state = EtlState(conn)
+        if not state.enabled:
+            return
+        if args.reset:
+            cursor = conn.cursor()
+            cursor.execute("DELETE FROM etl_match_state WHERE family = %s", (args.reset,))
+            print(f"Removed {cursor.rowcount} state rows for {args.reset}")
+            conn.commit()
+            return
+        for family, version, status, matches in state.summary():
+            current = ' (current)' if EXTRACTOR_VERSIONS.get(family) == version else ''
+            print(f"{family:15} v{version}{current:10} {status:7} {matches:,} matches")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -6,34 +6,47 @@ Extract comprehensive lineup data from FBref HTML files including:
 - Unused substitutes (dressed but never played)
 """
 
-import os
 import sys
 import json
 import uuid
-import psycopg2
-from psycopg2.extras import execute_batch
-from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
 import re
 from typing import Dict, List, Tuple, Optional
 from io import StringIO
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
+from db_session import DB_CONFIG, PreparedStatement, connect
+from compact_ids import CompactPlayerMap
+from etl_metrics import start_run
+from etl_profile import run_profiled
+from fbref_tables import iter_tables, parse_html_file
+from mapping_snapshot import cached_mapping, player_mapping
+from match_file_locator import find_match_file
+
+SUMMARY_TABLE_RE = re.compile(r'stats_[a-f0-9]{8}_summary')
+KEEPER_TABLE_RE = re.compile(r'keeper_stats_[a-f0-9]{8}')
 
 # HTML files directory
 HTML_DIR = '/Users/thomasmcmillan/projects/nwsl_data_backup_data/notebooks/match_html_files'
 
+# Prepared once per connection; each match's lineups are sent as pages of EXECUTEs
+INSERT_LINEUP = PreparedStatement('insert_match_lineup', """
+    INSERT INTO match_lineup (
+        lineup_id, match_id, player_id, player_name, position,
+        jersey_number, is_starter, formation, player_uuid, 
+        team_uuid, team_season_id
+    ) VALUES (
+        %(lineup_id)s, %(match_id)s, %(player_id)s, %(player_name)s, %(position)s,
+        %(jersey_number)s, %(is_starter)s, %(formation)s, %(player_uuid)s,
+        %(team_uuid)s, %(team_season_id)s
+    )
+    ON CONFLICT (lineup_id) DO NOTHING
+    RETURNING lineup_id;
+""")
+
 def get_db_connection():
     """Create and return a database connection."""
-    return psycopg2.connect(**DB_CONFIG)
+    return connect()
 
 def get_matches_missing_lineups(conn) -> List[Dict]:
     """Get list of matches that have no lineup data."""
@@ -73,28 +86,16 @@ def get_matches_missing_lineups(conn) -> List[Dict]:
         columns = [desc[0] for desc in cur.description]
         return [dict(zip(columns, row)) for row in cur.fetchall()]
 
-def get_player_mappings(conn) -> Dict:
-    """Get FBref ID to UUID mappings for players."""
-    
-    # Get player mappings
-    player_query = """
-    SELECT DISTINCT 
-        p.player_id,
-        p.id as player_uuid,
-        p.player_name
-    FROM player p
-    WHERE p.player_id IS NOT NULL;
-    """
-    
-    with conn.cursor() as cur:
-        cur.execute(player_query)
-        player_map = {row[0]: {'uuid': row[1], 'name': row[2]} 
-                     for row in cur.fetchall()}
-    
-    return player_map
+def get_player_mappings(conn) -> CompactPlayerMap:
+    """Get FBref ID to UUID mappings for players (snapshotted locally)."""
+    return player_mapping(conn)
 
 def get_team_mappings(conn) -> Tuple[Dict, Dict]:
-    """Get team season mappings and FBref team ID to UUID mappings."""
+    """Get team season mappings and FBref team ID to UUID mappings (snapshotted locally)."""
+    return cached_mapping(conn, 'lineup_team_mappings', ['team_season', 'match_lineup'], load_team_mappings)
+
+def load_team_mappings(conn) -> Tuple[Dict, Dict]:
+    """Team season mappings and FBref team ID to UUID mappings, from the database."""
     
     # Get team season mappings
     team_query = """
@@ -159,17 +160,36 @@ def identify_team_from_caption(caption_text: str, home_team: str, away_team: str
     
     return None
 
+def _is_header_row(row) -> bool:
+    return bool(row.xpath('.//th[@scope="col"]'))
+
+
+def _player_link(row):
+    """The <a> in a row's player cell, or None."""
+    player_cells = row.xpath('.//th[@data-stat="player"]')
+    if not player_cells:
+        return None
+    return player_cells[0].find('.//a')
+
+
+def _caption_text(table) -> Optional[str]:
+    caption = table.find('caption')
+    return caption.text_content().strip() if caption is not None else None
+
+
 def extract_lineup_from_html(html_file: str, match_info: Dict, player_map: Dict, 
-                            team_season_map: Dict, fbref_to_uuid_map: Dict) -> List[Dict]:
+                            team_season_map: Dict, fbref_to_uuid_map: Dict,
+                            root=None) -> List[Dict]:
     """
     Extract comprehensive lineup data from HTML file.
     Returns list of lineup entries including starters, used subs, and unused subs.
+    A pre-parsed lxml page can be supplied to avoid re-reading the file.
     """
     lineups = []
     
     try:
-        with open(html_file, 'r', encoding='utf-8') as f:
-            soup = BeautifulSoup(f.read(), 'html.parser')
+        if root is None:
+            root = parse_html_file(html_file)
         
         # Get team information
         home_team_season_id = match_info['home_team_season_id']
@@ -183,18 +203,17 @@ def extract_lineup_from_html(html_file: str, match_info: Dict, player_map: Dict,
         away_team_uuid = fbref_to_uuid_map.get(away_team_info.get('fbref_team_id'))
         
         # Find all player stats tables
-        player_tables = soup.find_all('table', id=re.compile(r'stats_[a-f0-9]{8}_summary'))
+        player_tables = [table for _, table in iter_tables(root, SUMMARY_TABLE_RE)]
         
         # Process each table (should be 2 - one for each team)
         for table_idx, table in enumerate(player_tables):
             table_id = table.get('id', '')
             
             # Determine which team this table belongs to
-            caption = table.find('caption')
+            caption_text = _caption_text(table)
             team_type = None
             
-            if caption:
-                caption_text = caption.text.strip()
+            if caption_text:
                 team_type = identify_team_from_caption(
                     caption_text, 
                     match_info['home_team'], 
@@ -214,23 +233,19 @@ def extract_lineup_from_html(html_file: str, match_info: Dict, player_map: Dict,
                 team_season_id = away_team_season_id
             
             # Process table rows to extract player data
-            rows = table.find_all('tr')
+            rows = table.iter('tr')
             
             # Track player count to identify starters (first 11)
             player_count = 0
             
             for row in rows:
                 # Skip header rows
-                if row.find('th', {'scope': 'col'}):
+                if _is_header_row(row):
                     continue
                 
                 # Get player link for FBref ID
-                player_cell = row.find('th', {'data-stat': 'player'})
-                if not player_cell:
-                    continue
-                
-                player_link = player_cell.find('a')
-                if not player_link:
+                player_link = _player_link(row)
+                if player_link is None:
                     continue
                 
                 player_href = player_link.get('href', '')
@@ -242,10 +257,10 @@ def extract_lineup_from_html(html_file: str, match_info: Dict, player_map: Dict,
                     player_fbref_id = match.group(1)
                 
                 # Get player name
-                player_name = player_link.text.strip()
+                player_name = player_link.text_content().strip()
                 
                 # Get data from row cells
-                cells = row.find_all('td')
+                cells = row.iter('td')
                 
                 # Extract key information
                 position = None
@@ -254,7 +269,7 @@ def extract_lineup_from_html(html_file: str, match_info: Dict, player_map: Dict,
                 
                 for cell in cells:
                     stat = cell.get('data-stat', '')
-                    cell_text = cell.text.strip()
+                    cell_text = cell.text_content().strip()
                     
                     if stat == 'position':
                         position = cell_text if cell_text else None
@@ -306,22 +321,18 @@ def extract_lineup_from_html(html_file: str, match_info: Dict, player_map: Dict,
                 lineups.append(lineup_entry)
         
         # Try to find goalkeeper information if not already captured
-        keeper_tables = soup.find_all('table', id=re.compile(r'keeper_stats_[a-f0-9]{8}'))
+        keeper_tables = [table for _, table in iter_tables(root, KEEPER_TABLE_RE)]
         
         for table in keeper_tables:
             # Process goalkeeper tables for any additional info
-            rows = table.find_all('tr')
+            rows = table.iter('tr')
             
             for row in rows:
-                if row.find('th', {'scope': 'col'}):
+                if _is_header_row(row):
                     continue
                 
-                player_cell = row.find('th', {'data-stat': 'player'})
-                if not player_cell:
-                    continue
-                
-                player_link = player_cell.find('a')
-                if not player_link:
+                player_link = _player_link(row)
+                if player_link is None:
                     continue
                 
                 player_href = player_link.get('href', '')
@@ -333,13 +344,12 @@ def extract_lineup_from_html(html_file: str, match_info: Dict, player_map: Dict,
                     existing = [l for l in lineups if l['player_id'] == player_fbref_id]
                     if not existing:
                         # Add goalkeeper if not already in lineup
-                        player_name = player_link.text.strip()
+                        player_name = player_link.text_content().strip()
                         
                         # Determine team
-                        caption = table.find('caption')
+                        caption_text = _caption_text(table)
                         team_type = None
-                        if caption:
-                            caption_text = caption.text.strip()
+                        if caption_text:
                             team_type = identify_team_from_caption(
                                 caption_text, 
                                 match_info['home_team'], 
@@ -385,22 +395,8 @@ def insert_lineups(conn, lineups: List[Dict]) -> int:
     if not lineups:
         return 0
     
-    insert_query = """
-    INSERT INTO match_lineup (
-        lineup_id, match_id, player_id, player_name, position,
-        jersey_number, is_starter, formation, player_uuid, 
-        team_uuid, team_season_id
-    ) VALUES (
-        %(lineup_id)s, %(match_id)s, %(player_id)s, %(player_name)s, %(position)s,
-        %(jersey_number)s, %(is_starter)s, %(formation)s, %(player_uuid)s,
-        %(team_uuid)s, %(team_season_id)s
-    )
-    ON CONFLICT (lineup_id) DO NOTHING
-    RETURNING lineup_id;
-    """
-    
     with conn.cursor() as cur:
-        execute_batch(cur, insert_query, lineups)
+        INSERT_LINEUP.execute_many(cur, lineups)
         inserted = cur.rowcount
         conn.commit()
         return inserted
@@ -413,6 +409,7 @@ def main():
     print()
     
     # Connect to database
+    metrics = start_run('lineups')
     conn = get_db_connection()
     
     try:
@@ -440,11 +437,11 @@ def main():
         
         for idx, match in enumerate(missing_matches):
             match_id = match['match_id']
-            html_file = os.path.join(HTML_DIR, f"match_{match_id}.html")
+            html_file = find_match_file(match_id)
             
             print(f"[{idx+1}/{len(missing_matches)}] Processing {match['match_date']}: {match['home_team']} vs {match['away_team']}...", end=' ')
             
-            if not os.path.exists(html_file):
+            if not html_file:
                 print(f"HTML file not found!")
                 failed_matches.append({
                     'match': match,
@@ -453,12 +450,16 @@ def main():
                 continue
             
             # Extract lineups
-            lineups = extract_lineup_from_html(html_file, match, player_map, 
-                                              team_season_map, fbref_to_uuid_map)
+            inserted = 0
+            with metrics.stage('lineups'):
+                lineups = extract_lineup_from_html(html_file, match, player_map, 
+                                                  team_season_map, fbref_to_uuid_map)
+                if lineups:
+                    # Insert into database
+                    inserted = insert_lineups(conn, lineups)
+            metrics.add('rows_written', inserted, 'lineups')
             
             if lineups:
-                # Insert into database
-                inserted = insert_lineups(conn, lineups)
                 total_lineups += len(lineups)
                 successful_matches += 1
                 print(f"Extracted {len(lineups)} players, inserted {inserted}")
@@ -511,6 +512,7 @@ def main():
     
     finally:
         conn.close()
+        metrics.write()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_profiled(main, 'lineups')
\ No newline at end of file
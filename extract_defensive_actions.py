@@ -6,23 +6,21 @@ Handles all 20 columns in the expanded schema.
 
 import os
 import sys
-import psycopg2
+import argparse
 from psycopg2.extras import execute_batch
-from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
 import re
 from typing import Dict, List, Tuple, Optional
 import json
 
-# Database connection parameters
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
+from db_session import connect
+from fbref_table_cache import get_stat_tables
+from fbref_parallel import run_parallel
+from bulk_loader import BulkLoader, DEFENSIVE_ACTIONS_COLUMNS
+from etl_metrics import start_run
+from etl_profile import run_profiled
+from match_player_resolver import MatchPlayerResolver
 
 # HTML files directory
 HTML_DIR = '/Users/thomasmcmillan/projects/nwsl_db_migration/html_files/'
@@ -47,9 +45,12 @@ COLUMN_MAPPINGS = {
     'errors': 'errors'
 }
 
+# Table id format: stats_{team_id}_defense
+DEFENSE_TABLE_RE = re.compile(r'stats_([a-f0-9]+)_defense')
+
 def get_db_connection():
     """Create and return a database connection."""
-    return psycopg2.connect(**DB_CONFIG)
+    return connect()
 
 def extract_match_id_from_filename(filename: str) -> str:
     """Extract match ID from HTML filename."""
@@ -64,51 +65,28 @@ def extract_match_id_from_filename(filename: str) -> str:
     
     return match_id
 
-def extract_defensive_actions_from_html(filepath: str) -> List[Dict]:
+def extract_defensive_actions_from_html(filepath: str, root=None) -> List[Dict]:
     """
     Extract defensive actions data from an FBref HTML file.
     
     Args:
         filepath: Path to the HTML file
+        root: Optional already-parsed page; otherwise tables come from the parsed table cache
     
     Returns:
         List of dictionaries containing player defensive actions data
     """
-    with open(filepath, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    
-    soup = BeautifulSoup(html_content, 'html.parser')
-    
     # Find all defensive actions tables (one per team)
-    defense_tables = []
-    for table in soup.find_all('table'):
-        table_id = table.get('id', '')
-        if '_defense' in table_id and 'stats_' in table_id:
-            defense_tables.append(table)
+    defense_tables = get_stat_tables(filepath, DEFENSE_TABLE_RE, root)
     
     all_player_data = []
     
-    for table in defense_tables:
+    for team_id_match, stat_table in defense_tables:
         # Extract team ID from table ID (e.g., stats_ae38d267_defense -> ae38d267)
-        table_id = table.get('id', '')
-        team_id_match = re.search(r'stats_([a-f0-9]+)_defense', table_id)
-        team_id = team_id_match.group(1) if team_id_match else None
-        
-        # Parse table rows
-        rows = table.find_all('tr')
+        team_id = team_id_match.group(1)
         
-        for row in rows:
-            # Skip header rows
-            if row.find('th', {'scope': 'col'}):
-                continue
-            
-            # Get player info
-            player_cell = row.find('th', {'data-stat': 'player'})
-            if not player_cell:
-                continue
-            
+        for row, player_fbref_id in zip(stat_table.rows, stat_table.player_ids):
             # Extract FBref player ID from data-append-csv attribute
-            player_fbref_id = player_cell.get('data-append-csv', '')
             if not player_fbref_id:
                 continue
             
@@ -119,9 +97,8 @@ def extract_defensive_actions_from_html(filepath: str) -> List[Dict]:
             
             # Extract all defensive stats
             for stat_name, db_column in COLUMN_MAPPINGS.items():
-                stat_cell = row.find('td', {'data-stat': stat_name})
-                if stat_cell:
-                    value = stat_cell.text.strip()
+                if stat_name in row:
+                    value = row[stat_name]
                     
                     # Handle percentage values
                     if stat_name == 'challenge_tackles_pct':
@@ -151,7 +128,8 @@ def extract_defensive_actions_from_html(filepath: str) -> List[Dict]:
     
     return all_player_data
 
-def update_defensive_actions(conn, match_id: str, player_data: List[Dict]) -> Tuple[int, int, List[str]]:
+def update_defensive_actions(conn, match_id: str, player_data: List[Dict],
+                             resolver: Optional[MatchPlayerResolver] = None) -> Tuple[int, int, List[str]]:
     """
     Update match_player_defensive_actions table with extracted data.
     
@@ -159,132 +137,50 @@ def update_defensive_actions(conn, match_id: str, player_data: List[Dict]) -> Tu
         conn: Database connection
         match_id: Match ID
         player_data: List of player defensive actions data
+        resolver: Optional shared match_player resolver (one is created per call otherwise)
     
     Returns:
         Tuple of (successful_updates, failed_updates, error_messages)
     """
-    cursor = conn.cursor()
-    successful_updates = 0
-    failed_updates = 0
     error_messages = []
     
+    # Get match_player.id for every player in the match with one query
+    resolver = resolver or MatchPlayerResolver(conn)
+    match_player_ids = resolver.resolve_match(match_id, [player['player_fbref_id'] for player in player_data])
+    
+    records = []
     for player in player_data:
-        try:
-            # Get match_player.id using player_id and match_id
-            cursor.execute("""
-                SELECT mp.id 
-                FROM match_player mp
-                WHERE mp.player_id = %s AND mp.match_id = %s
-            """, (player['player_fbref_id'], match_id))
-            
-            result = cursor.fetchone()
-            if not result:
-                error_messages.append(f"No match_player record found for player {player['player_fbref_id']} in match {match_id}")
-                failed_updates += 1
-                continue
-            
-            match_player_id = result[0]
-            
-            # Check if defensive actions record exists
-            cursor.execute("""
-                SELECT id FROM match_player_defensive_actions
-                WHERE match_player_id = %s
-            """, (match_player_id,))
-            
-            existing_record = cursor.fetchone()
-            
-            if existing_record:
-                # Update existing record
-                update_query = """
-                    UPDATE match_player_defensive_actions SET
-                        tackles = %s,
-                        tackles_won = %s,
-                        tackles_def_3rd = %s,
-                        tackles_mid_3rd = %s,
-                        tackles_att_3rd = %s,
-                        challenges_tkl = %s,
-                        challenges_att = %s,
-                        challenges_tkl_pct = %s,
-                        challenges_lost = %s,
-                        blocks = %s,
-                        blocks_shots = %s,
-                        blocks_passes = %s,
-                        interceptions = %s,
-                        tackles_interceptions = %s,
-                        clearances = %s,
-                        errors = %s
-                    WHERE match_player_id = %s
-                """
-                
-                cursor.execute(update_query, (
-                    player.get('tackles', 0),
-                    player.get('tackles_won', 0),
-                    player.get('tackles_def_3rd', 0),
-                    player.get('tackles_mid_3rd', 0),
-                    player.get('tackles_att_3rd', 0),
-                    player.get('challenges_tkl', 0),
-                    player.get('challenges_att', 0),
-                    player.get('challenges_tkl_pct'),
-                    player.get('challenges_lost', 0),
-                    player.get('blocks', 0),
-                    player.get('blocks_shots', 0),
-                    player.get('blocks_passes', 0),
-                    player.get('interceptions', 0),
-                    player.get('tackles_interceptions', 0),
-                    player.get('clearances', 0),
-                    player.get('errors', 0),
-                    match_player_id
-                ))
-            else:
-                # Insert new record
-                insert_query = """
-                    INSERT INTO match_player_defensive_actions (
-                        match_player_id,
-                        tackles, tackles_won, tackles_def_3rd, tackles_mid_3rd, tackles_att_3rd,
-                        challenges_tkl, challenges_att, challenges_tkl_pct, challenges_lost,
-                        blocks, blocks_shots, blocks_passes,
-                        interceptions, tackles_interceptions, clearances, errors
-                    ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """
-                
-                cursor.execute(insert_query, (
-                    match_player_id,
-                    player.get('tackles', 0),
-                    player.get('tackles_won', 0),
-                    player.get('tackles_def_3rd', 0),
-                    player.get('tackles_mid_3rd', 0),
-                    player.get('tackles_att_3rd', 0),
-                    player.get('challenges_tkl', 0),
-                    player.get('challenges_att', 0),
-                    player.get('challenges_tkl_pct'),
-                    player.get('challenges_lost', 0),
-                    player.get('blocks', 0),
-                    player.get('blocks_shots', 0),
-                    player.get('blocks_passes', 0),
-                    player.get('interceptions', 0),
-                    player.get('tackles_interceptions', 0),
-                    player.get('clearances', 0),
-                    player.get('errors', 0)
-                ))
-            
-            successful_updates += 1
-            
-        except Exception as e:
-            error_messages.append(f"Error processing player {player.get('player_fbref_id', 'unknown')}: {str(e)}")
-            failed_updates += 1
+        match_player_id = match_player_ids.get(player['player_fbref_id'])
+        if not match_player_id:
+            error_messages.append(f"No match_player record found for player {player['player_fbref_id']} in match {match_id}")
+            continue
+        record = {column: player.get(column, 0) for column in DEFENSIVE_ACTIONS_COLUMNS}
+        record['challenges_tkl_pct'] = player.get('challenges_tkl_pct')
+        record['match_player_id'] = match_player_id
+        records.append(record)
     
-    conn.commit()
-    cursor.close()
+    try:
+        # Stage with COPY and apply as one set-based upsert
+        BulkLoader(conn).load('match_player_defensive_actions', records)
+        conn.commit()
+        successful_updates = len(records)
+    except Exception as e:
+        conn.rollback()
+        error_messages.append(f"Error writing defensive actions for match {match_id}: {str(e)}")
+        successful_updates = 0
+    
+    failed_updates = len(player_data) - successful_updates
     
     return successful_updates, failed_updates, error_messages
 
-def process_single_file(filepath: str, conn) -> Dict:
+def process_single_file(filepath: str, conn, root=None) -> Dict:
     """
     Process a single HTML file and extract defensive actions data.
     
     Args:
         filepath: Path to the HTML file
         conn: Database connection
+        root: Optional already-parsed page shared with other extractors
     
     Returns:
         Dictionary with processing results
@@ -300,7 +196,7 @@ def process_single_file(filepath: str, conn) -> Dict:
     
     try:
         # Extract data from HTML
-        player_data = extract_defensive_actions_from_html(filepath)
+        player_data = extract_defensive_actions_from_html(filepath, root)
         result['players_found'] = len(player_data)
         
         if player_data:
@@ -323,6 +219,44 @@ def process_single_file(filepath: str, conn) -> Dict:
     
     return result
 
+def parse_defense_file(filepath: str) -> List[Dict]:
+    """DB-free parse for fbref_parallel workers: defensive rows tagged with their match ID."""
+    match_id = extract_match_id_from_filename(os.path.basename(filepath))
+    player_data = extract_defensive_actions_from_html(filepath)
+    for player in player_data:
+        player['match_id'] = match_id
+    return player_data
+
+class DefensiveActionsWriter:
+    """Single-connection writer for fbref_parallel."""
+    
+    def __init__(self):
+        self.conn = get_db_connection()
+        self.resolver = MatchPlayerResolver(self.conn)
+        self.failed_updates = 0
+    
+    def write(self, units) -> int:
+        """Apply a batch of (filepath, player rows) units; returns successful updates."""
+        successful_total = 0
+        # One match_player query for every match in the batch
+        self.resolver.prefetch(player_data[0]['match_id'] for _, player_data in units if player_data)
+        for _, player_data in units:
+            if not player_data:
+                continue
+            successful, failed, _ = update_defensive_actions(self.conn, player_data[0]['match_id'], player_data,
+                                                             self.resolver)
+            successful_total += successful
+            self.failed_updates += failed
+        return successful_total
+    
+    def rollback(self):
+        self.conn.rollback()
+    
+    def close(self):
+        if self.failed_updates:
+            print(f"Writer: {self.failed_updates} player updates failed")
+        self.conn.close()
+
 def verify_test_match(conn, match_id: str = '07c68416'):
     """
     Verify that test match data was correctly extracted and populated.
@@ -374,10 +308,16 @@ def verify_test_match(conn, match_id: str = '07c68416'):
 
 def main():
     """Main execution function."""
+    parser = argparse.ArgumentParser(description='Extract FBref defensive actions into match_player_defensive_actions')
+    parser.add_argument('--test', action='store_true', help='Process only match_07c68416.html')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Parse worker processes (>1 runs parse workers plus a single DB writer)')
+    args = parser.parse_args()
     
     # Test mode or full processing
-    test_mode = '--test' in sys.argv
+    test_mode = args.test
     
+    metrics = start_run('defense')
     conn = get_db_connection()
     
     if test_mode:
@@ -418,34 +358,49 @@ def main():
             'error_messages': []
         }
         
-        # Process each file
-        for i, filename in enumerate(html_files, 1):
-            filepath = os.path.join(HTML_DIR, filename)
+        if args.workers > 1:
+            stats = run_parallel([os.path.join(HTML_DIR, f) for f in html_files],
+                                 parse_defense_file, DefensiveActionsWriter, workers=args.workers,
+                                 stage='defense')
+            results['processed'] = stats.get('files_parsed', 0) + stats.get('files_failed', 0)
+            results['successful'] = stats.get('files_parsed', 0)
+            results['errors'] = stats.get('files_failed', 0)
+            results['total_updates'] = stats.get('records_written', 0)
+            results['error_messages'] = stats.get('parse_errors', []) + [
+                {'file': ', '.join(err['files']) or 'writer', 'error': err['error']}
+                for err in stats.get('write_errors', [])
+            ]
+        else:
+            # Process each file
+            for i, filename in enumerate(html_files, 1):
+                filepath = os.path.join(HTML_DIR, filename)
             
-            if i % 100 == 0:
-                print(f"Processing file {i}/{total_files}: {filename}")
+                if i % 100 == 0:
+                    print(f"Processing file {i}/{total_files}: {filename}")
             
-            file_result = process_single_file(filepath, conn)
+                with metrics.stage('defense'):
+                    file_result = process_single_file(filepath, conn)
+                metrics.add('rows_written', file_result.get('successful_updates', 0), 'defense')
             
-            results['processed'] += 1
+                results['processed'] += 1
             
-            if file_result['status'] == 'success':
-                results['successful'] += 1
-            elif file_result['status'] == 'partial':
-                results['partial'] += 1
-            elif file_result['status'] == 'no_data':
-                results['no_data'] += 1
-            else:
-                results['errors'] += 1
-                results['error_messages'].append({
-                    'file': filename,
-                    'error': file_result.get('error', 'Unknown error')
-                })
+                if file_result['status'] == 'success':
+                    results['successful'] += 1
+                elif file_result['status'] == 'partial':
+                    results['partial'] += 1
+                elif file_result['status'] == 'no_data':
+                    results['no_data'] += 1
+                else:
+                    results['errors'] += 1
+                    results['error_messages'].append({
+                        'file': filename,
+                        'error': file_result.get('error', 'Unknown error')
+                    })
             
-            if 'successful_updates' in file_result:
-                results['total_updates'] += file_result['successful_updates']
-            if 'failed_updates' in file_result:
-                results['failed_updates'] += file_result['failed_updates']
+                if 'successful_updates' in file_result:
+                    results['total_updates'] += file_result['successful_updates']
+                if 'failed_updates' in file_result:
+                    results['failed_updates'] += file_result['failed_updates']
         
         # Print summary
         print("\n" + "=" * 80)
@@ -470,7 +425,8 @@ def main():
         print("\nDetailed report saved to: defensive_actions_extraction_report.json")
     
     conn.close()
+    metrics.write()
     print("\nDone!")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_profiled(main, 'defense')
\ No newline at end of file
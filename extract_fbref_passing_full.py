@@ -7,24 +7,24 @@ This script extracts from both stats_{team_id}_passing and stats_{team_id}_passi
 import os
 import sys
 import json
-import psycopg2
 from psycopg2.extras import RealDictCursor
-from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Tuple
 import re
 import traceback
 from io import StringIO
 
-# Database connection parameters
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
+from db_session import DB_CONFIG, BatchTransaction, connect
+from fbref_tables import StatTable
+from fbref_table_cache import get_stat_tables
+from bulk_loader import BulkLoader
+from etl_metrics import start_run
+from etl_profile import run_profiled
+from match_player_resolver import MatchPlayerResolver
+
+# stats_{team_id}_passing and stats_{team_id}_passing_types; group 2 marks pass types
+PASSING_TABLE_RE = re.compile(r'^stats_([a-f0-9]+)_passing(_types)?$')
 
 class FBrefPassingFullExtractor:
     """Extract complete FBref passing statistics from HTML match files."""
@@ -34,6 +34,7 @@ class FBrefPassingFullExtractor:
         self.db_config = db_config
         self.conn = None
         self.cursor = None
+        self.resolver = None
         self.stats = {
             'files_processed': 0,
             'tables_found': 0,
@@ -97,11 +98,14 @@ class FBrefPassingFullExtractor:
             'passes_blocked': 'passes_blocked'
         }
         
-    def connect_db(self):
-        """Establish database connection."""
+    def connect_db(self, conn=None):
+        """Establish database connection (or adopt a shared one)."""
         try:
-            self.conn = psycopg2.connect(**self.db_config)
+            self.conn = conn or connect(**self.db_config)
             self.cursor = self.conn.cursor(cursor_factory=RealDictCursor)
+            self.resolver = MatchPlayerResolver(self.conn)
+            # Each match's upsert is one unit of work; FBREF_COMMIT_EVERY batches them
+            self.tx = BatchTransaction(self.conn)
             print("✓ Connected to database")
             return True
         except Exception as e:
@@ -113,6 +117,7 @@ class FBrefPassingFullExtractor:
         if self.cursor:
             self.cursor.close()
         if self.conn:
+            self.tx.close()
             self.conn.close()
             
     def extract_match_id_from_filename(self, filename: str) -> str:
@@ -120,44 +125,35 @@ class FBrefPassingFullExtractor:
         match = re.search(r'match_([a-f0-9]{8})\.html', filename)
         return match.group(1) if match else None
         
-    def extract_all_passing_data(self, html_path: str) -> Dict[str, Dict]:
-        """Extract all passing data from both passing and passing_types tables."""
+    def extract_all_passing_data(self, html_path: str, root=None) -> Dict[str, Dict]:
+        """Extract all passing data from both passing and passing_types tables.
+
+        Tables come from the parsed table cache; pass an already-parsed root
+        (e.g. from fbref_match_engine) to read them from that page instead.
+        """
         try:
-            with open(html_path, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-                
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
             # Dictionary to store combined data for each player
             players_data = {}
             
-            # Find all tables
-            all_tables = soup.find_all('table')
-            
-            for table in all_tables:
-                table_id = table.get('id', '')
+            # Find passing and passing_types tables, in page order
+            for team_match, stat_table in get_stat_tables(html_path, PASSING_TABLE_RE, root):
+                team_hex_id = team_match.group(1)
+                table_id = stat_table.table_id
+                self.stats['tables_found'] += 1
                 
                 # Process passing tables (not passing_types)
-                if '_passing' in table_id and '_passing_types' not in table_id and 'stats_' in table_id:
-                    team_match = re.search(r'stats_([a-f0-9]+)_passing', table_id)
-                    if team_match:
-                        team_hex_id = team_match.group(1)
-                        print(f"  Processing passing table: {table_id}")
-                        self.stats['tables_found'] += 1
-                        
-                        # Extract data from passing table
-                        self.extract_from_passing_table(table, team_hex_id, players_data)
+                if not team_match.group(2):
+                    print(f"  Processing passing table: {table_id}")
+                    
+                    # Extract data from passing table
+                    self.extract_from_passing_table(stat_table, team_hex_id, players_data)
                         
                 # Process passing_types tables
-                elif '_passing_types' in table_id and 'stats_' in table_id:
-                    team_match = re.search(r'stats_([a-f0-9]+)_passing_types', table_id)
-                    if team_match:
-                        team_hex_id = team_match.group(1)
-                        print(f"  Processing passing_types table: {table_id}")
-                        self.stats['tables_found'] += 1
-                        
-                        # Extract data from passing_types table
-                        self.extract_from_passing_types_table(table, team_hex_id, players_data)
+                else:
+                    print(f"  Processing passing_types table: {table_id}")
+                    
+                    # Extract data from passing_types table
+                    self.extract_from_passing_types_table(stat_table, team_hex_id, players_data)
                         
             return players_data
             
@@ -166,57 +162,39 @@ class FBrefPassingFullExtractor:
             self.stats['errors'].append(f"Extract error: {html_path} - {str(e)}")
             return {}
             
-    def extract_from_passing_table(self, table, team_hex_id: str, players_data: Dict):
+    def _player_entry(self, players_data: Dict, player_hex_id: str, player_name: str, team_hex_id: str) -> Dict:
+        """Get or create the combined record for a player."""
+        if player_hex_id not in players_data:
+            players_data[player_hex_id] = {
+                'player_hex_id': player_hex_id,
+                'player_name': player_name,
+                'team_hex_id': team_hex_id,
+                'stats': {}
+            }
+        return players_data[player_hex_id]
+        
+    def extract_from_passing_table(self, stat_table: StatTable, team_hex_id: str, players_data: Dict):
         """Extract data from a passing table."""
         try:
-            tbody = table.find('tbody')
-            if not tbody:
-                return
-                
-            rows = tbody.find_all('tr')
-            
-            for row in rows:
-                # Skip separator rows
-                if row.get('class') and 'thead' in row.get('class'):
-                    continue
-                    
-                # Get player cell
-                player_cell = row.find('th', {'data-stat': 'player'})
-                if not player_cell:
-                    continue
-                    
-                # Extract FBref player hex ID
-                player_hex_id = player_cell.get('data-append-csv')
+            for row, player_hex_id in zip(stat_table.rows, stat_table.player_ids):
+                # Skip rows without an FBref player hex ID
                 if not player_hex_id:
                     continue
                     
-                # Extract player name
-                player_link = player_cell.find('a')
-                player_name = player_link.text.strip() if player_link else player_cell.text.strip()
-                
-                # Initialize player data if not exists
-                if player_hex_id not in players_data:
-                    players_data[player_hex_id] = {
-                        'player_hex_id': player_hex_id,
-                        'player_name': player_name,
-                        'team_hex_id': team_hex_id,
-                        'stats': {}
-                    }
+                player = self._player_entry(players_data, player_hex_id, row.get('player', ''), team_hex_id)
                 
                 # Extract all passing statistics
-                for cell in row.find_all('td'):
-                    data_stat = cell.get('data-stat')
-                    if data_stat and data_stat in self.field_mappings:
-                        value = cell.text.strip()
+                for data_stat, value in row.items():
+                    if data_stat != 'player' and data_stat in self.field_mappings:
                         if value and value != '':
                             try:
                                 # Determine data type based on field
                                 db_field = self.field_mappings[data_stat]
                                 if db_field in ['passes_pct', 'passes_pct_short', 'passes_pct_medium', 
                                               'passes_pct_long', 'xg_assist', 'pass_xa']:
-                                    players_data[player_hex_id]['stats'][db_field] = float(value)
+                                    player['stats'][db_field] = float(value)
                                 else:
-                                    players_data[player_hex_id]['stats'][db_field] = int(value)
+                                    player['stats'][db_field] = int(value)
                                     
                                 # Track which columns we're populating
                                 if db_field not in self.stats['columns_populated']:
@@ -227,59 +205,30 @@ class FBrefPassingFullExtractor:
                                 pass
                 
                 # Special handling for key_passes (maps to assisted_shots in FBref)
-                if 'assisted_shots' in players_data[player_hex_id]['stats']:
-                    players_data[player_hex_id]['stats']['key_passes'] = players_data[player_hex_id]['stats']['assisted_shots']
+                if 'assisted_shots' in player['stats']:
+                    player['stats']['key_passes'] = player['stats']['assisted_shots']
                     
         except Exception as e:
             print(f"    Error parsing passing table: {e}")
             traceback.print_exc()
             
-    def extract_from_passing_types_table(self, table, team_hex_id: str, players_data: Dict):
+    def extract_from_passing_types_table(self, stat_table: StatTable, team_hex_id: str, players_data: Dict):
         """Extract data from a passing_types table."""
         try:
-            tbody = table.find('tbody')
-            if not tbody:
-                return
-                
-            rows = tbody.find_all('tr')
-            
-            for row in rows:
-                # Skip separator rows
-                if row.get('class') and 'thead' in row.get('class'):
-                    continue
-                    
-                # Get player cell
-                player_cell = row.find('th', {'data-stat': 'player'})
-                if not player_cell:
-                    continue
-                    
-                # Extract FBref player hex ID
-                player_hex_id = player_cell.get('data-append-csv')
+            for row, player_hex_id in zip(stat_table.rows, stat_table.player_ids):
+                # Skip rows without an FBref player hex ID
                 if not player_hex_id:
                     continue
                     
-                # Extract player name
-                player_link = player_cell.find('a')
-                player_name = player_link.text.strip() if player_link else player_cell.text.strip()
-                
-                # Initialize player data if not exists
-                if player_hex_id not in players_data:
-                    players_data[player_hex_id] = {
-                        'player_hex_id': player_hex_id,
-                        'player_name': player_name,
-                        'team_hex_id': team_hex_id,
-                        'stats': {}
-                    }
+                player = self._player_entry(players_data, player_hex_id, row.get('player', ''), team_hex_id)
                 
                 # Extract pass type statistics
-                for cell in row.find_all('td'):
-                    data_stat = cell.get('data-stat')
-                    if data_stat and data_stat in self.field_mappings:
-                        value = cell.text.strip()
+                for data_stat, value in row.items():
+                    if data_stat != 'player' and data_stat in self.field_mappings:
                         if value and value != '':
                             try:
                                 db_field = self.field_mappings[data_stat]
-                                players_data[player_hex_id]['stats'][db_field] = int(value)
+                                player['stats'][db_field] = int(value)
                                 
                                 # Track which columns we're populating
                                 if db_field not in self.stats['columns_populated']:
@@ -293,69 +242,16 @@ class FBrefPassingFullExtractor:
             print(f"    Error parsing passing_types table: {e}")
             traceback.print_exc()
             
-    def get_match_player_record(self, match_id: str, player_hex_id: str) -> Optional[Dict]:
-        """Get match_player record for a given match and player."""
-        try:
-            query = """
-                SELECT mp.id, mp.player_id, mp.match_id, 
-                       mpp.id as passing_id
-                FROM match_player mp
-                LEFT JOIN match_player_passing mpp ON mp.id = mpp.match_player_id
-                WHERE mp.match_id = %s AND mp.player_id = %s
-            """
-            self.cursor.execute(query, (match_id, player_hex_id))
-            return self.cursor.fetchone()
-        except Exception as e:
-            print(f"    Error fetching match_player record: {e}")
-            return None
-            
-    def update_passing_record(self, match_player_id: str, passing_id: str, stats: Dict) -> bool:
-        """Update or insert complete passing statistics for a player."""
+    def get_match_player_ids(self, match_id: str, player_hex_ids: List[str]) -> Dict[str, str]:
+        """Map player hex ID -> match_player.id for the given players in a match."""
         try:
-            if passing_id:
-                # Build UPDATE query dynamically based on available stats
-                set_clauses = []
-                values = []
-                
-                for db_field, value in stats.items():
-                    set_clauses.append(f"{db_field} = %s")
-                    values.append(value)
-                
-                if not set_clauses:
-                    return False
-                    
-                # Add updated_at
-                set_clauses.append("updated_at = NOW()")
-                values.append(passing_id)
-                
-                query = f"""
-                    UPDATE match_player_passing
-                    SET {', '.join(set_clauses)}
-                    WHERE id = %s
-                """
-                self.cursor.execute(query, values)
-                
-            else:
-                # Build INSERT query dynamically
-                columns = ['match_player_id'] + list(stats.keys())
-                values = [match_player_id] + list(stats.values())
-                placeholders = ['%s'] * len(values)
-                
-                query = f"""
-                    INSERT INTO match_player_passing 
-                    ({', '.join(columns)})
-                    VALUES ({', '.join(placeholders)})
-                """
-                self.cursor.execute(query, values)
-                
-            return True
-            
+            return self.resolver.resolve_match(match_id, player_hex_ids)
         except Exception as e:
-            print(f"      Error updating passing record: {e}")
-            self.conn.rollback()
-            return False
+            print(f"    Error fetching match_player records: {e}")
+            self.tx.rollback()
+            return {}
             
-    def process_match_file(self, html_path: str) -> Dict:
+    def process_match_file(self, html_path: str, root=None) -> Dict:
         """Process a single match HTML file."""
         filename = os.path.basename(html_path)
         match_id = self.extract_match_id_from_filename(filename)
@@ -367,7 +263,7 @@ class FBrefPassingFullExtractor:
         print(f"\nProcessing match {match_id} from {filename}")
         
         # Extract all passing data from both table types
-        players_data = self.extract_all_passing_data(html_path)
+        players_data = self.extract_all_passing_data(html_path, root)
         
         if not players_data:
             print(f"  No passing data found in {filename}")
@@ -382,7 +278,11 @@ class FBrefPassingFullExtractor:
             'errors': []
         }
         
-        # Process each player's combined data
+        # Get match_player IDs for every player in the match with one query
+        match_player_ids = self.get_match_player_ids(match_id, list(players_data.keys()))
+        
+        # Build one record per player's combined data
+        records = []
         for player_hex_id, player_info in players_data.items():
             player_name = player_info['player_name']
             stats = player_info['stats']
@@ -390,36 +290,38 @@ class FBrefPassingFullExtractor:
             if not stats:
                 continue
                 
-            # Get match_player record
-            mp_record = self.get_match_player_record(match_id, player_hex_id)
-            
-            if not mp_record:
+            match_player_id = match_player_ids.get(player_hex_id)
+            if not match_player_id:
                 print(f"    No match_player record for {player_name} ({player_hex_id})")
                 results['errors'].append(f"Missing match_player: {player_name} ({player_hex_id})")
                 continue
                 
-            # Update passing statistics
-            if self.update_passing_record(mp_record['id'], mp_record.get('passing_id'), stats):
-                results['players_updated'] += 1
-                results['columns_filled'].update(stats.keys())
-                self.stats['records_updated'] += 1
-                
-                # Show summary of what was updated
-                passes = stats.get('passes', 0)
-                completed = stats.get('passes_completed', 0)
-                pct = (completed / passes * 100) if passes > 0 else 0
-                assists = stats.get('assists', 0)
-                key_passes = stats.get('key_passes', 0)
-                
-                print(f"    ✓ {player_name}: {completed}/{passes} ({pct:.1f}%), {assists} assists, {key_passes} key passes, {len(stats)} fields")
-            else:
-                results['errors'].append(f"Update failed: {player_name}")
+            records.append(dict(stats, match_player_id=match_player_id))
+            results['columns_filled'].update(stats.keys())
+            
+            # Show summary of what will be written
+            passes = stats.get('passes', 0)
+            completed = stats.get('passes_completed', 0)
+            pct = (completed / passes * 100) if passes > 0 else 0
+            assists = stats.get('assists', 0)
+            key_passes = stats.get('key_passes', 0)
+            
+            print(f"    ✓ {player_name}: {completed}/{passes} ({pct:.1f}%), {assists} assists, {key_passes} key passes, {len(stats)} fields")
+            
+        # Stage with COPY and apply as one set-based upsert; this match is one unit
+        if records:
+            try:
+                self.tx.begin()
+                BulkLoader(self.conn).load('match_player_passing', records)
+                self.tx.commit()
+                results['players_updated'] = len(records)
+                self.stats['records_updated'] += len(records)
+                print(f"  Committed {results['players_updated']} player updates with {len(results['columns_filled'])} unique columns")
+            except Exception as e:
+                print(f"      Error updating passing records: {e}")
+                self.tx.rollback()
+                results['errors'].append(f"Update failed: {e}")
                 
-        # Commit changes for this match
-        if results['players_updated'] > 0:
-            self.conn.commit()
-            print(f"  Committed {results['players_updated']} player updates with {len(results['columns_filled'])} unique columns")
-            
         self.stats['files_processed'] += 1
         return results
         
@@ -527,6 +429,7 @@ class FBrefPassingFullExtractor:
 def main():
     """Main execution function."""
     # Initialize extractor
+    metrics = start_run('passing')
     extractor = FBrefPassingFullExtractor(DB_CONFIG)
     
     if not extractor.connect_db():
@@ -588,13 +491,18 @@ def main():
                     batch = match_files[i:i+batch_size]
                     print(f"\nProcessing batch {i//batch_size + 1} ({i+1}-{min(i+batch_size, len(match_files))} of {len(match_files)})")
                     
+                    # One match_player query for the whole batch
+                    extractor.resolver.prefetch(extractor.extract_match_id_from_filename(f) for f in batch)
+                    
                     for filename in batch:
                         if filename == os.path.basename(test_file):
                             continue  # Skip test file since already processed
                             
                         filepath = os.path.join(html_dir, filename)
                         try:
-                            extractor.process_match_file(filepath)
+                            with metrics.stage('passing'):
+                                result = extractor.process_match_file(filepath)
+                            metrics.add('rows_written', result.get('players_updated', 0), 'passing')
                         except Exception as e:
                             print(f"  Error processing {filename}: {e}")
                             extractor.stats['errors'].append(f"File error: {filename} - {str(e)}")
@@ -604,6 +512,7 @@ def main():
                     
         else:
             print(f"Test file not found: {test_file}")
+        extractor.tx.flush()
             
         # Generate final report
         print("\n" + "="*70)
@@ -639,7 +548,8 @@ def main():
     finally:
         extractor.close_db()
         print("\nDatabase connection closed")
+        metrics.write()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_profiled(main, 'passing')
\ No newline at end of file
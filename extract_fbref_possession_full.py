@@ -7,9 +7,7 @@ This script extracts from stats_{team_id}_possession tables in FBref HTML files.
 import os
 import sys
 import json
-import psycopg2
 from psycopg2.extras import RealDictCursor
-from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
@@ -17,14 +15,16 @@ import re
 import traceback
 from io import StringIO
 
-# Database connection parameters
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
+from db_session import DB_CONFIG, BatchTransaction, connect
+from fbref_tables import StatTable
+from fbref_table_cache import get_stat_tables
+from bulk_loader import BulkLoader
+from etl_metrics import get_metrics, start_run
+from etl_profile import run_profiled
+from match_player_resolver import MatchPlayerResolver
+
+# Table id format: stats_{team_id}_possession
+POSSESSION_TABLE_RE = re.compile(r'stats_([a-f0-9]+)_possession')
 
 class FBrefPossessionExtractor:
     """Extract complete FBref possession statistics from HTML match files."""
@@ -34,6 +34,9 @@ class FBrefPossessionExtractor:
         self.db_config = db_config
         self.conn = None
         self.cursor = None
+        self.resolver = None
+        self.season_years = {}      # season UUID -> season year
+        self.team_season_ids = {}   # (FBref team ID, season UUID) -> team_season_id
         self.stats = {
             'files_processed': 0,
             'tables_found': 0,
@@ -83,11 +86,14 @@ class FBrefPossessionExtractor:
             'progressive_passes_received': 'passes_received_progressive'
         }
         
-    def connect_db(self):
-        """Establish database connection."""
+    def connect_db(self, conn=None):
+        """Establish database connection (or adopt a shared one)."""
         try:
-            self.conn = psycopg2.connect(**self.db_config)
+            self.conn = conn or connect(**self.db_config)
             self.cursor = self.conn.cursor(cursor_factory=RealDictCursor)
+            self.resolver = MatchPlayerResolver(self.conn)
+            # Each match file is one unit of work; FBREF_COMMIT_EVERY batches them
+            self.tx = BatchTransaction(self.conn)
             print("✓ Database connection established")
             return True
         except Exception as e:
@@ -117,145 +123,82 @@ class FBrefPossessionExtractor:
             return dict(result)
         return None
     
-    def get_or_create_match_player(self, match_id: str, fbref_player_id: str, team_season_id: str, match_info: Dict) -> Optional[str]:
-        """Get or create match_player record and return its UUID."""
-        # First check if match_player record exists
-        query = """
-            SELECT id 
-            FROM match_player 
-            WHERE match_id = %s AND player_id = %s
-        """
-        self.cursor.execute(query, (match_id, fbref_player_id))
-        result = self.cursor.fetchone()
-        
-        if result:
-            return result['id']
-        
-        # If not exists, we need to create it with minimal data
-        # We'll need to get season_id from the season_uuid
-        season_query = """
-            SELECT season_year 
-            FROM season 
-            WHERE id = %s
-        """
-        self.cursor.execute(season_query, (match_info.get('season_uuid'),))
-        season_result = self.cursor.fetchone()
-        season_id = season_result['season_year'] if season_result else 2024  # Default to 2024 if not found
-        
-        # Create match_player record
-        insert_query = """
-            INSERT INTO match_player (match_id, player_id, team_season_id, match_date, season_id, minutes_played, started)
-            VALUES (%s, %s, %s, %s, %s, 0, false)
-            ON CONFLICT (match_id, player_id) DO UPDATE SET match_id = EXCLUDED.match_id
-            RETURNING id
-        """
-        self.cursor.execute(insert_query, (
-            match_id,
-            fbref_player_id,
-            team_season_id,
-            match_info.get('match_date'),
-            season_id
-        ))
-        result = self.cursor.fetchone()
-        self.conn.commit()
-        
-        return result['id'] if result else None
+    def get_season_year(self, season_uuid: str) -> Optional[int]:
+        """Season year for a season UUID (cached)."""
+        if season_uuid not in self.season_years:
+            season_query = """
+                SELECT season_year 
+                FROM season 
+                WHERE id = %s
+            """
+            self.cursor.execute(season_query, (season_uuid,))
+            season_result = self.cursor.fetchone()
+            self.season_years[season_uuid] = season_result['season_year'] if season_result else None
+        return self.season_years[season_uuid]
     
     def get_team_season_id(self, fbref_team_id: str, season_uuid: str) -> Optional[str]:
-        """Get team_season_id from FBref team hex ID and season."""
-        # The team_id in team_season table appears to be the FBref team ID
-        # Get season_year from season_uuid first
-        season_query = """
-            SELECT season_year 
-            FROM season 
-            WHERE id = %s
-        """
-        self.cursor.execute(season_query, (season_uuid,))
-        season_result = self.cursor.fetchone()
-        
-        if not season_result:
-            return None
+        """Get team_season_id from FBref team hex ID and season (cached)."""
+        key = (fbref_team_id, season_uuid)
+        if key in self.team_season_ids:
+            return self.team_season_ids[key]
         
-        # Now get the team_season_id using the FBref team ID directly
-        ts_query = """
-            SELECT id 
-            FROM team_season 
-            WHERE team_id = %s AND season_id = %s
-        """
-        self.cursor.execute(ts_query, (fbref_team_id, season_result['season_year']))
-        ts_result = self.cursor.fetchone()
+        # The team_id in team_season table appears to be the FBref team ID
+        season_year = self.get_season_year(season_uuid)
+        team_season_id = None
+        if season_year is not None:
+            ts_query = """
+                SELECT id 
+                FROM team_season 
+                WHERE team_id = %s AND season_id = %s
+            """
+            self.cursor.execute(ts_query, (fbref_team_id, season_year))
+            ts_result = self.cursor.fetchone()
+            team_season_id = ts_result['id'] if ts_result else None
         
-        return ts_result['id'] if ts_result else None
+        self.team_season_ids[key] = team_season_id
+        return team_season_id
     
-    def extract_possession_table(self, soup: BeautifulSoup, table_id: str) -> Optional[pd.DataFrame]:
-        """Extract possession data from a specific table."""
-        table = soup.find('table', {'id': table_id})
-        
-        if not table:
-            return None
-        
+    def extract_possession_table(self, stat_table: StatTable, fbref_team_id: str) -> Optional[pd.DataFrame]:
+        """Build the possession DataFrame for one team's table."""
         try:
-            # Extract data manually to handle complex structure
             data = []
-            headers = []
-            
-            # Get headers from the second header row (with actual column names)
-            header_rows = table.find('thead').find_all('tr')
-            if len(header_rows) >= 2:
-                # Use the second row which has the actual column names
-                for th in header_rows[-1].find_all(['th']):
-                    stat = th.get('data-stat', '')
-                    if stat:
-                        headers.append(stat)
             
-            # Extract player FBref IDs and data from tbody
-            tbody = table.find('tbody')
-            if tbody:
-                for row in tbody.find_all('tr'):
-                    row_data = {}
-                    
-                    # Get player ID from data-append-csv
-                    player_cell = row.find('th', {'data-stat': 'player'})
-                    if player_cell:
-                        row_data['fbref_player_id'] = player_cell.get('data-append-csv', '')
-                        row_data['Player'] = player_cell.get_text(strip=True)
-                    
-                    # Get all other cells
-                    for cell in row.find_all(['th', 'td']):
-                        stat = cell.get('data-stat', '')
-                        if stat and stat != 'player':
-                            value = cell.get_text(strip=True)
-                            # Clean up the value
-                            if value in ['', '—', '-']:
-                                value = None
-                            row_data[stat] = value
+            for row, player_id in zip(stat_table.rows, stat_table.player_ids):
+                if not player_id:
+                    continue
                     
-                    if row_data.get('fbref_player_id'):
-                        data.append(row_data)
+                # Player ID from data-append-csv, then all other cells by data-stat
+                row_data = {
+                    'fbref_player_id': player_id,
+                    'Player': row.get('player', '')
+                }
+                for stat, value in row.items():
+                    if stat != 'player':
+                        # Clean up the value
+                        row_data[stat] = None if value in ['', '—', '-'] else value
+                        
+                data.append(row_data)
             
             if not data:
                 return None
                 
             # Create DataFrame
             df = pd.DataFrame(data)
-            
-            # Extract team ID from table ID
-            team_id_match = re.search(r'stats_([a-f0-9]+)_possession', table_id)
-            if team_id_match:
-                df['fbref_team_id'] = team_id_match.group(1)
+            df['fbref_team_id'] = fbref_team_id
             
             return df
             
         except Exception as e:
-            print(f"  ✗ Error parsing table {table_id}: {e}")
-            import traceback
+            print(f"  ✗ Error parsing table {stat_table.table_id}: {e}")
             traceback.print_exc()
             return None
     
     def process_possession_data(self, df: pd.DataFrame, match_info: Dict) -> List[Dict]:
         """Process possession DataFrame and prepare records for database."""
         records = []
+        season_id = self.get_season_year(match_info.get('season_uuid'))
         
+        player_rows = []
         for _, row in df.iterrows():
             # Skip rows without player IDs
             if not row.get('fbref_player_id'):
@@ -269,13 +212,22 @@ class FBrefPossessionExtractor:
                 # Try to guess based on home/away team
                 team_season_id = match_info.get('home_team_season_id')
             
-            # Get or create match_player record
-            match_player_id = self.get_or_create_match_player(
-                match_info['match_id'],
-                row['fbref_player_id'],
-                team_season_id,
-                match_info
-            )
+            player_rows.append((row, team_season_id))
+        
+        # Get or create every player's match_player record in one round trip
+        match_player_ids = self.resolver.resolve_or_create([
+            {
+                'match_id': match_info['match_id'],
+                'player_id': row['fbref_player_id'],
+                'team_season_id': team_season_id,
+                'match_date': match_info.get('match_date'),
+                'season_id': season_id or 2024  # Default to 2024 if not found
+            }
+            for row, team_season_id in player_rows
+        ])
+        
+        for row, _ in player_rows:
+            match_player_id = match_player_ids.get((match_info['match_id'], row['fbref_player_id']))
             
             if not match_player_id:
                 self.stats['missing_players'].append({
@@ -288,21 +240,9 @@ class FBrefPossessionExtractor:
             # Build record with all possession fields
             record = {
                 'match_player_id': match_player_id,
-                'season_id': None  # We'll set this from the season table
+                'season_id': season_id
             }
             
-            # Get season_id (year) from season_uuid
-            if match_info.get('season_uuid'):
-                season_query = """
-                    SELECT season_year 
-                    FROM season 
-                    WHERE id = %s
-                """
-                self.cursor.execute(season_query, (match_info['season_uuid'],))
-                season_result = self.cursor.fetchone()
-                if season_result:
-                    record['season_id'] = season_result['season_year']
-            
             # Map all possession fields
             fields_populated = 0
             for fbref_field, db_field in self.field_mappings.items():
@@ -346,62 +286,23 @@ class FBrefPossessionExtractor:
         return records
     
     def upsert_possession_data(self, records: List[Dict]) -> int:
-        """Insert or update possession records in the database."""
+        """Insert or update possession records in the database.
+        
+        Records are staged with COPY and applied in one set-based pass; on
+        existing rows only the non-null fields of a record are overwritten.
+        """
         if not records:
             return 0
         
-        updated_count = 0
-        inserted_count = 0
+        counts = BulkLoader(self.conn).load('match_player_possession', records)
         
-        for record in records:
-            # Check if record exists
-            check_query = """
-                SELECT 1 FROM match_player_possession
-                WHERE match_player_id = %s
-            """
-            self.cursor.execute(check_query, (record['match_player_id'],))
-            exists = self.cursor.fetchone()
-            
-            if exists:
-                # Update existing record
-                update_fields = []
-                update_values = []
-                
-                for field, value in record.items():
-                    if field != 'match_player_id' and value is not None:
-                        update_fields.append(f"{field} = %s")
-                        update_values.append(value)
-                
-                if update_fields:
-                    update_query = f"""
-                        UPDATE match_player_possession
-                        SET {', '.join(update_fields)}
-                        WHERE match_player_id = %s
-                    """
-                    update_values.append(record['match_player_id'])
-                    self.cursor.execute(update_query, update_values)
-                    updated_count += 1
-            else:
-                # Insert new record
-                fields = list(record.keys())
-                placeholders = ['%s'] * len(fields)
-                insert_query = f"""
-                    INSERT INTO match_player_possession ({', '.join(fields)})
-                    VALUES ({', '.join(placeholders)})
-                    ON CONFLICT (match_player_id) DO UPDATE SET
-                    {', '.join([f'{f} = EXCLUDED.{f}' for f in fields if f != 'match_player_id'])}
-                """
-                self.cursor.execute(insert_query, list(record.values()))
-                inserted_count += 1
-        
-        self.conn.commit()
-        self.stats['records_updated'] += updated_count
-        self.stats['records_inserted'] += inserted_count
-        
-        return updated_count + inserted_count
+        self.stats['records_updated'] += counts['updated']
+        self.stats['records_inserted'] += counts['inserted']
+        
+        return counts['updated'] + counts['inserted']
     
-    def process_file(self, filepath: str) -> bool:
-        """Process a single HTML file."""
+    def process_file(self, filepath: str, root=None) -> bool:
+        """Process a single HTML file, reusing an already-parsed tree when one is supplied."""
         filename = os.path.basename(filepath)
         
         # Get match info
@@ -414,51 +315,49 @@ class FBrefPossessionExtractor:
         print(f"  Match ID: {match_info['match_id'][:8]}...")
         
         try:
-            # Read and parse HTML
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            soup = BeautifulSoup(content, 'html.parser')
-            
-            # Find all possession tables
-            possession_tables = soup.find_all('table', id=re.compile(r'stats_[a-f0-9]+_possession'))
-            
-            if not possession_tables:
-                print(f"  ⚠ No possession tables found")
-                return False
-            
-            print(f"  Found {len(possession_tables)} possession table(s)")
-            self.stats['tables_found'] += len(possession_tables)
-            
-            all_records = []
-            
-            for table in possession_tables:
-                table_id = table.get('id')
-                print(f"  Processing table: {table_id}")
-                
-                # Extract data from table
-                df = self.extract_possession_table(soup, table_id)
-                
-                if df is not None and not df.empty:
-                    # Process the data
-                    records = self.process_possession_data(df, match_info)
-                    all_records.extend(records)
-                    print(f"    Extracted {len(records)} player records")
-                    self.stats['players_extracted'] += len(records)
-            
-            # Upsert all records
-            if all_records:
-                count = self.upsert_possession_data(all_records)
-                print(f"  ✓ Updated/Inserted {count} possession records")
-            
-            return True
-            
+            # The match's match_player rows and possession rows commit together
+            with self.tx.unit():
+                return self.extract_file(filepath, match_info, root)
         except Exception as e:
             error_msg = f"Error processing {filename}: {str(e)}"
             print(f"  ✗ {error_msg}")
             self.stats['errors'].append(error_msg)
             return False
     
+    def extract_file(self, filepath: str, match_info: Dict, root=None) -> bool:
+        """Extract and write one file's possession tables (no commit; the caller owns the unit)."""
+        # Find all possession tables (parsed table cache unless a tree is given)
+        possession_tables = get_stat_tables(filepath, POSSESSION_TABLE_RE, root)
+        
+        if not possession_tables:
+            print(f"  ⚠ No possession tables found")
+            return False
+        
+        print(f"  Found {len(possession_tables)} possession table(s)")
+        self.stats['tables_found'] += len(possession_tables)
+        
+        all_records = []
+        
+        for team_match, stat_table in possession_tables:
+            print(f"  Processing table: {stat_table.table_id}")
+            
+            # Extract data from table
+            df = self.extract_possession_table(stat_table, team_match.group(1))
+            
+            if df is not None and not df.empty:
+                # Process the data
+                records = self.process_possession_data(df, match_info)
+                all_records.extend(records)
+                print(f"    Extracted {len(records)} player records")
+                self.stats['players_extracted'] += len(records)
+        
+        # Upsert all records
+        if all_records:
+            count = self.upsert_possession_data(all_records)
+            print(f"  ✓ Updated/Inserted {count} possession records")
+        
+        return True
+    
     def process_all_files(self, html_dir: str):
         """Process all HTML files in the directory."""
         html_files = [f for f in os.listdir(html_dir) if f.startswith('match_') and f.endswith('.html')]
@@ -467,12 +366,21 @@ class FBrefPossessionExtractor:
         print(f"\nFound {total_files} match HTML files to process")
         print("=" * 60)
         
+        # Load existing match_player IDs for every match in one query
+        self.resolver.prefetch(f[len('match_'):-len('.html')] for f in html_files)
+        
+        metrics = get_metrics()
         for i, filename in enumerate(html_files, 1):
             filepath = os.path.join(html_dir, filename)
             print(f"\n[{i}/{total_files}] Processing {filename}")
             
-            if self.process_file(filepath):
+            before = self.stats['players_extracted']
+            with metrics.stage('possession'):
+                processed = self.process_file(filepath)
+            metrics.add('rows_written', self.stats['players_extracted'] - before, 'possession')
+            if processed:
                 self.stats['files_processed'] += 1
+        self.tx.flush()
         
         print("\n" + "=" * 60)
         print("Processing complete!")
@@ -569,6 +477,7 @@ class FBrefPossessionExtractor:
         if self.cursor:
             self.cursor.close()
         if self.conn:
+            self.tx.close()
             self.conn.close()
         print("✓ Database connection closed")
 
@@ -576,6 +485,7 @@ class FBrefPossessionExtractor:
 def main():
     """Main execution function."""
     # Initialize extractor
+    metrics = start_run('possession')
     extractor = FBrefPossessionExtractor(DB_CONFIG)
     
     if not extractor.connect_db():
@@ -617,7 +527,8 @@ def main():
         traceback.print_exc()
     finally:
         extractor.close()
+        metrics.write()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_profiled(main, 'possession')
\ No newline at end of file
@@ -7,26 +7,25 @@ ACCURACY OVER COMPLETENESS - Better to have NULL than wrong data.
 import os
 import re
 import json
-import psycopg2
 from psycopg2.extras import RealDictCursor
-from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple
 import traceback
 
-# Database connection
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
+from db_session import DB_CONFIG, connect
+from fbref_tables import load_stat_table
+from fbref_table_cache import get_stat_tables
+from bulk_loader import BulkLoader
+from etl_metrics import start_run
+from etl_profile import run_profiled
 
 # HTML files directory
 HTML_DIR = '/Users/thomasmcmillan/projects/nwsl_db_migration/html_files/'
 
+# Goalkeeper table id format: keeper_stats_{team_id}
+KEEPER_TABLE_RE = re.compile(r'keeper_stats_([a-f0-9]+)')
+
 # Mapping from FBref column names to database columns
 COLUMN_MAPPING = {
     # Shot Stopping
@@ -67,101 +66,27 @@ COLUMN_MAPPING = {
 
 def get_db_connection():
     """Create database connection."""
-    return psycopg2.connect(**DB_CONFIG)
+    return connect()
 
 def extract_match_id_from_filename(filename: str) -> Optional[str]:
     """Extract match ID from filename."""
     match = re.search(r'match_([a-f0-9]{8})\.html', filename)
     return match.group(1) if match else None
 
-def extract_goalkeeper_table(soup: BeautifulSoup, table_id: str) -> Optional[pd.DataFrame]:
-    """Extract goalkeeper stats table from HTML."""
+def extract_goalkeeper_table(root, table_id: str) -> Optional[pd.DataFrame]:
+    """Extract goalkeeper stats table from HTML, with columns keyed by data-stat."""
     try:
-        # Find the table by ID
-        table = soup.find('table', {'id': table_id})
-        if not table:
+        # Find the table by ID and read its cells straight from the parsed tree
+        stat_table = load_stat_table(root, table_id)
+        if not stat_table:
             return None
         
-        # Convert to DataFrame
-        from io import StringIO
-        df = pd.read_html(StringIO(str(table)))[0]
-        
-        # Handle multi-level columns from pandas
-        if isinstance(df.columns, pd.MultiIndex):
-            # Flatten column names
-            df.columns = ['_'.join(col).strip('_') for col in df.columns.values]
-        
-        # Map the flattened column names to FBref data-stat attributes
-        # We need to extract the actual data-stat values from the HTML
-        column_mapping = {}
-        headers = table.find_all('th')
-        for th in headers:
-            data_stat = th.get('data-stat')
-            if data_stat:
-                # Get the text content for mapping
-                col_text = th.text.strip()
-                # Map common abbreviations
-                if data_stat == 'gk_shots_on_target_against':
-                    column_mapping['Shot Stopping_SoTA'] = 'gk_shots_on_target_against'
-                elif data_stat == 'gk_goals_against':
-                    column_mapping['Shot Stopping_GA'] = 'gk_goals_against'
-                elif data_stat == 'gk_saves':
-                    column_mapping['Shot Stopping_Saves'] = 'gk_saves'
-                elif data_stat == 'gk_save_pct':
-                    column_mapping['Shot Stopping_Save%'] = 'gk_save_pct'
-                elif data_stat == 'gk_psxg':
-                    column_mapping['Shot Stopping_PSxG'] = 'gk_psxg'
-                elif data_stat == 'gk_passes_completed_launched':
-                    column_mapping['Launched_Cmp'] = 'gk_passes_completed_launched'
-                elif data_stat == 'gk_passes_launched':
-                    column_mapping['Launched_Att'] = 'gk_passes_launched'
-                elif data_stat == 'gk_passes_pct_launched':
-                    column_mapping['Launched_Cmp%'] = 'gk_passes_pct_launched'
-                elif data_stat == 'gk_passes':
-                    column_mapping['Passes_Att (GK)'] = 'gk_passes'
-                elif data_stat == 'gk_passes_throws':
-                    column_mapping['Passes_Thr'] = 'gk_passes_throws'
-                elif data_stat == 'gk_pct_passes_launched':
-                    column_mapping['Passes_Launch%'] = 'gk_pct_passes_launched'
-                elif data_stat == 'gk_passes_length_avg':
-                    column_mapping['Passes_AvgLen'] = 'gk_passes_length_avg'
-                elif data_stat == 'gk_goal_kicks':
-                    column_mapping['Goal Kicks_Att'] = 'gk_goal_kicks'
-                elif data_stat == 'gk_pct_goal_kicks_launched':
-                    column_mapping['Goal Kicks_Launch%'] = 'gk_pct_goal_kicks_launched'
-                elif data_stat == 'gk_goal_kick_length_avg':
-                    column_mapping['Goal Kicks_AvgLen'] = 'gk_goal_kick_length_avg'
-                elif data_stat == 'gk_crosses':
-                    column_mapping['Crosses_Opp'] = 'gk_crosses'
-                elif data_stat == 'gk_crosses_stopped':
-                    column_mapping['Crosses_Stp'] = 'gk_crosses_stopped'
-                elif data_stat == 'gk_crosses_stopped_pct':
-                    column_mapping['Crosses_Stp%'] = 'gk_crosses_stopped_pct'
-                elif data_stat == 'gk_def_actions_outside_pen_area':
-                    column_mapping['Sweeper_#OPA'] = 'gk_def_actions_outside_pen_area'
-                elif data_stat == 'gk_avg_distance_def_actions':
-                    column_mapping['Sweeper_AvgDist'] = 'gk_avg_distance_def_actions'
-                elif data_stat == 'minutes':
-                    column_mapping['Unnamed: 3_level_0_Min'] = 'minutes'
-        
-        # Rename columns based on mapping
-        df = df.rename(columns=column_mapping)
-        
-        # Extract player IDs from data-append-csv attributes
-        player_ids = []
-        for row in table.find_all('tr'):
-            th = row.find('th', {'data-stat': 'player'})
-            if th and th.get('data-append-csv'):
-                player_ids.append(th.get('data-append-csv'))
-        
-        if player_ids and len(player_ids) == len(df):
-            df['player_id'] = player_ids
-        
-        return df
+        # Columns are already FBref data-stat names (gk_saves, minutes, ...),
+        # plus player_id from the player cell's data-append-csv
+        return stat_table.to_dataframe()
         
     except Exception as e:
         print(f"Error extracting table {table_id}: {e}")
-        import traceback
         traceback.print_exc()
         return None
 
@@ -243,7 +168,7 @@ def process_goalkeeper_row(row: Dict, match_id: str, match_info: Dict) -> Option
         # Validate the data
         is_valid, issues = validate_goalkeeper_data(data)
         if not is_valid:
-            player_name = row.get('Player', 'Unknown') if 'Player' in row else 'Unknown'
+            player_name = row.get('player') or 'Unknown'
             print(f"  Validation issues for {player_name} in match {match_id}:")
             for issue in issues:
                 print(f"    - {issue}")
@@ -306,73 +231,38 @@ def get_team_season_id(conn, player_id: str, season_id: int) -> Optional[str]:
         
         return result[0] if result else None
 
-def upsert_goalkeeper_data(conn, data: Dict) -> bool:
-    """Upsert goalkeeper data - replace existing with accurate FBref data."""
+def upsert_goalkeeper_data(conn, records: List[Dict]) -> int:
+    """Upsert a batch of goalkeeper rows - replace existing with accurate FBref data.
+    
+    Rows are staged with COPY and applied in one set-based pass keyed on
+    (match_id, player_id); on existing rows only non-null stats are overwritten.
+    Returns the number of rows written.
+    """
+    stat_columns = list(COLUMN_MAPPING.values())
+    batch = []
+    for data in records:
+        if not any(data.get(col) is not None for col in stat_columns):
+            print(f"  No valid data to update for player {data['player_id']} in match {data['match_id']}")
+            continue
+        batch.append(data)
+    
+    if not batch:
+        return 0
+    
+    columns = ['match_id', 'player_id', 'team_season_id', 'match_date', 'season_id'] + [
+        col for col in stat_columns if any(data.get(col) is not None for data in batch)
+    ]
     try:
-        with conn.cursor() as cur:
-            # Build the UPDATE SET clause dynamically for non-null values only
-            update_fields = []
-            update_values = []
-            
-            for col in COLUMN_MAPPING.values():
-                if col in data and data[col] is not None:
-                    update_fields.append(f"{col} = %s")
-                    update_values.append(data[col])
-            
-            if not update_fields:
-                print(f"  No valid data to update for player {data['player_id']} in match {data['match_id']}")
-                return False
-            
-            # Add updated_at
-            update_fields.append("updated_at = CURRENT_TIMESTAMP")
-            
-            # Build the INSERT statement with ON CONFLICT
-            insert_cols = ['match_id', 'player_id', 'team_season_id', 'match_date', 'season_id']
-            insert_vals = [data.get(col) for col in insert_cols]
-            
-            # Add the data columns
-            for col in COLUMN_MAPPING.values():
-                if col in data and data[col] is not None:
-                    insert_cols.append(col)
-                    insert_vals.append(data[col])
-            
-            # Check if there's a unique constraint on (match_id, player_id)
-            # If not, we'll handle it differently
-            cur.execute("""
-                SELECT 1 FROM match_goalkeeper_performance 
-                WHERE match_id = %s AND player_id = %s
-            """, (data['match_id'], data['player_id']))
-            
-            exists = cur.fetchone()
-            
-            if exists:
-                # Update existing record
-                update_query = f"""
-                    UPDATE match_goalkeeper_performance 
-                    SET {', '.join(update_fields)}
-                    WHERE match_id = %s AND player_id = %s
-                    RETURNING id
-                """
-                cur.execute(update_query, update_values + [data['match_id'], data['player_id']])
-            else:
-                # Insert new record
-                insert_query = f"""
-                    INSERT INTO match_goalkeeper_performance ({', '.join(insert_cols)})
-                    VALUES ({', '.join(['%s'] * len(insert_cols))})
-                    RETURNING id
-                """
-                cur.execute(insert_query, insert_vals)
-            
-            result = cur.fetchone()
-            return result is not None
-            
+        counts = BulkLoader(conn).load('match_goalkeeper_performance', batch, columns)
+        return counts['updated'] + counts['inserted']
     except Exception as e:
         print(f"Error upserting goalkeeper data: {e}")
         traceback.print_exc()
-        return False
+        conn.rollback()
+        return 0
 
-def process_html_file(filepath: str, conn) -> Dict:
-    """Process a single HTML file and extract goalkeeper data."""
+def process_html_file(filepath: str, conn, root=None) -> Dict:
+    """Process a single HTML file (or its already-parsed tree) and extract goalkeeper data."""
     stats = {
         'file': os.path.basename(filepath),
         'match_id': None,
@@ -398,26 +288,23 @@ def process_html_file(filepath: str, conn) -> Dict:
             stats['errors'].append("Could not find match info in database")
             return stats
         
-        # Parse HTML
-        with open(filepath, 'r', encoding='utf-8') as f:
-            soup = BeautifulSoup(f.read(), 'html.parser')
-        
-        # Find all goalkeeper tables (one per team)
-        keeper_tables = soup.find_all('table', id=re.compile(r'keeper_stats_[a-f0-9]+'))
+        # Find all goalkeeper tables (one per team), from the parsed table cache
+        # unless the caller already has the page parsed
+        keeper_tables = get_stat_tables(filepath, KEEPER_TABLE_RE, root)
         stats['tables_found'] = len(keeper_tables)
+        goalkeeper_rows = []
         
-        for table in keeper_tables:
-            table_id = table.get('id')
+        for team_match, stat_table in keeper_tables:
+            table_id = stat_table.table_id
             print(f"  Processing table: {table_id}")
             
             # Extract team ID from table ID
-            team_match = re.search(r'keeper_stats_([a-f0-9]+)', table_id)
-            team_id = team_match.group(1) if team_match else None
+            team_id = team_match.group(1)
             
             # Extract data
-            df = extract_goalkeeper_table(soup, table_id)
-            if df is None or df.empty:
+            if not stat_table:
                 continue
+            df = stat_table.to_dataframe()
             
             # Process each goalkeeper
             for _, row in df.iterrows():
@@ -442,15 +329,16 @@ def process_html_file(filepath: str, conn) -> Dict:
                 if not is_valid:
                     stats['validation_errors'] += 1
                 
-                # Upsert to database (even with validation issues - let DB constraints handle it)
+                # Queue for upsert (even with validation issues - let DB constraints handle it)
                 if goalkeeper_data.get('team_season_id'):
-                    if upsert_goalkeeper_data(conn, goalkeeper_data):
-                        stats['records_updated'] += 1
-                        player_name = row_dict.get('Player', 'Unknown') if 'Player' in row_dict else 'Unknown'
-                        print(f"    Updated: {player_name} ({goalkeeper_data['player_id']})")
+                    goalkeeper_rows.append(goalkeeper_data)
+                    player_name = row_dict.get('player') or 'Unknown'
+                    print(f"    Queued: {player_name} ({goalkeeper_data['player_id']})")
                 else:
                     stats['errors'].append(f"No team_season_id for player {goalkeeper_data['player_id']}")
         
+        # Write every goalkeeper in the file in one set-based upsert
+        stats['records_updated'] = upsert_goalkeeper_data(conn, goalkeeper_rows)
         conn.commit()
         
     except Exception as e:
@@ -520,6 +408,7 @@ def main():
     print("Processing all match files...")
     print("=" * 80)
     
+    metrics = start_run('keeper_stats')
     conn = get_db_connection()
     overall_stats = {
         'total_files': len(html_files),
@@ -536,7 +425,9 @@ def main():
             print(f"\n[{i}/{len(html_files)}] Processing {filename}...")
             
             filepath = os.path.join(HTML_DIR, filename)
-            stats = process_html_file(filepath, conn)
+            with metrics.stage('keeper_stats'):
+                stats = process_html_file(filepath, conn)
+            metrics.add('rows_written', stats['records_updated'], 'keeper_stats')
             
             overall_stats['files_processed'] += 1
             overall_stats['total_tables'] += stats['tables_found']
@@ -557,6 +448,7 @@ def main():
     
     finally:
         conn.close()
+        metrics.write()
     
     # Print final summary
     print("\n" + "=" * 80)
@@ -623,4 +515,4 @@ def main():
     print("=" * 80)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_profiled(main, 'keeper_stats')
\ No newline at end of file
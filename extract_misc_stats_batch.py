@@ -6,16 +6,24 @@ Batch extract FBref miscellaneous statistics from HTML files with progress track
 import os
 import re
 import json
-import psycopg2
-from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
 from typing import Dict, List, Optional
 import logging
 from pathlib import Path
 import time
+import argparse
 from io import StringIO
 
+from db_session import connect
+from fbref_table_cache import get_stat_tables
+from fbref_parallel import run_parallel
+from bulk_loader import BulkLoader
+from match_player_resolver import MatchPlayerResolver
+from checkpoint import Checkpoint
+from etl_metrics import get_metrics, start_run
+from etl_profile import run_profiled
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -23,15 +31,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database connection parameters
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
-
 # FBref stat column mappings to database columns
 STAT_MAPPINGS = {
     'cards_yellow': 'yellow_cards',
@@ -52,6 +51,66 @@ STAT_MAPPINGS = {
     'aerials_won_pct': 'aerial_duels_won_pct'
 }
 
+# Table id format: stats_{team_id}_misc
+MISC_TABLE_RE = re.compile(r'stats_([a-f0-9]+)_misc')
+
+def parse_misc_stats(filepath: str, root=None) -> List[Dict]:
+    """
+    Parse the misc tables of a match file without touching the database.
+
+    Returns one record per player row with match_fbref_id, player_fbref_id and
+    the mapped stats; match_player IDs are resolved by the caller.
+    """
+    records = []
+    
+    # Extract match ID from filename
+    match_fbref_id = os.path.basename(filepath).replace('match_', '').replace('.html', '')
+    
+    # Find all miscellaneous stats tables (parsed table cache unless a tree is given)
+    for team_match, stat_table in get_stat_tables(filepath, MISC_TABLE_RE, root):
+        # Process each player row
+        for row, player_fbref_id in zip(stat_table.rows, stat_table.player_ids):
+            # Skip rows without a player FBref ID
+            if not player_fbref_id:
+                continue
+                
+            stats = {}
+            for fbref_col, db_col in STAT_MAPPINGS.items():
+                if fbref_col in row:
+                    value = row[fbref_col]
+                    
+                    # Handle percentage values
+                    if fbref_col == 'aerials_won_pct':
+                        if value and value != '':
+                            try:
+                                stats[db_col] = float(value)
+                            except ValueError:
+                                stats[db_col] = None
+                        else:
+                            stats[db_col] = None
+                    else:
+                        # Handle integer values
+                        try:
+                            stats[db_col] = int(value) if value and value != '' else 0
+                        except ValueError:
+                            stats[db_col] = 0
+                else:
+                    # Set default values for missing columns
+                    if db_col == 'aerial_duels_won_pct':
+                        stats[db_col] = None
+                    else:
+                        stats[db_col] = 0
+                        
+            records.append({
+                'match_fbref_id': match_fbref_id,
+                'team_fbref_id': team_match.group(1),
+                'player_fbref_id': player_fbref_id,
+                'stats': stats
+            })
+            
+    return records
+
+
 class BatchMiscStatsExtractor:
     """Batch extract miscellaneous statistics from FBref HTML files."""
     
@@ -59,16 +118,17 @@ class BatchMiscStatsExtractor:
         """Initialize the extractor with database connection."""
         self.conn = None
         self.batch_size = batch_size
-        self.match_player_cache = {}  # Cache match_player IDs
+        self.resolver = None  # match_player ID cache, created on connect
         self.stats_extracted = 0
         self.files_processed = 0
         self.files_skipped = 0
         self.errors = []
         
-    def connect_db(self):
-        """Establish database connection."""
+    def connect_db(self, conn=None):
+        """Establish database connection (or adopt a shared one)."""
         try:
-            self.conn = psycopg2.connect(**DB_CONFIG)
+            self.conn = conn or connect()
+            self.resolver = MatchPlayerResolver(self.conn)
             logger.info("Database connection established")
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
@@ -82,228 +142,59 @@ class BatchMiscStatsExtractor:
             
     def load_match_player_cache(self):
         """Pre-load all match_player IDs into cache for faster lookups."""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT match_id, player_id, id 
-            FROM match_player
-        """)
-        
-        for match_id, player_id, mp_id in cursor.fetchall():
-            key = f"{match_id}_{player_id}"
-            self.match_player_cache[key] = mp_id
-            
-        cursor.close()
-        logger.info(f"Loaded {len(self.match_player_cache)} match_player records into cache")
+        loaded = self.resolver.load_all()
+        logger.info(f"Loaded {loaded} match_player records into cache")
         
     def get_match_player_id(self, match_id: str, player_id: str) -> Optional[str]:
         """Get match_player ID from cache."""
-        key = f"{match_id}_{player_id}"
-        return self.match_player_cache.get(key)
-        
-    def extract_misc_stats_from_html(self, filepath: str) -> List[Dict]:
-        """Extract miscellaneous statistics from an HTML file."""
-        stats_records = []
-        
-        # Extract match ID from filename
-        match_fbref_id = os.path.basename(filepath).replace('match_', '').replace('.html', '')
+        return self.resolver.get(match_id, player_id)
         
+    def extract_misc_stats_from_html(self, filepath: str, root=None) -> List[Dict]:
+        """Extract miscellaneous statistics from an HTML file (or its already-parsed tree)."""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-                
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # Find all miscellaneous stats tables
-            misc_tables = soup.find_all('table', id=re.compile(r'stats_.*_misc'))
-            
-            if not misc_tables:
-                return stats_records
-            
-            for table in misc_tables:
-                # Extract team ID from table ID
-                table_id = table.get('id', '')
-                team_match = re.search(r'stats_([a-f0-9]+)_misc', table_id)
-                if not team_match:
-                    continue
-                    
-                team_fbref_id = team_match.group(1)
-                
-                # Process each player row
-                rows = table.find_all('tr')[2:]  # Skip header rows
-                
-                for row in rows:
-                    player_cell = row.find('th', {'data-stat': 'player'})
-                    if not player_cell:
-                        continue
-                        
-                    # Extract player FBref ID
-                    player_fbref_id = player_cell.get('data-append-csv')
-                    if not player_fbref_id:
-                        continue
-                        
-                    # Get match_player_id
-                    match_player_id = self.get_match_player_id(match_fbref_id, player_fbref_id)
-                    if not match_player_id:
-                        continue
-                        
-                    # Extract stats
-                    stats_record = {
-                        'match_player_id': match_player_id
-                    }
-                    
-                    # Extract each stat
-                    for fbref_col, db_col in STAT_MAPPINGS.items():
-                        stat_cell = row.find('td', {'data-stat': fbref_col})
-                        if stat_cell:
-                            value = stat_cell.text.strip()
-                            
-                            # Handle percentage values
-                            if fbref_col == 'aerials_won_pct':
-                                if value and value != '':
-                                    try:
-                                        stats_record[db_col] = float(value)
-                                    except ValueError:
-                                        stats_record[db_col] = None
-                                else:
-                                    stats_record[db_col] = None
-                            else:
-                                # Handle integer values
-                                try:
-                                    stats_record[db_col] = int(value) if value and value != '' else 0
-                                except ValueError:
-                                    stats_record[db_col] = 0
-                        else:
-                            # Set default values for missing columns
-                            if db_col == 'aerial_duels_won_pct':
-                                stats_record[db_col] = None
-                            else:
-                                stats_record[db_col] = 0
-                                
-                    stats_records.append(stats_record)
-                    
+            parsed = parse_misc_stats(filepath, root)
         except Exception as e:
             logger.error(f"Error processing file {filepath}: {e}")
             self.errors.append({'file': filepath, 'error': str(e)})
-            
+            return []
+        return self.resolve_records(parsed)
+        
+    def resolve_records(self, parsed_records: List[Dict]) -> List[Dict]:
+        """Attach match_player IDs to parsed rows, dropping players not in match_player."""
+        stats_records = []
+        for parsed in parsed_records:
+            match_player_id = self.get_match_player_id(parsed['match_fbref_id'], parsed['player_fbref_id'])
+            if not match_player_id:
+                continue
+            stats_record = {'match_player_id': match_player_id}
+            stats_record.update(parsed['stats'])
+            stats_records.append(stats_record)
         return stats_records
         
     def process_batch(self, batch_records: List[Dict]) -> tuple:
-        """Process a batch of stats records."""
-        inserted = 0
-        updated = 0
-        
-        cursor = self.conn.cursor()
-        
-        # Check existing records
-        match_player_ids = [r['match_player_id'] for r in batch_records]
-        cursor.execute("""
-            SELECT match_player_id FROM match_player_misc 
-            WHERE match_player_id = ANY(%s::uuid[])
-        """, (match_player_ids,))
-        
-        existing_ids = set(row[0] for row in cursor.fetchall())
-        
-        # Prepare batch insert/update
-        insert_records = []
-        update_records = []
-        
-        for record in batch_records:
-            if record['match_player_id'] in existing_ids:
-                update_records.append(record)
-            else:
-                insert_records.append(record)
-                
-        # Batch insert new records
-        if insert_records:
-            insert_sql = """
-                INSERT INTO match_player_misc (
-                    match_player_id, yellow_cards, red_cards, 
-                    second_yellow_cards, fouls_committed, fouled, offsides,
-                    crosses, interceptions, tackles_won, penalty_kicks_won,
-                    penalty_kicks_conceded, own_goals, ball_recoveries,
-                    aerial_duels_won, aerial_duels_lost, aerial_duels_won_pct
-                ) VALUES %s
-            """
-            
-            values = []
-            for r in insert_records:
-                values.append((
-                    r['match_player_id'],
-                    r.get('yellow_cards', 0),
-                    r.get('red_cards', 0),
-                    r.get('second_yellow_cards', 0),
-                    r.get('fouls_committed', 0),
-                    r.get('fouled', 0),
-                    r.get('offsides', 0),
-                    r.get('crosses', 0),
-                    r.get('interceptions', 0),
-                    r.get('tackles_won', 0),
-                    r.get('penalty_kicks_won', 0),
-                    r.get('penalty_kicks_conceded', 0),
-                    r.get('own_goals', 0),
-                    r.get('ball_recoveries', 0),
-                    r.get('aerial_duels_won', 0),
-                    r.get('aerial_duels_lost', 0),
-                    r.get('aerial_duels_won_pct')
-                ))
-                
-            from psycopg2.extras import execute_values
-            execute_values(cursor, insert_sql, values)
-            inserted = len(insert_records)
-            
-        # Batch update existing records
-        for record in update_records:
-            cursor.execute("""
-                UPDATE match_player_misc SET
-                    yellow_cards = %s,
-                    red_cards = %s,
-                    second_yellow_cards = %s,
-                    fouls_committed = %s,
-                    fouled = %s,
-                    offsides = %s,
-                    crosses = %s,
-                    interceptions = %s,
-                    tackles_won = %s,
-                    penalty_kicks_won = %s,
-                    penalty_kicks_conceded = %s,
-                    own_goals = %s,
-                    ball_recoveries = %s,
-                    aerial_duels_won = %s,
-                    aerial_duels_lost = %s,
-                    aerial_duels_won_pct = %s
-                WHERE match_player_id = %s
-            """, (
-                record.get('yellow_cards', 0),
-                record.get('red_cards', 0),
-                record.get('second_yellow_cards', 0),
-                record.get('fouls_committed', 0),
-                record.get('fouled', 0),
-                record.get('offsides', 0),
-                record.get('crosses', 0),
-                record.get('interceptions', 0),
-                record.get('tackles_won', 0),
-                record.get('penalty_kicks_won', 0),
-                record.get('penalty_kicks_conceded', 0),
-                record.get('own_goals', 0),
-                record.get('ball_recoveries', 0),
-                record.get('aerial_duels_won', 0),
-                record.get('aerial_duels_lost', 0),
-                record.get('aerial_duels_won_pct'),
-                record['match_player_id']
-            ))
-            
-        updated = len(update_records)
-        
-        self.conn.commit()
-        cursor.close()
+        """Process a batch of stats records as one set-based upsert (inline VALUES for small batches, else COPY)."""
+        try:
+            counts = BulkLoader(self.conn).load('match_player_misc', batch_records, method='auto')
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
         
-        return inserted, updated
+        return counts['inserted'], counts['updated']
         
-    def process_all_files(self, html_dir: str):
-        """Process all HTML files in the directory with batch processing."""
+    def process_all_files(self, html_dir: str, resume: bool = False):
+        """Process all HTML files in the directory with batch processing, checkpointing each batch."""
         html_path = Path(html_dir)
         html_files = sorted(html_path.glob('match_*.html'))
         
+        # Skip files committed by an interrupted run and carry its counters forward
+        checkpoint = Checkpoint('misc_stats', resume=resume)
+        if resume:
+            html_files = [f for f in html_files if not checkpoint.is_done(str(f))]
+            self.files_processed = checkpoint.counter('files_processed')
+            self.files_skipped = checkpoint.counter('files_skipped')
+            self.stats_extracted = checkpoint.counter('stats_extracted')
+        
         total_files = len(html_files)
         logger.info(f"Found {total_files} HTML files to process")
         
@@ -311,11 +202,18 @@ class BatchMiscStatsExtractor:
         self.load_match_player_cache()
         
         batch_records = []
+        batch_files = []
         start_time = time.time()
+        metrics = get_metrics()
         
         for i, filepath in enumerate(html_files, 1):
             # Extract stats from file
-            file_records = self.extract_misc_stats_from_html(str(filepath))
+            errors_before = len(self.errors)
+            with metrics.stage('misc'):
+                file_records = self.extract_misc_stats_from_html(str(filepath))
+            if len(self.errors) == errors_before:
+                # Files that failed to parse are left out of the checkpoint so a resume retries them
+                batch_files.append(str(filepath))
             
             if file_records:
                 batch_records.extend(file_records)
@@ -326,9 +224,16 @@ class BatchMiscStatsExtractor:
             # Process batch when it reaches batch size or at the end
             if len(batch_records) >= self.batch_size or i == total_files:
                 if batch_records:
-                    inserted, updated = self.process_batch(batch_records)
+                    with metrics.stage('misc', files=0):
+                        inserted, updated = self.process_batch(batch_records)
+                    metrics.add('rows_written', inserted + updated, 'misc')
                     self.stats_extracted += inserted + updated
-                    
+                # Batch committed: record its files (including ones without misc tables)
+                checkpoint.commit(batch_files, files_processed=self.files_processed,
+                                  files_skipped=self.files_skipped, stats_extracted=self.stats_extracted)
+                batch_files = []
+                
+                if batch_records:
                     # Progress update
                     elapsed = time.time() - start_time
                     rate = i / elapsed if elapsed > 0 else 0
@@ -341,6 +246,21 @@ class BatchMiscStatsExtractor:
                     
                     batch_records = []
                     
+    def process_all_files_parallel(self, html_dir: str, workers: int):
+        """Parse files on worker processes and write through one batched writer process."""
+        html_files = [str(f) for f in sorted(Path(html_dir).glob('match_*.html'))]
+        logger.info(f"Found {len(html_files)} HTML files to process")
+        
+        stats = run_parallel(html_files, parse_misc_stats, MiscStatsWriter,
+                             workers=workers, batch_records=self.batch_size, stage='misc')
+        
+        self.stats_extracted += stats.get('records_written', 0)
+        self.files_processed += stats.get('files_parsed', 0)
+        self.files_skipped += stats.get('files_failed', 0)
+        self.errors.extend(stats.get('parse_errors', []))
+        for error in stats.get('write_errors', []):
+            self.errors.append({'file': ', '.join(error['files']) or 'writer', 'error': error['error']})
+
     def generate_report(self) -> Dict:
         """Generate extraction report."""
         cursor = self.conn.cursor()
@@ -376,16 +296,53 @@ class BatchMiscStatsExtractor:
         
         return report
         
+class MiscStatsWriter:
+    """Single-connection writer for fbref_parallel: resolves match_player IDs and upserts batches."""
+    
+    def __init__(self):
+        self.extractor = BatchMiscStatsExtractor()
+        self.extractor.connect_db()
+        self.extractor.load_match_player_cache()
+        
+    def write(self, units) -> int:
+        """Write a batch of (filepath, parsed records) units; returns rows written."""
+        batch_records = []
+        for _, parsed_records in units:
+            batch_records.extend(self.extractor.resolve_records(parsed_records))
+        if not batch_records:
+            return 0
+        inserted, updated = self.extractor.process_batch(batch_records)
+        return inserted + updated
+        
+    def rollback(self):
+        self.extractor.conn.rollback()
+        
+    def close(self):
+        self.extractor.close_db()
+
+
 def main():
     """Main execution function."""
+    parser = argparse.ArgumentParser(description='Batch extract FBref miscellaneous statistics')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Parse worker processes (>1 runs parse workers plus a single DB writer)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run from its last committed batch')
+    args = parser.parse_args()
+    
+    metrics = start_run('misc')
     extractor = BatchMiscStatsExtractor(batch_size=100)
+    html_dir = '/Users/thomasmcmillan/projects/nwsl_db_migration/html_files/'
     
     try:
         # Connect to database
         extractor.connect_db()
         
         # Process all files
-        extractor.process_all_files('/Users/thomasmcmillan/projects/nwsl_db_migration/html_files/')
+        if args.workers > 1:
+            extractor.process_all_files_parallel(html_dir, args.workers)
+        else:
+            extractor.process_all_files(html_dir, resume=args.resume)
         
         # Generate report
         report = extractor.generate_report()
@@ -418,6 +375,7 @@ def main():
         raise
     finally:
         extractor.close_db()
+        metrics.write()
         
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_profiled(main, 'misc')
\ No newline at end of file
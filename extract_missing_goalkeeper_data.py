@@ -7,7 +7,6 @@ Focuses on 96 missing records: 93 from 2015, 1 from 2014, 2 from 2021.
 import os
 import re
 import json
-import psycopg2
 from datetime import datetime
 from pathlib import Path
 from bs4 import BeautifulSoup
@@ -15,20 +14,15 @@ import pandas as pd
 from io import StringIO
 import uuid
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
+from db_session import connect
+from match_file_locator import find_match_file
+from etl_profile import run_profiled
 
 HTML_DIR = '/Users/thomasmcmillan/projects/nwsl_data_backup_data/notebooks/match_html_files'
 
 def get_missing_matches():
     """Get list of matches missing goalkeeper data from database"""
-    conn = psycopg2.connect(**DB_CONFIG)
+    conn = connect()
     cur = conn.cursor()
     
     query = """
@@ -298,7 +292,7 @@ def get_player_uuid(player_name, player_fbref_id=None):
     First tries to match by FBref ID, then by name.
     Note: In this database, player_id column contains the FBref hex ID
     """
-    conn = psycopg2.connect(**DB_CONFIG)
+    conn = connect()
     cur = conn.cursor()
     
     found_player_id = None  # This will be the FBref hex ID
@@ -371,7 +365,7 @@ def insert_goalkeeper_performance(match_id, team_season_id, gk_data):
     """
     Insert goalkeeper performance data into database.
     """
-    conn = psycopg2.connect(**DB_CONFIG)
+    conn = connect()
     cur = conn.cursor()
     
     try:
@@ -516,8 +510,8 @@ def main():
         away_team_season_id = match[4]
         
         # Check if HTML file exists
-        html_path = Path(HTML_DIR) / f"match_{match_id}.html"
-        if not html_path.exists():
+        html_path = find_match_file(match_id)
+        if not html_path:
             print(f"\nSkipping {match_id} - HTML file not found")
             failed += 1
             continue
@@ -547,7 +541,7 @@ def main():
     print("=" * 80)
     
     # Verify final coverage
-    conn = psycopg2.connect(**DB_CONFIG)
+    conn = connect()
     cur = conn.cursor()
     
     cur.execute("""
@@ -569,4 +563,4 @@ def main():
     conn.close()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_profiled(main, 'missing_keepers')
\ No newline at end of file
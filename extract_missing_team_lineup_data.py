@@ -4,7 +4,6 @@ Script to extract missing team performance and lineup data from FBref HTML files
 """
 
 import os
-import psycopg2
 from psycopg2.extras import RealDictCursor
 import pandas as pd
 from bs4 import BeautifulSoup
@@ -13,23 +12,17 @@ from datetime import datetime
 import json
 import re
 from typing import Dict, List, Tuple, Optional, Any
-from pathlib import Path
 
-# Database connection parameters
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
+from db_session import connect
+from match_file_locator import find_match_file, get_locator
+from etl_profile import run_profiled
 
 # HTML files directory
 HTML_DIR = '/Users/thomasmcmillan/projects/nwsl_data_backup_data/notebooks/match_html_files'
 
 def connect_to_db():
     """Create database connection"""
-    return psycopg2.connect(**DB_CONFIG)
+    return connect()
 
 def get_database_coverage():
     """Analyze current database coverage for team and lineup data"""
@@ -142,18 +135,13 @@ def get_matches_missing_team_data():
 
 def find_html_file_for_match(match_id: str, match_date: str) -> Optional[str]:
     """Find HTML file for a given match"""
-    # Try different file naming patterns
-    patterns = [
-        f"{match_id}.html",
-        f"*{match_id}*.html",
-        f"*{match_date}*.html"
-    ]
+    html_file = find_match_file(match_id)
+    if html_file:
+        return html_file
     
-    for pattern in patterns:
-        for file in Path(HTML_DIR).glob(pattern):
-            return str(file)
-    
-    return None
+    # Fall back to a file from the same date
+    candidates = get_locator().find_by_date(match_date)
+    return candidates[0] if candidates else None
 
 def extract_lineup_from_html(soup: BeautifulSoup, match_id: str, team_id: str, team_name: str) -> List[Dict]:
     """Extract lineup data from HTML"""
@@ -486,4 +474,4 @@ def main():
         print(f"  Improvement: {(team_covered_new - team_covered)} matches")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_profiled(main, 'missing_lineups')
\ No newline at end of file
@@ -8,13 +8,22 @@ Handles missing columns gracefully for older match files
 import os
 import re
 import json
-import psycopg2
-from psycopg2.extras import execute_batch
-from bs4 import BeautifulSoup
-import pandas as pd
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+import queue
 import logging
+import argparse
+import threading
+
+from db_session import connect
+from fbref_tables import StatTable
+from fbref_table_cache import get_stat_tables
+from fbref_parallel import run_parallel
+from bulk_loader import BulkLoader
+from match_player_resolver import MatchPlayerResolver
+from checkpoint import Checkpoint
+from etl_metrics import get_metrics, start_run
+from etl_profile import run_profiled
 
 # Configure logging
 logging.basicConfig(
@@ -23,15 +32,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database connection parameters
-DB_PARAMS = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
-
 # FBref column to database column mapping
 COLUMN_MAPPING = {
     # Core Pass Types
@@ -62,6 +62,12 @@ COLUMN_MAPPING = {
     'passes_high': 'passes_high',            # High passes
 }
 
+# Table id format: stats_{team_id}_passing_types
+PASS_TYPES_TABLE_RE = re.compile(r'^stats_([a-f0-9]+)_passing_types$')
+
+# Rows buffered before a write; bounds peak memory in streaming mode
+FLUSH_THRESHOLD = 1000
+
 # Additional columns that might appear in newer formats
 ADDITIONAL_COLUMNS = [
     'passes_left_foot', 'passes_right_foot', 'passes_head',
@@ -70,8 +76,10 @@ ADDITIONAL_COLUMNS = [
 ]
 
 class PassTypesExtractor:
-    def __init__(self):
+    def __init__(self, flush_threshold: int = FLUSH_THRESHOLD):
         self.conn = None
+        self.resolver = None
+        self.flush_threshold = flush_threshold
         self.extracted_data = []
         self.extraction_stats = {
             'files_processed': 0,
@@ -82,10 +90,11 @@ class PassTypesExtractor:
             'errors': []
         }
         
-    def connect_db(self):
-        """Establish database connection"""
+    def connect_db(self, conn=None):
+        """Establish database connection (or adopt a shared one)"""
         try:
-            self.conn = psycopg2.connect(**DB_PARAMS)
+            self.conn = conn or connect()
+            self.resolver = MatchPlayerResolver(self.conn)
             logger.info("Database connection established")
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
@@ -110,94 +119,83 @@ class PassTypesExtractor:
         
     def get_match_player_id(self, match_fbref_id: str, player_fbref_id: str) -> Optional[str]:
         """Get match_player UUID for the given match and player FBref IDs"""
-        cursor = self.conn.cursor()
-        
-        # Get match_player UUID
-        cursor.execute("""
-            SELECT id FROM match_player 
-            WHERE match_id = %s AND player_id = %s
-        """, (match_fbref_id, player_fbref_id))
-        result = cursor.fetchone()
-        match_player_id = result[0] if result else None
-        
-        cursor.close()
-        
-        return match_player_id
-        
-    def parse_pass_types_table(self, table, match_fbref_id: str, team_fbref_id: str) -> List[Dict]:
+        # First lookup for a match loads all of its match_player rows
+        return self.resolver.get(match_fbref_id, player_fbref_id)
+        
+    def resolve_match_player_ids(self, rows: List[Dict]) -> List[Dict]:
+        """Fill match_player_id for parsed rows with one lookup per batch; drops unmatched rows."""
+        lookup = self.resolver.resolve((row['match_fbref_id'], row['player_fbref_id']) for row in rows)
+        
+        resolved = []
+        for row in rows:
+            match_player_id = lookup.get((row['match_fbref_id'], row['player_fbref_id']))
+            if not match_player_id:
+                logger.warning(f"No match_player record for match {row['match_fbref_id']}, "
+                               f"player {row['player_fbref_id']}")
+                continue
+            row['match_player_id'] = match_player_id
+            resolved.append(row)
+        return resolved
+        
+    def parse_pass_types_table(self, stat_table: StatTable, match_fbref_id: str, team_fbref_id: str) -> List[Dict]:
         """Parse a single pass types table and extract all available columns"""
         rows_data = []
         
         try:
-            # Convert to DataFrame
-            df = pd.read_html(str(table))[0]
-            
-            # Handle multi-level column headers
-            if isinstance(df.columns, pd.MultiIndex):
-                # Flatten column names
-                df.columns = ['_'.join(col).strip('_').lower() if col[1] != '' else col[0].lower() 
-                             for col in df.columns.values]
-            else:
-                df.columns = [col.lower() for col in df.columns]
-            
-            # Log available columns for debugging
-            available_columns = set(df.columns)
-            self.extraction_stats['columns_found'].update(available_columns)
+            # Log available columns (data-stat names) for debugging
+            self.extraction_stats['columns_found'].update(stat_table.stats)
             
             # Process each row
-            tbody = table.find('tbody')
-            if tbody:
-                for idx, row in enumerate(tbody.find_all('tr')):
-                    player_cell = row.find('th', {'data-stat': 'player'})
-                    if not player_cell:
-                        continue
-                        
-                    # Extract player FBref ID
-                    player_fbref_id = player_cell.get('data-append-csv', '')
-                    if not player_fbref_id:
-                        continue
-                        
-                    # Get match_player ID
+            for row, player_fbref_id in zip(stat_table.rows, stat_table.player_ids):
+                # Skip rows without a player FBref ID
+                if not player_fbref_id:
+                    continue
+                    
+                # Get match_player ID (without a connection - parallel parse workers -
+                # the writer resolves it from the FBref IDs kept on the row)
+                match_player_id = None
+                if self.conn:
                     match_player_id = self.get_match_player_id(match_fbref_id, player_fbref_id)
                     
                     if not match_player_id:
                         logger.warning(f"No match_player record for match {match_fbref_id}, player {player_fbref_id}")
                         continue
-                    
-                    # Extract all available pass types columns
-                    row_data = {
-                        'match_player_id': match_player_id
-                    }
-                    
-                    # Extract each mapped column
-                    for fbref_col, db_col in COLUMN_MAPPING.items():
-                        cell = row.find('td', {'data-stat': fbref_col})
-                        if cell:
-                            value = cell.text.strip()
-                            # Convert to integer, handling empty strings and zeros
-                            if value and value != '':
-                                try:
-                                    row_data[db_col] = int(value) if value != '0' and not value.startswith('0.') else (0 if value == '0' else None)
-                                except ValueError:
-                                    row_data[db_col] = None
-                            else:
+                
+                # Extract all available pass types columns
+                row_data = {
+                    'match_player_id': match_player_id,
+                    'match_fbref_id': match_fbref_id,
+                    'player_fbref_id': player_fbref_id
+                }
+                
+                # Extract each mapped column
+                for fbref_col, db_col in COLUMN_MAPPING.items():
+                    if fbref_col in row:
+                        value = row[fbref_col]
+                        # Convert to integer, handling empty strings and zeros
+                        if value and value != '':
+                            try:
+                                row_data[db_col] = int(value) if value != '0' and not value.startswith('0.') else (0 if value == '0' else None)
+                            except ValueError:
                                 row_data[db_col] = None
                         else:
-                            # Column not found in this table
-                            self.extraction_stats['missing_columns'].add(fbref_col)
                             row_data[db_col] = None
-                    
-                    # Set metadata
-                    row_data['data_source'] = 'fbref_html'
-                    
-                    # Determine completeness based on available data
-                    # Consider data complete if we have at least the core columns
-                    core_columns = ['passes', 'passes_live', 'passes_dead', 'crosses', 'passes_completed']
-                    has_core_data = any(row_data.get(col) is not None for col in core_columns)
-                    row_data['is_complete'] = has_core_data
-                    
-                    rows_data.append(row_data)
-                    self.extraction_stats['rows_extracted'] += 1
+                    else:
+                        # Column not found in this table
+                        self.extraction_stats['missing_columns'].add(fbref_col)
+                        row_data[db_col] = None
+                
+                # Set metadata
+                row_data['data_source'] = 'fbref_html'
+                
+                # Determine completeness based on available data
+                # Consider data complete if we have at least the core columns
+                core_columns = ['passes', 'passes_live', 'passes_dead', 'crosses', 'passes_completed']
+                has_core_data = any(row_data.get(col) is not None for col in core_columns)
+                row_data['is_complete'] = has_core_data
+                
+                rows_data.append(row_data)
+                self.extraction_stats['rows_extracted'] += 1
                     
         except Exception as e:
             logger.error(f"Error parsing pass types table: {e}")
@@ -205,21 +203,20 @@ class PassTypesExtractor:
             
         return rows_data
         
-    def process_file(self, filepath: str) -> int:
-        """Process a single HTML file and extract pass types data"""
+    def process_file(self, filepath: str, root=None) -> int:
+        """Process a single HTML file and extract pass types data.
+        
+        Tables come from the parsed table cache (or just their slices of the
+        page on a miss); pass root when the caller already has the page parsed.
+        """
         try:
             match_fbref_id = self.extract_match_id(os.path.basename(filepath))
             if not match_fbref_id:
                 logger.warning(f"Could not extract match ID from {filepath}")
                 return 0
                 
-            with open(filepath, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-                
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
             # Find all pass types tables
-            pass_types_tables = soup.find_all('table', id=re.compile(r'stats_.*_passing_types'))
+            pass_types_tables = get_stat_tables(filepath, PASS_TYPES_TABLE_RE, root)
             
             if not pass_types_tables:
                 logger.info(f"No pass types tables found in {filepath}")
@@ -227,16 +224,11 @@ class PassTypesExtractor:
                 
             self.extraction_stats['tables_found'] += len(pass_types_tables)
             
-            for table in pass_types_tables:
-                table_id = table.get('id', '')
-                team_fbref_id = self.extract_team_id(table_id)
-                
-                if not team_fbref_id:
-                    logger.warning(f"Could not extract team ID from table {table_id}")
-                    continue
+            for team_match, stat_table in pass_types_tables:
+                team_fbref_id = team_match.group(1)
                     
                 # Extract data from this table
-                table_data = self.parse_pass_types_table(table, match_fbref_id, team_fbref_id)
+                table_data = self.parse_pass_types_table(stat_table, match_fbref_id, team_fbref_id)
                 self.extracted_data.extend(table_data)
                 
             return len(pass_types_tables)
@@ -311,79 +303,98 @@ class PassTypesExtractor:
             }
         }
         
-    def insert_data(self):
-        """Insert extracted data into database"""
-        if not self.extracted_data:
+    def insert_data(self, rows: Optional[List[Dict]] = None):
+        """Insert extracted data (or the given resolved rows) into database"""
+        rows = self.extracted_data if rows is None else rows
+        if not rows:
             logger.info("No data to insert")
             return
             
-        cursor = self.conn.cursor()
-        
-        # Prepare insert query with all columns
-        insert_query = """
-            INSERT INTO match_player_pass_types (
-                match_player_id,
-                passes, passes_live, passes_dead, passes_free_kicks,
-                through_balls, passes_switches, crosses,
-                throw_ins, corner_kicks, corner_kicks_in, corner_kicks_out, corner_kicks_straight,
-                passes_completed, passes_offsides, passes_blocked,
-                passes_pressure, passes_ground, passes_low, passes_high,
-                data_source, is_complete,
-                created_at, updated_at
-            ) VALUES (
-                %(match_player_id)s,
-                %(passes)s, %(passes_live)s, %(passes_dead)s, %(passes_free_kicks)s,
-                %(through_balls)s, %(passes_switches)s, %(crosses)s,
-                %(throw_ins)s, %(corner_kicks)s, %(corner_kicks_in)s, %(corner_kicks_out)s, %(corner_kicks_straight)s,
-                %(passes_completed)s, %(passes_offsides)s, %(passes_blocked)s,
-                %(passes_pressure)s, %(passes_ground)s, %(passes_low)s, %(passes_high)s,
-                %(data_source)s, %(is_complete)s,
-                NOW(), NOW()
-            )
-            ON CONFLICT (match_player_id) 
-            DO UPDATE SET
-                passes = EXCLUDED.passes,
-                passes_live = EXCLUDED.passes_live,
-                passes_dead = EXCLUDED.passes_dead,
-                passes_free_kicks = EXCLUDED.passes_free_kicks,
-                through_balls = EXCLUDED.through_balls,
-                passes_switches = EXCLUDED.passes_switches,
-                crosses = EXCLUDED.crosses,
-                throw_ins = EXCLUDED.throw_ins,
-                corner_kicks = EXCLUDED.corner_kicks,
-                corner_kicks_in = EXCLUDED.corner_kicks_in,
-                corner_kicks_out = EXCLUDED.corner_kicks_out,
-                corner_kicks_straight = EXCLUDED.corner_kicks_straight,
-                passes_completed = EXCLUDED.passes_completed,
-                passes_offsides = EXCLUDED.passes_offsides,
-                passes_blocked = EXCLUDED.passes_blocked,
-                passes_pressure = EXCLUDED.passes_pressure,
-                passes_ground = EXCLUDED.passes_ground,
-                passes_low = EXCLUDED.passes_low,
-                passes_high = EXCLUDED.passes_high,
-                data_source = EXCLUDED.data_source,
-                is_complete = EXCLUDED.is_complete,
-                updated_at = NOW()
-        """
-        
         try:
-            # Ensure all required fields are present
-            for row in self.extracted_data:
-                # Add any missing columns with None values
-                for col in COLUMN_MAPPING.values():
-                    if col not in row:
-                        row[col] = None
-                        
-            execute_batch(cursor, insert_query, self.extracted_data, page_size=100)
+            # Stage with COPY and apply as one set-based upsert on match_player_id
+            BulkLoader(self.conn).load('match_player_pass_types', rows)
             self.conn.commit()
-            logger.info(f"Successfully inserted/updated {len(self.extracted_data)} records")
+            logger.info(f"Successfully inserted/updated {len(rows)} records")
             
         except Exception as e:
             self.conn.rollback()
             logger.error(f"Error inserting data: {e}")
             raise
+            
+    def write_rows(self, rows: List[Dict]) -> int:
+        """Resolve match_player IDs for parsed rows and upsert them; returns rows written"""
+        rows = self.resolve_match_player_ids(rows)
+        self.insert_data(rows)
+        return len(rows)
+        
+    def stream_rows(self, filepaths: List[str]) -> Iterator[Tuple[str, List[Dict], bool]]:
+        """Parse files one at a time without touching the database, yielding (filepath, rows, parsed_ok)"""
+        parser = PassTypesExtractor()
+        parser.extraction_stats = self.extraction_stats
+        metrics = get_metrics()
+        for filepath in filepaths:
+            parser.extracted_data = []
+            errors_before = len(self.extraction_stats['errors'])
+            with metrics.stage('passing_types'):
+                parser.process_file(filepath)
+            self.extraction_stats['files_processed'] += 1
+            yield filepath, parser.extracted_data, len(self.extraction_stats['errors']) == errors_before
+            
+    def process_stream(self, filepaths: List[str], checkpoint: Optional[Checkpoint] = None) -> int:
+        """
+        Stream parsed rows to the database in flush_threshold batches.
+        
+        Parsing runs on the calling thread and writes on a writer thread that
+        owns the connection. The hand-off queue holds one batch, so at most
+        about three batches of rows are in memory however large the corpus,
+        and a batch is written while the next one is parsed. Each committed
+        batch is checkpointed with the files it covered. Returns rows written.
+        """
+        batches = queue.Queue(maxsize=1)
+        result = {'written': 0, 'error': None}
+        metrics = get_metrics()
+        
+        def writer():
+            for rows, files, counters in iter(batches.get, None):
+                if result['error']:
+                    continue  # keep draining so the parser never blocks on a dead writer
+                try:
+                    with metrics.stage('passing_types', files=0):
+                        written = self.write_rows(rows) if rows else 0
+                    metrics.add('rows_written', written, 'passing_types')
+                    result['written'] += written
+                    if checkpoint:
+                        checkpoint.commit(files, **counters)
+                except Exception as e:
+                    result['error'] = e
+                    
+        writer_thread = threading.Thread(target=writer, name='pass-types-writer', daemon=True)
+        writer_thread.start()
+        
+        def hand_off(rows, files):
+            if result['error']:
+                raise result['error']
+            counters = {k: self.extraction_stats[k] for k in ('files_processed', 'tables_found', 'rows_extracted')}
+            batches.put((rows, files, counters))
+            
+        buffer, buffer_files = [], []
+        try:
+            for filepath, rows, parsed_ok in self.stream_rows(filepaths):
+                buffer.extend(rows)
+                if parsed_ok:
+                    # Failed files stay out of the checkpoint so a resume retries them
+                    buffer_files.append(filepath)
+                if len(buffer) >= self.flush_threshold:
+                    hand_off(buffer, buffer_files)
+                    buffer, buffer_files = [], []
+            hand_off(buffer, buffer_files)
         finally:
-            cursor.close()
+            batches.put(None)
+            writer_thread.join()
+            
+        if result['error']:
+            raise result['error']
+        return result['written']
             
     def generate_report(self) -> Dict:
         """Generate comprehensive extraction report"""
@@ -445,8 +456,8 @@ class PassTypesExtractor:
         
         return report
         
-    def process_all_files(self, directory: str):
-        """Process all HTML files in directory"""
+    def process_all_files(self, directory: str, resume: bool = False):
+        """Process all HTML files in directory, checkpointing each committed batch"""
         logger.info(f"Processing all files in {directory}")
         
         self.connect_db()
@@ -455,24 +466,19 @@ class PassTypesExtractor:
         initial_state = self.check_existing_data()
         logger.info(f"Initial database state: {json.dumps(initial_state, indent=2)}")
         
-        # Get all HTML files
-        html_files = [f for f in os.listdir(directory) if f.startswith('match_') and f.endswith('.html')]
+        # Get all HTML files (skipping those committed by an interrupted run)
+        html_files = sorted(f for f in os.listdir(directory) if f.startswith('match_') and f.endswith('.html'))
+        checkpoint = Checkpoint('pass_types', resume=resume)
+        if resume:
+            html_files = [f for f in html_files if not checkpoint.is_done(f)]
+            self.extraction_stats['files_processed'] = checkpoint.counter('files_processed')
+            self.extraction_stats['tables_found'] = checkpoint.counter('tables_found')
+            self.extraction_stats['rows_extracted'] = checkpoint.counter('rows_extracted')
         logger.info(f"Found {len(html_files)} HTML files to process")
         
-        # Process each file
-        for filename in html_files:
-            filepath = os.path.join(directory, filename)
-            self.process_file(filepath)
-            self.extraction_stats['files_processed'] += 1
-            
-            # Insert data in batches
-            if len(self.extracted_data) >= 1000:
-                self.insert_data()
-                self.extracted_data = []
-                
-        # Insert remaining data
-        if self.extracted_data:
-            self.insert_data()
+        # Stream rows to the database in flush_threshold batches, checkpointing each one
+        rows_written = self.process_stream([os.path.join(directory, f) for f in html_files], checkpoint)
+        logger.info(f"Wrote {rows_written} rows in batches of up to {self.flush_threshold}")
             
         # Check final state
         final_state = self.check_existing_data()
@@ -485,15 +491,75 @@ class PassTypesExtractor:
         self.close_db()
         
         return report
+        
+    def process_all_files_parallel(self, directory: str, workers: int):
+        """Process all HTML files with parse workers feeding a single batched writer"""
+        logger.info(f"Processing all files in {directory} with {workers} workers")
+        
+        html_files = [os.path.join(directory, f) for f in os.listdir(directory)
+                      if f.startswith('match_') and f.endswith('.html')]
+        logger.info(f"Found {len(html_files)} HTML files to process")
+        
+        stats = run_parallel(html_files, parse_pass_types_file, PassTypesWriter,
+                             workers=workers, batch_records=self.flush_threshold, stage='passing_types')
+        self.extraction_stats['files_processed'] = stats.get('files_parsed', 0)
+        self.extraction_stats['rows_extracted'] = stats.get('records_parsed', 0)
+        self.extraction_stats['errors'].extend(
+            f"{err['file']}: {err['error']}" for err in stats.get('parse_errors', [])
+        )
+        self.extraction_stats['errors'].extend(err['error'] for err in stats.get('write_errors', []))
+        
+        self.connect_db()
+        report = self.generate_report()
+        report['extraction_summary']['rows_written'] = stats.get('records_written', 0)
+        logger.info(f"Extraction report: {json.dumps(report, indent=2)}")
+        self.close_db()
+        
+        return report
+
+
+def parse_pass_types_file(filepath: str) -> List[Dict]:
+    """DB-free parse for fbref_parallel workers; match_player_id is left for the writer."""
+    extractor = PassTypesExtractor()
+    extractor.process_file(filepath)
+    return extractor.extracted_data
+
+
+class PassTypesWriter:
+    """Single-connection writer for fbref_parallel: resolves match_player IDs, then upserts."""
+    
+    def __init__(self):
+        self.extractor = PassTypesExtractor()
+        self.extractor.connect_db()
+        
+    def write(self, units) -> int:
+        """Upsert a batch of (filepath, parsed rows) units; returns rows written."""
+        rows = [row for _, parsed_rows in units for row in parsed_rows]
+        return self.extractor.write_rows(rows)
+        
+    def rollback(self):
+        self.extractor.conn.rollback()
+        
+    def close(self):
+        self.extractor.close_db()
 
 
 def main():
     """Main execution function"""
-    import sys
+    parser = argparse.ArgumentParser(description='Extract FBref pass types into match_player_pass_types')
+    parser.add_argument('--test', action='store_true', help='Process only match_07c68416.html')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Parse worker processes (>1 runs parse workers plus a single DB writer)')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run from its last committed batch')
+    parser.add_argument('--flush-threshold', type=int, default=FLUSH_THRESHOLD,
+                        help=f'Rows buffered before each write (default: {FLUSH_THRESHOLD})')
+    args = parser.parse_args()
     
-    extractor = PassTypesExtractor()
+    metrics = start_run('passing_types')
+    extractor = PassTypesExtractor(flush_threshold=args.flush_threshold)
     
-    if len(sys.argv) > 1 and sys.argv[1] == '--test':
+    if args.test:
         # Test mode with single file
         test_file = '/Users/thomasmcmillan/projects/nwsl_db_migration/html_files/match_07c68416.html'
         report = extractor.test_single_file(test_file)
@@ -506,13 +572,17 @@ def main():
     else:
         # Process all files
         html_dir = '/Users/thomasmcmillan/projects/nwsl_db_migration/html_files'
-        report = extractor.process_all_files(html_dir)
+        if args.workers > 1:
+            report = extractor.process_all_files_parallel(html_dir, args.workers)
+        else:
+            report = extractor.process_all_files(html_dir, resume=args.resume)
         
         # Save report
         with open('pass_types_extraction_report.json', 'w') as f:
             json.dump(report, f, indent=2)
         logger.info("Full extraction report saved to pass_types_extraction_report.json")
+    metrics.write()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_profiled(main, 'passing_types')
\ No newline at end of file
@@ -8,16 +8,17 @@ import os
 import sys
 import json
 import uuid
-import psycopg2
-from psycopg2.extras import execute_batch
 from datetime import datetime
-from bs4 import BeautifulSoup
-import pandas as pd
-from io import StringIO
 import re
 from typing import Dict, List, Optional, Tuple
 import logging
 
+from db_session import DB_CONFIG, PreparedStatement, connect
+from fbref_shot_engine import read_shots_file
+from mapping_snapshot import player_mapping, team_names
+from etl_metrics import get_metrics, start_run
+from etl_profile import run_profiled
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,18 +26,25 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
-
 # HTML files directory
 HTML_DIR = '/Users/thomasmcmillan/projects/nwsl_data_backup_data/notebooks/match_html_files'
 
+# Prepared once per connection; each match's shots are sent as pages of EXECUTEs
+INSERT_SHOT = PreparedStatement('insert_match_shot', """
+    INSERT INTO match_shot (
+        shot_id, match_id, minute, player_name, player_id, squad,
+        xg, psxg, outcome_id, distance, body_part, notes,
+        sca1_player_name, sca1_event, sca2_player_name, sca2_event,
+        player_uuid
+    ) VALUES (
+        %(shot_id)s, %(match_id)s, %(minute)s, %(player_name)s, %(player_id)s, %(squad)s,
+        %(xg)s, %(psxg)s, %(outcome_id)s, %(distance)s, %(body_part)s, %(notes)s,
+        %(sca1_player_name)s, %(sca1_event)s, %(sca2_player_name)s, %(sca2_event)s,
+        %(player_uuid)s
+    )
+    ON CONFLICT (shot_id) DO NOTHING
+""")
+
 
 class ShotDataExtractor:
     """Extracts shot data from FBref HTML files."""
@@ -52,7 +60,7 @@ class ShotDataExtractor:
     def connect_db(self):
         """Establish database connection."""
         try:
-            self.conn = psycopg2.connect(**self.db_config)
+            self.conn = connect(**self.db_config)
             self.cursor = self.conn.cursor()
             logger.info("Database connection established")
         except Exception as e:
@@ -69,21 +77,12 @@ class ShotDataExtractor:
         
     def load_mappings(self):
         """Load player and team mappings from database."""
-        # Load player mappings (player_id is the FBref hex ID, id is the UUID)
-        self.cursor.execute("""
-            SELECT player_id, id, player_name 
-            FROM player
-        """)
-        for row in self.cursor.fetchall():
-            self.player_mapping[row[0]] = {'uuid': row[1], 'name': row[2]}
+        # Player mappings (FBref hex ID -> UUID and name); snapshotted locally
+        self.player_mapping = player_mapping(self.conn)
         logger.info(f"Loaded {len(self.player_mapping)} player mappings")
         
         # Load team mappings
-        self.cursor.execute("""
-            SELECT DISTINCT team_id, team_name_season_1 
-            FROM team_season
-        """)
-        self.team_mapping = {row[0]: row[1] for row in self.cursor.fetchall()}
+        self.team_mapping = team_names(self.conn)
         logger.info(f"Loaded {len(self.team_mapping)} team mappings")
         
     def get_matches_without_shots(self) -> List[Tuple[str, datetime]]:
@@ -104,30 +103,13 @@ class ShotDataExtractor:
         shots = []
         
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-                
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # Find the main shots table
-            shots_table = soup.find('table', {'id': 'shots_all'})
+            # Read the main shots table into typed columns (fbref_shot_engine)
+            shots_table = read_shots_file(filepath)
             if not shots_table:
                 logger.debug(f"No shots_all table found in {filepath}")
                 return shots
                 
-            # Parse table with pandas
-            df = pd.read_html(StringIO(str(shots_table)))[0]
-            
-            # Process each shot row
-            for idx, row in df.iterrows():
-                try:
-                    shot = self.parse_shot_row(row, match_id, idx)
-                    if shot:
-                        shots.append(shot)
-                except Exception as e:
-                    logger.warning(f"Error parsing shot row {idx}: {e}")
-                    continue
-                    
+            shots = shots_table.records(match_id, 'legacy', player_uuid=self.player_uuid)
             logger.info(f"Extracted {len(shots)} shots from {filepath}")
             
         except Exception as e:
@@ -135,86 +117,18 @@ class ShotDataExtractor:
             
         return shots
         
-    def parse_shot_row(self, row: pd.Series, match_id: str, shot_index: int) -> Optional[Dict]:
-        """Parse a single shot row from the dataframe."""
-        try:
-            # Generate unique shot ID based on match and index
-            shot_id = f"{match_id}_{shot_index:03d}"
-            
-            shot = {
-                'shot_id': shot_id,
-                'match_id': match_id,
-                'minute': self.parse_minute(row.get('Minute', '')),
-                'player_name': row.get('Player', ''),
-                'player_id': None,  # Will be extracted from HTML
-                'squad': row.get('Squad', ''),
-                'xg': self.safe_float(row.get('xG', None)),
-                'psxg': self.safe_float(row.get('PSxG', None)),
-                'outcome_id': row.get('Outcome', ''),
-                'distance': self.safe_float(row.get('Distance', None)),
-                'body_part': row.get('Body Part', ''),
-                'notes': row.get('Notes', ''),
-                'sca1_player_name': None,  # These are in nested columns
-                'sca1_event': None,
-                'sca2_player_name': None,
-                'sca2_event': None,
-                'player_uuid': None  # Will be mapped if player_id found
-            }
-            
-            # Only return if we have essential data
-            if shot['minute'] is not None and shot['player_name']:
-                return shot
-                
-        except Exception as e:
-            logger.debug(f"Error parsing shot row: {e}")
-            
-        return None
-        
-    def parse_minute(self, minute_str: str) -> Optional[int]:
-        """Parse minute string to integer."""
-        if not minute_str:
-            return None
-        try:
-            # Handle formats like "45+2"
-            if '+' in str(minute_str):
-                parts = str(minute_str).split('+')
-                return int(parts[0]) + int(parts[1])
-            return int(minute_str)
-        except:
-            return None
-            
-    def safe_float(self, value) -> Optional[float]:
-        """Safely convert value to float."""
-        if pd.isna(value) or value == '':
-            return None
-        try:
-            return float(value)
-        except:
-            return None
+    def player_uuid(self, player_id: str) -> Optional[str]:
+        """Player UUID for an FBref player ID, or None when unmapped."""
+        player_info = self.player_mapping.get(player_id)
+        return player_info['uuid'] if player_info else None
             
     def insert_shots_to_db(self, shots: List[Dict]):
         """Insert shot data into database."""
         if not shots:
             return
             
-        # Prepare insert query matching actual table schema
-        insert_query = """
-            INSERT INTO match_shot (
-                shot_id, match_id, minute, player_name, player_id, squad,
-                xg, psxg, outcome_id, distance, body_part, notes,
-                sca1_player_name, sca1_event, sca2_player_name, sca2_event,
-                player_uuid
-            ) VALUES (
-                %(shot_id)s, %(match_id)s, %(minute)s, %(player_name)s, %(player_id)s, %(squad)s,
-                %(xg)s, %(psxg)s, %(outcome_id)s, %(distance)s, %(body_part)s, %(notes)s,
-                %(sca1_player_name)s, %(sca1_event)s, %(sca2_player_name)s, %(sca2_event)s,
-                %(player_uuid)s
-            )
-            ON CONFLICT (shot_id) DO NOTHING
-        """
-        
         try:
-            execute_batch(self.cursor, insert_query, shots)
+            INSERT_SHOT.execute_many(self.cursor, shots)
             self.conn.commit()
             logger.info(f"Inserted {len(shots)} shots to database")
         except Exception as e:
@@ -243,10 +157,13 @@ class ShotDataExtractor:
                 continue
                 
             # Extract shot data
-            shots = self.extract_shot_data_from_html(filepath, match_id)
+            with get_metrics().stage('shots_all'):
+                shots = self.extract_shot_data_from_html(filepath, match_id)
+                if shots:
+                    self.insert_shots_to_db(shots)
+            get_metrics().add('rows_written', len(shots), 'shots_all')
             
             if shots:
-                self.insert_shots_to_db(shots)
                 total_shots_extracted += len(shots)
                 matches_with_shots += 1
                 logger.info(f"Processed {match_id} ({match_date}): {len(shots)} shots")
@@ -309,6 +226,7 @@ def main():
     logger.info("Starting FBref Shot Data Extraction")
     logger.info("=" * 60)
     
+    metrics = start_run('shots')
     extractor = ShotDataExtractor(DB_CONFIG, HTML_DIR)
     
     try:
@@ -331,9 +249,10 @@ def main():
         
     finally:
         extractor.close_db()
+        metrics.write()
         
     logger.info("Extraction complete!")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_profiled(main, 'shots')
\ No newline at end of file
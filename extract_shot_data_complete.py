@@ -3,22 +3,33 @@
 FBref HTML Shot Data Extractor for NWSL Database - COMPLETE VERSION
 Extracts ALL shot-by-shot data from FBref HTML match files and populates the match_shot table.
 Fixes issue where shots were being missed due to incomplete HTML parsing.
+
+Shots are replaced a batch of matches at a time: one DELETE for all of the
+batch's matches and one COPY of their new rows, committed together, so a
+match never shows a partial or empty set of shots. A page without shots
+clears its match's shots; a page that fails to parse leaves them alone.
 """
 
 import os
 import sys
 import json
 import uuid
-import psycopg2
-from psycopg2.extras import execute_batch
 from datetime import datetime
-from bs4 import BeautifulSoup
 import pandas as pd
 from io import StringIO
-import re
 from typing import Dict, List, Optional, Tuple
 import logging
 
+from db_session import DB_CONFIG, connect
+from fbref_parallel import run_parallel
+from match_file_locator import find_match_file
+from bulk_loader import BulkLoader
+from mapping_snapshot import player_mapping, team_names
+from etl_metrics import get_metrics, start_run
+from etl_profile import run_profiled
+from fbref_tables import parse_html_file
+from fbref_shot_engine import read_shots
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -26,21 +37,15 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
-
 # HTML files directory - check both locations
 HTML_DIRS = [
     '/Users/thomasmcmillan/projects/nwsl_db_migration/html_files',
     '/Users/thomasmcmillan/projects/nwsl_data_backup_data/notebooks/match_html_files'
 ]
 
+# Matches whose shots are replaced per transaction; override with FBREF_SHOT_BATCH_MATCHES
+REPLACE_BATCH_MATCHES = int(os.environ.get('FBREF_SHOT_BATCH_MATCHES', '250'))
+
 
 class CompleteShotDataExtractor:
     """Extracts ALL shot data from FBref HTML files with complete coverage."""
@@ -53,10 +58,10 @@ class CompleteShotDataExtractor:
         self.player_mapping = {}
         self.team_mapping = {}
         
-    def connect_db(self):
-        """Establish database connection."""
+    def connect_db(self, conn=None):
+        """Establish database connection (or adopt a shared one)."""
         try:
-            self.conn = psycopg2.connect(**self.db_config)
+            self.conn = conn or connect(**self.db_config)
             self.cursor = self.conn.cursor()
             logger.info("Database connection established")
         except Exception as e:
@@ -73,70 +78,41 @@ class CompleteShotDataExtractor:
         
     def load_mappings(self):
         """Load player and team mappings from database."""
-        # Load player mappings (player_id is the FBref hex ID, id is the UUID)
-        self.cursor.execute("""
-            SELECT player_id, id, player_name 
-            FROM player
-            WHERE player_id IS NOT NULL
-        """)
-        for row in self.cursor.fetchall():
-            self.player_mapping[row[0]] = {'uuid': row[1], 'name': row[2]}
+        # Player mappings (FBref hex ID -> UUID and name); snapshotted locally
+        self.player_mapping = player_mapping(self.conn)
         logger.info(f"Loaded {len(self.player_mapping)} player mappings")
         
         # Load team mappings
-        self.cursor.execute("""
-            SELECT DISTINCT team_id, team_name_season_1 
-            FROM team_season
-            WHERE team_id IS NOT NULL
-        """)
-        self.team_mapping = {row[0]: row[1] for row in self.cursor.fetchall()}
+        self.team_mapping = team_names(self.conn)
         logger.info(f"Loaded {len(self.team_mapping)} team mappings")
         
     def find_html_file(self, match_id: str) -> Optional[str]:
-        """Find HTML file for a match ID across multiple directories."""
-        html_file = f"match_{match_id}.html"
-        for html_dir in self.html_dirs:
-            filepath = os.path.join(html_dir, html_file)
-            if os.path.exists(filepath):
-                return filepath
-        return None
-        
-    def extract_shot_data_from_html(self, filepath: str, match_id: str) -> List[Dict]:
-        """Extract ALL shot data from HTML file using BeautifulSoup directly."""
+        """Find HTML file for a match ID across multiple directories (first directory wins)."""
+        return find_match_file(match_id, self.html_dirs)
+        
+    def extract_shot_data_from_html(self, filepath: str, match_id: str, root=None) -> List[Dict]:
+        """
+        Extract ALL shot data from an HTML file (or an already parsed lxml page).
+        
+        Returns [] when the page has no shots_all table or no shot rows; a page
+        that fails to parse raises, so its existing shots are not replaced.
+        """
         shots = []
         
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                html_content = f.read()
-                
-            soup = BeautifulSoup(html_content, 'html.parser')
+            if root is None:
+                root = parse_html_file(filepath)
             
-            # Find the shots_all table
-            shots_table = soup.find('table', {'id': 'shots_all'})
+            # Read the shots_all table into typed columns (fbref_shot_engine)
+            shots_table = read_shots(root)
             if not shots_table:
                 logger.debug(f"No shots_all table found in {filepath}")
                 return shots
             
-            # Find all data rows (tr elements with class containing 'shots_')
-            shot_rows = shots_table.find_all('tr', class_=re.compile(r'shots_[a-z0-9]+'))
+            logger.info(f"Found {len(shots_table)} shot rows in HTML for match {match_id}")
             
-            logger.info(f"Found {len(shot_rows)} shot rows in HTML for match {match_id}")
+            shots = shots_table.records(match_id, 'match_shot', player_uuid=self.player_uuid)
             
-            shot_index = 0
-            for row in shot_rows:
-                # Skip header rows
-                if 'thead' in row.get('class', []) or 'over_header' in row.get('class', []):
-                    continue
-                    
-                try:
-                    shot = self.parse_shot_row_from_html(row, match_id, shot_index)
-                    if shot:
-                        shots.append(shot)
-                        shot_index += 1
-                except Exception as e:
-                    logger.warning(f"Error parsing shot row {shot_index}: {e}")
-                    continue
-                    
             logger.info(f"Successfully extracted {len(shots)} shots from {filepath}")
             
             # Verify we got critical shots (for debugging)
@@ -147,140 +123,14 @@ class CompleteShotDataExtractor:
             
         except Exception as e:
             logger.error(f"Error extracting shots from {filepath}: {e}")
+            raise
             
         return shots
         
-    def parse_shot_row_from_html(self, row, match_id: str, shot_index: int) -> Optional[Dict]:
-        """Parse a single shot row from the HTML directly."""
-        try:
-            # Extract data from td/th elements
-            cells = row.find_all(['td', 'th'])
-            if len(cells) < 13:  # Need at least 13 columns for basic shot data
-                return None
-            
-            # Extract minute
-            minute_text = cells[0].get_text(strip=True)
-            minute = self.parse_minute(minute_text)
-            
-            # Extract player info - get both name and ID
-            player_cell = cells[1]
-            player_name = player_cell.get_text(strip=True)
-            player_id = player_cell.get('data-append-csv', '')
-            
-            # If no ID in cell, check for link
-            if not player_id:
-                player_link = player_cell.find('a')
-                if player_link and player_link.get('href'):
-                    # Extract player ID from href like /en/players/fe95f6e7/Christen-Press
-                    href_parts = player_link['href'].split('/')
-                    if len(href_parts) >= 4 and href_parts[2] == 'players':
-                        player_id = href_parts[3]
-            
-            # Extract team/squad
-            squad_cell = cells[2]
-            squad = squad_cell.get_text(strip=True)
-            
-            # Extract xG and PSxG
-            xg = self.safe_float(cells[3].get_text(strip=True))
-            psxg = self.safe_float(cells[4].get_text(strip=True))
-            
-            # Extract outcome
-            outcome = cells[5].get_text(strip=True)
-            
-            # Extract distance
-            distance = self.safe_float(cells[6].get_text(strip=True))
-            
-            # Extract body part
-            body_part = cells[7].get_text(strip=True)
-            
-            # Extract notes
-            notes = cells[8].get_text(strip=True) if cells[8].get_text(strip=True) else None
-            
-            # Extract SCA players and events if available
-            sca1_player_name = None
-            sca1_event = None
-            sca2_player_name = None
-            sca2_event = None
-            
-            if len(cells) > 9:
-                sca1_player_cell = cells[9]
-                sca1_player_name = sca1_player_cell.get_text(strip=True) or None
-                
-            if len(cells) > 10:
-                sca1_event = cells[10].get_text(strip=True) or None
-                
-            if len(cells) > 11:
-                sca2_player_cell = cells[11]
-                sca2_player_name = sca2_player_cell.get_text(strip=True) or None
-                
-            if len(cells) > 12:
-                sca2_event = cells[12].get_text(strip=True) or None
-            
-            # Map player UUID if we have the ID
-            player_uuid = None
-            if player_id and player_id in self.player_mapping:
-                player_uuid = self.player_mapping[player_id]['uuid']
-            
-            shot = {
-                'match_id': match_id,
-                'minute': minute,
-                'player_name': player_name,
-                'player_id': player_id if player_id else None,
-                'team_name': squad,  # Changed from 'squad' to 'team_name' to match schema
-                'xg': xg,
-                'psxg': psxg,
-                'outcome': outcome,  # Changed from 'outcome_id' to 'outcome' to match schema
-                'distance': int(distance) if distance else None,  # Convert to int for schema
-                'body_part': body_part,
-                'notes': notes,
-                'sca1_player_name': sca1_player_name,
-                'sca1_event': sca1_event,
-                'sca2_player_name': sca2_player_name,
-                'sca2_event': sca2_event,
-                'player_uuid': player_uuid
-            }
-            
-            # Only return if we have essential data
-            if shot['minute'] is not None and shot['player_name']:
-                return shot
-                
-        except Exception as e:
-            logger.debug(f"Error parsing shot row: {e}")
-            
-        return None
-        
-    def parse_minute(self, minute_str: str) -> Optional[int]:
-        """Parse minute string to integer, handling stoppage time."""
-        if not minute_str:
-            return None
-        try:
-            # Remove any non-numeric characters except + 
-            minute_str = str(minute_str).strip()
-            
-            # Handle formats like "90+7"
-            if '+' in minute_str:
-                parts = minute_str.split('+')
-                base = int(parts[0])
-                added = int(parts[1]) if len(parts) > 1 else 0
-                # Store as base + added (e.g., 90+7 = 97)
-                return base + added
-            
-            # Regular minute
-            return int(minute_str)
-        except Exception as e:
-            logger.debug(f"Could not parse minute '{minute_str}': {e}")
-            return None
-            
-    def safe_float(self, value) -> Optional[float]:
-        """Safely convert value to float."""
-        if not value or value == '' or value == '—':
-            return None
-        try:
-            # Remove any non-numeric characters except . and -
-            value = str(value).strip()
-            return float(value)
-        except:
-            return None
+    def player_uuid(self, player_id: str) -> Optional[str]:
+        """Player UUID for an FBref player ID, or None when unmapped."""
+        player_info = self.player_mapping.get(player_id)
+        return player_info['uuid'] if player_info else None
             
     def clear_existing_shots(self, match_id: str = None):
         """Clear existing shot data for a match or all matches."""
@@ -297,33 +147,22 @@ class CompleteShotDataExtractor:
             logger.error(f"Error clearing shots: {e}")
             raise
             
-    def insert_shots_to_db(self, shots: List[Dict]):
-        """Insert shot data into database."""
-        if not shots:
-            return
-            
-        # Prepare insert query - let database generate UUID primary key
-        insert_query = """
-            INSERT INTO match_shot (
-                match_id, minute, player_name, player_id, team_name,
-                xg, psxg, outcome, distance, body_part, notes,
-                sca1_player_name, sca1_event, sca2_player_name, sca2_event,
-                player_uuid
-            ) VALUES (
-                %(match_id)s, %(minute)s, %(player_name)s, %(player_id)s, %(team_name)s,
-                %(xg)s, %(psxg)s, %(outcome)s, %(distance)s, %(body_part)s, %(notes)s,
-                %(sca1_player_name)s, %(sca1_event)s, %(sca2_player_name)s, %(sca2_event)s,
-                %(player_uuid)s
-            )
-        """
+    def replace_shots(self, shots_by_match: Dict[str, List[Dict]]) -> int:
+        """Replace the shots of a batch of matches in one transaction (one DELETE, one COPY)."""
+        if not shots_by_match:
+            return 0
+        shots = [shot for match_shots in shots_by_match.values() for shot in match_shots]
         
         try:
-            execute_batch(self.cursor, insert_query, shots)
+            # Single COPY - let database generate UUID primary key
+            counts = BulkLoader(self.conn).replace('match_shot', shots, shots_by_match.keys())
             self.conn.commit()
-            logger.info(f"Inserted/updated {len(shots)} shots in database")
+            logger.info(f"Replaced shots for {len(shots_by_match)} matches: "
+                        f"{counts['deleted']} deleted, {counts['inserted']} inserted")
+            return counts['inserted']
         except Exception as e:
             self.conn.rollback()
-            logger.error(f"Error inserting shots: {e}")
+            logger.error(f"Error replacing shots: {e}")
             raise
             
     def test_specific_match(self, match_id: str):
@@ -336,16 +175,16 @@ class CompleteShotDataExtractor:
             logger.error(f"HTML file not found for match {match_id}")
             return
             
-        # Clear existing shots for this match
-        self.clear_existing_shots(match_id)
+        # Extract shots; on a parse error the stored shots are kept
+        try:
+            shots = self.extract_shot_data_from_html(filepath, match_id)
+        except Exception:
+            return
         
-        # Extract shots
-        shots = self.extract_shot_data_from_html(filepath, match_id)
+        # Replace this match's shots (cleared even when the file has none)
+        self.replace_shots({match_id: shots})
         
         if shots:
-            # Insert to database
-            self.insert_shots_to_db(shots)
-            
             # Verify in database
             self.cursor.execute("""
                 SELECT COUNT(*) as total_shots,
@@ -392,7 +231,17 @@ class CompleteShotDataExtractor:
         matches_with_shots = 0
         matches_without_html = 0
         matches_without_shots = 0
+        matches_failed = 0
         
+        metrics = get_metrics()
+        pending: Dict[str, List[Dict]] = {}
+        
+        def write_pending():
+            with metrics.stage('shots_all', files=0):
+                written = self.replace_shots(pending)
+            metrics.add('rows_written', written, 'shots_all')
+            pending.clear()
+            
         for match_id, match_date in matches:
             # Find HTML file
             filepath = self.find_html_file(match_id)
@@ -402,20 +251,29 @@ class CompleteShotDataExtractor:
                 logger.debug(f"No HTML file for {match_id} ({match_date})")
                 continue
                 
-            # Clear existing shots for this match
-            self.clear_existing_shots(match_id)
-            
-            # Extract shot data
-            shots = self.extract_shot_data_from_html(filepath, match_id)
+            try:
+                with metrics.stage('shots_all'):
+                    # Extract shot data
+                    shots = self.extract_shot_data_from_html(filepath, match_id)
+            except Exception:
+                # Keep the match's stored shots rather than clearing them
+                matches_failed += 1
+                continue
+                
+            # Existing shots are replaced even when the file has none
+            pending[match_id] = shots
+            if len(pending) >= REPLACE_BATCH_MATCHES:
+                write_pending()
             
             if shots:
-                self.insert_shots_to_db(shots)
                 total_shots_extracted += len(shots)
                 matches_with_shots += 1
                 logger.info(f"Processed {match_id} ({match_date}): {len(shots)} shots")
             else:
                 matches_without_shots += 1
                 logger.debug(f"No shots found for {match_id} ({match_date})")
+        if pending:
+            write_pending()
                 
         # Final report
         logger.info("=" * 60)
@@ -424,9 +282,37 @@ class CompleteShotDataExtractor:
         logger.info(f"Matches with shot data: {matches_with_shots}")
         logger.info(f"Matches without HTML files: {matches_without_html}")
         logger.info(f"Matches without shot data: {matches_without_shots}")
+        logger.info(f"Matches that failed to parse (shots kept): {matches_failed}")
         logger.info(f"Total shots extracted: {total_shots_extracted}")
         logger.info("=" * 60)
         
+    def process_all_matches_parallel(self, workers: int):
+        """Process all matches with parse workers feeding a single batched writer."""
+        self.cursor.execute("""
+            SELECT match_id
+            FROM match
+            ORDER BY match_date
+        """)
+        match_ids = [row[0] for row in self.cursor.fetchall()]
+        logger.info(f"Found {len(match_ids)} total matches to process")
+        
+        files = []
+        for match_id in match_ids:
+            filepath = self.find_html_file(match_id)
+            if filepath:
+                files.append(filepath)
+                
+        stats = run_parallel(files, parse_shots_file, ShotsWriter, workers=workers, stage='shots_all')
+        
+        # Final report
+        logger.info("=" * 60)
+        logger.info("EXTRACTION COMPLETE")
+        logger.info(f"Matches processed: {len(match_ids)}")
+        logger.info(f"Matches without HTML files: {len(match_ids) - len(files)}")
+        logger.info(f"Files that failed to parse: {stats.get('files_failed', 0)}")
+        logger.info(f"Total shots extracted: {stats.get('records_written', 0)}")
+        logger.info("=" * 60)
+        
     def verify_coverage(self):
         """Verify shot data coverage after extraction."""
         self.cursor.execute("""
@@ -476,6 +362,41 @@ class CompleteShotDataExtractor:
                        f"{total_shots} shots ({avg_shots:.1f} avg), {goals} goals")
 
 
+def parse_shots_file(filepath: str) -> List[Dict]:
+    """
+    DB-free parse for fbref_parallel workers; player_uuid is filled in by the writer.
+    A parse error raises, so the file is reported failed and its shots are not replaced.
+    """
+    match_id = os.path.basename(filepath).replace('match_', '').replace('.html', '')
+    extractor = CompleteShotDataExtractor(DB_CONFIG, HTML_DIRS)
+    return extractor.extract_shot_data_from_html(filepath, match_id)
+
+
+class ShotsWriter:
+    """Single-connection writer for fbref_parallel: replaces each match's shots."""
+    
+    def __init__(self):
+        self.extractor = CompleteShotDataExtractor(DB_CONFIG, HTML_DIRS)
+        self.extractor.connect_db()
+        self.extractor.load_mappings()
+        
+    def write(self, units) -> int:
+        """Replace shots for a batch of (filepath, shots) units in one transaction; returns shots written."""
+        shots_by_match = {}
+        for filepath, shots in units:
+            match_id = os.path.basename(filepath).replace('match_', '').replace('.html', '')
+            for shot in shots:
+                shot['player_uuid'] = self.extractor.player_uuid(shot['player_id']) if shot['player_id'] else None
+            # Cleared even when the file has no shots, as the sequential path does
+            shots_by_match[match_id] = shots
+        return self.extractor.replace_shots(shots_by_match)
+        
+    def rollback(self):
+        self.extractor.conn.rollback()
+        
+    def close(self):
+        self.extractor.close_db()
+
 def main():
     """Main execution function."""
     import argparse
@@ -484,11 +405,14 @@ def main():
     parser.add_argument('--test-match', type=str, help='Test extraction for a specific match ID')
     parser.add_argument('--clear-all', action='store_true', help='Clear all existing shot data before extraction')
     parser.add_argument('--process-all', action='store_true', help='Process all matches')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Parse worker processes for --process-all (>1 runs parse workers plus a single DB writer)')
     args = parser.parse_args()
     
     logger.info("Starting Complete FBref Shot Data Extraction")
     logger.info("=" * 60)
     
+    metrics = start_run('shots_all')
     extractor = CompleteShotDataExtractor(DB_CONFIG, HTML_DIRS)
     
     try:
@@ -508,7 +432,10 @@ def main():
             
             # Process all matches
             logger.info("Processing all matches...")
-            extractor.process_all_matches()
+            if args.workers > 1:
+                extractor.process_all_matches_parallel(args.workers)
+            else:
+                extractor.process_all_matches()
         else:
             # Default: test with the problematic match
             logger.info("Testing with match_07c68416 (known to have missing shots)...")
@@ -523,9 +450,10 @@ def main():
         
     finally:
         extractor.close_db()
+        metrics.write()
         
     logger.info("Extraction complete!")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    run_profiled(main, 'shots_all')
\ No newline at end of file
@@ -4,19 +4,23 @@ Extract team-level performance statistics from FBref HTML files
 to fill gaps in match_team_performance table.
 """
 
-import os
 import re
 import json
 import uuid
-import psycopg2
 from psycopg2.extras import RealDictCursor
-from bs4 import BeautifulSoup
 import pandas as pd
 from datetime import datetime
 from typing import Dict, List, Optional, Tuple, Any
 import traceback
 import logging
 
+from db_session import connect
+from fbref_tables import iter_tables, parse_html_file, read_stat_table, read_text_grid
+from etl_metrics import get_metrics, start_run
+from etl_profile import run_profiled
+from mapping_snapshot import cached_mapping
+from match_file_locator import find_match_file
+
 # Set up logging
 logging.basicConfig(
     level=logging.INFO,
@@ -24,18 +28,48 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
-
 # HTML files directory
 HTML_DIR = '/Users/thomasmcmillan/projects/nwsl_data_backup_data/notebooks/match_html_files'
 
+# Player summary data-stats summed into team totals when no team_stats table exists
+SUMMARY_TOTAL_FIELDS = {
+    'goals': 'goals',
+    'assists': 'assists',
+    'shots': 'shots',
+    'tackles': 'tackles',
+    'interceptions': 'interceptions',
+    'touches': 'touches'
+}
+
+def load_team_season_lookup(conn) -> Dict[str, str]:
+    """'{team_id}_{season_id}' and '{lowercase team name}_{season_id}' -> team_season UUID."""
+    query = """
+    SELECT ts.id, ts.team_id, ts.season_id, ts.team_name_season_1, ts.team_name_season_2
+    FROM team_season ts
+    """
+    
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        cur.execute(query)
+        results = cur.fetchall()
+    
+    team_season_map = {}
+    for row in results:
+        # Create multiple lookup keys for flexibility
+        season_id = row['season_id']
+        team_id = row['team_id']
+        
+        # Store by fbref team ID and season
+        key = f"{team_id}_{season_id}"
+        team_season_map[key] = row['id']
+        
+        # Also store by team names for backup matching
+        for name_field in ['team_name_season_1', 'team_name_season_2']:
+            if row[name_field]:
+                name_key = f"{row[name_field].lower()}_{season_id}"
+                team_season_map[name_key] = row['id']
+    return team_season_map
+
+
 class TeamPerformanceExtractor:
     """Extract team performance statistics from FBref HTML files."""
     
@@ -52,10 +86,10 @@ class TeamPerformanceExtractor:
             'records_inserted': 0
         }
         
-    def connect_db(self):
-        """Connect to the database."""
+    def connect_db(self, conn=None):
+        """Connect to the database (or adopt a shared connection)."""
         try:
-            self.conn = psycopg2.connect(**DB_CONFIG)
+            self.conn = conn or connect()
             logger.info("Connected to database successfully")
         except Exception as e:
             logger.error(f"Database connection failed: {e}")
@@ -102,88 +136,35 @@ class TeamPerformanceExtractor:
             logger.info(f"Matches by season: {season_counts}")
             
     def load_team_season_mappings(self):
-        """Load team_season mappings for UUID lookups."""
-        query = """
-        SELECT ts.id, ts.team_id, ts.season_id, ts.team_name_season_1, ts.team_name_season_2
-        FROM team_season ts
-        """
-        
-        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(query)
-            results = cur.fetchall()
-            
-        for row in results:
-            # Create multiple lookup keys for flexibility
-            season_id = row['season_id']
-            team_id = row['team_id']
-            
-            # Store by fbref team ID and season
-            key = f"{team_id}_{season_id}"
-            self.team_season_map[key] = row['id']
-            
-            # Also store by team names for backup matching
-            for name_field in ['team_name_season_1', 'team_name_season_2']:
-                if row[name_field]:
-                    name_key = f"{row[name_field].lower()}_{season_id}"
-                    self.team_season_map[name_key] = row['id']
-                    
+        """Load team_season mappings for UUID lookups (snapshotted locally)."""
+        self.team_season_map = cached_mapping(self.conn, 'team_season_lookup', ['team_season'],
+                                              load_team_season_lookup)
         logger.info(f"Loaded {len(self.team_season_map)} team_season mappings")
         
     def find_html_file(self, match_id: str, match_date) -> Optional[str]:
-        """Find HTML file for a given match."""
-        # Try multiple filename patterns
-        patterns = [
-            f"{match_id}.html",
-            f"match_{match_id}.html",
-            match_id.replace('-', '_') + ".html"
-        ]
+        """Find HTML file for a given match.
         
-        for pattern in patterns:
-            filepath = os.path.join(HTML_DIR, pattern)
-            if os.path.exists(filepath):
-                return filepath
-                
-        # If not found by ID, try date-based search
-        if match_date:
-            date_str = match_date.strftime('%Y-%m-%d')
-            for filename in os.listdir(HTML_DIR):
-                if date_str in filename and filename.endswith('.html'):
-                    filepath = os.path.join(HTML_DIR, filename)
-                    # Verify it's the right match by checking content
-                    if self.verify_match_file(filepath, match_id):
-                        return filepath
-                        
-        return None
+        The match file locator indexes every corpus root once (match IDs are read
+        from file names or, failing that, the page's canonical link), replacing
+        the per-match directory listing and content checks.
+        """
+        return find_match_file(match_id)
         
-    def verify_match_file(self, filepath: str, match_id: str) -> bool:
-        """Verify that HTML file corresponds to the expected match."""
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                content = f.read()
-                # Check if match ID appears in the file
-                return match_id in content
-        except:
-            return False
-            
-    def extract_team_stats_from_html(self, filepath: str, match_data: dict) -> List[Dict]:
-        """Extract team statistics from HTML file."""
+    def extract_team_stats_from_html(self, filepath: str, match_data: dict, root=None) -> List[Dict]:
+        """Extract team statistics from HTML file (or its already-parsed tree)."""
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                soup = BeautifulSoup(f.read(), 'html.parser')
+            if root is None:
+                root = parse_html_file(filepath)
                 
             team_stats = []
             
             # Find team stats tables
             # Common patterns: team_stats, team_stats_extra, stats_{team_id}_summary
-            tables = soup.find_all('table')
-            
             # Look for main team stats table
             team_stats_table = None
-            for table in tables:
-                table_id = table.get('id', '')
-                if 'team_stats' in table_id:
-                    team_stats_table = table
-                    break
+            for _, table in iter_tables(root, 'team_stats'):
+                team_stats_table = table
+                break
                     
             if team_stats_table:
                 # Extract from team_stats table
@@ -192,8 +173,8 @@ class TeamPerformanceExtractor:
                     team_stats.extend(stats)
             else:
                 # Try to extract from individual team summary tables
-                home_stats = self.extract_team_summary_stats(soup, match_data, is_home=True)
-                away_stats = self.extract_team_summary_stats(soup, match_data, is_home=False)
+                home_stats = self.extract_team_summary_stats(root, match_data, is_home=True)
+                away_stats = self.extract_team_summary_stats(root, match_data, is_home=False)
                 
                 if home_stats:
                     team_stats.append(home_stats)
@@ -202,7 +183,7 @@ class TeamPerformanceExtractor:
                     
             # If still no stats, try extracting from matchlog tables
             if not team_stats:
-                team_stats = self.extract_from_matchlogs(soup, match_data)
+                team_stats = self.extract_from_matchlogs(root, match_data)
                 
             return team_stats
             
@@ -214,16 +195,13 @@ class TeamPerformanceExtractor:
     def parse_team_stats_table(self, table, match_data: dict) -> List[Dict]:
         """Parse the main team_stats table."""
         try:
-            df = pd.read_html(str(table))[0]
-            
-            # Handle multi-level columns
-            if isinstance(df.columns, pd.MultiIndex):
-                df.columns = ['_'.join(col).strip() for col in df.columns.values]
+            # Header labels are flattened the same way multi-level columns were
+            columns, rows = read_text_grid(table)
                 
             stats = []
             
             # Usually has two rows - one for each team
-            for idx, row in df.iterrows():
+            for idx, row in enumerate(rows):
                 if idx >= 2:  # Only process first two rows
                     break
                     
@@ -282,12 +260,12 @@ class TeamPerformanceExtractor:
                     'Expected Goals': 'xg'
                 }
                 
-                for col in row.index:
+                for col in columns:
                     col_str = str(col)
                     for pattern, field in column_mappings.items():
                         if pattern.lower() in col_str.lower():
-                            value = row[col]
-                            if pd.notna(value):
+                            value = row.get(col)
+                            if value not in (None, ''):
                                 stat_dict[field] = self.parse_stat_value(value, field)
                             break
                             
@@ -323,7 +301,7 @@ class TeamPerformanceExtractor:
             logger.error(f"Error parsing team stats table: {e}")
             return []
             
-    def extract_team_summary_stats(self, soup, match_data: dict, is_home: bool) -> Optional[Dict]:
+    def extract_team_summary_stats(self, root, match_data: dict, is_home: bool) -> Optional[Dict]:
         """Extract stats from individual team summary tables."""
         try:
             # Look for stats_{team_id}_summary tables
@@ -332,120 +310,100 @@ class TeamPerformanceExtractor:
             opponent_id = match_data['away_team_season_id'] if is_home else match_data['home_team_season_id']
             
             # Find team-specific tables
-            for table in soup.find_all('table'):
-                table_id = table.get('id', '')
+            for team_match, table in iter_tables(root, r'stats_(.+)_summary'):
+                # Extract team hex ID from table ID
+                team_hex = team_match.group(1)
                 
-                # Check if this is a team summary table
-                if 'stats_' in table_id and '_summary' in table_id:
-                    # Extract team hex ID from table ID
-                    team_hex = table_id.replace('stats_', '').replace('_summary', '')
-                    
-                    # Try to match this with our team
-                    # This is simplified - you may need more sophisticated matching
-                    df = pd.read_html(str(table))[0]
+                # Try to match this with our team
+                # This is simplified - you may need more sophisticated matching
+                summary = read_stat_table(table)
+                
+                if not summary:
+                    continue
                     
-                    if df.empty:
-                        continue
+                # Aggregate stats from player rows
+                stat_dict = {
+                    'match_id': match_data['match_id'],
+                    'team_season_id': team_season_id,
+                    'opponent_team_season_id': opponent_id,
+                    'is_home': is_home,
+                    'match_date': match_data['match_date'],
+                    'season_id': match_data['season_id'],
+                    'match_type_name': match_data['match_type_name'],
+                    'match_subtype_name': match_data['match_subtype_name'],
+                    'fbref_match_team_id': f"{match_data['match_id']}_{team_season_id}"
+                }
+                
+                # Aggregate team totals from player stats
+                for data_stat, field in SUMMARY_TOTAL_FIELDS.items():
+                    values = [v for v in summary.column(data_stat) if isinstance(v, (int, float))]
+                    if values:
+                        stat_dict[field] = int(sum(values))
                         
-                    # Aggregate stats from player rows
-                    stat_dict = {
-                        'match_id': match_data['match_id'],
-                        'team_season_id': team_season_id,
-                        'opponent_team_season_id': opponent_id,
-                        'is_home': is_home,
-                        'match_date': match_data['match_date'],
-                        'season_id': match_data['season_id'],
-                        'match_type_name': match_data['match_type_name'],
-                        'match_subtype_name': match_data['match_subtype_name'],
-                        'fbref_match_team_id': f"{match_data['match_id']}_{team_season_id}"
-                    }
+                if len(stat_dict) > 10:  # If we found meaningful stats
+                    return stat_dict
                     
-                    # Aggregate team totals from player stats
-                    numeric_cols = df.select_dtypes(include=['number']).columns
-                    for col in numeric_cols:
-                        col_lower = str(col).lower()
-                        if 'gls' in col_lower or 'goals' in col_lower:
-                            stat_dict['goals'] = int(df[col].sum())
-                        elif 'ast' in col_lower or 'assists' in col_lower:
-                            stat_dict['assists'] = int(df[col].sum())
-                        elif 'sh' in col_lower and 'shot' in col_lower:
-                            stat_dict['shots'] = int(df[col].sum())
-                        elif 'tkl' in col_lower or 'tackle' in col_lower:
-                            stat_dict['tackles'] = int(df[col].sum())
-                        elif 'int' in col_lower and 'intercept' in col_lower:
-                            stat_dict['interceptions'] = int(df[col].sum())
-                        elif 'touches' in col_lower:
-                            stat_dict['touches'] = int(df[col].sum())
-                            
-                    if len(stat_dict) > 10:  # If we found meaningful stats
-                        return stat_dict
-                        
             return None
             
         except Exception as e:
             logger.error(f"Error extracting team summary stats: {e}")
             return None
             
-    def extract_from_matchlogs(self, soup, match_data: dict) -> List[Dict]:
+    def extract_from_matchlogs(self, root, match_data: dict) -> List[Dict]:
         """Extract basic stats from matchlog tables as fallback."""
         stats = []
         
         try:
             # Look for matchlogs_for tables which often have basic stats
-            for table in soup.find_all('table'):
-                table_id = table.get('id', '')
-                if 'matchlogs' in table_id:
-                    df = pd.read_html(str(table))[0]
+            for _, table in iter_tables(root, 'matchlogs'):
+                matchlog = read_stat_table(table)
+                
+                if not matchlog:
+                    continue
                     
-                    if df.empty:
-                        continue
-                        
-                    # Extract basic info from matchlog
-                    # This is a simplified extraction - enhance as needed
-                    for idx, row in df.iterrows():
-                        if idx >= 2:  # Process first two teams
-                            break
-                            
-                        is_home = idx == 0
-                        team_season_id = match_data['home_team_season_id'] if is_home else match_data['away_team_season_id']
-                        opponent_id = match_data['away_team_season_id'] if is_home else match_data['home_team_season_id']
-                        
-                        stat_dict = {
-                            'match_id': match_data['match_id'],
-                            'team_season_id': team_season_id,
-                            'opponent_team_season_id': opponent_id,
-                            'is_home': is_home,
-                            'match_date': match_data['match_date'],
-                            'season_id': match_data['season_id'],
-                            'match_type_name': match_data['match_type_name'],
-                            'match_subtype_name': match_data['match_subtype_name'],
-                            'fbref_match_team_id': f"{match_data['match_id']}_{team_season_id}"
-                        }
-                        
-                        # Extract available stats
-                        for col in row.index:
-                            col_str = str(col).lower()
-                            value = row[col]
-                            
-                            if pd.notna(value):
-                                if 'gf' in col_str or 'goals for' in col_str:
-                                    stat_dict['goals'] = int(value)
-                                elif 'ga' in col_str or 'goals against' in col_str:
-                                    stat_dict['goals_against'] = int(value)
-                                elif 'result' in col_str:
-                                    if 'W' in str(value):
-                                        stat_dict['result'] = 'W'
-                                    elif 'L' in str(value):
-                                        stat_dict['result'] = 'L'
-                                    elif 'D' in str(value):
-                                        stat_dict['result'] = 'D'
-                                        
-                        if 'goals' in stat_dict:
-                            stats.append(stat_dict)
-                            
-                    if stats:
+                # Extract basic info from matchlog
+                # This is a simplified extraction - enhance as needed
+                for idx, row in enumerate(matchlog.records()):
+                    if idx >= 2:  # Process first two teams
                         break
                         
+                    is_home = idx == 0
+                    team_season_id = match_data['home_team_season_id'] if is_home else match_data['away_team_season_id']
+                    opponent_id = match_data['away_team_season_id'] if is_home else match_data['home_team_season_id']
+                    
+                    stat_dict = {
+                        'match_id': match_data['match_id'],
+                        'team_season_id': team_season_id,
+                        'opponent_team_season_id': opponent_id,
+                        'is_home': is_home,
+                        'match_date': match_data['match_date'],
+                        'season_id': match_data['season_id'],
+                        'match_type_name': match_data['match_type_name'],
+                        'match_subtype_name': match_data['match_subtype_name'],
+                        'fbref_match_team_id': f"{match_data['match_id']}_{team_season_id}"
+                    }
+                    
+                    # Extract available stats
+                    for col, value in row.items():
+                        if value is not None:
+                            if col == 'goals_for':
+                                stat_dict['goals'] = int(value)
+                            elif col == 'goals_against':
+                                stat_dict['goals_against'] = int(value)
+                            elif col == 'result':
+                                if 'W' in str(value):
+                                    stat_dict['result'] = 'W'
+                                elif 'L' in str(value):
+                                    stat_dict['result'] = 'L'
+                                elif 'D' in str(value):
+                                    stat_dict['result'] = 'D'
+                                    
+                    if 'goals' in stat_dict:
+                        stats.append(stat_dict)
+                        
+                if stats:
+                    break
+                    
         except Exception as e:
             logger.error(f"Error extracting from matchlogs: {e}")
             
@@ -590,12 +548,15 @@ class TeamPerformanceExtractor:
             self.extraction_stats['files_found'] += 1
             
             # Extract team stats
-            team_stats = self.extract_team_stats_from_html(html_file, match)
+            inserted = 0
+            with get_metrics().stage('team_stats'):
+                team_stats = self.extract_team_stats_from_html(html_file, match)
+                if team_stats:
+                    # Insert into database
+                    inserted = self.insert_team_performance(team_stats)
+            get_metrics().add('rows_written', inserted, 'team_stats')
             
             if team_stats:
-                # Insert into database
-                inserted = self.insert_team_performance(team_stats)
-                
                 if inserted > 0:
                     self.extraction_stats['successfully_extracted'] += 1
                     self.extraction_stats['records_inserted'] += inserted
@@ -613,6 +574,7 @@ class TeamPerformanceExtractor:
         # Close connection
         if self.conn:
             self.conn.close()
+        get_metrics().write()
             
     def print_final_report(self):
         """Print final extraction report."""
@@ -639,8 +601,13 @@ class TeamPerformanceExtractor:
         else:
             remaining = total_matches - covered_matches
             logger.info(f"Remaining gaps: {remaining} matches")
-            
-            
-if __name__ == "__main__":
+
+
+def main():
+    start_run('team_stats')
     extractor = TeamPerformanceExtractor()
-    extractor.run_extraction()
\ No newline at end of file
+    extractor.run_extraction()
+
+
+if __name__ == "__main__":
+    run_profiled(main, 'team_stats')
\ No newline at end of file
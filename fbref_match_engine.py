@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+"""
+Single-pass extraction engine for FBref match_*.html files.
+
+Every table family (passing, passing_types, possession, misc, defense,
+keeper_stats, shots_all, lineups, team stats) used to be extracted by its own
+script, each of which re-opened and re-parsed the same match pages. This engine
+reads and parses each match file exactly once and hands the shared document to
+a handler per family, so a full rebuild pays the parse cost a single time.
+
+With an etl_state.EtlState, files whose families are all up to date are not
+read at all, and each file only runs the families it still needs.
+
+Handler builders take an optional shared connection (nwsl_etl.py hands them
+pooled ones); without it each handler opens and closes its own. Handlers
+commit every match: possession's match_player rows must be visible to the
+other families' connections, and a match's state row is written as soon as
+its families are done.
+"""
+
+import os
+import re
+import sys
+import json
+import logging
+import time
+import argparse
+import threading
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+from db_session import connect, set_commit_every
+from etl_metrics import get_metrics, start_run
+from etl_profile import run_profiled
+from fbref_tables import parse_html, read_html_file
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# HTML files directory
+HTML_DIR = '/Users/thomasmcmillan/projects/nwsl_db_migration/html_files'
+
+# Table id patterns for every family we extract. The first group (when present)
+# is the FBref team hex ID the table belongs to.
+TABLE_FAMILIES = {
+    'passing': re.compile(r'^stats_([a-f0-9]{8})_passing$'),
+    'passing_types': re.compile(r'^stats_([a-f0-9]{8})_passing_types$'),
+    'possession': re.compile(r'^stats_([a-f0-9]{8})_possession$'),
+    'misc': re.compile(r'^stats_([a-f0-9]{8})_misc$'),
+    'defense': re.compile(r'^stats_([a-f0-9]{8})_defense$'),
+    'keeper_stats': re.compile(r'^keeper_stats_([a-f0-9]{8})$'),
+    'shots_all': re.compile(r'^shots_all$'),
+    'lineups': re.compile(r'^stats_([a-f0-9]{8})_summary$'),
+    'team_stats': re.compile(r'^team_stats'),
+}
+
+ALL_FAMILIES = list(TABLE_FAMILIES.keys())
+
+# Reads and parses of the shared page are recorded under this stage, not the
+# family that happens to touch the page first
+PAGE_STAGE = 'page'
+
+metrics = get_metrics()
+
+
+def extract_match_id(filepath: str) -> Optional[str]:
+    """Extract the FBref match hex ID from a match_*.html path."""
+    match = re.search(r'match_([a-f0-9]{8})\.html', os.path.basename(filepath))
+    return match.group(1) if match else None
+
+
+def list_match_files(html_dir: str) -> List[str]:
+    """Return the sorted match_*.html files in a directory."""
+    return sorted(
+        os.path.join(html_dir, f)
+        for f in os.listdir(html_dir)
+        if f.startswith('match_') and f.endswith('.html')
+    )
+
+
+class MatchPage:
+    """A match page that is read and parsed once, then shared by every family."""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.match_id = extract_match_id(filepath)
+        self._html = None
+        self._root = None
+        self._tables = None
+        # Handlers may share a page across threads; build each view only once
+        self._lock = threading.RLock()
+
+    @property
+    def html(self) -> str:
+        """Raw page content, read on first access."""
+        with self._lock:
+            if self._html is None:
+                with metrics.stage(PAGE_STAGE):
+                    self._html = read_html_file(self.filepath)
+            return self._html
+
+    @property
+    def root(self):
+        """lxml tree for extractors using the fbref_tables reader, built on first access."""
+        with self._lock:
+            if self._root is None:
+                html = self.html
+                with metrics.stage(PAGE_STAGE, files=0):
+                    self._root = parse_html(html)
+            return self._root
+
+    def _index_tables(self):
+        """Bucket every <table id=...> in the page by family in one walk."""
+        root = self.root
+        with metrics.stage(PAGE_STAGE, files=0), metrics.phase('extract'):
+            self._tables = self._bucket_tables(root)
+
+    @staticmethod
+    def _bucket_tables(root) -> Dict[str, List[Tuple[Optional[str], object]]]:
+        tables = {family: [] for family in TABLE_FAMILIES}
+        for table in root.iter('table'):
+            table_id = table.get('id')
+            if not table_id:
+                continue
+            for family, pattern in TABLE_FAMILIES.items():
+                match = pattern.match(table_id)
+                if match:
+                    team_hex_id = match.group(1) if match.groups() else None
+                    tables[family].append((team_hex_id, table))
+        return tables
+
+    def tables(self, family: str) -> List[Tuple[Optional[str], object]]:
+        """Return (team_hex_id, table) pairs for a family."""
+        with self._lock:
+            if self._tables is None:
+                self._index_tables()
+            return self._tables.get(family, [])
+
+    def has_family(self, family: str) -> bool:
+        """Check whether the page contains any table of the family."""
+        return bool(self.tables(family))
+
+    def release(self):
+        """Drop the parsed document so memory stays flat across a corpus run."""
+        self._html = None
+        self._root = None
+        self._tables = None
+
+
+class FamilyHandler:
+    """
+    Callbacks for one table family: process(page) per file, flush() at the end.
+
+    Handlers that buffer rows across matches also pass committed(), which
+    returns (and forgets) the match IDs whose rows have been committed since
+    the last call; their matches are only recorded done once listed there.
+    """
+
+    def __init__(self, family: str, process: Callable[[MatchPage], int],
+                 flush: Optional[Callable[[], None]] = None,
+                 close: Optional[Callable[[], None]] = None,
+                 committed: Optional[Callable[[], List[str]]] = None):
+        self.family = family
+        self.process = process
+        self.flush = flush
+        self.close = close
+        self.committed = committed
+
+
+def record_done(state, handler: FamilyHandler, page: 'MatchPage', count: int, seconds: float):
+    """Record a processed match in the ETL state; buffered families wait until their batch commits."""
+    if handler.committed is None:
+        state.record(page.match_id, handler.family, page.filepath, 'done', count, seconds)
+        return
+    state.defer(page.match_id, handler.family, page.filepath, count, seconds)
+    state.confirm(handler.family, handler.committed())
+
+
+def flush_handler(state, handler: FamilyHandler):
+    """Flush a handler's buffered rows, then record the matches they completed."""
+    if handler.flush:
+        with metrics.stage(handler.family, files=0):
+            handler.flush()
+    if state is not None and handler.committed is not None:
+        state.confirm(handler.family, handler.committed())
+
+
+class SinglePassEngine:
+    """Parse each match file once and dispatch the shared DOM to all registered families."""
+
+    def __init__(self):
+        self.handlers: List[FamilyHandler] = []
+        self.state = None
+        self.stats = {
+            'files_processed': 0,
+            'files_failed': 0,
+            'files_up_to_date': 0,
+            'records_by_family': {},
+            'errors': []
+        }
+
+    def register(self, handler: FamilyHandler):
+        """Register a family handler; handlers run in registration order."""
+        self.handlers.append(handler)
+        self.stats['records_by_family'].setdefault(handler.family, 0)
+
+    def process_file(self, filepath: str, families: Optional[set] = None) -> Dict[str, int]:
+        """Parse one file and run every handler (or only those of the given families) against it."""
+        page = MatchPage(filepath)
+        results = {}
+        try:
+            for handler in self.handlers:
+                if families is not None and handler.family not in families:
+                    continue
+                started = time.time()
+                try:
+                    with metrics.stage(handler.family):
+                        count = handler.process(page) or 0
+                    metrics.add('rows_written', count, handler.family)
+                    if self.state:
+                        record_done(self.state, handler, page, count, time.time() - started)
+                except Exception as e:
+                    logger.error(f"{handler.family} failed for {os.path.basename(filepath)}: {e}")
+                    self.stats['errors'].append({
+                        'file': os.path.basename(filepath),
+                        'family': handler.family,
+                        'error': str(e)
+                    })
+                    if self.state:
+                        self.state.record(page.match_id, handler.family, filepath, 'failed',
+                                          seconds=time.time() - started, error=str(e))
+                    count = 0
+                results[handler.family] = count
+                self.stats['records_by_family'][handler.family] += count
+            self.stats['files_processed'] += 1
+        except Exception as e:
+            logger.error(f"Error parsing {filepath}: {e}")
+            self.stats['files_failed'] += 1
+            self.stats['errors'].append({'file': os.path.basename(filepath), 'error': str(e)})
+        finally:
+            page.release()
+        return results
+
+    def run(self, files: List[str], state=None, force: bool = False) -> Dict:
+        """Process a list of files (only outstanding work when given an EtlState), then flush and close."""
+        todo = None
+        if state is not None:
+            self.state = state
+            todo = state.plan([(extract_match_id(f), f) for f in files], [h.family for h in self.handlers], force)
+            self.stats['files_up_to_date'] = len(files) - len(todo)
+            files = [f for f in files if f in todo]
+        total = len(files)
+        logger.info(f"Single-pass run over {total} files for families: "
+                    f"{', '.join(h.family for h in self.handlers)}")
+        try:
+            for i, filepath in enumerate(files, 1):
+                self.process_file(filepath, todo[filepath] if todo is not None else None)
+                if i % 50 == 0 or i == total:
+                    logger.info(f"Progress: {i}/{total} files | records: {self.stats['records_by_family']}")
+            for handler in self.handlers:
+                flush_handler(self.state, handler)
+        finally:
+            for handler in self.handlers:
+                if handler.close:
+                    try:
+                        handler.close()
+                    except Exception as e:
+                        logger.warning(f"Error closing {handler.family} handler: {e}")
+        return self.stats
+
+
+# ---------------------------------------------------------------------------
+# Handlers wiring the existing extractors onto the shared page
+# ---------------------------------------------------------------------------
+
+def build_passing_handler(conn=None) -> FamilyHandler:
+    """match_player_passing from the passing and passing_types tables."""
+    from extract_fbref_passing_full import FBrefPassingFullExtractor, DB_CONFIG
+
+    extractor = FBrefPassingFullExtractor(DB_CONFIG)
+    if not extractor.connect_db(conn):
+        raise RuntimeError("passing extractor could not connect to database")
+
+    def process(page: MatchPage) -> int:
+        if not page.has_family('passing') and not page.has_family('passing_types'):
+            return 0
+        result = extractor.process_match_file(page.filepath, page.root)
+        return result.get('players_updated', 0)
+
+    return FamilyHandler('passing', process, close=None if conn else extractor.close_db)
+
+
+def build_pass_types_handler(conn=None) -> FamilyHandler:
+    """match_player_pass_types from the passing_types tables."""
+    from extract_pass_types_comprehensive import PassTypesExtractor
+
+    extractor = PassTypesExtractor()
+    extractor.connect_db(conn)
+    # Matches whose rows sit in extracted_data, and those whose rows have committed
+    buffered, committed = [], []
+
+    def flush():
+        try:
+            if extractor.extracted_data:
+                extractor.insert_data()
+            committed.extend(buffered)
+        finally:
+            # A failed batch is dropped; its matches are never recorded done, so they are redone
+            extractor.extracted_data = []
+            buffered.clear()
+
+    def process(page: MatchPage) -> int:
+        buffered.append(page.match_id)
+        if not page.has_family('passing_types'):
+            return 0
+        before = len(extractor.extracted_data)
+        extractor.process_file(page.filepath, page.root)
+        extractor.extraction_stats['files_processed'] += 1
+        added = len(extractor.extracted_data) - before
+        if len(extractor.extracted_data) >= extractor.flush_threshold:
+            flush()
+        return added
+
+    def take_committed() -> List[str]:
+        match_ids = list(committed)
+        committed.clear()
+        return match_ids
+
+    return FamilyHandler('passing_types', process, flush=flush, close=None if conn else extractor.close_db,
+                         committed=take_committed)
+
+
+def build_possession_handler(conn=None) -> FamilyHandler:
+    """match_player_possession from the possession tables."""
+    from extract_fbref_possession_full import FBrefPossessionExtractor, DB_CONFIG
+
+    extractor = FBrefPossessionExtractor(DB_CONFIG)
+    if not extractor.connect_db(conn):
+        raise RuntimeError("possession extractor could not connect to database")
+
+    def process(page: MatchPage) -> int:
+        if not page.has_family('possession'):
+            return 0
+        before = extractor.stats['players_extracted']
+        if extractor.process_file(page.filepath, page.root):
+            extractor.stats['files_processed'] += 1
+        return extractor.stats['players_extracted'] - before
+
+    return FamilyHandler('possession', process, close=None if conn else extractor.close)
+
+
+def build_misc_handler(conn=None, batch_size: int = 100) -> FamilyHandler:
+    """match_player_misc from the misc tables, written in batches."""
+    from extract_misc_stats_batch import BatchMiscStatsExtractor
+
+    extractor = BatchMiscStatsExtractor(batch_size=batch_size)
+    extractor.connect_db(conn)
+    # match_player IDs are fetched per match on first use, after possession has created them
+    pending = []
+    # Matches whose rows sit in pending, and those whose rows have committed
+    buffered, committed = [], []
+
+    def write_pending():
+        try:
+            if pending:
+                inserted, updated = extractor.process_batch(pending)
+                extractor.stats_extracted += inserted + updated
+            committed.extend(buffered)
+        finally:
+            # A failed batch is dropped; its matches are never recorded done, so they are redone
+            pending.clear()
+            buffered.clear()
+
+    def process(page: MatchPage) -> int:
+        buffered.append(page.match_id)
+        if not page.has_family('misc'):
+            extractor.files_skipped += 1
+            return 0
+        records = extractor.extract_misc_stats_from_html(page.filepath, page.root)
+        if records:
+            extractor.files_processed += 1
+            pending.extend(records)
+        else:
+            extractor.files_skipped += 1
+        if len(pending) >= extractor.batch_size:
+            write_pending()
+        return len(records)
+
+    def take_committed() -> List[str]:
+        match_ids = list(committed)
+        committed.clear()
+        return match_ids
+
+    return FamilyHandler('misc', process, flush=write_pending, close=None if conn else extractor.close_db,
+                         committed=take_committed)
+
+
+def build_defense_handler(conn=None) -> FamilyHandler:
+    """match_player_defensive_actions from the defense tables."""
+    from extract_defensive_actions import get_db_connection, process_single_file
+
+    shared = conn is not None
+    conn = conn or get_db_connection()
+
+    def process(page: MatchPage) -> int:
+        if not page.has_family('defense'):
+            return 0
+        result = process_single_file(page.filepath, conn, page.root)
+        return result.get('successful_updates', 0)
+
+    return FamilyHandler('defense', process, close=None if shared else conn.close)
+
+
+def build_keeper_handler(conn=None) -> FamilyHandler:
+    """match_goalkeeper_performance from the keeper_stats tables."""
+    from extract_goalkeeper_data_accurate import get_db_connection, process_html_file
+
+    shared = conn is not None
+    conn = conn or get_db_connection()
+
+    def process(page: MatchPage) -> int:
+        if not page.has_family('keeper_stats'):
+            return 0
+        stats = process_html_file(page.filepath, conn, page.root)
+        return stats['records_updated']
+
+    return FamilyHandler('keeper_stats', process, close=None if shared else conn.close)
+
+
+def build_shots_handler(conn=None) -> FamilyHandler:
+    """match_shot from the shots_all table, replacing each match's shots."""
+    from extract_shot_data_complete import CompleteShotDataExtractor, DB_CONFIG, HTML_DIRS
+
+    extractor = CompleteShotDataExtractor(DB_CONFIG, HTML_DIRS)
+    extractor.connect_db(conn)
+    extractor.load_mappings()
+
+    def process(page: MatchPage) -> int:
+        if not page.has_family('shots_all'):
+            return 0
+        # Raises on a parse error: the match is recorded failed and keeps its shots
+        shots = extractor.extract_shot_data_from_html(page.filepath, page.match_id, page.root)
+        # An empty list (no shot rows) still clears the match's old shots
+        extractor.replace_shots({page.match_id: shots})
+        return len(shots)
+
+    return FamilyHandler('shots_all', process, close=None if conn else extractor.close_db)
+
+
+def build_lineups_handler(conn=None) -> FamilyHandler:
+    """match_lineup for matches that have no lineup rows yet."""
+    from extract_comprehensive_lineups_v3 import (
+        get_db_connection, get_matches_missing_lineups, get_player_mappings,
+        get_team_mappings, extract_lineup_from_html, insert_lineups
+    )
+
+    shared = conn is not None
+    conn = conn or get_db_connection()
+    missing = {m['match_id']: m for m in get_matches_missing_lineups(conn)}
+    player_map = get_player_mappings(conn)
+    team_season_map, fbref_to_uuid_map = get_team_mappings(conn)
+    logger.info(f"Lineups: {len(missing)} matches missing lineup data")
+
+    def process(page: MatchPage) -> int:
+        match_info = missing.get(page.match_id)
+        if not match_info or not page.has_family('lineups'):
+            return 0
+        lineups = extract_lineup_from_html(page.filepath, match_info, player_map,
+                                           team_season_map, fbref_to_uuid_map, page.root)
+        if lineups:
+            insert_lineups(conn, lineups)
+        return len(lineups)
+
+    return FamilyHandler('lineups', process, close=None if shared else conn.close)
+
+
+def build_team_stats_handler(conn=None) -> FamilyHandler:
+    """match_team_performance for matches that have no team rows yet."""
+    from extract_team_performance import TeamPerformanceExtractor
+
+    extractor = TeamPerformanceExtractor()
+    extractor.connect_db(conn)
+    extractor.get_missing_matches()
+    extractor.load_team_season_mappings()
+    missing = {m['match_id']: m for m in extractor.missing_matches}
+
+    def process(page: MatchPage) -> int:
+        match_data = missing.get(page.match_id)
+        if not match_data:
+            return 0
+        team_stats = extractor.extract_team_stats_from_html(page.filepath, match_data, page.root)
+        if not team_stats:
+            return 0
+        return extractor.insert_team_performance(team_stats)
+
+    return FamilyHandler('team_stats', process,
+                         close=None if conn else lambda: extractor.conn and extractor.conn.close())
+
+
+HANDLER_BUILDERS = {
+    'passing': build_passing_handler,
+    'passing_types': build_pass_types_handler,
+    'possession': build_possession_handler,
+    'misc': build_misc_handler,
+    'defense': build_defense_handler,
+    'keeper_stats': build_keeper_handler,
+    'shots_all': build_shots_handler,
+    'lineups': build_lineups_handler,
+    'team_stats': build_team_stats_handler,
+}
+
+
+def build_engine(families: List[str]) -> SinglePassEngine:
+    """Create an engine with a handler for each requested family."""
+    engine = SinglePassEngine()
+    set_commit_every(1)
+    for family in families:
+        if family not in HANDLER_BUILDERS:
+            raise ValueError(f"Unknown family '{family}'. Choose from: {', '.join(ALL_FAMILIES)}")
+        engine.register(HANDLER_BUILDERS[family]())
+    return engine
+
+
+def main():
+    """Main execution function."""
+    parser = argparse.ArgumentParser(description='Extract every FBref table family in a single pass per file')
+    parser.add_argument('--html-dir', default=HTML_DIR, help='Directory containing match_*.html files')
+    parser.add_argument('--families', default=','.join(ALL_FAMILIES),
+                        help=f"Comma-separated families to extract (default: all of {', '.join(ALL_FAMILIES)})")
+    parser.add_argument('--limit', type=int, help='Only process the first N files')
+    parser.add_argument('--force', action='store_true', help='Ignore the ETL state and redo every match')
+    args = parser.parse_args()
+
+    families = [f.strip() for f in args.families.split(',') if f.strip()]
+    files = list_match_files(args.html_dir)
+    if args.limit:
+        files = files[:args.limit]
+
+    from etl_state import EtlState
+    start_run('single_pass')
+    state_conn = connect()
+    state = EtlState(state_conn)
+    engine = build_engine(families)
+    try:
+        stats = engine.run(files, state, args.force)
+    except BaseException:
+        # Outcomes not written yet may describe rows that never committed
+        state.discard()
+        raise
+    finally:
+        state.flush()
+        state_conn.close()
+        metrics.write()
+
+    print("\n" + "=" * 60)
+    print("SINGLE-PASS EXTRACTION SUMMARY")
+    print("=" * 60)
+    print(f"Files processed: {stats['files_processed']}")
+    print(f"Files already up to date: {stats['files_up_to_date']}")
+    print(f"Files failed: {stats['files_failed']}")
+    for family, count in stats['records_by_family'].items():
+        print(f"  {family:15} : {count:,} records")
+    print(f"Errors: {len(stats['errors'])}")
+
+    report_file = f"single_pass_extraction_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(report_file, 'w') as f:
+        json.dump(stats, f, indent=2, default=str)
+    print(f"\nReport saved to: {report_file}")
+
+    if stats['files_failed']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_profiled(main, 'single_pass')
@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Parallel parse / single-writer execution for the FBref extractors.
+
+N worker processes parse match files and push typed records into a bounded
+queue; one writer process drains the queue and applies batched upserts on a
+single database connection. The queue bound provides backpressure: when the
+writer falls behind, workers block on put() instead of piling parsed records up
+in memory.
+
+Parsing never touches the database, so workers scale with cores; anything that
+needs a lookup (match_player ids, player UUIDs) is resolved in the writer.
+
+An extractor plugs in with two module-level callables (so they can be pickled
+under the spawn start method used on macOS):
+
+    parse_file(filepath) -> List[Dict]
+        DB-free parse of one file.
+
+    writer_factory() -> writer
+        Called once inside the writer process. The writer exposes
+        write(units) -> int, where units is a list of (filepath, records),
+        rollback(), called after a failed write so the connection is usable
+        for the next batch, and close().
+"""
+
+import os
+import time
+import queue
+import logging
+import traceback
+import multiprocessing as mp
+from typing import Callable, Dict, List, Optional, Tuple
+
+from etl_metrics import get_metrics
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUEUE_SIZE = 64        # parsed files buffered between workers and writer
+DEFAULT_BATCH_RECORDS = 500    # records per writer batch
+PROGRESS_EVERY = 100           # files between writer progress lines
+
+
+def default_workers() -> int:
+    """One worker per core, leaving one for the writer."""
+    return max(1, (os.cpu_count() or 2) - 1)
+
+
+def _worker_loop(parse_file: Callable[[str], List[Dict]], task_queue, result_queue, stage: str):
+    """Parse files from the task queue until the None sentinel arrives."""
+    # Forked workers inherit the parent's metrics; report only their own
+    metrics = get_metrics()
+    metrics.reset(metrics.run)
+    parsed = 0
+    for filepath in iter(task_queue.get, None):
+        try:
+            with metrics.stage(stage):
+                records = parse_file(filepath) or []
+            # Blocks while the queue is full: this is the backpressure point
+            result_queue.put(('file', filepath, records))
+            parsed += 1
+        except Exception as e:
+            result_queue.put(('error', filepath, f"{type(e).__name__}: {e}"))
+    result_queue.put(('metrics', os.getpid(), metrics.snapshot()))
+    result_queue.put(('done', os.getpid(), parsed))
+
+
+def _writer_loop(writer_factory: Callable, result_queue, stats_queue, n_workers: int,
+                 batch_records: int, total_files: int, stage: str):
+    """Drain parsed files into batched writes on one connection."""
+    metrics = get_metrics()
+    metrics.reset(metrics.run)
+    stats = {
+        'files_parsed': 0,
+        'files_failed': 0,
+        'records_parsed': 0,
+        'records_written': 0,
+        'batches_written': 0,
+        'write_errors': [],
+        'parse_errors': [],
+        'files_per_worker': {}
+    }
+    writer = None
+    pending: List[Tuple[str, List[Dict]]] = []
+    pending_records = 0
+    start_time = time.time()
+
+    def flush():
+        nonlocal pending, pending_records
+        if not pending:
+            return
+        try:
+            with metrics.stage(stage, files=0):
+                written = writer.write(pending) or 0
+            metrics.add('rows_written', written, stage)
+            stats['records_written'] += written
+            stats['batches_written'] += 1
+        except Exception as e:
+            logger.error(f"Writer batch failed ({len(pending)} files): {e}")
+            # The batch is lost, not the run: clear the aborted transaction
+            try:
+                writer.rollback()
+            except Exception as rollback_error:
+                logger.error(f"Writer rollback failed: {rollback_error}")
+            stats['files_failed'] += len(pending)
+            stats['write_errors'].append({
+                'files': [os.path.basename(path) for path, _ in pending],
+                'error': str(e)
+            })
+        pending = []
+        pending_records = 0
+
+    try:
+        writer = writer_factory()
+        done_workers = 0
+        while done_workers < n_workers:
+            kind, key, payload = result_queue.get()
+            if kind == 'file':
+                pending.append((key, payload))
+                pending_records += len(payload)
+                stats['files_parsed'] += 1
+                stats['records_parsed'] += len(payload)
+                if pending_records >= batch_records:
+                    flush()
+                handled = stats['files_parsed'] + len(stats['parse_errors'])
+                if handled % PROGRESS_EVERY == 0:
+                    elapsed = time.time() - start_time
+                    rate = handled / elapsed if elapsed > 0 else 0
+                    logger.info(f"Progress: {handled}/{total_files} files | "
+                                f"written: {stats['records_written']} records | "
+                                f"{rate:.1f} files/sec | queue: ~{_qsize(result_queue)}")
+            elif kind == 'error':
+                stats['files_failed'] += 1
+                stats['parse_errors'].append({'file': os.path.basename(key), 'error': payload})
+            elif kind == 'metrics':
+                metrics.merge(payload)
+            elif kind == 'done':
+                done_workers += 1
+                stats['files_per_worker'][str(key)] = payload
+        flush()
+    except Exception as e:
+        stats['write_errors'].append({'files': [], 'error': f"writer crashed: {e}"})
+        logger.error(f"Writer process failed: {e}")
+        traceback.print_exc()
+    finally:
+        if writer is not None:
+            try:
+                writer.close()
+            except Exception as e:
+                logger.warning(f"Error closing writer: {e}")
+        stats['writer_seconds'] = time.time() - start_time
+        stats['metrics'] = metrics.snapshot()
+        stats_queue.put(stats)
+
+
+def _qsize(q) -> str:
+    try:
+        return str(q.qsize())
+    except NotImplementedError:  # macOS
+        return '?'
+
+
+def run_parallel(files: List[str], parse_file: Callable[[str], List[Dict]], writer_factory: Callable,
+                 workers: Optional[int] = None, queue_size: int = DEFAULT_QUEUE_SIZE,
+                 batch_records: int = DEFAULT_BATCH_RECORDS, stage: str = 'parallel') -> Dict:
+    """
+    Parse files on `workers` processes and write through one writer process.
+
+    Returns the writer's stats (files/records parsed and written, errors).
+    Workers' and the writer's metrics are merged into this process's
+    etl_metrics under stage.
+    """
+    workers = workers or default_workers()
+    ctx = mp.get_context()
+    task_queue = ctx.Queue()
+    result_queue = ctx.Queue(maxsize=queue_size)
+    stats_queue = ctx.Queue()
+
+    for filepath in files:
+        task_queue.put(filepath)
+    for _ in range(workers):
+        task_queue.put(None)
+
+    logger.info(f"Parallel run: {len(files)} files, {workers} parse workers, 1 writer, "
+                f"queue bound {queue_size} files, batches of {batch_records} records")
+    start_time = time.time()
+
+    writer_proc = ctx.Process(
+        target=_writer_loop,
+        args=(writer_factory, result_queue, stats_queue, workers, batch_records, len(files), stage),
+        name='fbref-writer'
+    )
+    writer_proc.start()
+    worker_procs = [
+        ctx.Process(target=_worker_loop, args=(parse_file, task_queue, result_queue, stage),
+                    name=f'fbref-parse-{i}')
+        for i in range(workers)
+    ]
+    for proc in worker_procs:
+        proc.start()
+
+    # Wait for workers; if the writer dies they would block forever on a full queue
+    while any(proc.is_alive() for proc in worker_procs):
+        for proc in worker_procs:
+            proc.join(timeout=1)
+        if not writer_proc.is_alive():
+            logger.error("Writer exited early; stopping parse workers")
+            for proc in worker_procs:
+                proc.terminate()
+            break
+
+    stats = None
+    while stats is None:
+        try:
+            stats = stats_queue.get(timeout=1)
+        except queue.Empty:
+            if not writer_proc.is_alive():
+                stats = {'write_errors': [{'files': [], 'error': 'writer exited without reporting'}]}
+    writer_proc.join()
+    get_metrics().merge(stats.pop('metrics', None))
+
+    stats['workers'] = workers
+    stats['elapsed_seconds'] = time.time() - start_time
+    parsed = stats.get('files_parsed', 0)
+    stats['files_per_second'] = parsed / stats['elapsed_seconds'] if stats['elapsed_seconds'] > 0 else 0
+    logger.info(f"Parallel run complete: {parsed} files parsed, {stats.get('files_failed', 0)} failed, "
+                f"{stats.get('records_written', 0)} records written in {stats['elapsed_seconds']:.1f}s "
+                f"({stats['files_per_second']:.1f} files/sec)")
+    return stats
@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""
+Shared shots_all reader for every match_shot write path.
+
+extract_shot_data.py, extract_shot_data_complete.py and
+rebuild_match_shot_table.py used to read shots_all three different ways
+(pd.read_html, BeautifulSoup per row, positional cells[0..12]), each with its
+own speed and its own idea of which rows to keep. Here the table is read once
+with lxml: the header row's data-stat attributes are resolved to cell
+positions once per table, data rows are read by position (falling back to
+data-stat lookup for a row that doesn't line up), and values go straight into
+a ShotTable - a numpy array for the numeric columns and interned strings for
+the text ones.
+
+Row parsers turn a ShotTable into the records a write path needs:
+
+    match_shot    the match_shot columns written with BulkLoader (the
+                  complete extractor, the parallel writer, the rebuild)
+    legacy        the shot_id / squad / outcome_id columns of extract_shot_data.py
+
+Every parser sees the same rows: a shot is kept when it has a minute
+(stoppage time like "90+7" is 97) and a player name. Each kept shot carries
+its row position as pd.read_html numbered it (every body row except blank
+ones, spacers included), which the legacy shot_id has always been built from.
+
+Usage:
+    table = read_shots(parse_html_file(path))          # None when the page has no shots_all
+    shots = table.records(match_id, 'match_shot', player_uuid=uuid_map.get)
+"""
+
+import re
+import sys
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from etl_metrics import get_metrics
+from fbref_tables import EMPTY_VALUES, SKIP_ROW_CLASSES, find_table, parse_html_file
+
+# data-stat -> canonical row field, in shots_all column order
+SHOT_STATS = {
+    'minute': 'minute',
+    'player': 'player',
+    'team': 'team',
+    'xg_shot': 'xg',
+    'psxg_shot': 'psxg',
+    'outcome': 'outcome',
+    'distance': 'distance',
+    'body_part': 'body_part',
+    'notes': 'notes',
+    'sca_1_player': 'sca_1_player',
+    'sca_1_type': 'sca_1_type',
+    'sca_2_player': 'sca_2_player',
+    'sca_2_type': 'sca_2_type',
+}
+
+# Numeric columns; MISSING_INT / NaN mark empty cells
+NUMERIC_DTYPE = np.dtype([('minute', 'i2'), ('xg', 'f8'), ('psxg', 'f8'), ('distance', 'i2')])
+MISSING_INT = -1
+
+TEXT_FIELDS = ['player', 'team', 'outcome', 'body_part', 'notes',
+               'sca_1_player', 'sca_1_type', 'sca_2_player', 'sca_2_type']
+
+CELL_TAGS = ('th', 'td')
+
+PLAYER_HREF_RE = re.compile(r'/players/([a-f0-9]{8})/')
+
+OUTCOMES = {
+    'goal': 'Goal',
+    'saved': 'Saved',
+    'off target': 'Off Target',
+    'off_target': 'Off Target',
+    'blocked': 'Blocked',
+    'woodwork': 'Woodwork',
+    'saved off target': 'Saved off Target',
+    'saved_off_target': 'Saved off Target',
+    'unknown': 'Unknown',
+}
+
+metrics = get_metrics()
+
+
+def parse_minute(text: Optional[str]) -> Optional[int]:
+    """Match minute as an int, stoppage time added ("90+7" -> 97); None when unparseable."""
+    if not text:
+        return None
+    try:
+        if '+' in text:
+            base, _, added = text.partition('+')
+            return int(base) + (int(added) if added else 0)
+        return int(text)
+    except ValueError:
+        return None
+
+
+def parse_float(text: Optional[str]) -> Optional[float]:
+    """A numeric cell as a float, None for FBref's empty markers."""
+    if text is None or text in EMPTY_VALUES:
+        return None
+    try:
+        return float(text.replace(',', ''))
+    except ValueError:
+        return None
+
+
+def standardize_outcome(outcome: Optional[str]) -> Optional[str]:
+    """Shot outcome in its standard spelling ('so_goal', 'goal' -> 'Goal')."""
+    if not outcome:
+        return None
+    outcome = outcome.strip().lower()
+    if outcome.startswith('so_'):
+        outcome = outcome[3:]
+    return OUTCOMES.get(outcome, outcome.title())
+
+
+def _cells(tr) -> List:
+    return [child for child in tr if child.tag in CELL_TAGS]
+
+
+def _player_id(cell) -> Optional[str]:
+    """FBref player hex ID from the cell's data-append-csv, or its /players/ link."""
+    player_id = cell.get('data-append-csv')
+    if player_id:
+        return player_id
+    for link in cell.iter('a'):
+        match = PLAYER_HREF_RE.search(link.get('href') or '')
+        if match:
+            return match.group(1)
+    return None
+
+
+class ShotTable:
+    """A shots_all table read into typed columns."""
+
+    def __init__(self, numbers: np.ndarray, text: Dict[str, List[Optional[str]]],
+                 player_ids: List[Optional[str]], positions: Optional[List[int]] = None):
+        self.numbers = numbers          # NUMERIC_DTYPE per row
+        self.text = text                # field -> interned cell text (None when empty)
+        self.player_ids = player_ids    # FBref player hex ID per row
+        self.positions = positions if positions is not None else list(range(len(numbers)))
+
+    def __len__(self) -> int:
+        return len(self.numbers)
+
+    def __bool__(self) -> bool:
+        return len(self.numbers) > 0
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the numeric array (strings are shared, not counted)."""
+        return self.numbers.nbytes
+
+    def rows(self) -> Iterator[Tuple[int, Dict]]:
+        """(position, row) for every shot that has a minute and a player name."""
+        text = [self.text[field] for field in TEXT_FIELDS]
+        for i, (minute, xg, psxg, distance) in enumerate(self.numbers.tolist()):
+            if minute == MISSING_INT or not self.text['player'][i]:
+                continue
+            row = dict(zip(TEXT_FIELDS, (column[i] for column in text)))
+            row['minute'] = minute
+            row['xg'] = None if xg != xg else xg
+            row['psxg'] = None if psxg != psxg else psxg
+            row['distance'] = None if distance == MISSING_INT else distance
+            row['player_id'] = self.player_ids[i]
+            yield self.positions[i], row
+
+    def records(self, match_id: str, row_parser='match_shot',
+                player_uuid: Optional[Callable[[str], Optional[str]]] = None, **extra) -> List[Dict]:
+        """
+        One record per kept shot, shaped by a row parser (a ROW_PARSERS name or a callable).
+
+        player_uuid maps an FBref player ID to a UUID (None leaves it empty);
+        extra fields (e.g. season_year) are added to every record.
+        """
+        parse = ROW_PARSERS[row_parser] if isinstance(row_parser, str) else row_parser
+        records = []
+        for position, row in self.rows():
+            record = parse(row, position, match_id)
+            player_id = row['player_id']
+            record['player_uuid'] = player_uuid(player_id) if player_uuid and player_id else None
+            record.update(extra)
+            records.append(record)
+        return records
+
+
+def match_shot_row(row: Dict, index: int, match_id: str) -> Dict:
+    """A match_shot record (bulk_loader.SHOT_COLUMNS)."""
+    return {
+        'match_id': match_id,
+        'minute': row['minute'],
+        'player_name': row['player'],
+        'player_id': row['player_id'],
+        'team_name': row['team'],
+        'xg': row['xg'],
+        'psxg': row['psxg'],
+        'outcome': standardize_outcome(row['outcome']),
+        'distance': row['distance'],
+        'body_part': row['body_part'],
+        'notes': row['notes'],
+        'sca1_player_name': row['sca_1_player'],
+        'sca1_event': row['sca_1_type'],
+        'sca2_player_name': row['sca_2_player'],
+        'sca2_event': row['sca_2_type'],
+    }
+
+
+def legacy_shot_row(row: Dict, index: int, match_id: str) -> Dict:
+    """A record for extract_shot_data.INSERT_SHOT; shot_id is the row's pd.read_html position."""
+    return {
+        'shot_id': f"{match_id}_{index:03d}",
+        'match_id': match_id,
+        'minute': row['minute'],
+        'player_name': row['player'],
+        'player_id': row['player_id'],
+        'squad': row['team'] or '',
+        'xg': row['xg'],
+        'psxg': row['psxg'],
+        'outcome_id': row['outcome'] or '',
+        'distance': float(row['distance']) if row['distance'] is not None else None,
+        'body_part': row['body_part'] or '',
+        'notes': row['notes'] or '',
+        'sca1_player_name': row['sca_1_player'],
+        'sca1_event': row['sca_1_type'],
+        'sca2_player_name': row['sca_2_player'],
+        'sca2_event': row['sca_2_type'],
+    }
+
+
+ROW_PARSERS: Dict[str, Callable[[Dict, int, str], Dict]] = {
+    'match_shot': match_shot_row,
+    'legacy': legacy_shot_row,
+}
+
+
+def read_shots(root, table_id: str = 'shots_all') -> Optional[ShotTable]:
+    """Find the shots table in a parsed page (lxml) and read it, or None when the page doesn't have it."""
+    table = find_table(root, table_id)
+    if table is None:
+        return None
+    with metrics.phase('extract'):
+        return _read_shots(table)
+
+
+def read_shots_file(filepath: str, table_id: str = 'shots_all') -> Optional[ShotTable]:
+    """Read, parse and extract the shots table of a match file."""
+    return read_shots(parse_html_file(filepath), table_id)
+
+
+def _resolve_positions(table) -> Dict[str, int]:
+    """data-stat -> cell position, from the last header row."""
+    header = table.xpath('./thead/tr[last()]')
+    if not header:
+        return {}
+    return {cell.get('data-stat'): pos for pos, cell in enumerate(_cells(header[0]))
+            if cell.get('data-stat') in SHOT_STATS}
+
+
+def _is_blank_row(cells) -> bool:
+    """Rows pd.read_html dropped: no cells, or a single empty cell spanning one column."""
+    if not cells:
+        return True
+    if len(cells) > 1:
+        return False
+    try:
+        span = int(cells[0].get('colspan') or 1)
+    except ValueError:
+        span = 1
+    return span == 1 and not cells[0].text_content().strip()
+
+
+def _read_shots(table) -> ShotTable:
+    positions = _resolve_positions(table)
+    width = max(positions.values()) + 1 if positions else 0
+    first = min(positions, key=positions.get) if positions else None
+    last = max(positions, key=positions.get) if positions else None
+
+    data_rows = table.xpath('./tbody/tr') or table.xpath('./tr')
+    minutes, xgs, psxgs, distances = [], [], [], []
+    text: Dict[str, List[Optional[str]]] = {field: [] for field in TEXT_FIELDS}
+    player_ids: List[Optional[str]] = []
+    row_positions: List[int] = []
+
+    position = -1
+    for tr in data_rows:
+        cells = _cells(tr)
+        if _is_blank_row(cells):
+            continue
+        # Spacer and repeated header rows still took a position in pd.read_html
+        position += 1
+        if SKIP_ROW_CLASSES.intersection((tr.get('class') or '').split()):
+            continue
+        if (positions and len(cells) >= width
+                and cells[positions[first]].get('data-stat') == first
+                and cells[positions[last]].get('data-stat') == last):
+            by_stat = {stat: cells[pos] for stat, pos in positions.items()}
+        else:
+            # Row doesn't line up with the header (or there is none): look cells up by data-stat
+            by_stat = {cell.get('data-stat'): cell for cell in cells if cell.get('data-stat') in SHOT_STATS}
+        if not by_stat:
+            continue
+
+        values = {}
+        for stat, field in SHOT_STATS.items():
+            cell = by_stat.get(stat)
+            value = cell.text_content().strip() if cell is not None else ''
+            values[field] = sys.intern(value) if value and value not in EMPTY_VALUES else None
+
+        minute = parse_minute(values['minute'])
+        distance = parse_float(values['distance'])
+        minutes.append(MISSING_INT if minute is None else minute)
+        xg, psxg = parse_float(values['xg']), parse_float(values['psxg'])
+        xgs.append(np.nan if xg is None else xg)
+        psxgs.append(np.nan if psxg is None else psxg)
+        distances.append(MISSING_INT if distance is None else int(distance))
+        for field in TEXT_FIELDS:
+            text[field].append(values[field])
+        player_cell = by_stat.get('player')
+        player_ids.append(_player_id(player_cell) if player_cell is not None else None)
+        row_positions.append(position)
+
+    numbers = np.empty(len(minutes), dtype=NUMERIC_DTYPE)
+    numbers['minute'] = minutes
+    numbers['xg'] = xgs
+    numbers['psxg'] = psxgs
+    numbers['distance'] = distances
+    return ShotTable(numbers, text, player_ids, row_positions)
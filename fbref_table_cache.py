@@ -0,0 +1,490 @@
+#!/usr/bin/env python3
+"""
+Persistent columnar cache of parsed FBref tables.
+
+Every parsed stats table is stored as a Parquet file keyed by
+(sha256 of the match file, table_id, PARSER_VERSION). Extractors read through
+load_stat_tables(): cache first, then the byte-offset table index, then the
+HTML. Changing only an extractor's DB-write logic therefore no longer pays the
+HTML parse again on the next run, while editing a match file (new hash) or the
+reader (new PARSER_VERSION) naturally misses.
+
+The cache is size bounded; least recently used tables are evicted once it grows
+past the limit. Hits update last_access in memory and are written to the
+manifest in batches (before every eviction, and on close), so a warm run does
+not commit once per table. One cache is shared by every thread of a process;
+the manifest connection is used under a lock. pyarrow is optional: without it
+extractors fall back to the table index and nothing is cached.
+
+Usage:
+    python fbref_table_cache.py warm [html_dir] [--pattern REGEX]
+    python fbref_table_cache.py inspect
+    python fbref_table_cache.py purge [--all | --older-than DAYS]
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import atexit
+import argparse
+import threading
+from typing import Dict, List, Optional, Pattern, Tuple, Union
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from etl_metrics import get_metrics
+from fbref_tables import PARSER_VERSION, StatTable, iter_tables, read_stat_table
+from fbref_table_index import TableIndex, get_default_index, load_stat_tables as index_load_stat_tables
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# HTML files directory
+HTML_DIR = '/Users/thomasmcmillan/projects/nwsl_db_migration/html_files'
+
+# Cache location and size limit; override with FBREF_TABLE_CACHE_DIR / FBREF_TABLE_CACHE_MAX_MB.
+# Set FBREF_TABLE_CACHE=0 to bypass the cache entirely.
+DEFAULT_CACHE_DIR = os.environ.get(
+    'FBREF_TABLE_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fbref_table_cache')
+)
+DEFAULT_MAX_BYTES = int(os.environ.get('FBREF_TABLE_CACHE_MAX_MB', '2048')) * 1024 * 1024
+CACHE_ENABLED = os.environ.get('FBREF_TABLE_CACHE', '1') != '0'
+
+# Tables worth caching when warming: every per-team stats table, keepers and shots
+WARM_PATTERN = r'^(stats_[a-f0-9]{8}_|keeper_stats_|shots_all$)'
+
+# Cache hits whose last_access is held in memory before it is written
+TOUCH_FLUSH_EVERY = 500
+
+# Column name prefix for data-append-csv ids stored next to the cell text
+ID_COLUMN_PREFIX = '__id__:'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_digest (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS file_tables (
+    sha256 TEXT PRIMARY KEY,
+    table_ids TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache_entry (
+    sha256 TEXT NOT NULL,
+    table_id TEXT NOT NULL,
+    parser_version INTEGER NOT NULL,
+    relpath TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (sha256, table_id, parser_version)
+);
+CREATE INDEX IF NOT EXISTS idx_cache_entry_last_access ON cache_entry (last_access);
+"""
+
+
+def file_sha256(filepath: str) -> str:
+    """sha256 of a file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def stat_table_to_arrow(table: StatTable):
+    """Store a StatTable's raw cell text (and player/link ids) as string columns."""
+    arrays = {}
+    for stat in table.stats:
+        arrays[stat] = pa.array([row.get(stat) for row in table.rows], type=pa.string())
+    id_stats = sorted({stat for row_ids in table.ids for stat in row_ids})
+    for stat in id_stats:
+        arrays[ID_COLUMN_PREFIX + stat] = pa.array([row_ids.get(stat) for row_ids in table.ids],
+                                                   type=pa.string())
+    arrow_table = pa.table(arrays) if arrays else pa.table({})
+    metadata = {
+        'table_id': table.table_id or '',
+        'caption': json.dumps(table.caption),
+        'stats': json.dumps(table.stats),
+        'headers': json.dumps(table.headers),
+        'parser_version': str(PARSER_VERSION),
+    }
+    return arrow_table.replace_schema_metadata({k: v.encode('utf-8') for k, v in metadata.items()})
+
+
+def stat_table_from_arrow(arrow_table) -> StatTable:
+    """Rebuild a StatTable from its cached Arrow form."""
+    metadata = {k.decode('utf-8'): v.decode('utf-8') for k, v in (arrow_table.schema.metadata or {}).items()}
+    stats = json.loads(metadata['stats'])
+    columns = {name: arrow_table.column(name).to_pylist() for name in arrow_table.column_names}
+    num_rows = arrow_table.num_rows
+
+    rows = [{} for _ in range(num_rows)]
+    ids = [{} for _ in range(num_rows)]
+    for name, values in columns.items():
+        if name.startswith(ID_COLUMN_PREFIX):
+            stat, target = name[len(ID_COLUMN_PREFIX):], ids
+        else:
+            stat, target = name, rows
+        for i, value in enumerate(values):
+            if value is not None:
+                target[i][stat] = value
+
+    return StatTable(metadata['table_id'], json.loads(metadata['caption']), stats,
+                     json.loads(metadata['headers']), rows, ids)
+
+
+class TableCache:
+    """Parquet files on disk plus a SQLite manifest for lookups and LRU eviction."""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 index: Optional[TableIndex] = None):
+        if pa is None:
+            raise RuntimeError("pyarrow is required for the table cache (pip install pyarrow)")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index = index
+        os.makedirs(cache_dir, exist_ok=True)
+        # Shared across worker threads; every use of conn holds the lock
+        self.conn = sqlite3.connect(os.path.join(cache_dir, 'manifest.sqlite'), check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.RLock()
+        self.touched: Dict[Tuple[str, str, int], float] = {}
+        self.stats = {'hits': 0, 'misses': 0, 'evicted': 0}
+
+    def close(self):
+        """Write pending access times and close the manifest database."""
+        with self.lock:
+            if self.conn:
+                self.flush_access()
+                self.conn.close()
+                self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # -- keys ---------------------------------------------------------------
+
+    def file_digest(self, filepath: str) -> str:
+        """Content hash of a match file, memoized by path, size and mtime."""
+        path = os.path.abspath(filepath)
+        st = os.stat(path)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime, sha256 FROM file_digest WHERE path = ?", (path,)
+            ).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            return row[2]
+        sha = file_sha256(path)
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO file_digest (path, size, mtime, sha256) VALUES (?, ?, ?, ?)",
+                (path, st.st_size, st.st_mtime, sha)
+            )
+        return sha
+
+    def file_table_ids(self, filepath: str, sha: str) -> List[str]:
+        """Table ids present in a file (page order), from the manifest or the table index."""
+        with self.lock:
+            row = self.conn.execute("SELECT table_ids FROM file_tables WHERE sha256 = ?", (sha,)).fetchone()
+        if row:
+            return json.loads(row[0])
+        index = self.index or get_default_index()
+        ranges = index.get_ranges(filepath)
+        table_ids = [table_id for table_id, _ in sorted(ranges.items(), key=lambda item: item[1][0])]
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO file_tables (sha256, table_ids) VALUES (?, ?)",
+                (sha, json.dumps(table_ids))
+            )
+        return table_ids
+
+    def _relpath(self, sha: str, table_id: str) -> str:
+        return os.path.join(sha[:2], f"{sha}_{table_id}_v{PARSER_VERSION}.parquet")
+
+    # -- get / put ----------------------------------------------------------
+
+    def get(self, sha: str, table_id: str) -> Optional[StatTable]:
+        """Cached table for (sha, table_id, PARSER_VERSION), or None on a miss."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT relpath FROM cache_entry WHERE sha256 = ? AND table_id = ? AND parser_version = ?",
+                (sha, table_id, PARSER_VERSION)
+            ).fetchone()
+        if not row:
+            return None
+        path = os.path.join(self.cache_dir, row[0])
+        try:
+            # A cache hit replaces read + parse + extract of the table
+            with get_metrics().phase('extract'):
+                table = stat_table_from_arrow(pq.read_table(path))
+        except Exception as e:
+            logger.warning(f"Dropping unreadable cache entry {row[0]}: {e}")
+            self._delete_entry(sha, table_id, PARSER_VERSION, row[0])
+            return None
+        with self.lock:
+            self.touched[(sha, table_id, PARSER_VERSION)] = time.time()
+            if len(self.touched) >= TOUCH_FLUSH_EVERY:
+                self.flush_access()
+        return table
+
+    def flush_access(self):
+        """Write the last_access times of cache hits held in memory."""
+        with self.lock:
+            if not self.touched or not self.conn:
+                return
+            with self.conn:
+                self.conn.executemany(
+                    "UPDATE cache_entry SET last_access = ? WHERE sha256 = ? AND table_id = ? AND parser_version = ?",
+                    [(accessed, sha, table_id, parser_version)
+                     for (sha, table_id, parser_version), accessed in self.touched.items()]
+                )
+            self.touched = {}
+
+    def put(self, sha: str, table: StatTable):
+        """Store a parsed table, then evict old entries if the cache is over its limit."""
+        relpath = self._relpath(sha, table.table_id)
+        path = os.path.join(self.cache_dir, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        pq.write_table(stat_table_to_arrow(table), tmp_path)
+        os.replace(tmp_path, path)
+        now = time.time()
+        with self.lock, self.conn:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO cache_entry
+                   (sha256, table_id, parser_version, relpath, bytes, created_at, last_access)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (sha, table.table_id, PARSER_VERSION, relpath, os.path.getsize(path), now, now)
+            )
+        self.evict()
+
+    def load_stat_tables(self, filepath: str, pattern: Union[str, Pattern]) -> List[Tuple[re.Match, StatTable]]:
+        """Cache-first equivalent of fbref_table_index.load_stat_tables."""
+        if isinstance(pattern, str):
+            pattern = re.compile(pattern)
+        sha = self.file_digest(filepath)
+
+        wanted = []
+        for table_id in self.file_table_ids(filepath, sha):
+            match = pattern.search(table_id)
+            if match:
+                wanted.append((table_id, match))
+
+        found: Dict[str, StatTable] = {}
+        missing = False
+        for table_id, _ in wanted:
+            table = self.get(sha, table_id)
+            if table is None:
+                missing = True
+            else:
+                found[table_id] = table
+                self.stats['hits'] += 1
+
+        if missing:
+            for match, table in index_load_stat_tables(filepath, pattern, self.index):
+                if match.string in found:
+                    continue
+                self.stats['misses'] += 1
+                self.put(sha, table)
+                found[match.string] = table
+
+        return [(match, found[table_id]) for table_id, match in wanted if table_id in found]
+
+    # -- maintenance --------------------------------------------------------
+
+    def _delete_entry(self, sha: str, table_id: str, parser_version: int, relpath: str):
+        try:
+            os.remove(os.path.join(self.cache_dir, relpath))
+        except FileNotFoundError:
+            pass
+        with self.lock, self.conn:
+            self.touched.pop((sha, table_id, parser_version), None)
+            self.conn.execute(
+                "DELETE FROM cache_entry WHERE sha256 = ? AND table_id = ? AND parser_version = ?",
+                (sha, table_id, parser_version)
+            )
+
+    def total_bytes(self) -> int:
+        """Bytes used by cached tables."""
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM cache_entry").fetchone()[0]
+
+    def evict(self, target_bytes: Optional[int] = None) -> int:
+        """Remove least recently used entries until the cache fits; returns entries removed."""
+        with self.lock:
+            if target_bytes is None:
+                if self.total_bytes() <= self.max_bytes:
+                    return 0
+                # Evict down to 90% so we don't evict on every subsequent put
+                target_bytes = int(self.max_bytes * 0.9)
+            # Recent hits must be on disk for the LRU order to be right
+            self.flush_access()
+            total = self.total_bytes()
+            removed = 0
+            rows = self.conn.execute(
+                "SELECT sha256, table_id, parser_version, relpath, bytes FROM cache_entry ORDER BY last_access"
+            ).fetchall()
+            for sha, table_id, parser_version, relpath, size in rows:
+                if total <= target_bytes:
+                    break
+                self._delete_entry(sha, table_id, parser_version, relpath)
+                total -= size
+                removed += 1
+            self.stats['evicted'] += removed
+            return removed
+
+    def purge(self, everything: bool = False, older_than_days: Optional[float] = None) -> int:
+        """Remove entries from old parser versions, entries unused for N days, or everything."""
+        if everything:
+            query, params = "SELECT sha256, table_id, parser_version, relpath FROM cache_entry", ()
+        elif older_than_days is not None:
+            cutoff = time.time() - older_than_days * 86400
+            query = "SELECT sha256, table_id, parser_version, relpath FROM cache_entry WHERE last_access < ?"
+            params = (cutoff,)
+        else:
+            query = "SELECT sha256, table_id, parser_version, relpath FROM cache_entry WHERE parser_version <> ?"
+            params = (PARSER_VERSION,)
+        with self.lock:
+            self.flush_access()
+            rows = self.conn.execute(query, params).fetchall()
+            for sha, table_id, parser_version, relpath in rows:
+                self._delete_entry(sha, table_id, parser_version, relpath)
+            if everything:
+                with self.conn:
+                    self.conn.execute("DELETE FROM file_tables")
+                    self.conn.execute("DELETE FROM file_digest")
+        return len(rows)
+
+    def inspect(self) -> Dict:
+        """Summary of what the cache holds."""
+        with self.lock:
+            return self._inspect()
+
+    def _inspect(self) -> Dict:
+        summary = {
+            'cache_dir': self.cache_dir,
+            'parser_version': PARSER_VERSION,
+            'max_bytes': self.max_bytes,
+            'total_bytes': self.total_bytes(),
+            'entries': self.conn.execute("SELECT COUNT(*) FROM cache_entry").fetchone()[0],
+            'files': self.conn.execute("SELECT COUNT(DISTINCT sha256) FROM cache_entry").fetchone()[0],
+            'by_parser_version': dict(self.conn.execute(
+                "SELECT parser_version, COUNT(*) FROM cache_entry GROUP BY parser_version"
+            ).fetchall()),
+            'by_family': {}
+        }
+        for (table_id,) in self.conn.execute("SELECT table_id FROM cache_entry").fetchall():
+            family = re.sub(r'[a-f0-9]{8}', '{team}', table_id)
+            summary['by_family'][family] = summary['by_family'].get(family, 0) + 1
+        return summary
+
+
+_default_cache: Optional[TableCache] = None
+_default_cache_lock = threading.Lock()
+_cache_unavailable_logged = False
+
+
+def get_default_cache() -> Optional[TableCache]:
+    """Shared cache for the current process (safe to use from any thread), or None when disabled or pyarrow is missing."""
+    global _default_cache, _cache_unavailable_logged
+    if not CACHE_ENABLED:
+        return None
+    if pa is None:
+        if not _cache_unavailable_logged:
+            logger.info("pyarrow not installed; parsed table cache disabled")
+            _cache_unavailable_logged = True
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = TableCache()
+            atexit.register(_default_cache.close)
+    return _default_cache
+
+
+def load_stat_tables(filepath: str, pattern: Union[str, Pattern]) -> List[Tuple[re.Match, StatTable]]:
+    """Matching tables of a match file: cache first, then the table index / HTML."""
+    cache = get_default_cache()
+    if cache is None:
+        return index_load_stat_tables(filepath, pattern)
+    return cache.load_stat_tables(filepath, pattern)
+
+
+def get_stat_tables(filepath: str, pattern: Union[str, Pattern], root=None) -> List[Tuple[re.Match, StatTable]]:
+    """
+    Matching tables for an extractor.
+
+    When the caller already holds the parsed page (e.g. the single-pass engine)
+    the tables are read from it; otherwise they come from load_stat_tables().
+    """
+    if root is None:
+        return load_stat_tables(filepath, pattern)
+    return [(match, read_stat_table(table)) for match, table in iter_tables(root, pattern)]
+
+
+def main():
+    """Warm, inspect or purge the parsed table cache."""
+    parser = argparse.ArgumentParser(description='Manage the parsed FBref table cache')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help='Cache directory')
+    parser.add_argument('--max-mb', type=int, default=DEFAULT_MAX_BYTES // (1024 * 1024),
+                        help='Size limit in MB before LRU eviction')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    warm_parser = subparsers.add_parser('warm', help='Parse and cache tables for every match file')
+    warm_parser.add_argument('html_dir', nargs='?', default=HTML_DIR)
+    warm_parser.add_argument('--pattern', default=WARM_PATTERN, help='Regex of table ids to cache')
+
+    subparsers.add_parser('inspect', help='Show cache contents')
+
+    purge_parser = subparsers.add_parser('purge', help='Remove cache entries (default: old parser versions)')
+    purge_parser.add_argument('--all', action='store_true', help='Remove everything')
+    purge_parser.add_argument('--older-than', type=float, metavar='DAYS', help='Remove entries unused for DAYS')
+
+    args = parser.parse_args()
+
+    if pa is None:
+        print("pyarrow is required for the table cache (pip install pyarrow)")
+        sys.exit(1)
+
+    with TableCache(args.cache_dir, args.max_mb * 1024 * 1024) as cache:
+        if args.command == 'warm':
+            files = sorted(f for f in os.listdir(args.html_dir) if f.startswith('match_') and f.endswith('.html'))
+            start_time = time.time()
+            for i, filename in enumerate(files, 1):
+                try:
+                    cache.load_stat_tables(os.path.join(args.html_dir, filename), args.pattern)
+                except Exception as e:
+                    logger.error(f"Error caching {filename}: {e}")
+                if i % 100 == 0 or i == len(files):
+                    logger.info(f"Warmed {i}/{len(files)} files | parsed: {cache.stats['misses']} | "
+                                f"already cached: {cache.stats['hits']} | {time.time() - start_time:.1f}s")
+            print(f"Cached tables parsed: {cache.stats['misses']}, already cached: {cache.stats['hits']}, "
+                  f"evicted: {cache.stats['evicted']}")
+        elif args.command == 'inspect':
+            print(json.dumps(cache.inspect(), indent=2))
+        elif args.command == 'purge':
+            removed = cache.purge(everything=args.all, older_than_days=args.older_than)
+            print(f"Removed {removed} cache entries")
+
+
+if __name__ == "__main__":
+    main()
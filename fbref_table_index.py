@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+Byte-offset table index for FBref match files.
+
+Each match page is several megabytes, but an extractor usually needs only a few
+<table id="..."> regions. The index scans every match_*.html once, records
+table_id -> (start, end) byte ranges in a small SQLite database, and lets
+extractors mmap the file and parse just the slices they need.
+
+Entries are keyed by path and invalidated when a file's size or mtime changes,
+so a stale index is rebuilt transparently on the next lookup. One index (and
+its SQLite connection) is shared by every thread of a process; lookups and
+writes are serialized with a lock, file scans run outside it.
+
+Usage:
+    python fbref_table_index.py [html_dir] [--index PATH] [--rebuild]
+"""
+
+import os
+import re
+import sys
+import mmap
+import sqlite3
+import logging
+import argparse
+import threading
+from typing import Dict, List, Optional, Pattern, Tuple, Union
+
+from lxml import html as lxml_html
+
+from etl_metrics import get_metrics
+from fbref_tables import StatTable, read_stat_table
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# HTML files directory
+HTML_DIR = '/Users/thomasmcmillan/projects/nwsl_db_migration/html_files'
+
+# Index database; override with FBREF_TABLE_INDEX
+DEFAULT_INDEX_PATH = os.environ.get(
+    'FBREF_TABLE_INDEX',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fbref_table_index.sqlite')
+)
+
+TABLE_OPEN_RE = re.compile(rb'<table\b[^>]*?\bid="([^"]+)"[^>]*>', re.IGNORECASE)
+TABLE_TAG_RE = re.compile(rb'<(/?)table\b', re.IGNORECASE)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS indexed_file (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS table_range (
+    path TEXT NOT NULL,
+    table_id TEXT NOT NULL,
+    start_offset INTEGER NOT NULL,
+    end_offset INTEGER NOT NULL,
+    PRIMARY KEY (path, table_id)
+);
+"""
+
+
+def scan_table_ranges(data: Union[bytes, mmap.mmap]) -> Dict[str, Tuple[int, int]]:
+    """
+    Find the byte range of every <table id=...> in a page.
+
+    The end offset points just past the matching </table>, counting nested
+    tables so a table containing another table is captured whole.
+    """
+    ranges = {}
+    pos = 0
+    while True:
+        opening = TABLE_OPEN_RE.search(data, pos)
+        if not opening:
+            break
+        table_id = opening.group(1).decode('utf-8', 'replace')
+        depth = 1
+        cursor = opening.end()
+        end = None
+        while depth:
+            tag = TABLE_TAG_RE.search(data, cursor)
+            if not tag:
+                break
+            if tag.group(1):
+                depth -= 1
+                if depth == 0:
+                    end = data.find(b'>', tag.end()) + 1
+            else:
+                depth += 1
+            cursor = tag.end()
+        if end is None:
+            # Unclosed table: skip it rather than index a bogus range
+            pos = opening.end()
+            continue
+        ranges.setdefault(table_id, (opening.start(), end))
+        pos = opening.end()
+    return ranges
+
+
+def scan_file(filepath: str) -> Dict[str, Tuple[int, int]]:
+    """Scan one file for table ranges without reading it into memory."""
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return {}
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return scan_table_ranges(mm)
+
+
+class TableIndex:
+    """SQLite-backed map of match file -> table_id -> (start, end) byte range."""
+
+    def __init__(self, index_path: str = DEFAULT_INDEX_PATH):
+        self.index_path = index_path
+        # Shared across worker threads; every use of conn holds the lock
+        self.conn = sqlite3.connect(index_path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.RLock()
+        self.stats = {'hits': 0, 'rebuilt': 0}
+
+    def close(self):
+        """Close the index database."""
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _is_current(self, path: str, size: int, mtime: float) -> bool:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT size, mtime FROM indexed_file WHERE path = ?", (path,)
+            ).fetchone()
+        return row is not None and row[0] == size and row[1] == mtime
+
+    def index_file(self, filepath: str, force: bool = False) -> Dict[str, Tuple[int, int]]:
+        """Scan a file and store its ranges, unless the stored entry is still current."""
+        path = os.path.abspath(filepath)
+        st = os.stat(path)
+        if not force and self._is_current(path, st.st_size, st.st_mtime):
+            return self._stored_ranges(path)
+
+        ranges = scan_file(path)
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM table_range WHERE path = ?", (path,))
+            self.conn.executemany(
+                "INSERT INTO table_range (path, table_id, start_offset, end_offset) VALUES (?, ?, ?, ?)",
+                [(path, table_id, start, end) for table_id, (start, end) in ranges.items()]
+            )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO indexed_file (path, size, mtime) VALUES (?, ?, ?)",
+                (path, st.st_size, st.st_mtime)
+            )
+            self.stats['rebuilt'] += 1
+        return ranges
+
+    def _stored_ranges(self, path: str) -> Dict[str, Tuple[int, int]]:
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT table_id, start_offset, end_offset FROM table_range WHERE path = ?", (path,)
+            ).fetchall()
+            self.stats['hits'] += 1
+        return {table_id: (start, end) for table_id, start, end in rows}
+
+    def get_ranges(self, filepath: str) -> Dict[str, Tuple[int, int]]:
+        """Table ranges for a file, (re)scanning it if the index is missing or stale."""
+        return self.index_file(filepath)
+
+    def build(self, html_dir: str, force: bool = False) -> int:
+        """Index every match_*.html in a directory; returns the number of files scanned."""
+        files = sorted(f for f in os.listdir(html_dir) if f.startswith('match_') and f.endswith('.html'))
+        before = self.stats['rebuilt']
+        for i, filename in enumerate(files, 1):
+            try:
+                self.index_file(os.path.join(html_dir, filename), force=force)
+            except Exception as e:
+                logger.error(f"Error indexing {filename}: {e}")
+            if i % 500 == 0:
+                logger.info(f"Indexed {i}/{len(files)} files")
+        # Drop entries for files that no longer exist
+        with self.lock, self.conn:
+            for (path,) in self.conn.execute("SELECT path FROM indexed_file").fetchall():
+                if not os.path.exists(path):
+                    self.conn.execute("DELETE FROM table_range WHERE path = ?", (path,))
+                    self.conn.execute("DELETE FROM indexed_file WHERE path = ?", (path,))
+        return self.stats['rebuilt'] - before
+
+
+_default_index: Optional[TableIndex] = None
+_default_index_lock = threading.Lock()
+
+
+def get_default_index() -> TableIndex:
+    """Shared index instance for the current process (safe to use from any thread)."""
+    global _default_index
+    with _default_index_lock:
+        if _default_index is None:
+            _default_index = TableIndex()
+    return _default_index
+
+
+def read_table_slices(filepath: str, pattern: Union[str, Pattern],
+                      index: Optional[TableIndex] = None) -> List[Tuple[re.Match, bytes]]:
+    """Return (match, raw bytes) for each table whose id matches the pattern, in page order."""
+    if isinstance(pattern, str):
+        pattern = re.compile(pattern)
+    index = index or get_default_index()
+    ranges = index.get_ranges(filepath)
+
+    wanted = []
+    for table_id, (start, end) in ranges.items():
+        match = pattern.search(table_id)
+        if match:
+            wanted.append((start, end, match))
+    if not wanted:
+        return []
+
+    slices = []
+    metrics = get_metrics()
+    with metrics.phase('read'), open(filepath, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for start, end, match in sorted(wanted, key=lambda w: w[0]):
+                slices.append((match, mm[start:end]))
+                metrics.add('read_bytes', end - start)
+    return slices
+
+
+def load_stat_tables(filepath: str, pattern: Union[str, Pattern],
+                     index: Optional[TableIndex] = None) -> List[Tuple[re.Match, StatTable]]:
+    """Parse only the matching table slices of a file into StatTables."""
+    tables = []
+    metrics = get_metrics()
+    for match, raw in read_table_slices(filepath, pattern, index):
+        with metrics.phase('parse'):
+            element = lxml_html.fragment_fromstring(raw.decode('utf-8', 'replace'))
+        tables.append((match, read_stat_table(element)))
+    return tables
+
+
+def main():
+    """Build or refresh the table index for a directory of match files."""
+    parser = argparse.ArgumentParser(description='Build the byte-offset table index for FBref match files')
+    parser.add_argument('html_dir', nargs='?', default=HTML_DIR, help='Directory containing match_*.html files')
+    parser.add_argument('--index', default=DEFAULT_INDEX_PATH, help='SQLite index path')
+    parser.add_argument('--rebuild', action='store_true', help='Rescan every file even if unchanged')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.html_dir):
+        print(f"Directory not found: {args.html_dir}")
+        sys.exit(1)
+
+    with TableIndex(args.index) as index:
+        scanned = index.build(args.html_dir, force=args.rebuild)
+        total_files = index.conn.execute("SELECT COUNT(*) FROM indexed_file").fetchone()[0]
+        total_tables = index.conn.execute("SELECT COUNT(*) FROM table_range").fetchone()[0]
+
+    print(f"Scanned {scanned} new or changed files")
+    print(f"Index now covers {total_files} files and {total_tables} tables: {args.index}")
+
+
+if __name__ == "__main__":
+    main()
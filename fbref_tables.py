@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Shared FBref table reader.
+
+Parses match pages with lxml (C-backed) and turns a <table id=...> straight into
+columns keyed by the FBref data-stat attribute. Tables are read in place from the
+parsed tree; they are never serialized back to a string and re-parsed the way
+pd.read_html(str(table)) does.
+
+Tables found in a BeautifulSoup document are accepted too, so call sites that
+already hold a soup can switch over without changing how they load the page.
+"""
+
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Pattern, Tuple, Union
+
+from lxml import etree
+from lxml import html as lxml_html
+
+from etl_metrics import get_metrics
+
+# Bump whenever read_stat_table's output changes; cached tables
+# (fbref_table_cache) from other versions are then ignored
+PARSER_VERSION = 1
+
+# Values FBref uses for "no data"
+EMPTY_VALUES = {'', '—', '-', 'N/A'}
+
+# Row classes that are repeated headers or separators rather than data
+SKIP_ROW_CLASSES = {'thead', 'over_header', 'spacer', 'hidden'}
+
+INT_RE = re.compile(r'^-?\d+$')
+FLOAT_RE = re.compile(r'^-?\d*\.\d+$')
+TEAM_ID_RE = re.compile(r'([a-f0-9]{8})')
+
+metrics = get_metrics()
+
+
+def parse_html(source: Union[str, bytes]) -> etree._Element:
+    """Parse page content (str or bytes) into an lxml tree."""
+    with metrics.phase('parse'):
+        return lxml_html.fromstring(source)
+
+
+def read_html_file(filepath: str) -> str:
+    """Read an HTML file, counting the bytes read for the current stage."""
+    with metrics.phase('read'):
+        with open(filepath, 'r', encoding='utf-8') as f:
+            metrics.add('read_bytes', os.fstat(f.fileno()).st_size)
+            return f.read()
+
+
+def parse_html_file(filepath: str) -> etree._Element:
+    """Read and parse an HTML file into an lxml tree."""
+    return parse_html(read_html_file(filepath))
+
+
+def coerce_value(text: Optional[str]):
+    """Convert a cell's text to int/float, None for FBref's empty markers, else str."""
+    if text is None:
+        return None
+    value = text.strip()
+    if value in EMPTY_VALUES:
+        return None
+    numeric = value.replace(',', '')
+    if INT_RE.match(numeric):
+        return int(numeric)
+    if FLOAT_RE.match(numeric):
+        return float(numeric)
+    return value
+
+
+# ---------------------------------------------------------------------------
+# Node helpers: the same walk over lxml elements or BeautifulSoup tags
+# ---------------------------------------------------------------------------
+
+def _is_lxml(node) -> bool:
+    return isinstance(node, etree._Element)
+
+
+def _children(node, tags: Tuple[str, ...]) -> List:
+    if _is_lxml(node):
+        return [child for child in node if child.tag in tags]
+    return node.find_all(list(tags), recursive=False)
+
+
+def _text(node) -> str:
+    if _is_lxml(node):
+        return node.text_content().strip()
+    return node.get_text(strip=True)
+
+
+def _classes(node) -> List[str]:
+    value = node.get('class') or []
+    return value.split() if isinstance(value, str) else list(value)
+
+
+def _all_tables(root) -> List:
+    if _is_lxml(root):
+        return root.iter('table')
+    return root.find_all('table')
+
+
+def _section_rows(table, section: str) -> List:
+    rows = []
+    for part in _children(table, (section,)):
+        rows.extend(_children(part, ('tr',)))
+    return rows
+
+
+def _body_rows(table) -> List:
+    """Data rows from every tbody (or the table itself when there is no tbody)."""
+    rows = _section_rows(table, 'tbody')
+    if not rows and not _children(table, ('thead',)):
+        rows = _children(table, ('tr',))
+    return rows
+
+
+def find_table(root, table_id: str):
+    """Find a table by exact id, or None."""
+    if _is_lxml(root):
+        found = root.xpath('//table[@id=$table_id]', table_id=table_id)
+        return found[0] if found else None
+    return root.find('table', id=table_id)
+
+
+def iter_tables(root, pattern: Union[str, Pattern]) -> Iterator[Tuple[re.Match, object]]:
+    """Yield (match, table) for every table whose id matches the pattern."""
+    if isinstance(pattern, str):
+        pattern = re.compile(pattern)
+    for table in _all_tables(root):
+        table_id = table.get('id')
+        if not table_id:
+            continue
+        match = pattern.search(table_id)
+        if match:
+            yield match, table
+
+
+class StatTable:
+    """An FBref stats table read into columns keyed by data-stat."""
+
+    def __init__(self, table_id: str, caption: Optional[str], stats: List[str],
+                 headers: Dict[str, str], rows: List[Dict[str, str]],
+                 ids: List[Dict[str, str]]):
+        self.table_id = table_id
+        self.caption = caption
+        self.stats = stats          # data-stat keys in column order
+        self.headers = headers      # data-stat -> visible header label
+        self.rows = rows            # raw cell text per row, keyed by data-stat
+        self.ids = ids              # data-append-csv per row, keyed by data-stat
+        team_match = TEAM_ID_RE.search(table_id or '')
+        self.team_id = team_match.group(1) if team_match else None
+        self._columns = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __bool__(self) -> bool:
+        return bool(self.rows)
+
+    @property
+    def player_ids(self) -> List[Optional[str]]:
+        """FBref player hex ID for each row (from the player cell's data-append-csv)."""
+        return [row_ids.get('player') for row_ids in self.ids]
+
+    @property
+    def columns(self) -> Dict[str, List]:
+        """Typed values per data-stat, built once on first access."""
+        if self._columns is None:
+            self._columns = {
+                stat: [coerce_value(row.get(stat)) for row in self.rows]
+                for stat in self.stats
+            }
+        return self._columns
+
+    def column(self, stat: str, typed: bool = True) -> List:
+        """Values of one data-stat column; None where a row lacks the cell."""
+        if typed:
+            return self.columns.get(stat, [None] * len(self.rows))
+        return [row.get(stat) for row in self.rows]
+
+    def records(self, typed: bool = True) -> List[Dict]:
+        """One dict per row keyed by data-stat, with 'player_id' added."""
+        records = []
+        for i, row in enumerate(self.rows):
+            if typed:
+                record = {stat: coerce_value(value) for stat, value in row.items()}
+            else:
+                record = dict(row)
+            record['player_id'] = self.ids[i].get('player')
+            records.append(record)
+        return records
+
+    def to_dataframe(self):
+        """Typed columns as a pandas DataFrame, plus a player_id column."""
+        import pandas as pd
+        df = pd.DataFrame(self.columns, columns=self.stats)
+        df['player_id'] = self.player_ids
+        return df
+
+
+def read_stat_table(table, include_footer: bool = False) -> StatTable:
+    """
+    Read a <table> element into a StatTable.
+
+    Cells are keyed by their data-stat attribute; repeated header rows and
+    spacer rows inside tbody are skipped. Footer (team total) rows are only
+    included when include_footer is set.
+    """
+    with metrics.phase('extract'):
+        return _read_stat_table(table, include_footer)
+
+
+def _read_stat_table(table, include_footer: bool) -> StatTable:
+    table_id = table.get('id') or ''
+
+    caption_nodes = _children(table, ('caption',))
+    caption = _text(caption_nodes[0]) if caption_nodes else None
+
+    headers: Dict[str, str] = {}
+    header_rows = _section_rows(table, 'thead')
+    if header_rows:
+        for cell in _children(header_rows[-1], ('th', 'td')):
+            stat = cell.get('data-stat')
+            if stat:
+                headers[stat] = _text(cell)
+
+    data_rows = _body_rows(table)
+    if include_footer:
+        data_rows = data_rows + _section_rows(table, 'tfoot')
+
+    stats: List[str] = list(headers.keys())
+    seen = set(stats)
+    rows: List[Dict[str, str]] = []
+    ids: List[Dict[str, str]] = []
+
+    for tr in data_rows:
+        if SKIP_ROW_CLASSES.intersection(_classes(tr)):
+            continue
+        row: Dict[str, str] = {}
+        row_ids: Dict[str, str] = {}
+        for cell in _children(tr, ('th', 'td')):
+            stat = cell.get('data-stat')
+            if not stat:
+                continue
+            row[stat] = _text(cell)
+            append_csv = cell.get('data-append-csv')
+            if append_csv:
+                row_ids[stat] = append_csv
+            if stat not in seen:
+                seen.add(stat)
+                stats.append(stat)
+        if row:
+            rows.append(row)
+            ids.append(row_ids)
+
+    return StatTable(table_id, caption, stats, headers, rows, ids)
+
+
+def load_stat_table(root, table_id: str, include_footer: bool = False) -> Optional[StatTable]:
+    """Find a table by id and read it, or None when the page doesn't have it."""
+    table = find_table(root, table_id)
+    if table is None:
+        return None
+    return read_stat_table(table, include_footer=include_footer)
+
+
+def read_text_grid(table) -> Tuple[List[str], List[Dict[str, str]]]:
+    """
+    Read a table without data-stat attributes as header labels and text rows.
+
+    Multi-row headers are flattened the way pandas does it ("Group_Label"), so
+    callers matching on header text keep working.
+    """
+    with metrics.phase('extract'):
+        return _read_text_grid(table)
+
+
+def _read_text_grid(table) -> Tuple[List[str], List[Dict[str, str]]]:
+    header_rows = _section_rows(table, 'thead')
+    grid: List[List[str]] = []
+    for tr in header_rows:
+        labels = []
+        for cell in _children(tr, ('th', 'td')):
+            span = int(cell.get('colspan') or 1)
+            labels.extend([_text(cell)] * span)
+        grid.append(labels)
+
+    body_rows = _body_rows(table)
+    if not grid and body_rows:
+        # No thead: treat the first row as the header
+        grid.append([_text(c) for c in _children(body_rows[0], ('th', 'td'))])
+        body_rows = body_rows[1:]
+
+    width = max((len(labels) for labels in grid), default=0)
+    columns = []
+    for i in range(width):
+        parts = [labels[i] for labels in grid if i < len(labels) and labels[i]]
+        # Drop repeated group labels ("Passing_Passing_Cmp" -> "Passing_Cmp")
+        deduped = [p for j, p in enumerate(parts) if j == 0 or p != parts[j - 1]]
+        columns.append('_'.join(deduped) or f'column_{i}')
+
+    rows = []
+    for tr in body_rows:
+        if SKIP_ROW_CLASSES.intersection(_classes(tr)):
+            continue
+        cells = [_text(c) for c in _children(tr, ('th', 'td'))]
+        if cells:
+            rows.append(dict(zip(columns, cells)))
+    return columns, rows
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Local snapshots of the reference mappings every extractor loads at startup.
+
+Scripts begin by pulling player, team_season, season and match_player
+mappings from Postgres. cached_mapping() keeps each loaded mapping in a
+binary file under mapping_snapshots/ together with a fingerprint of the
+tables it was built from, and on the next start only runs the fingerprint
+query: when it matches, the mapping is read from disk instead of reloaded.
+
+The fingerprint is one query over the source tables: row count plus
+max(updated_at) per table, or max(xmin) for tables without an updated_at
+column (the schema has none today). xmin is the inserting transaction of a
+row version, so any insert or update raises it and any delete changes the
+count. The fingerprint is taken before the mapping is loaded, so a change
+that lands in between makes the next start reload rather than trust stale
+data.
+
+Snapshots are pickles written atomically; each file starts with a small
+header (database, fingerprint) so a stale snapshot is rejected without
+reading the mapping. Set FBREF_MAPPING_SNAPSHOTS=0 to always load from the
+database.
+
+Usage:
+    players = player_mapping(conn)
+    team_names = cached_mapping(conn, 'team_names', ['team_season'], load_team_names)
+
+    python mapping_snapshot.py            # list snapshots
+    python mapping_snapshot.py --clear    # remove them
+"""
+
+import os
+import pickle
+import logging
+import argparse
+import tempfile
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from compact_ids import CompactPlayerMap
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Snapshot directory; override with FBREF_SNAPSHOT_DIR
+SNAPSHOT_DIR = os.environ.get(
+    'FBREF_SNAPSHOT_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mapping_snapshots')
+)
+SNAPSHOTS_ENABLED = os.environ.get('FBREF_MAPPING_SNAPSHOTS', '1') != '0'
+
+# Bump when the snapshot layout or a shared loader's output changes
+SNAPSHOT_FORMAT = 1
+
+
+def database_key(conn) -> str:
+    """host:port/dbname of a connection, so snapshots of different databases never mix."""
+    params = conn.get_dsn_parameters()
+    return f"{params.get('host')}:{params.get('port')}/{params.get('dbname')}"
+
+
+def table_fingerprint(conn, tables: List[str]) -> Dict[str, Tuple]:
+    """(row count, max(updated_at) or max(xmin)) per table, in one round trip."""
+    tables = sorted(set(tables))
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT table_name
+        FROM information_schema.columns
+        WHERE table_schema = current_schema() AND column_name = 'updated_at' AND table_name = ANY(%s)
+    """, (tables,))
+    stamped = {row[0] for row in cursor.fetchall()}
+    parts = []
+    for table in tables:
+        marker = 'max(updated_at)::text' if table in stamped else 'max(xmin::text::bigint)::text'
+        parts.append(f"SELECT '{table}', count(*), {marker} FROM {table}")
+    cursor.execute(' UNION ALL '.join(parts))
+    fingerprint = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+    cursor.close()
+    return fingerprint
+
+
+def snapshot_path(name: str, directory: str = SNAPSHOT_DIR) -> str:
+    return os.path.join(directory, f"{name}.pickle")
+
+
+def read_snapshot(path: str, header: Dict):
+    """The stored mapping when the file's header equals header, else None."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            if pickle.load(f) != header:
+                return None
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+        return None
+
+
+def write_snapshot(path: str, header: Dict, value):
+    """Write header and mapping to path atomically."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(header, f, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Could not write snapshot {path}: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def cached_mapping(conn, name: str, tables: List[str], loader: Callable,
+                   directory: str = SNAPSHOT_DIR):
+    """
+    loader(conn), served from the snapshot named name while tables are unchanged.
+
+    name must identify the loader's query: two loaders must never share one.
+    """
+    if not SNAPSHOTS_ENABLED:
+        return loader(conn)
+    header = {
+        'format': SNAPSHOT_FORMAT,
+        'database': database_key(conn),
+        'fingerprint': table_fingerprint(conn, tables),
+    }
+    path = snapshot_path(name, directory)
+    value = read_snapshot(path, header)
+    if value is not None:
+        logger.debug(f"Mapping {name} served from snapshot")
+        return value
+    value = loader(conn)
+    write_snapshot(path, header, value)
+    return value
+
+
+def load_player_mapping(conn) -> CompactPlayerMap:
+    """FBref player ID -> {'uuid', 'name'} for every player."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT player_id, id, player_name
+        FROM player
+        WHERE player_id IS NOT NULL
+    """)
+    mapping = CompactPlayerMap.from_rows(cursor.fetchall())
+    cursor.close()
+    return mapping
+
+
+def player_mapping(conn) -> CompactPlayerMap:
+    """The player mapping, from its snapshot when the player table is unchanged."""
+    return cached_mapping(conn, 'player_mapping', ['player'], load_player_mapping)
+
+
+def load_team_names(conn) -> Dict[str, str]:
+    """FBref team ID -> team name (team_name_season_1 of one of its seasons)."""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT DISTINCT team_id, team_name_season_1
+        FROM team_season
+        WHERE team_id IS NOT NULL
+    """)
+    mapping = {row[0]: row[1] for row in cursor.fetchall()}
+    cursor.close()
+    return mapping
+
+
+def team_names(conn) -> Dict[str, str]:
+    """The team name mapping, from its snapshot when team_season is unchanged."""
+    return cached_mapping(conn, 'team_names', ['team_season'], load_team_names)
+
+
+def list_snapshots(directory: str = SNAPSHOT_DIR) -> List[Tuple[str, Optional[Dict], int]]:
+    """(name, header, size in bytes) per snapshot file."""
+    if not os.path.isdir(directory):
+        return []
+    result = []
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.pickle'):
+            continue
+        path = os.path.join(directory, filename)
+        try:
+            with open(path, 'rb') as f:
+                header = pickle.load(f)
+        except Exception:
+            header = None
+        result.append((filename[:-len('.pickle')], header, os.path.getsize(path)))
+    return result
+
+
+def main():
+    """List or clear mapping snapshots."""
+    parser = argparse.ArgumentParser(description='Inspect local mapping snapshots')
+    parser.add_argument('--dir', default=SNAPSHOT_DIR, help='Snapshot directory')
+    parser.add_argument('--clear', action='store_true', help='Remove every snapshot')
+    args = parser.parse_args()
+
+    snapshots = list_snapshots(args.dir)
+    if args.clear:
+        for name, _, _ in snapshots:
+            os.remove(snapshot_path(name, args.dir))
+        print(f"Removed {len(snapshots)} snapshots from {args.dir}")
+        return
+    for name, header, size in snapshots:
+        if header is None:
+            print(f"{name:30} unreadable")
+            continue
+        tables = ', '.join(f"{table} ({count:,} rows)" for table, (count, _) in header['fingerprint'].items())
+        modified = datetime.fromtimestamp(os.path.getmtime(snapshot_path(name, args.dir)))
+        print(f"{name:30} {size / 1024:8.0f} KB  {modified:%Y-%m-%d %H:%M}  {header['database']}  {tables}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Persistent locator for FBref match files across every corpus root.
+
+Scripts used to find a match's HTML by probing hard-coded directories, globbing
+per match, or (worst case) listing a directory and reading every candidate file
+to check for the match ID. The locator indexes all configured roots once into a
+small SQLite database - match_id, match date, path, size, mtime and content
+hash per file - and answers lookups from an in-memory map.
+
+Refreshes are incremental: a file is only re-read when its size or mtime
+changes, so re-indexing an unchanged corpus costs one stat per file. When the
+same match appears under several roots the first configured root wins; copies
+whose content hash differs are reported by --duplicates.
+
+Usage:
+    python match_file_locator.py [--roots DIR ...] [--rebuild]
+    python match_file_locator.py --lookup MATCH_ID
+    python match_file_locator.py --duplicates
+"""
+
+import os
+import re
+import sys
+import mmap
+import sqlite3
+import logging
+import argparse
+from typing import Dict, List, Optional, Tuple
+
+from fbref_table_cache import file_sha256
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Corpus roots in priority order; override with FBREF_CORPUS_ROOTS (os.pathsep separated)
+DEFAULT_ROOTS = [
+    '/Users/thomasmcmillan/projects/nwsl_db_migration/html_files',
+    '/Users/thomasmcmillan/projects/nwsl_data_backup_data/notebooks/match_html_files'
+]
+CORPUS_ROOTS = [
+    root for root in os.environ.get('FBREF_CORPUS_ROOTS', os.pathsep.join(DEFAULT_ROOTS)).split(os.pathsep)
+    if root
+]
+
+# Locator database; override with FBREF_MATCH_LOCATOR
+DEFAULT_LOCATOR_PATH = os.environ.get(
+    'FBREF_MATCH_LOCATOR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'match_file_locator.sqlite')
+)
+
+FILENAME_ID_RE = re.compile(r'^(?:match_)?([a-f0-9]{8})\.html$')
+DATE_RE = re.compile(r'(\d{4}-\d{2}-\d{2})')
+# Canonical match link and the scorebox date link near the top of every match page
+CONTENT_ID_RE = re.compile(rb'/en/matches/([a-f0-9]{8})/')
+CONTENT_DATE_RE = re.compile(rb'/en/matches/(\d{4}-\d{2}-\d{2})')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS match_file (
+    path TEXT PRIMARY KEY,
+    root TEXT NOT NULL,
+    match_id TEXT,
+    match_date TEXT,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    sha256 TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_match_file_match_id ON match_file (match_id);
+CREATE INDEX IF NOT EXISTS idx_match_file_match_date ON match_file (match_date);
+"""
+
+
+def identify_match_file(filepath: str) -> Tuple[Optional[str], Optional[str]]:
+    """(match_id, match_date) for a file: from its name when possible, else from its content."""
+    filename = os.path.basename(filepath)
+    id_match = FILENAME_ID_RE.match(filename)
+    date_match = DATE_RE.search(filename)
+    match_id = id_match.group(1) if id_match else None
+    match_date = date_match.group(1) if date_match else None
+    if match_id and match_date:
+        return match_id, match_date
+
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return match_id, match_date
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if not match_id:
+                found = CONTENT_ID_RE.search(mm)
+                match_id = found.group(1).decode('ascii') if found else None
+            if not match_date:
+                found = CONTENT_DATE_RE.search(mm)
+                match_date = found.group(1).decode('ascii') if found else None
+    return match_id, match_date
+
+
+class MatchFileLocator:
+    """SQLite-backed map of match_id -> HTML path across all corpus roots."""
+
+    def __init__(self, roots: Optional[List[str]] = None, locator_path: str = DEFAULT_LOCATOR_PATH):
+        self.roots = [os.path.abspath(root) for root in (roots or CORPUS_ROOTS)]
+        self.locator_path = locator_path
+        self.conn = sqlite3.connect(locator_path)
+        self.conn.executescript(SCHEMA)
+        self.stats = {'scanned': 0, 'unchanged': 0, 'removed': 0}
+        self._by_match: Optional[Dict[str, str]] = None
+        self._by_date: Optional[Dict[str, List[str]]] = None
+
+    def close(self):
+        """Close the locator database."""
+        if self.conn:
+            self.conn.close()
+            self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def refresh(self, force: bool = False) -> int:
+        """Index new or changed files under every root; returns the number of files read."""
+        stored = {
+            path: (size, mtime)
+            for path, size, mtime in self.conn.execute(
+                "SELECT path, size, mtime FROM match_file WHERE root IN (%s)" % ','.join('?' * len(self.roots)),
+                self.roots
+            ).fetchall()
+        }
+        seen = set()
+        scanned_before = self.stats['scanned']
+
+        for root in self.roots:
+            if not os.path.isdir(root):
+                logger.debug(f"Corpus root not found: {root}")
+                continue
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if not entry.name.endswith('.html') or not entry.is_file():
+                        continue
+                    st = entry.stat()
+                    seen.add(entry.path)
+                    if not force and stored.get(entry.path) == (st.st_size, st.st_mtime):
+                        self.stats['unchanged'] += 1
+                        continue
+                    try:
+                        self._index_file(root, entry.path, st)
+                    except Exception as e:
+                        logger.error(f"Error indexing {entry.path}: {e}")
+
+        # Drop entries for files that no longer exist
+        gone = [path for path in stored if path not in seen]
+        if gone:
+            with self.conn:
+                self.conn.executemany("DELETE FROM match_file WHERE path = ?", [(path,) for path in gone])
+            self.stats['removed'] += len(gone)
+
+        self._by_match = None
+        self._by_date = None
+        return self.stats['scanned'] - scanned_before
+
+    def _index_file(self, root: str, path: str, st: os.stat_result):
+        match_id, match_date = identify_match_file(path)
+        with self.conn:
+            self.conn.execute(
+                """INSERT OR REPLACE INTO match_file (path, root, match_id, match_date, size, mtime, sha256)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (path, root, match_id, match_date, st.st_size, st.st_mtime, file_sha256(path))
+            )
+        self.stats['scanned'] += 1
+
+    def _rows(self) -> List[Tuple[str, str, str, Optional[str]]]:
+        """(path, root, match_id, match_date) for indexed files, best copy of each match first."""
+        rank = {root: i for i, root in enumerate(self.roots)}
+        rows = self.conn.execute(
+            "SELECT path, root, match_id, match_date FROM match_file WHERE root IN (%s)"
+            % ','.join('?' * len(self.roots)),
+            self.roots
+        ).fetchall()
+        # Root priority first; within a root prefer the canonical match_{id}.html name
+        return sorted(rows, key=lambda r: (rank[r[1]], not os.path.basename(r[0]).startswith('match_'), r[0]))
+
+    def _load(self):
+        by_match: Dict[str, str] = {}
+        by_date: Dict[str, List[str]] = {}
+        for path, _, match_id, match_date in self._rows():
+            if match_id and match_id not in by_match:
+                by_match[match_id] = path
+                if match_date:
+                    by_date.setdefault(match_date, []).append(path)
+            elif not match_id and match_date:
+                by_date.setdefault(match_date, []).append(path)
+        self._by_match = by_match
+        self._by_date = by_date
+
+    def find(self, match_id: str) -> Optional[str]:
+        """Path of the preferred copy of a match file, or None."""
+        if self._by_match is None:
+            self._load()
+        return self._by_match.get(match_id)
+
+    def find_by_date(self, match_date) -> List[str]:
+        """Paths of (deduplicated) match files played on a date (date or 'YYYY-MM-DD')."""
+        if self._by_date is None:
+            self._load()
+        key = match_date.strftime('%Y-%m-%d') if hasattr(match_date, 'strftime') else str(match_date)[:10]
+        return list(self._by_date.get(key, []))
+
+    def match_files(self) -> Dict[str, str]:
+        """match_id -> preferred path for every indexed match."""
+        if self._by_match is None:
+            self._load()
+        return dict(self._by_match)
+
+    def matches(self, since: Optional[str] = None, until: Optional[str] = None) -> List[Tuple[str, Optional[str], str]]:
+        """(match_id, match_date, path) per indexed match, by date; since/until ('YYYY-MM-DD') are inclusive."""
+        rows = self.conn.execute(
+            "SELECT path, match_id, match_date FROM match_file WHERE match_id IS NOT NULL"
+        ).fetchall()
+        dates = {match_id: match_date for _, match_id, match_date in rows if match_date}
+        result = []
+        for match_id, path in self.match_files().items():
+            match_date = dates.get(match_id)
+            if (since or until) and not match_date:
+                continue
+            if since and match_date < since:
+                continue
+            if until and match_date > until:
+                continue
+            result.append((match_id, match_date, path))
+        return sorted(result, key=lambda r: (r[1] or '', r[0]))
+
+    def file_hashes(self) -> Dict[str, str]:
+        """path -> content sha256 for every indexed file."""
+        return dict(self.conn.execute("SELECT path, sha256 FROM match_file").fetchall())
+
+    def duplicates(self) -> Dict[str, List[Dict]]:
+        """Matches present more than once, with each copy's path and whether its content differs."""
+        copies: Dict[str, List[Dict]] = {}
+        hashes = dict(self.conn.execute("SELECT path, sha256 FROM match_file").fetchall())
+        for path, root, match_id, _ in self._rows():
+            if match_id:
+                copies.setdefault(match_id, []).append({'path': path, 'root': root, 'sha256': hashes[path]})
+        result = {}
+        for match_id, files in copies.items():
+            if len(files) > 1:
+                for copy in files:
+                    copy['differs'] = copy['sha256'] != files[0]['sha256']
+                result[match_id] = files
+        return result
+
+
+_locators: Dict[Tuple[str, ...], MatchFileLocator] = {}
+
+
+def get_locator(roots: Optional[List[str]] = None) -> MatchFileLocator:
+    """Shared locator for a set of roots, refreshed once per process on first use."""
+    key = tuple(os.path.abspath(root) for root in (roots or CORPUS_ROOTS))
+    if key not in _locators:
+        locator = MatchFileLocator(list(key))
+        locator.refresh()
+        _locators[key] = locator
+    return _locators[key]
+
+
+def find_match_file(match_id: str, roots: Optional[List[str]] = None) -> Optional[str]:
+    """Path of a match's HTML file across the corpus roots, or None."""
+    return get_locator(roots).find(match_id)
+
+
+def main():
+    """Build, refresh or query the match file locator."""
+    parser = argparse.ArgumentParser(description='Index FBref match files across corpus roots')
+    parser.add_argument('--roots', nargs='+', default=CORPUS_ROOTS, help='Corpus roots in priority order')
+    parser.add_argument('--locator', default=DEFAULT_LOCATOR_PATH, help='SQLite locator path')
+    parser.add_argument('--rebuild', action='store_true', help='Re-read every file even if unchanged')
+    parser.add_argument('--lookup', metavar='MATCH_ID', help='Print the path for a match ID')
+    parser.add_argument('--duplicates', action='store_true', help='List matches present in several roots')
+    args = parser.parse_args()
+
+    with MatchFileLocator(args.roots, args.locator) as locator:
+        scanned = locator.refresh(force=args.rebuild)
+
+        if args.lookup:
+            path = locator.find(args.lookup)
+            if not path:
+                print(f"No file found for match {args.lookup}")
+                sys.exit(1)
+            print(path)
+            return
+
+        if args.duplicates:
+            for match_id, copies in sorted(locator.duplicates().items()):
+                print(match_id)
+                for copy in copies:
+                    print(f"  {'DIFFERS ' if copy['differs'] else ''}{copy['path']}")
+            return
+
+        print(f"Read {scanned} new or changed files ({locator.stats['unchanged']} unchanged, "
+              f"{locator.stats['removed']} removed)")
+        print(f"Locator covers {len(locator.match_files())} matches across {len(locator.roots)} roots: "
+              f"{args.locator}")
+
+
+if __name__ == "__main__":
+    main()
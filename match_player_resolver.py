@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Bulk (match_id, player_id) -> match_player.id resolution.
+
+Extractors used to look up match_player one player at a time (and the
+possession extractor created missing rows one INSERT and commit at a time).
+The resolver fetches every match_player row for a batch of matches in one
+query, creates any missing rows with one multi-row INSERT ... RETURNING, and
+keeps the results in memory for the rest of the run.
+
+Usage:
+    resolver = MatchPlayerResolver(conn)
+    ids = resolver.resolve_match(match_id, player_ids)      # {player_id: match_player_id}
+    ids = resolver.resolve_or_create(rows)                  # {(match_id, player_id): match_player_id}
+"""
+
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from compact_ids import CompactIdMap
+from mapping_snapshot import cached_mapping
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Columns written when a missing match_player row is created
+CREATE_COLUMNS = ['match_id', 'player_id', 'team_season_id', 'match_date', 'season_id']
+
+
+def load_match_player_ids(conn) -> CompactIdMap:
+    """(match_id, player_id) -> match_player.id for every match_player row."""
+    cursor = conn.cursor()
+    cursor.execute("SELECT match_id, player_id, id FROM match_player")
+    ids = CompactIdMap.from_rows(cursor.fetchall(), pairs=True)
+    cursor.close()
+    return ids
+
+
+class MatchPlayerResolver:
+    """In-memory map of (match_id, player_id) -> match_player.id, filled a batch of matches at a time."""
+
+    def __init__(self, conn):
+        self.conn = conn
+        # (match_id, player_id) -> match_player.id, packed (see compact_ids)
+        self.ids = CompactIdMap(pairs=True)
+        self.loaded_matches = set()
+        self.all_loaded = False
+        self.stats = {'queries': 0, 'loaded': 0, 'created': 0}
+
+    def load_all(self) -> int:
+        """
+        Load every match_player row (from the local snapshot when the table is
+        unchanged), replacing the cache; returns the number of rows loaded.
+        """
+        self.ids = cached_mapping(self.conn, 'match_player_ids', ['match_player'], load_match_player_ids)
+        self.all_loaded = True
+        self.stats['queries'] += 1
+        self.stats['loaded'] += len(self.ids)
+        return len(self.ids)
+
+    def prefetch(self, match_ids: Iterable[str]) -> int:
+        """Load match_player rows for matches not seen yet, in one query; returns rows loaded."""
+        if self.all_loaded:
+            return 0
+        wanted = sorted({m for m in match_ids if m and m not in self.loaded_matches})
+        if not wanted:
+            return 0
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            SELECT match_id, player_id, id
+            FROM match_player
+            WHERE match_id = ANY(%s)
+        """, (wanted,))
+        rows = cursor.fetchall()
+        cursor.close()
+        self._remember(rows)
+        self.loaded_matches.update(wanted)
+        self.stats['queries'] += 1
+        return len(rows)
+
+    def _remember(self, rows):
+        # Plain and RealDictCursor rows
+        self.ids.load(
+            (row['match_id'], row['player_id'], row['id']) if isinstance(row, dict) else row
+            for row in rows
+        )
+        self.stats['loaded'] += len(rows)
+
+    def get(self, match_id: str, player_id: str) -> Optional[str]:
+        """match_player.id for one pair (fetching the match's rows on first use), or None."""
+        self.prefetch([match_id])
+        return self.ids.get((match_id, player_id))
+
+    def resolve(self, pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], str]:
+        """match_player.id for every known (match_id, player_id) pair; unknown pairs are omitted."""
+        pairs = list(pairs)
+        self.prefetch(match_id for match_id, _ in pairs)
+        return {pair: self.ids[pair] for pair in pairs if pair in self.ids}
+
+    def resolve_match(self, match_id: str, player_ids: Iterable[str]) -> Dict[str, str]:
+        """player_id -> match_player.id for the known players of one match."""
+        self.prefetch([match_id])
+        return {
+            player_id: self.ids[(match_id, player_id)]
+            for player_id in player_ids
+            if (match_id, player_id) in self.ids
+        }
+
+    def resolve_or_create(self, rows: List[Dict]) -> Dict[Tuple[str, str], str]:
+        """
+        match_player.id for every row, creating missing match_player rows.
+
+        Each row needs match_id and player_id, plus team_season_id, match_date
+        and season_id for the rows that have to be created (with 0 minutes, not
+        started). Creation is one multi-row INSERT ... RETURNING; the caller
+        commits.
+        """
+        resolved = self.resolve((row['match_id'], row['player_id']) for row in rows)
+
+        missing = {}
+        for row in rows:
+            pair = (row['match_id'], row['player_id'])
+            if pair not in resolved and pair not in missing:
+                missing[pair] = row
+        if missing:
+            cursor = self.conn.cursor()
+            created = execute_values(cursor, f"""
+                INSERT INTO match_player ({', '.join(CREATE_COLUMNS)}, minutes_played, started)
+                VALUES %s
+                ON CONFLICT (match_id, player_id) DO UPDATE SET match_id = EXCLUDED.match_id
+                RETURNING match_id, player_id, id
+            """, [tuple(row.get(col) for col in CREATE_COLUMNS) for row in missing.values()],
+                template=f"({', '.join(['%s'] * len(CREATE_COLUMNS))}, 0, false)",
+                fetch=True)
+            cursor.close()
+            self._remember(created)
+            self.stats['queries'] += 1
+            self.stats['created'] += len(created)
+            logger.info(f"Created {len(created)} match_player records")
+            for pair in missing:
+                if pair in self.ids:
+                    resolved[pair] = self.ids[pair]
+
+        return resolved
@@ -0,0 +1,42 @@
+-- =====================================================
+-- STATS FINGERPRINT COLUMNS
+-- Lets bulk_loader.py skip rows whose extracted stats are unchanged
+-- =====================================================
+
+-- Each keyed stat table gets a stats_fingerprint column holding a hash of
+-- the stat values last written to the row. The loader only updates rows
+-- whose fingerprint differs from the incoming one, so re-running an
+-- extractor over an unchanged corpus does (almost) no writes.
+-- Existing rows start with NULL and are fingerprinted on their next load.
+
+BEGIN;
+
+ALTER TABLE match_player_passing
+    ADD COLUMN IF NOT EXISTS stats_fingerprint text;
+
+ALTER TABLE match_player_pass_types
+    ADD COLUMN IF NOT EXISTS stats_fingerprint text;
+
+ALTER TABLE match_player_possession
+    ADD COLUMN IF NOT EXISTS stats_fingerprint text;
+
+ALTER TABLE match_player_misc
+    ADD COLUMN IF NOT EXISTS stats_fingerprint text;
+
+ALTER TABLE match_player_defensive_actions
+    ADD COLUMN IF NOT EXISTS stats_fingerprint text;
+
+ALTER TABLE match_goalkeeper_performance
+    ADD COLUMN IF NOT EXISTS stats_fingerprint text;
+
+COMMIT;
+
+-- =====================================================
+-- VERIFICATION
+-- =====================================================
+
+SELECT table_name
+FROM information_schema.columns
+WHERE table_schema = 'public'
+    AND column_name = 'stats_fingerprint'
+ORDER BY table_name;
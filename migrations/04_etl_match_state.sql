@@ -0,0 +1,42 @@
+-- =====================================================
+-- ETL MATCH STATE
+-- Which extractor version has processed which match file version
+-- =====================================================
+
+-- One row per (match, family, file content hash, extractor version). A row
+-- with status 'done' means that family's data for the match is loaded from
+-- exactly that file content by exactly that extractor version, so an
+-- incremental run can skip it. A changed file (new hash) or a bumped
+-- extractor version (etl_state.EXTRACTOR_VERSIONS) has no 'done' row and
+-- is processed again.
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS etl_match_state (
+    match_id TEXT NOT NULL,
+    family TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    extractor_version TEXT NOT NULL,
+    status TEXT NOT NULL CHECK (status IN ('done', 'failed')),
+    records INTEGER,
+    duration_ms INTEGER,
+    error TEXT,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP NOT NULL DEFAULT NOW(),
+    attempts INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (match_id, family, file_hash, extractor_version)
+);
+
+CREATE INDEX IF NOT EXISTS idx_etl_match_state_family_status
+    ON etl_match_state(family, extractor_version, status);
+
+COMMIT;
+
+-- =====================================================
+-- VERIFICATION
+-- =====================================================
+
+SELECT family, extractor_version, status, COUNT(*) AS matches
+FROM etl_match_state
+GROUP BY family, extractor_version, status
+ORDER BY family, extractor_version, status;
@@ -0,0 +1,394 @@
+#!/usr/bin/env python3
+"""
+Unified runner for the FBref extraction pipeline (the nwsl-etl entry point).
+
+The extractors used to be run one script at a time in an order that lived in
+people's heads. This runner knows the dependencies between them:
+
+    possession      creates any missing match_player rows
+    passing, passing_types, misc, defense
+                    need match_player rows, so run after possession
+    lineups, team_stats, keeper_stats, shots_all
+                    independent
+    validate        validate_data_consistency, after shots_all and team_stats
+
+Requested families pull in their dependencies (unless --only). Per-file stages
+are grouped into dependency levels and run in one pass over the corpus: each
+match file is read and parsed once (fbref_match_engine.MatchPage), then every
+level runs in order with the families inside a level running concurrently,
+while the next file is parsed in the background. Dependencies hold per match,
+so possession for a match has committed before passing reads its
+match_player rows. Post-corpus stages (validate) run after all handlers flush.
+That is also why the pipeline commits every match (FBREF_COMMIT_EVERY is
+ignored): a later level reads rows over another connection, and the state
+row for a match is written once its stages are done.
+
+Runs are incremental: etl_state records which extractor version loaded each
+match from which file content, and a file is only parsed for the stages that
+still need it (--force redoes everything).
+
+Connections come from one pool. Families in different levels never run at the
+same time, so a level's handlers reuse the connections of the previous level:
+the run needs as many connections as its widest level (plus one for state).
+
+Per-stage timings (read, parse, extract, transform, db), round-trips and rows
+are written to metrics/pipeline.json and metrics/pipeline.prom (etl_metrics).
+
+Usage:
+    python nwsl_etl.py run --families passing,possession,shots --since 2024-01-01
+    python nwsl_etl.py run                         # every family, full corpus
+    python nwsl_etl.py plan --families passing     # show the stage order only
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Set
+
+from db_session import DB_CONFIG, create_pool, set_commit_every
+from etl_metrics import get_metrics, start_run
+from etl_profile import run_profiled
+from fbref_match_engine import (HANDLER_BUILDERS, FamilyHandler, MatchPage, extract_match_id, flush_handler,
+                                record_done)
+from match_file_locator import get_locator
+from etl_state import EtlState
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Stage -> stages that must have run first (per match for file stages)
+DEPENDENCIES = {
+    'lineups': [],
+    'team_stats': [],
+    'keeper_stats': [],
+    'shots_all': [],
+    'possession': [],
+    'passing': ['possession'],
+    'passing_types': ['possession'],
+    'misc': ['possession'],
+    'defense': ['possession'],
+    'validate': ['shots_all', 'team_stats'],
+}
+
+# Stages that run once after the corpus pass instead of per file
+POST_CORPUS_STAGES = {'validate'}
+
+ALIASES = {
+    'shots': 'shots_all',
+    'keeper': 'keeper_stats',
+    'goalkeeper': 'keeper_stats',
+    'pass_types': 'passing_types',
+    'team': 'team_stats',
+    'defensive_actions': 'defense',
+}
+
+ALL_STAGES = list(DEPENDENCIES.keys())
+
+metrics = get_metrics()
+
+
+def resolve_stages(requested: List[str], with_dependencies: bool = True) -> Set[str]:
+    """Canonical stage names for a request, plus their dependencies unless disabled."""
+    stages = set()
+    for name in requested:
+        stage = ALIASES.get(name, name)
+        if stage not in DEPENDENCIES:
+            raise ValueError(f"Unknown family '{name}'. Choose from: {', '.join(ALL_STAGES)}")
+        stages.add(stage)
+    if with_dependencies:
+        pending = list(stages)
+        while pending:
+            for dep in DEPENDENCIES[pending.pop()]:
+                if dep not in stages:
+                    stages.add(dep)
+                    pending.append(dep)
+    return stages
+
+
+def dependency_levels(stages: Set[str]) -> List[List[str]]:
+    """Group stages into levels; every stage's (selected) dependencies sit in earlier levels."""
+    remaining = {stage: {dep for dep in DEPENDENCIES[stage] if dep in stages} for stage in stages}
+    levels = []
+    while remaining:
+        ready = sorted(stage for stage, deps in remaining.items() if not deps)
+        if not ready:
+            raise ValueError(f"Dependency cycle between: {', '.join(sorted(remaining))}")
+        levels.append(ready)
+        for stage in ready:
+            del remaining[stage]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return levels
+
+
+def upstream(stage: str) -> Set[str]:
+    """All transitive dependencies of a stage."""
+    found = set()
+    pending = list(DEPENDENCIES[stage])
+    while pending:
+        dep = pending.pop()
+        if dep not in found:
+            found.add(dep)
+            pending.extend(DEPENDENCIES[dep])
+    return found
+
+
+def select_files(roots: Optional[List[str]] = None, since: Optional[str] = None,
+                 until: Optional[str] = None, limit: Optional[int] = None) -> List[str]:
+    """Match files from the corpus locator in date order, optionally limited to a date range."""
+    files = []
+    skipped = 0
+    for match_id, _, path in get_locator(roots).matches(since, until):
+        # The extractors read the match ID from the canonical match_{id}.html name
+        if extract_match_id(path) != match_id:
+            skipped += 1
+            continue
+        files.append(path)
+    if skipped:
+        logger.warning(f"Skipping {skipped} matches without a match_{{id}}.html copy")
+    return files[:limit] if limit else files
+
+
+class PipelineRunner:
+    """Run the selected stages over the corpus, one parse per file, levels in dependency order."""
+
+    def __init__(self, stages: Set[str], db_config: Dict = DB_CONFIG, force: bool = False):
+        self.levels = dependency_levels(stages)
+        self.file_levels = [[s for s in level if s not in POST_CORPUS_STAGES] for level in self.levels]
+        self.file_levels = [level for level in self.file_levels if level]
+        self.post_stages = [s for level in self.levels for s in level if s in POST_CORPUS_STAGES]
+        self.upstream = {stage: upstream(stage) for stage in stages}
+        # Later levels read earlier levels' rows over other connections
+        set_commit_every(1)
+
+        self.width = max([len(level) for level in self.file_levels] + [1])
+        # One connection per concurrent stage, plus one for the ETL state
+        self.pool = create_pool(self.width + 1, db_config)
+        self.force = force
+        self.state = None
+        self.todo: Dict[str, Set[str]] = {}
+        self.conns = []
+        self.handlers: Dict[str, FamilyHandler] = {}
+        self.handler_conns = {}
+        self.stats = {
+            'stages': [list(level) for level in self.levels],
+            'connections': self.width,
+            'files_processed': 0,
+            'files_up_to_date': 0,
+            'records_by_stage': {},
+            'seconds_by_stage': {},
+            'skipped_by_stage': {},
+            'errors': []
+        }
+
+    def build(self):
+        """Create every file stage's handler on the level's shared connections."""
+        self.conns = [self.pool.getconn() for _ in range(self.width)]
+        for level in self.file_levels:
+            for slot, stage in enumerate(level):
+                started = time.time()
+                self.handlers[stage] = HANDLER_BUILDERS[stage](conn=self.conns[slot])
+                self.handler_conns[stage] = self.conns[slot]
+                self.stats['records_by_stage'][stage] = 0
+                self.stats['seconds_by_stage'][stage] = time.time() - started
+                self.stats['skipped_by_stage'][stage] = 0
+        logger.info(f"Pipeline levels: {' -> '.join('[' + ', '.join(level) + ']' for level in self.levels)} "
+                    f"on {self.width} pooled connections")
+
+    def load_page(self, filepath: str) -> MatchPage:
+        """Read and parse a file ahead of its stages."""
+        page = MatchPage(filepath)
+        page.has_family('passing')  # builds the lxml tree and the table index
+        return page
+
+    def run_stage(self, stage: str, page: MatchPage) -> int:
+        handler = self.handlers[stage]
+        started = time.time()
+        try:
+            with metrics.stage(stage):
+                count = handler.process(page) or 0
+            metrics.add('rows_written', count, stage)
+            self.stats['records_by_stage'][stage] += count
+            record_done(self.state, handler, page, count, time.time() - started)
+            return count
+        except Exception as e:
+            logger.error(f"{stage} failed for {os.path.basename(page.filepath)}: {e}")
+            self.stats['errors'].append({'file': os.path.basename(page.filepath), 'stage': stage, 'error': str(e)})
+            # The connection is shared with other levels: never leave it in an aborted transaction
+            self.handler_conns[stage].rollback()
+            self.state.record(page.match_id, stage, page.filepath, 'failed', seconds=time.time() - started,
+                              error=str(e))
+            raise
+        finally:
+            self.stats['seconds_by_stage'][stage] += time.time() - started
+
+    def process_page(self, page: MatchPage, executor: ThreadPoolExecutor):
+        """Run the page's outstanding stages level by level; stages whose upstream failed are skipped."""
+        todo = self.todo.get(page.filepath, set())
+        failed = set()
+        for level in self.file_levels:
+            runnable = []
+            for stage in level:
+                if stage not in todo:
+                    continue
+                if self.upstream[stage] & failed:
+                    self.stats['skipped_by_stage'][stage] += 1
+                    failed.add(stage)
+                else:
+                    runnable.append(stage)
+            futures = {stage: executor.submit(self.run_stage, stage, page) for stage in runnable}
+            for stage, future in futures.items():
+                if future.exception() is not None:
+                    failed.add(stage)
+        self.stats['files_processed'] += 1
+
+    def run(self, files: List[str]) -> Dict:
+        """Process the files, flush file stages in level order, then run post-corpus stages."""
+        start_time = time.time()
+        try:
+            self.state = EtlState(self.pool.getconn())
+            file_stages = [stage for level in self.file_levels for stage in level]
+            self.todo = self.state.plan([(extract_match_id(path), path) for path in files], file_stages,
+                                        force=self.force)
+            self.stats['files_up_to_date'] = len(files) - len(self.todo)
+            files = [path for path in files if path in self.todo]
+            total = len(files)
+            logger.info(f"Pipeline run over {total} files "
+                        f"({self.stats['files_up_to_date']} already up to date)")
+
+            self.build()
+            with ThreadPoolExecutor(max_workers=self.width, thread_name_prefix='etl-stage') as executor, \
+                    ThreadPoolExecutor(max_workers=1, thread_name_prefix='etl-parse') as reader:
+                next_page = reader.submit(self.load_page, files[0]) if files else None
+                for i in range(total):
+                    try:
+                        page = next_page.result()
+                    except Exception as e:
+                        logger.error(f"Error parsing {files[i]}: {e}")
+                        self.stats['errors'].append({'file': os.path.basename(files[i]), 'error': str(e)})
+                        page = None
+                    # Parse the next file while this one's stages run
+                    next_page = reader.submit(self.load_page, files[i + 1]) if i + 1 < total else None
+                    if page is not None:
+                        try:
+                            self.process_page(page, executor)
+                        finally:
+                            page.release()
+                    if (i + 1) % 50 == 0 or i + 1 == total:
+                        elapsed = time.time() - start_time
+                        rate = (i + 1) / elapsed if elapsed > 0 else 0
+                        logger.info(f"Progress: {i + 1}/{total} files | {rate:.1f} files/sec | "
+                                    f"records: {self.stats['records_by_stage']}")
+
+            for level in self.file_levels:
+                for stage in level:
+                    flush_handler(self.state, self.handlers[stage])
+
+            for stage in self.post_stages:
+                with metrics.stage(stage, files=0):
+                    self.run_post_stage(stage)
+        except BaseException:
+            # Outcomes not written yet may describe rows that never committed
+            if self.state is not None:
+                self.state.discard()
+            raise
+        finally:
+            self.close()
+        self.stats['elapsed_seconds'] = time.time() - start_time
+        return self.stats
+
+    def run_post_stage(self, stage: str):
+        """Run a stage that needs the whole corpus loaded first."""
+        started = time.time()
+        if stage == 'validate':
+            from validate_data_consistency import DataConsistencyValidator
+            ok = DataConsistencyValidator(DB_CONFIG).run_all_checks(self.conns[0] if self.conns else None)
+            if not ok:
+                self.stats['errors'].append({'stage': stage, 'error': 'validation failed'})
+        self.stats['seconds_by_stage'][stage] = time.time() - started
+
+    def close(self):
+        """Write outstanding state, close handlers and return the shared connections to the pool."""
+        if self.state is not None:
+            try:
+                self.state.flush()
+            except Exception as e:
+                logger.warning(f"Error writing ETL state: {e}")
+            self.pool.putconn(self.state.conn)
+            self.state = None
+        for stage, handler in self.handlers.items():
+            if handler.close:
+                try:
+                    handler.close()
+                except Exception as e:
+                    logger.warning(f"Error closing {stage} handler: {e}")
+        for conn in self.conns:
+            self.pool.putconn(conn)
+        self.conns = []
+        self.pool.closeall()
+
+
+def main():
+    """Main execution function."""
+    parser = argparse.ArgumentParser(description='Run the NWSL FBref extraction pipeline')
+    parser.add_argument('command', choices=['run', 'plan'], help='run the pipeline, or print its stage order')
+    parser.add_argument('--families', default=','.join(ALL_STAGES),
+                        help=f"Comma-separated stages (default: all of {', '.join(ALL_STAGES)})")
+    parser.add_argument('--only', action='store_true', help='Do not add the dependencies of the requested stages')
+    parser.add_argument('--since', help='Only matches played on or after this date (YYYY-MM-DD)')
+    parser.add_argument('--until', help='Only matches played on or before this date (YYYY-MM-DD)')
+    parser.add_argument('--roots', nargs='+', help='Corpus roots in priority order (default: locator roots)')
+    parser.add_argument('--limit', type=int, help='Only process the first N files')
+    parser.add_argument('--force', action='store_true', help='Ignore the ETL state and redo every match')
+    args = parser.parse_args()
+
+    requested = [f.strip() for f in args.families.split(',') if f.strip()]
+    try:
+        stages = resolve_stages(requested, with_dependencies=not args.only)
+        levels = dependency_levels(stages)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.command == 'plan':
+        for i, level in enumerate(levels, 1):
+            print(f"Level {i}: {', '.join(level)}")
+        return
+
+    files = select_files(args.roots, args.since, args.until, args.limit)
+    start_run('pipeline')
+    runner = PipelineRunner(stages, force=args.force)
+    stats = runner.run(files)
+    stats['metrics'] = metrics.write()
+
+    print("\n" + "=" * 60)
+    print("PIPELINE SUMMARY")
+    print("=" * 60)
+    print(f"Stages: {' -> '.join(', '.join(level) for level in stats['stages'])}")
+    print(f"Files processed: {stats['files_processed']} in {stats['elapsed_seconds']:.1f}s "
+          f"on {stats['connections']} connections ({stats['files_up_to_date']} already up to date)")
+    for stage, count in stats['records_by_stage'].items():
+        skipped = stats['skipped_by_stage'].get(stage, 0)
+        print(f"  {stage:15} : {count:,} records, {stats['seconds_by_stage'][stage]:.1f}s"
+              + (f", {skipped} files skipped (upstream failed)" if skipped else ''))
+    print(f"Errors: {len(stats['errors'])}")
+
+    report_file = f"pipeline_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    with open(report_file, 'w') as f:
+        json.dump(stats, f, indent=2, default=str)
+    print(f"\nReport saved to: {report_file}")
+
+    if stats['errors']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    run_profiled(main, 'pipeline')
@@ -2,19 +2,28 @@
 """
 Complete rebuild of match_shot table from FBref HTML files.
 Extracts all shot data with proper standardization and validation.
+
+The new table is loaded unlogged in a side schema, gets its indexes and
+foreign keys once the data is in, and is swapped in atomically
+(table_rebuild.TableRebuild), so readers keep the old table until then.
 """
 
 import os
 import re
 import json
-import psycopg2
-from psycopg2.extras import execute_values
-from bs4 import BeautifulSoup
-import pandas as pd
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, List, Tuple
 import logging
 
+from db_session import connect
+from fbref_shot_engine import read_shots_file
+from bulk_loader import BulkLoader, SHOT_COLUMNS
+from compact_ids import CompactIdMap
+from etl_metrics import get_metrics, start_run
+from etl_profile import run_profiled
+from mapping_snapshot import cached_mapping
+from table_rebuild import TableRebuild
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -22,23 +31,78 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database connection
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'user': 'postgres',
-    'password': 'postgres',
-    'database': 'nwsl_data'
-}
-
 # HTML files directory
 HTML_DIR = '/Users/thomasmcmillan/projects/nwsl_db_migration/html_files'
 
+# match_shot as rebuilt; constraints and indexes are created after the load
+MATCH_SHOT_COLUMNS_DDL = """
+    id UUID NOT NULL DEFAULT gen_random_uuid(),
+    match_id TEXT,
+    minute INTEGER,
+    player_name TEXT,
+    player_id TEXT,
+    player_uuid UUID,
+    team_name TEXT,
+    xg REAL,
+    psxg REAL,
+    outcome TEXT,
+    distance INTEGER,
+    body_part TEXT,
+    notes TEXT,
+    sca1_player_name TEXT,
+    sca1_event TEXT,
+    sca2_player_name TEXT,
+    sca2_event TEXT,
+    season_year INTEGER,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+"""
+MATCH_SHOT_CONSTRAINTS = [
+    'PRIMARY KEY (id)',
+    'FOREIGN KEY (match_id) REFERENCES match(match_id)',
+    'FOREIGN KEY (player_uuid) REFERENCES player(id)',
+]
+MATCH_SHOT_INDEXES = {
+    'idx_match_shot_match_id': 'match_id',
+    'idx_match_shot_player_id': 'player_id',
+    'idx_match_shot_player_uuid': 'player_uuid',
+    'idx_match_shot_season_year': 'season_year',
+    'idx_match_shot_outcome': 'outcome',
+}
+
+
+def load_player_uuid_map(conn) -> CompactIdMap:
+    """FBref player ID -> player UUID."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT player_id, id 
+        FROM player 
+        WHERE player_id IS NOT NULL AND id IS NOT NULL
+    """)
+    mapping = CompactIdMap.from_rows(cur.fetchall())
+    cur.close()
+    return mapping
+
+
+def load_match_season_map(conn) -> Dict[str, int]:
+    """FBref match ID -> season year."""
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT m.match_id, s.season_year 
+        FROM match m
+        LEFT JOIN season s ON m.season_uuid = s.id
+        WHERE m.match_id IS NOT NULL
+    """)
+    mapping = {row[0]: row[1] for row in cur.fetchall()}
+    cur.close()
+    return mapping
+
+
 class MatchShotExtractor:
     """Extract shot data from FBref HTML files."""
     
     def __init__(self):
         self.conn = None
+        self.rebuild = None
         self.player_uuid_map = {}
         self.match_season_map = {}
         self.stats = {
@@ -52,67 +116,17 @@ class MatchShotExtractor:
         
     def connect_db(self):
         """Establish database connection."""
-        self.conn = psycopg2.connect(**DB_CONFIG)
+        self.conn = connect()
         return self.conn
     
     def load_mappings(self):
-        """Load player UUID mappings and match season mappings."""
-        cur = self.conn.cursor()
-        
-        # Load player UUID mappings
-        cur.execute("""
-            SELECT player_id, id 
-            FROM player 
-            WHERE player_id IS NOT NULL AND id IS NOT NULL
-        """)
-        self.player_uuid_map = {row[0]: row[1] for row in cur.fetchall()}
+        """Load player UUID mappings and match season mappings (snapshotted locally)."""
+        self.player_uuid_map = cached_mapping(self.conn, 'player_uuid_map', ['player'], load_player_uuid_map)
         logger.info(f"Loaded {len(self.player_uuid_map)} player UUID mappings")
         
-        # Load match season mappings
-        cur.execute("""
-            SELECT m.match_id, s.season_year 
-            FROM match m
-            LEFT JOIN season s ON m.season_uuid = s.id
-            WHERE m.match_id IS NOT NULL
-        """)
-        self.match_season_map = {row[0]: row[1] for row in cur.fetchall()}
+        self.match_season_map = cached_mapping(self.conn, 'match_season_map', ['match', 'season'],
+                                               load_match_season_map)
         logger.info(f"Loaded {len(self.match_season_map)} match season mappings")
-        
-        cur.close()
-    
-    def standardize_outcome(self, outcome: str) -> str:
-        """Standardize shot outcome values."""
-        if not outcome:
-            return None
-            
-        outcome = outcome.strip().lower()
-        
-        # Remove 'so_' prefix if present
-        if outcome.startswith('so_'):
-            outcome = outcome[3:]
-        
-        # Map to standard values
-        outcome_map = {
-            'goal': 'Goal',
-            'saved': 'Saved',
-            'off target': 'Off Target',
-            'off_target': 'Off Target',
-            'blocked': 'Blocked',
-            'woodwork': 'Woodwork',
-            'saved off target': 'Saved off Target',
-            'saved_off_target': 'Saved off Target',
-            'unknown': 'Unknown'
-        }
-        
-        return outcome_map.get(outcome, outcome.title())
-    
-    def extract_player_id(self, cell) -> Optional[str]:
-        """Extract FBref player hex ID from table cell."""
-        if cell and hasattr(cell, 'get'):
-            player_id = cell.get('data-append-csv')
-            if player_id:
-                return player_id
-        return None
     
     def extract_shots_from_file(self, filepath: str) -> List[Dict]:
         """Extract shot data from a single HTML file."""
@@ -120,103 +134,14 @@ class MatchShotExtractor:
         match_id = os.path.basename(filepath).replace('match_', '').replace('.html', '')
         
         try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                soup = BeautifulSoup(f.read(), 'html.parser')
-            
-            # Find shots_all table
-            shots_table = soup.find('table', {'id': 'shots_all'})
+            # Read the shots_all table into typed columns (fbref_shot_engine)
+            shots_table = read_shots_file(filepath)
             
             if not shots_table:
                 return shots
             
-            # Convert to DataFrame
-            df = pd.read_html(str(shots_table))[0]
-            
-            # Find all rows in the table body
-            tbody = shots_table.find('tbody')
-            if not tbody:
-                return shots
-            
-            rows = tbody.find_all('tr')
-            
-            for idx, row in enumerate(rows):
-                # Skip header rows
-                if 'thead' in row.get('class', []):
-                    continue
-                
-                cells = row.find_all(['td', 'th'])
-                if len(cells) < 13:  # Minimum required columns
-                    continue
-                
-                try:
-                    # Extract data from cells
-                    minute_text = cells[0].get_text(strip=True)
-                    minute = None
-                    if minute_text and minute_text.isdigit():
-                        minute = int(minute_text)
-                    
-                    # Player info
-                    player_cell = cells[1]
-                    player_name = player_cell.get_text(strip=True)
-                    player_id = self.extract_player_id(player_cell)
-                    
-                    # Team info
-                    team_name = cells[2].get_text(strip=True)
-                    
-                    # Shot details
-                    xg_text = cells[3].get_text(strip=True)
-                    xg = float(xg_text) if xg_text and xg_text not in ['', '—'] else None
-                    
-                    psxg_text = cells[4].get_text(strip=True)
-                    psxg = float(psxg_text) if psxg_text and psxg_text not in ['', '—', '0.00'] else None
-                    
-                    outcome = self.standardize_outcome(cells[5].get_text(strip=True))
-                    
-                    distance_text = cells[6].get_text(strip=True)
-                    distance = int(distance_text) if distance_text and distance_text.isdigit() else None
-                    
-                    body_part = cells[7].get_text(strip=True) or None
-                    notes = cells[8].get_text(strip=True) or None
-                    
-                    # SCA1 info
-                    sca1_player_name = cells[9].get_text(strip=True) or None
-                    sca1_event = cells[10].get_text(strip=True) or None
-                    
-                    # SCA2 info
-                    sca2_player_name = cells[11].get_text(strip=True) or None
-                    sca2_event = cells[12].get_text(strip=True) or None
-                    
-                    # Get player UUID from mapping
-                    player_uuid = self.player_uuid_map.get(player_id) if player_id else None
-                    
-                    # Get season year from match
-                    season_year = self.match_season_map.get(match_id)
-                    
-                    shot = {
-                        'match_id': match_id,
-                        'minute': minute,
-                        'player_name': player_name,
-                        'player_id': player_id,
-                        'player_uuid': player_uuid,
-                        'team_name': team_name,
-                        'xg': xg,
-                        'psxg': psxg,
-                        'outcome': outcome,
-                        'distance': distance,
-                        'body_part': body_part,
-                        'notes': notes,
-                        'sca1_player_name': sca1_player_name,
-                        'sca1_event': sca1_event,
-                        'sca2_player_name': sca2_player_name,
-                        'sca2_event': sca2_event,
-                        'season_year': season_year
-                    }
-                    
-                    shots.append(shot)
-                    
-                except Exception as e:
-                    logger.debug(f"Error parsing row {idx} in {filepath}: {e}")
-                    continue
+            shots = shots_table.records(match_id, 'match_shot', player_uuid=self.player_uuid_map.get,
+                                        season_year=self.match_season_map.get(match_id))
             
             if shots:
                 self.stats['files_with_shots'] += 1
@@ -241,95 +166,19 @@ class MatchShotExtractor:
         return shots
     
     def create_new_table(self):
-        """Drop and recreate the match_shot table with proper structure."""
-        cur = self.conn.cursor()
-        
-        logger.info("Dropping existing match_shot table...")
-        cur.execute("DROP TABLE IF EXISTS match_shot CASCADE")
-        
-        logger.info("Creating new match_shot table...")
-        cur.execute("""
-            CREATE TABLE match_shot (
-                id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
-                match_id TEXT REFERENCES match(match_id),
-                minute INTEGER,
-                player_name TEXT,
-                player_id TEXT,
-                player_uuid UUID REFERENCES player(id),
-                team_name TEXT,
-                xg REAL,
-                psxg REAL,
-                outcome TEXT,
-                distance INTEGER,
-                body_part TEXT,
-                notes TEXT,
-                sca1_player_name TEXT,
-                sca1_event TEXT,
-                sca2_player_name TEXT,
-                sca2_event TEXT,
-                season_year INTEGER,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        
-        # Create indexes
-        logger.info("Creating indexes...")
-        cur.execute("CREATE INDEX idx_match_shot_match_id ON match_shot(match_id)")
-        cur.execute("CREATE INDEX idx_match_shot_player_id ON match_shot(player_id)")
-        cur.execute("CREATE INDEX idx_match_shot_player_uuid ON match_shot(player_uuid)")
-        cur.execute("CREATE INDEX idx_match_shot_season_year ON match_shot(season_year)")
-        cur.execute("CREATE INDEX idx_match_shot_outcome ON match_shot(outcome)")
-        
-        self.conn.commit()
-        cur.close()
-        logger.info("New match_shot table created successfully")
+        """Start building the new match_shot off to the side (the live table stays readable)."""
+        self.rebuild = TableRebuild(self.conn, 'match_shot', MATCH_SHOT_COLUMNS_DDL,
+                                    MATCH_SHOT_CONSTRAINTS, MATCH_SHOT_INDEXES)
+        self.rebuild.begin()
     
     def insert_shots(self, shots: List[Dict]):
-        """Insert shot data into the database."""
+        """Insert shot data into the new table with a single COPY."""
         if not shots:
             return
         
-        cur = self.conn.cursor()
-        
-        # Prepare data for insertion
-        values = []
-        for shot in shots:
-            values.append((
-                shot['match_id'],
-                shot['minute'],
-                shot['player_name'],
-                shot['player_id'],
-                shot['player_uuid'],
-                shot['team_name'],
-                shot['xg'],
-                shot['psxg'],
-                shot['outcome'],
-                shot['distance'],
-                shot['body_part'],
-                shot['notes'],
-                shot['sca1_player_name'],
-                shot['sca1_event'],
-                shot['sca2_player_name'],
-                shot['sca2_event'],
-                shot['season_year']
-            ))
-        
-        # Insert using execute_values for efficiency
-        execute_values(
-            cur,
-            """
-            INSERT INTO match_shot (
-                match_id, minute, player_name, player_id, player_uuid,
-                team_name, xg, psxg, outcome, distance, body_part, notes,
-                sca1_player_name, sca1_event, sca2_player_name, sca2_event,
-                season_year
-            ) VALUES %s
-            """,
-            values
-        )
+        BulkLoader(self.conn).load('match_shot', shots, SHOT_COLUMNS + ['season_year'])
         
         self.conn.commit()
-        cur.close()
     
     def process_all_files(self):
         """Process all HTML files and extract shot data."""
@@ -345,6 +194,7 @@ class MatchShotExtractor:
         # Process in batches
         batch_size = 100
         all_shots = []
+        metrics = get_metrics()
         
         for i in range(0, len(html_files), batch_size):
             batch_files = html_files[i:i+batch_size]
@@ -352,7 +202,8 @@ class MatchShotExtractor:
             
             for filepath in batch_files:
                 self.stats['files_processed'] += 1
-                shots = self.extract_shots_from_file(filepath)
+                with metrics.stage('shots_all'):
+                    shots = self.extract_shots_from_file(filepath)
                 batch_shots.extend(shots)
                 
                 if self.stats['files_processed'] % 50 == 0:
@@ -360,7 +211,9 @@ class MatchShotExtractor:
             
             # Insert batch
             if batch_shots:
-                self.insert_shots(batch_shots)
+                with metrics.stage('shots_all', files=0):
+                    self.insert_shots(batch_shots)
+                metrics.add('rows_written', len(batch_shots), 'shots_all')
                 all_shots.extend(batch_shots)
                 logger.info(f"Inserted {len(batch_shots)} shots from batch {i//batch_size + 1}")
         
@@ -406,6 +259,7 @@ class MatchShotExtractor:
     def run(self):
         """Main execution method."""
         logger.info("Starting match_shot table rebuild...")
+        metrics = start_run('match_shot_rebuild')
         
         try:
             # Connect to database
@@ -421,6 +275,10 @@ class MatchShotExtractor:
             logger.info("Processing HTML files...")
             all_shots = self.process_all_files()
             
+            # Indexes, constraints, ANALYZE, then swap it in
+            self.stats['rebuild'] = self.rebuild.finish()
+            self.rebuild = None
+            
             # Validate data
             logger.info("Validating extracted data...")
             validation = self.validate_data()
@@ -461,12 +319,19 @@ class MatchShotExtractor:
             
         except Exception as e:
             logger.error(f"Fatal error: {e}")
+            if self.rebuild:
+                self.rebuild.abort()
             raise
         finally:
             if self.conn:
                 self.conn.close()
+            metrics.write()
 
 
-if __name__ == "__main__":
+def main():
     extractor = MatchShotExtractor()
-    extractor.run()
\ No newline at end of file
+    extractor.run()
+
+
+if __name__ == "__main__":
+    run_profiled(main, 'match_shot_rebuild')
\ No newline at end of file
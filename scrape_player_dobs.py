@@ -6,7 +6,6 @@ Following the guide in parse_fbref_instructions.md EXACTLY to avoid being blocke
 
 import requests
 import pandas as pd
-import psycopg2
 from psycopg2.extras import RealDictCursor
 from bs4 import BeautifulSoup
 from selenium import webdriver
@@ -19,6 +18,7 @@ import time
 import logging
 from datetime import datetime
 import traceback
+from db_session import connect
 
 # Configure logging
 logging.basicConfig(
@@ -31,15 +31,6 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Database configuration
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'user': 'postgres',
-    'password': 'postgres',
-    'database': 'nwsl_data'
-}
-
 # CRITICAL: Following guide's header recommendations to avoid being blocked
 headers = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
@@ -57,7 +48,7 @@ class PlayerDOBScraper:
     def connect_db(self):
         """Connect to database"""
         try:
-            self.conn = psycopg2.connect(**DB_CONFIG)
+            self.conn = connect()
             self.cursor = self.conn.cursor(cursor_factory=RealDictCursor)
             logger.info("Database connection established")
             return True
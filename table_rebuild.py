@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Rebuild a table off to the side and swap it in.
+
+Full reloads (rebuild_match_shot_table.py) used to DROP the live table,
+recreate it with its primary key, foreign keys and indexes, and insert into
+it: readers saw a missing or half-filled table for the whole run, and every
+row paid for WAL, FK trigger checks and five index insertions.
+
+TableRebuild instead:
+
+    begin()     creates the new table UNLOGGED in the side schema
+                (REBUILD_SCHEMA) with no constraints or indexes, and puts the
+                session in a fast-load profile (synchronous_commit off, a
+                large maintenance_work_mem). While the rebuild is open the
+                side schema is first on the search_path, so unqualified
+                writes (BulkLoader) land in the new table.
+    finish()    SET LOGGED (one sequential WAL pass over the heap), then
+                builds the primary key, indexes and foreign keys over the
+                loaded data, ANALYZEs, and swaps the table in: one short
+                transaction drops the live table, moves the new one into its
+                schema and copies the old grants. Readers wait on that lock
+                for milliseconds and then see the complete new table.
+    abort()     drops the half-built table; the live one is untouched.
+
+Usage:
+    rebuild = TableRebuild(conn, 'match_shot', COLUMNS_DDL, constraints, indexes)
+    rebuild.begin()
+    ...                       # COPY/INSERT into match_shot, committing as you go
+    rebuild.finish()
+"""
+
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Side schema the new tables are built in; override with FBREF_REBUILD_SCHEMA
+REBUILD_SCHEMA = os.environ.get('FBREF_REBUILD_SCHEMA', 'etl_rebuild')
+# Memory for the deferred index builds; override with FBREF_REBUILD_MAINTENANCE_WORK_MEM
+MAINTENANCE_WORK_MEM = os.environ.get('FBREF_REBUILD_MAINTENANCE_WORK_MEM', '1GB')
+# How long the swap waits for readers' locks before giving up (the live table is kept)
+SWAP_LOCK_TIMEOUT = '10s'
+
+# Session settings for the load; RESET afterwards
+FAST_LOAD_SETTINGS = {
+    # Losing the last commits in a crash only loses rows of a table nobody reads yet
+    'synchronous_commit': 'off',
+    'maintenance_work_mem': MAINTENANCE_WORK_MEM,
+}
+
+
+class TableRebuild:
+    """Build a replacement for schema.table in REBUILD_SCHEMA and swap it in."""
+
+    def __init__(self, conn, table: str, columns_ddl: str, constraints: Optional[List[str]] = None,
+                 indexes: Optional[Dict[str, str]] = None, schema: str = 'public'):
+        """
+        columns_ddl is the column list of CREATE TABLE (no constraints);
+        constraints are ALTER TABLE ... ADD clauses ('PRIMARY KEY (id)',
+        'FOREIGN KEY (match_id) REFERENCES match(match_id)'); indexes map
+        index name -> indexed columns.
+        """
+        self.conn = conn
+        self.table = table
+        self.columns_ddl = columns_ddl
+        self.constraints = constraints or []
+        self.indexes = indexes or {}
+        self.schema = schema
+        self.new_table = f"{REBUILD_SCHEMA}.{table}"
+        self.live_table = f"{schema}.{table}"
+        self.search_path = None
+        self.started = None
+        self.stats = {}
+
+    def _execute(self, sql: str, params=None):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(sql, params)
+        finally:
+            cursor.close()
+
+    def _timed(self, step: str, sql: str):
+        started = time.time()
+        self._execute(sql)
+        self.stats[f'{step}_seconds'] = round(self.stats.get(f'{step}_seconds', 0) + time.time() - started, 3)
+
+    def begin(self):
+        """Create the empty UNLOGGED table in the side schema and switch to the fast-load profile."""
+        cursor = self.conn.cursor()
+        cursor.execute("SHOW search_path")
+        self.search_path = cursor.fetchone()[0]
+        cursor.close()
+
+        self._execute(f"CREATE SCHEMA IF NOT EXISTS {REBUILD_SCHEMA}")
+        self._execute(f"DROP TABLE IF EXISTS {self.new_table}")
+        self._execute(f"CREATE UNLOGGED TABLE {self.new_table} ({self.columns_ddl})")
+        for name, value in FAST_LOAD_SETTINGS.items():
+            self._execute(f"SET {name} = %s", (value,))
+        self._execute(f"SET search_path = {REBUILD_SCHEMA}, {self.search_path}")
+        self.conn.commit()
+        self.started = time.time()
+        logger.info(f"Building {self.live_table} as unlogged {self.new_table}")
+
+    def _reset_session(self):
+        for name in FAST_LOAD_SETTINGS:
+            self._execute(f"RESET {name}")
+        if self.search_path is not None:
+            self._execute(f"SET search_path = {self.search_path}")
+
+    def finish(self) -> Dict:
+        """Make the table durable, build its indexes and constraints, ANALYZE it and swap it in."""
+        self.conn.commit()
+        self.stats['load_seconds'] = round(time.time() - self.started, 3)
+
+        logger.info(f"Writing {self.new_table} to WAL (SET LOGGED)...")
+        self._timed('set_logged', f"ALTER TABLE {self.new_table} SET LOGGED")
+        logger.info(f"Building {len(self.constraints)} constraints and {len(self.indexes)} indexes...")
+        for constraint in self.constraints:
+            self._timed('constraints', f"ALTER TABLE {self.new_table} ADD {constraint}")
+        for name, columns in self.indexes.items():
+            self._timed('indexes', f"CREATE INDEX {name} ON {self.new_table} ({columns})")
+        self._timed('analyze', f"ANALYZE {self.new_table}")
+        self.conn.commit()
+
+        self.swap()
+        self._reset_session()
+        self.conn.commit()
+        logger.info(f"{self.live_table} rebuilt: {self.stats}")
+        return self.stats
+
+    def swap(self):
+        """Replace the live table with the new one in a single transaction."""
+        cursor = self.conn.cursor()
+        started = time.time()
+        try:
+            cursor.execute("SET LOCAL lock_timeout = %s", (SWAP_LOCK_TIMEOUT,))
+            cursor.execute("SELECT to_regclass(%s)", (self.live_table,))
+            if cursor.fetchone()[0] is not None:
+                # Grants on the live table (nwsl_ro's SELECT) carry over to the new one
+                cursor.execute("""
+                    SELECT CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE quote_ident(r.rolname) END,
+                           a.privilege_type, a.is_grantable
+                    FROM pg_class c
+                    CROSS JOIN LATERAL aclexplode(c.relacl) a
+                    LEFT JOIN pg_roles r ON r.oid = a.grantee
+                    WHERE c.oid = %s::regclass AND a.grantee <> c.relowner
+                """, (self.live_table,))
+                grants = cursor.fetchall()
+                # CASCADE as the old drop-and-recreate did: dependent views go with the old table
+                cursor.execute(f"DROP TABLE {self.live_table} CASCADE")
+                for grantee, privilege, grantable in grants:
+                    cursor.execute(f"GRANT {privilege} ON {self.new_table} TO {grantee}"
+                                   + (" WITH GRANT OPTION" if grantable else ""))
+            cursor.execute(f"ALTER TABLE {self.new_table} SET SCHEMA {self.schema}")
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            # The caller's abort() drops the new table; a rerun builds it again (begin() drops leftovers anyway)
+            logger.error(f"Swap failed; {self.live_table} is unchanged")
+            raise
+        finally:
+            cursor.close()
+        self.stats['swap_seconds'] = round(time.time() - started, 3)
+
+    def abort(self):
+        """Drop the half-built table and restore the session; the live table is untouched."""
+        self.conn.rollback()
+        self._execute(f"DROP TABLE IF EXISTS {self.new_table}")
+        self._reset_session()
+        self.conn.commit()
+        logger.info(f"Rebuild of {self.live_table} aborted; dropped {self.new_table}")
@@ -0,0 +1,8 @@
+"""Put the repository root on sys.path so tests import the scripts' modules directly."""
+
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
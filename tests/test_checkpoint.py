@@ -0,0 +1,50 @@
+"""Checkpoint log: resume, torn last line, undecodable lines."""
+
+from checkpoint import Checkpoint
+
+
+def test_resume_reads_committed_files_and_counters(tmp_path):
+    checkpoint = Checkpoint('run', directory=str(tmp_path))
+    checkpoint.commit(['/html/match_a.html'], files_processed=1)
+    checkpoint.commit(['/html/match_b.html'], files_processed=2)
+
+    resumed = Checkpoint('run', resume=True, directory=str(tmp_path))
+    assert resumed.completed == {'match_a.html', 'match_b.html'}
+    assert resumed.is_done('/elsewhere/match_a.html')
+    assert resumed.counter('files_processed') == 2
+
+
+def test_without_resume_the_log_is_cleared(tmp_path):
+    Checkpoint('run', directory=str(tmp_path)).commit(['match_a.html'])
+    assert Checkpoint('run', resume=True, directory=str(tmp_path)).completed == {'match_a.html'}
+    Checkpoint('run', directory=str(tmp_path))
+    assert Checkpoint('run', resume=True, directory=str(tmp_path)).completed == set()
+
+
+def test_torn_last_line_is_cut_before_the_next_append(tmp_path):
+    checkpoint = Checkpoint('run', directory=str(tmp_path))
+    checkpoint.commit(['match_a.html'], files_processed=1)
+    with open(checkpoint.path, 'ab') as f:
+        f.write(b'{"files": ["match_b.ht')
+
+    resumed = Checkpoint('run', resume=True, directory=str(tmp_path))
+    assert resumed.completed == {'match_a.html'}
+    resumed.commit(['match_c.html'], files_processed=2)
+
+    again = Checkpoint('run', resume=True, directory=str(tmp_path))
+    assert again.completed == {'match_a.html', 'match_c.html'}
+    assert again.counter('files_processed') == 2
+    with open(again.path, 'rb') as f:
+        assert f.read().endswith(b'\n')
+
+
+def test_undecodable_lines_are_skipped(tmp_path):
+    checkpoint = Checkpoint('run', directory=str(tmp_path))
+    checkpoint.commit(['match_a.html'])
+    with open(checkpoint.path, 'ab') as f:
+        f.write(b'\xff\xfe not json\n')
+        f.write(b'[1, 2]\n')
+    checkpoint.commit(['match_b.html'])
+
+    resumed = Checkpoint('run', resume=True, directory=str(tmp_path))
+    assert resumed.completed == {'match_a.html', 'match_b.html'}
@@ -0,0 +1,70 @@
+"""CompactIdMap / CompactPlayerMap: bulk load, overlay, compaction."""
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+import compact_ids  # noqa: E402
+from compact_ids import CompactIdMap, CompactPlayerMap, pack_hex_id, pack_pair  # noqa: E402
+
+UUID_A = '6f1c2a9e-0c4b-4c1e-9a57-0d6b2f1e8a01'
+UUID_B = '0b8d4e52-7f3a-4d2c-8e11-5a9c3b7d6e02'
+
+
+def test_pack_hex_id_and_pair():
+    assert pack_hex_id('0000000a') == 10
+    assert pack_hex_id('not-hex!') is None
+    assert pack_hex_id('abc') is None
+    assert pack_pair('00000001', '00000002') == (1 << 32) | 2
+    assert pack_pair('00000001', 'bad') is None
+
+
+def test_small_load_goes_to_the_overlay():
+    ids = CompactIdMap.from_rows([('a1b2c3d4', UUID_A)])
+    assert ids.get('a1b2c3d4') == UUID_A
+    assert len(ids._keys) == 0
+    assert 'a1b2c3d4' in ids
+    assert ids.get('ffffffff') is None
+    with pytest.raises(KeyError):
+        ids['ffffffff']
+
+
+def test_large_load_is_merged_into_the_arrays(monkeypatch):
+    monkeypatch.setattr(compact_ids, 'COMPACT_THRESHOLD', 2)
+    ids = CompactIdMap.from_rows([('a1b2c3d4', UUID_A), ('00000001', UUID_B), ('player-x', UUID_B)])
+    assert len(ids._keys) == 2
+    assert ids.get('a1b2c3d4') == UUID_A
+    assert ids.get('00000001') == UUID_B
+    # Keys that don't pack stay in the overlay
+    assert ids._extra == {'player-x': UUID_B}
+    assert len(ids) == 3
+
+
+def test_overlay_compacts_at_the_threshold(monkeypatch):
+    monkeypatch.setattr(compact_ids, 'COMPACT_THRESHOLD', 3)
+    ids = CompactIdMap(pairs=True)
+    ids.load([('07c68416', 'a1b2c3d4', UUID_A)])
+    ids[('07c68416', '00000001')] = UUID_B
+    assert len(ids._keys) == 0
+    ids.load([('07c68416', '00000002', UUID_A)])
+    assert len(ids._keys) == 3
+    assert ids._extra == {}
+    assert ids.get(('07c68416', 'a1b2c3d4')) == UUID_A
+    assert ids.get(('07c68416', '00000001')) == UUID_B
+
+
+def test_later_values_win(monkeypatch):
+    monkeypatch.setattr(compact_ids, 'COMPACT_THRESHOLD', 2)
+    ids = CompactIdMap.from_rows([('a1b2c3d4', UUID_A), ('00000001', UUID_A)])
+    ids['a1b2c3d4'] = UUID_B
+    assert ids.get('a1b2c3d4') == UUID_B
+    ids.compact()
+    assert ids.get('a1b2c3d4') == UUID_B
+    assert len(ids) == 2
+
+
+def test_player_map_returns_uuid_and_name():
+    players = CompactPlayerMap.from_rows([('a1b2c3d4', UUID_A, 'Sam Kerr'), ('odd-id', None, 'Unknown')])
+    assert players.get('a1b2c3d4') == {'uuid': UUID_A, 'name': 'Sam Kerr'}
+    assert players.get('odd-id') == {'uuid': None, 'name': 'Unknown'}
+    assert players.get('00000000', {}) == {}
@@ -0,0 +1,105 @@
+"""EtlState: planning from loaded state, buffering, deferral and discard (no database)."""
+
+import pytest
+
+pytest.importorskip('psycopg2')
+pytest.importorskip('lxml')
+
+import etl_state  # noqa: E402
+from etl_state import EtlState  # noqa: E402
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.conn.executed.append((sql, params))
+        if 'to_regclass' in sql:
+            self.rows = [(True,)]
+        elif 'FROM etl_match_state' in sql:
+            self.rows = list(self.conn.state_rows.get(params[0], []))
+
+    def fetchone(self):
+        return self.rows[0]
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, state_rows=None):
+        self.state_rows = state_rows or {}
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def state(monkeypatch):
+    # Paths in these tests are not real files; hashes come from the locator stub
+    monkeypatch.setattr(etl_state, 'file_hashes', lambda paths: {path: f'hash:{path}' for path in paths})
+    conn = FakeConn({'passing': [('m1', 'hash:/html/match_m1.html')]})
+    return EtlState(conn)
+
+
+def test_plan_skips_families_done_for_the_current_file_hash(state):
+    files = [('m1', '/html/match_m1.html'), ('m2', '/html/match_m2.html')]
+    todo = state.plan(files, ['passing', 'misc'])
+    assert todo == {'/html/match_m1.html': {'misc'}, '/html/match_m2.html': {'passing', 'misc'}}
+    assert state.stats['skipped'] == 1
+    assert state.is_done('m1', 'passing', 'hash:/html/match_m1.html')
+    assert not state.is_done('m1', 'passing', 'hash:changed')
+    assert not state.is_done('m1', 'passing', None)
+
+
+def test_force_runs_everything(state):
+    files = [('m1', '/html/match_m1.html')]
+    assert state.plan(files, ['passing'], force=True) == {'/html/match_m1.html': {'passing'}}
+
+
+def test_record_buffers_rows_with_the_file_hash(state):
+    state.plan([('m2', '/html/match_m2.html')], ['passing'])
+    state.record('m2', 'passing', '/html/match_m2.html', 'done', records=22, seconds=0.5)
+    (row,) = state.pending
+    assert row[:6] == ('m2', 'passing', 'hash:/html/match_m2.html', '1', 'done', 22)
+    assert row[6] == 500
+
+
+def test_record_without_a_hash_is_not_buffered(state):
+    state.record('m3', 'passing', None, 'done')
+    assert state.pending == []
+
+
+def test_deferred_rows_are_recorded_only_when_confirmed(state):
+    state.plan([('m2', '/html/match_m2.html')], ['misc'])
+    state.defer('m2', 'misc', '/html/match_m2.html', records=30, seconds=0.1)
+    assert state.pending == []
+    state.confirm('misc', ['other'])
+    assert state.pending == []
+    state.confirm('misc', ['m2'])
+    assert [row[:5] for row in state.pending] == [('m2', 'misc', 'hash:/html/match_m2.html', '1', 'done')]
+    assert state.deferred == {}
+
+
+def test_discard_drops_unwritten_and_unconfirmed_rows(state):
+    state.plan([('m2', '/html/match_m2.html')], ['passing', 'misc'])
+    state.record('m2', 'passing', '/html/match_m2.html', 'done')
+    state.defer('m2', 'misc', '/html/match_m2.html')
+    state.discard()
+    assert state.pending == []
+    assert state.deferred == {}
+    state.confirm('misc', ['m2'])
+    assert state.pending == []
@@ -0,0 +1,115 @@
+"""Shot replacement: a page without shots clears a match, a failed parse keeps its shots."""
+
+import datetime
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('lxml')
+pytest.importorskip('psycopg2')
+pytest.importorskip('pandas')
+
+import extract_shot_data_complete  # noqa: E402
+from extract_shot_data_complete import CompleteShotDataExtractor  # noqa: E402
+from fbref_match_engine import SinglePassEngine, build_shots_handler  # noqa: E402
+from fbref_tables import parse_html  # noqa: E402
+
+SHOT = {'match_id': 'm1', 'minute': 5, 'player_name': 'Christine Sinclair', 'player_id': None,
+        'outcome': 'Goal'}
+
+
+class FakeCursor:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchall(self):
+        return self.rows
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, rows=()):
+        self.rows = rows
+
+    def cursor(self):
+        return FakeCursor(self.rows)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+class FakeState:
+    def __init__(self):
+        self.recorded = []
+
+    def record(self, match_id, family, path_or_hash, status, *args, **kwargs):
+        self.recorded.append((match_id, family, status))
+
+
+def broken_read_shots(root):
+    raise ValueError("malformed shots_all")
+
+
+@pytest.fixture
+def replaced(monkeypatch):
+    calls = []
+
+    def replace_shots(self, shots_by_match):
+        calls.append(dict(shots_by_match))
+        return sum(len(shots) for shots in shots_by_match.values())
+
+    monkeypatch.setattr(CompleteShotDataExtractor, 'replace_shots', replace_shots)
+    monkeypatch.setattr(CompleteShotDataExtractor, 'load_mappings', lambda self: None)
+    return calls
+
+
+def test_page_without_shots_table_yields_no_shots():
+    extractor = CompleteShotDataExtractor({}, [])
+    root = parse_html('<html><body><table id="other"></table></body></html>')
+    assert extractor.extract_shot_data_from_html('match_m1.html', 'm1', root) == []
+
+
+def test_parse_failure_raises(monkeypatch):
+    monkeypatch.setattr(extract_shot_data_complete, 'read_shots', broken_read_shots)
+    extractor = CompleteShotDataExtractor({}, [])
+    with pytest.raises(ValueError):
+        extractor.extract_shot_data_from_html('match_m1.html', 'm1', parse_html('<html></html>'))
+
+
+def test_sequential_run_keeps_shots_of_a_failed_match(monkeypatch, replaced):
+    day = datetime.date(2024, 3, 16)
+    extractor = CompleteShotDataExtractor({}, [])
+    extractor.connect_db(FakeConn([('m1', day), ('m2', day), ('m3', day)]))
+    monkeypatch.setattr(extractor, 'find_html_file', lambda match_id: f'match_{match_id}.html')
+
+    def extract(filepath, match_id, root=None):
+        if match_id == 'm2':
+            raise ValueError("malformed shots_all")
+        return [dict(SHOT)] if match_id == 'm1' else []
+
+    monkeypatch.setattr(extractor, 'extract_shot_data_from_html', extract)
+    extractor.process_all_matches()
+
+    assert replaced == [{'m1': [SHOT], 'm3': []}]
+
+
+def test_engine_records_a_failed_parse_and_keeps_shots(tmp_path, monkeypatch, replaced):
+    monkeypatch.setattr(extract_shot_data_complete, 'read_shots', broken_read_shots)
+    page = tmp_path / 'match_07c68416.html'
+    page.write_text('<html><body><table id="shots_all"><tbody></tbody></table></body></html>')
+
+    engine = SinglePassEngine()
+    engine.state = FakeState()
+    engine.register(build_shots_handler(conn=FakeConn()))
+    engine.process_file(str(page))
+
+    assert replaced == []
+    assert engine.state.recorded == [('07c68416', 'shots_all', 'failed')]
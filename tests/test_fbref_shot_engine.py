@@ -0,0 +1,93 @@
+"""fbref_shot_engine: cell parsing and shots_all reading on a fixture table."""
+
+import pytest
+
+pytest.importorskip('numpy')
+pytest.importorskip('lxml')
+pytest.importorskip('psycopg2')
+
+from fbref_shot_engine import parse_minute, read_shots, standardize_outcome  # noqa: E402
+from fbref_tables import parse_html  # noqa: E402
+
+STATS = ['minute', 'player', 'team', 'xg_shot', 'psxg_shot', 'outcome', 'distance', 'body_part',
+         'notes', 'sca_1_player', 'sca_1_type', 'sca_2_player', 'sca_2_type']
+
+
+def shot_row(minute, player, outcome, xg='0.10', player_id='a1b2c3d4'):
+    link = f'<a href="/en/players/{player_id}/Someone">{player}</a>' if player else ''
+    cells = {'minute': minute, 'player': link, 'team': 'Portland Thorns FC', 'xg_shot': xg,
+             'psxg_shot': '', 'outcome': outcome, 'distance': '12', 'body_part': 'Right Foot',
+             'notes': '', 'sca_1_player': 'Sophia Smith', 'sca_1_type': 'Pass (Live)',
+             'sca_2_player': '', 'sca_2_type': ''}
+    tds = ''.join(f'<td data-stat="{stat}">{cells[stat]}</td>' for stat in STATS[1:])
+    return f'<tr><th data-stat="minute">{minute}</th>{tds}</tr>'
+
+
+SHOTS_PAGE = f"""
+<html><body>
+<table id="shots_all">
+  <thead>
+    <tr class="over_header"><th colspan="10"></th><th colspan="2">SCA 1</th><th colspan="2">SCA 2</th></tr>
+    <tr>{''.join(f'<th data-stat="{stat}">{stat}</th>' for stat in STATS)}</tr>
+  </thead>
+  <tbody>
+    {shot_row('5', 'Christine Sinclair', 'Goal')}
+    {shot_row('', 'No Minute', 'Saved')}
+    <tr class="spacer partial_table"><td colspan="13"></td></tr>
+    {shot_row('90+3', 'Morgan Weaver', 'so_saved_off_target', xg='')}
+    {shot_row('60', '', 'Blocked')}
+    <tr></tr>
+  </tbody>
+</table>
+</body></html>
+"""
+
+
+def test_parse_minute():
+    assert parse_minute('17') == 17
+    assert parse_minute('90+7') == 97
+    assert parse_minute('45+') == 45
+    assert parse_minute('') is None
+    assert parse_minute(None) is None
+    assert parse_minute('abc') is None
+
+
+def test_standardize_outcome():
+    assert standardize_outcome('Goal') == 'Goal'
+    assert standardize_outcome('so_goal') == 'Goal'
+    assert standardize_outcome('off_target') == 'Off Target'
+    assert standardize_outcome(' Saved off Target ') == 'Saved off Target'
+    assert standardize_outcome('post') == 'Post'
+    assert standardize_outcome('') is None
+
+
+def test_read_shots_keeps_rows_with_a_minute_and_a_player():
+    table = read_shots(parse_html(SHOTS_PAGE))
+    assert len(table) == 4      # the spacer and the empty row are not stored
+    records = table.records('07c68416', 'match_shot', player_uuid={'a1b2c3d4': 'uuid-1'}.get,
+                            season_year=2024)
+    assert [(r['minute'], r['player_name'], r['outcome']) for r in records] == [
+        (5, 'Christine Sinclair', 'Goal'),
+        (93, 'Morgan Weaver', 'Saved off Target'),
+    ]
+    first, second = records
+    assert first['player_id'] == 'a1b2c3d4'
+    assert first['player_uuid'] == 'uuid-1'
+    assert first['xg'] == pytest.approx(0.10)
+    assert first['psxg'] is None
+    assert first['distance'] == 12
+    assert first['sca1_player_name'] == 'Sophia Smith'
+    assert first['sca2_player_name'] is None
+    assert second['xg'] is None
+    assert second['season_year'] == 2024
+
+
+def test_legacy_shot_ids_count_rows_as_read_html_did():
+    records = read_shots(parse_html(SHOTS_PAGE)).records('07c68416', 'legacy')
+    # Row 1 has no minute and row 2 is the spacer; both still take a position
+    assert [r['shot_id'] for r in records] == ['07c68416_000', '07c68416_003']
+    assert records[1]['outcome_id'] == 'so_saved_off_target'
+
+
+def test_page_without_shots_table():
+    assert read_shots(parse_html('<html><body><table id="other"></table></body></html>')) is None
@@ -13,20 +13,11 @@ This script performs comprehensive validation checks and generates reports on:
 4. Data quality metrics
 """
 
-import psycopg2
 import json
 from datetime import datetime
 from typing import Dict, List, Tuple, Any
 import sys
-
-# Database connection parameters
-DB_CONFIG = {
-    'host': 'localhost',
-    'port': 5433,
-    'database': 'nwsl_data',
-    'user': 'postgres',
-    'password': 'postgres'
-}
+from db_session import DB_CONFIG, connect
 
 class DataConsistencyValidator:
     """Validates data consistency across NWSL database tables"""
@@ -36,6 +27,7 @@ class DataConsistencyValidator:
         self.db_config = db_config
         self.conn = None
         self.cur = None
+        self.owns_conn = True
         self.validation_results = {
             'timestamp': datetime.now().isoformat(),
             'checks': [],
@@ -43,10 +35,11 @@ class DataConsistencyValidator:
             'issues': []
         }
     
-    def connect(self):
-        """Establish database connection"""
+    def connect(self, conn=None):
+        """Establish database connection (or adopt a shared one)"""
         try:
-            self.conn = psycopg2.connect(**self.db_config)
+            self.owns_conn = conn is None
+            self.conn = conn or connect(**self.db_config)
             self.cur = self.conn.cursor()
             print("✓ Connected to database")
             return True
@@ -58,7 +51,7 @@ class DataConsistencyValidator:
         """Close database connection"""
         if self.cur:
             self.cur.close()
-        if self.conn:
+        if self.conn and self.owns_conn:
             self.conn.close()
         print("✓ Disconnected from database")
     
@@ -497,13 +490,13 @@ class DataConsistencyValidator:
         print(f"\n💾 Report saved to: {filename}")
         return filename
     
-    def run_all_checks(self):
-        """Run all validation checks"""
+    def run_all_checks(self, conn=None):
+        """Run all validation checks (on a shared connection if given)"""
         print("=" * 60)
         print("NWSL DATABASE CONSISTENCY VALIDATION")
         print("=" * 60)
         
-        if not self.connect():
+        if not self.connect(conn):
             return False
         
         try: